@@ -1,11 +1,13 @@
 from typing import Annotated, TypedDict, Sequence, List, Dict, Any
 from langgraph.graph import Graph, StateGraph
+from langgraph.types import StreamWriter
 from langchain_core.messages import HumanMessage, AIMessage
 # from langchain_openai import ChatOpenAI # 不需要 ChatOpenAI 了，我们直接使用 AcademicTools
 from pydantic import BaseModel
 import os
 from dotenv import load_dotenv
 from academic_tools import AcademicTools # 导入 AcademicTools
+from speculative import SummaryPrefetcher
 import json
 
 # 加载环境变量
@@ -17,55 +19,104 @@ class AgentState(TypedDict):
     task_type: str | None # 用户请求的任务类型 (e.g., "search", "summary", "parse_bibtex")
     user_input: str | None # 原始用户输入
     search_query: str | None # 搜索任务的查询词
-    search_method: str | None # 搜索方法偏好 ("scholarly" or "qwen")
+    search_method: str | None # 搜索方法偏好 ("scholarly", "qwen" or "local")
     literature_results: list | None # 文献搜索结果
     summary: str | None # 文献摘要结果
     citations: list | None # 引用生成结果
     analysis_results: dict | None # 数据分析结果
+    data_path: str | None # 待分析的数据文件路径（CSV/Parquet）
+    analysis_type: str | None # 数据分析类型 ("descriptive" or "regression")
+    analysis_options: dict | None # 数据分析参数（targets, features, method, alpha 等）
+    data_options: dict | None # 数据加载参数（columns, downcast, sample, sample_frac, streaming 等）
+    dataset: Any # 已加载的数据（pd.DataFrame），为 None 时 analyze_data 按路径流式读取
     text_to_polish: str | None # 需要润色的文本
+    polished_text: str | None # 润色结果
     paper_to_summarize_index: int | None # 需要总结的文献在 literature_results 中的索引
-    paper_to_cite_index: int | None # 需要生成引用的文献索引
+    paper_to_cite_index: int | list | None # 需要生成引用的文献索引（单个索引或索引列表）
     citation_style: str | None # 引用格式
+    citation_export_path: str | None # 批量导出引用的目标文件路径
+    citation_validation: list | None # 文献元数据校验报告，与 literature_results 一一对应
     bibtex_input: str | None # 用户输入的 BibTeX 文本
     pdf_path: str | None # PDF 文件路径
     pdf_sections: dict | None # PDF 章节内容
     pdf_analysis: dict | None # PDF 分析结果
+    history_set_id: int | None # 当前文献列表在历史库中的结果集编号
+    topic_clusters: list | None # 文献列表的主题聚类（id、label、terms、size、indices），文献较少时为 None
 
 # 定义各个节点函数，接收 tools 和 state
-def scholarly_search_node(state: AgentState, tools: AcademicTools) -> AgentState:
-    """使用 scholarly 进行文献检索节点"""
+def scholarly_search_node(state: AgentState, tools: AcademicTools, writer: StreamWriter | None = None,
+                          prefetcher: SummaryPrefetcher | None = None) -> AgentState:
+    """使用 scholarly 进行文献检索节点
+
+    通过 writer 逐条发出 paper / summary 事件（workflow.stream 的 custom 模式），
+    调用方无需等待全部检索和摘要完成即可展示结果。
+    """
     print("[DEBUG] 进入 scholarly_search_node")
+    if prefetcher:
+        # 新的检索将替换文献列表，上一批的预取摘要不再需要
+        prefetcher.cancel()
     search_query = state.get("search_query")
     if not search_query:
         print("[DEBUG] scholarly_search_node: 缺少搜索查询词")
         return {**state, "literature_results": []}
         
+    results = []
     try:
-        # 调用 AcademicTools 中的 scholarly 搜索方法
-        results = tools.search_papers(search_query)
+        # 调用 AcademicTools 中的流式 scholarly 搜索方法
+        for event in tools.iter_search_papers(search_query):
+            if event['event'] == 'paper':
+                results.append(event['paper'])
+            if writer:
+                writer({"node": "scholarly_search", **event})
         print(f"[DEBUG] scholarly_search_node: 找到 {len(results)} 篇文献")
         return {**state, "literature_results": results}
     except Exception as e:
+        # 保留出错前已经拿到的结果
         print(f"[DEBUG] scholarly_search_node 执行失败: {str(e)}")
-        return {**state, "literature_results": []}
+        return {**state, "literature_results": results}
 
-def qwen_search_node(state: AgentState, tools: AcademicTools) -> AgentState:
-    """使用 Qwen 联网搜索进行文献检索节点"""
+def qwen_search_node(state: AgentState, tools: AcademicTools, writer: StreamWriter | None = None,
+                     prefetcher: SummaryPrefetcher | None = None) -> AgentState:
+    """使用 Qwen 联网搜索进行文献检索节点（每解析出一篇文献即通过 writer 发出 paper 事件）"""
     print("[DEBUG] 进入 qwen_search_node")
+    if prefetcher:
+        prefetcher.cancel()
     search_query = state.get("search_query")
     if not search_query:
         print("[DEBUG] qwen_search_node: 缺少搜索查询词")
         return {**state, "literature_results": []}
         
+    results = []
     try:
-        # 调用 AcademicTools 中的 Qwen 联网搜索方法
-        results = tools.qwen_search_papers(search_query)
+        # 调用 AcademicTools 中的流式 Qwen 联网搜索方法
+        for index, paper in enumerate(tools.iter_qwen_search_papers(search_query)):
+            results.append(paper)
+            if writer:
+                writer({"node": "qwen_search", "event": "paper", "index": index, "paper": paper})
         print(f"[DEBUG] qwen_search_node: 找到 {len(results)} 篇文献")
         return {**state, "literature_results": results}
     except Exception as e:
         print(f"[DEBUG] qwen_search_node 执行失败: {str(e)}")
+        return {**state, "literature_results": results}
+
+def local_search_node(state: AgentState, tools: AcademicTools, writer: StreamWriter | None = None,
+                      prefetcher: SummaryPrefetcher | None = None) -> AgentState:
+    """使用本地元数据快照索引进行离线文献检索节点"""
+    print("[DEBUG] 进入 local_search_node")
+    if prefetcher:
+        prefetcher.cancel()
+    search_query = state.get("search_query")
+    if not search_query:
+        print("[DEBUG] local_search_node: 缺少搜索查询词")
         return {**state, "literature_results": []}
 
+    results = tools.local_search_papers(search_query)
+    if writer:
+        for index, paper in enumerate(results):
+            writer({"node": "local_search", "event": "paper", "index": index, "paper": paper})
+    print(f"[DEBUG] local_search_node: 找到 {len(results)} 篇文献")
+    return {**state, "literature_results": results}
+
 def parse_bibtex_node(state: AgentState, tools: AcademicTools) -> AgentState:
     """解析 BibTeX 文本节点"""
     print("[DEBUG] 进入 parse_bibtex_node")
@@ -79,13 +130,15 @@ def parse_bibtex_node(state: AgentState, tools: AcademicTools) -> AgentState:
         # 调用 AcademicTools 中的 parse_bibtex 方法
         results = tools.parse_bibtex(bibtex_input)
         print(f"[DEBUG] parse_bibtex_node: 解析出 {len(results)} 篇文献")
+        tools.add_bibtex_crossrefs(results)
         return {**state, "literature_results": results} # 将解析结果存入 literature_results
     except Exception as e:
         print(f"[DEBUG] parse_bibtex_node 执行失败: {str(e)}")
         return {**state, "literature_results": []}
 
-def summarize_and_explain_node(state: AgentState, tools: AcademicTools) -> AgentState:
-    """文献摘要与术语解释节点"""
+def summarize_and_explain_node(state: AgentState, tools: AcademicTools,
+                               prefetcher: SummaryPrefetcher | None = None) -> AgentState:
+    """文献摘要与术语解释节点（优先使用后台预取的摘要）"""
     print("[DEBUG] 进入 summarize_and_explain_node")
     literature_results = state.get("literature_results")
     paper_index = state.get("paper_to_summarize_index")
@@ -96,20 +149,117 @@ def summarize_and_explain_node(state: AgentState, tools: AcademicTools) -> Agent
         
     try:
         paper_to_summarize = literature_results[paper_index]
-        # 调用 AcademicTools 中的 summarize_paper 方法
-        summary = tools.summarize_paper(paper_to_summarize)
+        history = tools.history()
+        history_id = paper_to_summarize.get("history_id")
+        if history and history_id:
+            # 以前生成过的摘要直接从历史库取回
+            summary = history.latest_artifact("summary", paper_id=history_id)
+            if summary:
+                print("[DEBUG] summarize_and_explain_node: 使用历史库中的摘要")
+                return {**state, "summary": summary}
+        summary = prefetcher.lookup(paper_to_summarize) if prefetcher else None
+        if summary:
+            print("[DEBUG] summarize_and_explain_node: 命中预取摘要")
+        else:
+            # 调用 AcademicTools 中的 summarize_paper 方法
+            try:
+                summary = tools.summarize_paper(paper_to_summarize, strict=True)
+            except Exception as e:
+                # 调用失败时向用户显示提示文本，不写入历史
+                summary = str(e)
+                history_id = None
         print("[DEBUG] summarize_and_explain_node: 摘要生成完成")
+        if history and history_id:
+            history.record_artifact("summary", summary, paper_id=history_id)
         return {**state, "summary": summary}
     except Exception as e:
         print(f"[DEBUG] summarize_and_explain_node 执行失败: {str(e)}")
         return {**state, "summary": f"生成摘要时发生错误: {str(e)}"}
 
+def deduplicate_results_node(state: AgentState, tools: AcademicTools) -> AgentState:
+    """近似重复文献合并节点"""
+    print("[DEBUG] 进入 deduplicate_results_node")
+    literature_results = state.get("literature_results")
+
+    if not literature_results or len(literature_results) < 2:
+        return state
+
+    try:
+        results = tools.deduplicate_papers(literature_results)
+        print(f"[DEBUG] deduplicate_results_node: 保留 {len(results)} 篇文献")
+        return {**state, "literature_results": results}
+    except Exception as e:
+        print(f"[DEBUG] deduplicate_results_node 执行失败: {str(e)}")
+        return state
+
 def check_citation_validity_node(state: AgentState, tools: AcademicTools) -> AgentState:
     """引用与元数据验证节点"""
     print("[DEBUG] 进入 check_citation_validity_node")
-    # TODO: 实现引用验证逻辑
-    # 当前不做实际验证，直接返回状态
-    print("[DEBUG] check_citation_validity_node: 引用验证（待实现）")
+    literature_results = state.get("literature_results")
+
+    if not literature_results:
+        print("[DEBUG] check_citation_validity_node: 没有需要验证的文献")
+        return {**state, "citation_validation": []}
+
+    try:
+        # 整个结果列表在一次批量查询中完成校验
+        reports = tools.validate_citations(literature_results)
+        annotated = [{**paper, "validation": report} for paper, report in zip(literature_results, reports)]
+        invalid = sum(1 for report in reports if not report["valid"])
+        print(f"[DEBUG] check_citation_validity_node: 校验 {len(reports)} 篇文献，{invalid} 篇存在问题")
+        return {**state, "literature_results": annotated, "citation_validation": reports}
+    except Exception as e:
+        print(f"[DEBUG] check_citation_validity_node 执行失败: {str(e)}")
+        return {**state, "citation_validation": []}
+
+def rank_results_node(state: AgentState, tools: AcademicTools) -> AgentState:
+    """按引用图（PageRank / 共被引）重排检索结果；BibTeX 和 PDF 解析结果保持原顺序"""
+    literature_results = state.get("literature_results")
+    if state.get("task_type") != "search" or not literature_results or len(literature_results) < 2:
+        return state
+    ranked = tools.rank_by_citations(literature_results)
+    if ranked is literature_results:
+        return state
+    # citation_validation 与 literature_results 一一对应，需要按同样的顺序重排
+    reports = [paper.get("validation") for paper in ranked]
+    print(f"[DEBUG] rank_results_node: 按引用图重排 {len(ranked)} 篇文献")
+    return {**state, "literature_results": ranked,
+            "citation_validation": reports if all(r is not None for r in reports) else state.get("citation_validation")}
+
+def cluster_results_node(state: AgentState, tools: AcademicTools) -> AgentState:
+    """文献较多时按主题聚类，每篇文献标注 topic_cluster，聚类及标签写入 topic_clusters"""
+    literature_results = state.get("literature_results")
+    if not literature_results or len(literature_results) < tools.topic_cluster_min_results:
+        return {**state, "topic_clusters": None}
+    clusters = tools.cluster_papers(literature_results)
+    if not clusters:
+        return {**state, "topic_clusters": None}
+    labels = {index: cluster["id"] for cluster in clusters for index in cluster["indices"]}
+    annotated = [{**paper, "topic_cluster": labels.get(i)} for i, paper in enumerate(literature_results)]
+    return {**state, "literature_results": annotated, "topic_clusters": clusters}
+
+def record_history_node(state: AgentState, tools: AcademicTools) -> AgentState:
+    """把新的文献结果集写入本地历史库，并为每篇文献标注历史编号 history_id"""
+    literature_results = state.get("literature_results")
+    history = tools.history()
+    # 没有新文献（例如 PDF 中没有参考文献、沿用了之前的列表）时不重复记录
+    if not history or not literature_results or all(p.get("history_id") for p in literature_results):
+        return state
+    try:
+        query = state.get("search_query") if state.get("task_type") == "search" else state.get("pdf_path")
+        saved = history.record_results(state.get("task_type") or "unknown", literature_results, query)
+        annotated = [{**paper, "history_id": paper_id} for paper, paper_id in zip(literature_results, saved["paper_ids"])]
+        print(f"[DEBUG] record_history_node: 结果集 s{saved['set_id']} 已保存 {len(annotated)} 篇文献")
+        return {**state, "literature_results": annotated, "history_set_id": saved["set_id"]}
+    except Exception as e:
+        print(f"[DEBUG] record_history_node 执行失败: {str(e)}")
+        return state
+
+def prefetch_summaries_node(state: AgentState, tools: AcademicTools,
+                            prefetcher: SummaryPrefetcher | None = None) -> AgentState:
+    """检索结果确定后，在后台为排名靠前的文献预取详细摘要（未启用预取时直接返回）"""
+    if prefetcher and state.get("literature_results"):
+        prefetcher.schedule(state["literature_results"])
     return state
 
 def polish_writing_node(state: AgentState, tools: AcademicTools) -> AgentState:
@@ -130,37 +280,94 @@ def polish_writing_node(state: AgentState, tools: AcademicTools) -> AgentState:
         print(f"[DEBUG] polish_writing_node 执行失败: {str(e)}")
         return {**state, "polished_text": f"文本润色失败: {str(e)}"}
 
+def load_data_node(state: AgentState, tools: AcademicTools) -> AgentState:
+    """数据加载节点：内存映射读取数据文件，供 analyze_data 使用"""
+    print("[DEBUG] 进入 load_data_node")
+    data_path = state.get("data_path")
+    options = dict(state.get("data_options") or {})
+
+    if not data_path:
+        print("[DEBUG] load_data_node: 缺少数据文件路径")
+        return {**state, "dataset": None}
+    if options.pop("streaming", False):
+        # 超出内存的文件交给 analyze_data 按块流式计算
+        print("[DEBUG] load_data_node: 使用流式分析，跳过加载")
+        return {**state, "dataset": None}
+
+    # 回归分析且未指定列时，只加载用到的列
+    analysis_options = state.get("analysis_options") or {}
+    if not options.get("columns") and analysis_options.get("targets") and analysis_options.get("features"):
+        options["columns"] = list(analysis_options["features"]) + list(analysis_options["targets"])
+
+    try:
+        dataset = tools.load_data(data_path, **options)
+        return {**state, "dataset": dataset}
+    except Exception as e:
+        print(f"[DEBUG] load_data_node 执行失败: {str(e)}")
+        return {**state, "dataset": None}
+
 def analyze_data_node(state: AgentState, tools: AcademicTools) -> AgentState:
     """数据解析节点"""
     print("[DEBUG] 进入 analyze_data_node")
-    # TODO: 实现数据分析逻辑
-    print("[DEBUG] analyze_data_node: 数据分析（待实现）")
-    # 目前没有实际数据和分析逻辑，直接返回状态
-    return state # {**state, "analysis_results": "数据分析功能待实现"}
+    data_path = state.get("data_path")
+    analysis_type = state.get("analysis_type") or "descriptive"
+    options = state.get("analysis_options") or {}
+
+    dataset = state.get("dataset")
+
+    if dataset is None and not data_path:
+        print("[DEBUG] analyze_data_node: 缺少数据文件路径")
+        return {**state, "analysis_results": {}}
+
+    try:
+        # 调用 AcademicTools 中的 analyze_data 方法（未加载数据时按路径流式读取）
+        results = tools.analyze_data(dataset if dataset is not None else data_path, analysis_type, **options)
+        print(f"[DEBUG] analyze_data_node: {analysis_type} 分析完成")
+        return {**state, "analysis_results": results}
+    except Exception as e:
+        print(f"[DEBUG] analyze_data_node 执行失败: {str(e)}")
+        return {**state, "analysis_results": {"error": f"数据分析失败: {str(e)}"}}
 
 def generate_references_node(state: AgentState, tools: AcademicTools) -> AgentState:
     """格式化引用节点"""
     print("[DEBUG] 进入 generate_references_node")
-    literature_results = state.get("literature_results")
+    literature_results = state.get("literature_results") or []
     paper_index = state.get("paper_to_cite_index")
-    style = state.get("citation_style", "apa")
-    
-    if literature_results is None or paper_index is None or paper_index < 0 or paper_index >= len(literature_results):
+    style = state.get("citation_style") or "apa"
+    export_path = state.get("citation_export_path")
+
+    # paper_to_cite_index 可以是单个索引或索引列表；指定导出路径且未给索引时导出全部文献
+    if paper_index is None:
+        indices = list(range(len(literature_results))) if export_path else []
+    elif isinstance(paper_index, int):
+        indices = [paper_index]
+    else:
+        indices = list(paper_index)
+
+    if not indices or any(i < 0 or i >= len(literature_results) for i in indices):
          print("[DEBUG] generate_references_node: 无效的文献索引或搜索结果")
          return {**state, "citations": ["无法生成引用，请先进行文献搜索或提供有效的文献信息。"]}
          
     try:
-        paper_to_cite = literature_results[paper_index]
-        # 调用 AcademicTools 中的 generate_reference 方法
-        citation = tools.generate_reference(paper_to_cite, style)
+        papers_to_cite = [literature_results[i] for i in indices]
+        if export_path:
+            count = tools.export_references(papers_to_cite, export_path, style)
+            print("[DEBUG] generate_references_node: 引用导出完成")
+            return {**state, "citations": [f"已将 {count} 条引用导出到 {export_path}"]}
+        # 调用 AcademicTools 中的 generate_references 方法批量格式化
+        citations = tools.generate_references(papers_to_cite, style)
         print("[DEBUG] generate_references_node: 引用生成完成")
-        return {**state, "citations": [citation]}
+        history = tools.history()
+        if history:
+            for paper, citation in zip(papers_to_cite, citations):
+                history.record_artifact("citation", citation, paper_id=paper.get("history_id"), style=style)
+        return {**state, "citations": citations}
     except Exception as e:
         print(f"[DEBUG] generate_references_node 执行失败: {str(e)}")
         return {**state, "citations": [f"生成引用时发生错误: {str(e)}"]}
 
 def parse_pdf_node(state: AgentState, tools: AcademicTools) -> AgentState:
-    """解析 PDF 文件节点"""
+    """解析 PDF 文件节点：提取章节内容，并把参考文献列表作为 literature_results 供后续引用和总结"""
     print("[DEBUG] 进入 parse_pdf_node")
     pdf_path = state.get("pdf_path")
     
@@ -169,10 +376,14 @@ def parse_pdf_node(state: AgentState, tools: AcademicTools) -> AgentState:
         return {**state, "pdf_sections": {}}
         
     try:
+        # 本地解析参考文献列表（没有参考文献时保留之前的文献结果）
+        references = tools.extract_pdf_references(pdf_path)
+        tools.add_citations(pdf_path, references)
+        literature_results = references or state.get("literature_results") or []
         # 调用 AcademicTools 中的 PDF 解析方法
         sections = tools.extract_pdf_sections(pdf_path)
         print(f"[DEBUG] parse_pdf_node: 成功提取 {len(sections)} 个章节")
-        return {**state, "pdf_sections": sections}
+        return {**state, "pdf_sections": sections, "literature_results": literature_results}
     except Exception as e:
         print(f"[DEBUG] parse_pdf_node 执行失败: {str(e)}")
         return {**state, "pdf_sections": {}}
@@ -190,6 +401,9 @@ def analyze_pdf_node(state: AgentState, tools: AcademicTools) -> AgentState:
         # 调用 AcademicTools 中的 PDF 分析方法
         analysis = tools.analyze_pdf_content(pdf_path)
         print("[DEBUG] analyze_pdf_node: 成功分析 PDF 内容")
+        history = tools.history()
+        if history and analysis:
+            history.record_artifact("pdf_analysis", analysis, source=os.path.abspath(pdf_path))
         return {**state, "pdf_analysis": analysis}
     except Exception as e:
         print(f"[DEBUG] analyze_pdf_node 执行失败: {str(e)}")
@@ -206,6 +420,8 @@ def route_by_task_type(state: AgentState) -> dict:
             return {"next": "scholarly_search"}
         elif search_method == "qwen":
             return {"next": "qwen_search"}
+        elif search_method == "local":
+            return {"next": "local_search"}
         else:
             print("[DEBUG] 未知或未指定搜索方法，路由到 scholarly_search")
             return {"next": "scholarly_search"} # 默认使用 scholarly
@@ -230,29 +446,47 @@ def route_by_task_type(state: AgentState) -> dict:
     elif task_type == "writing":
         return {"next": "polish_writing"}
     elif task_type == "analysis":
-        return {"next": "analyze_data"}
+        return {"next": "load_data"}
     else:
         print("[DEBUG] 未知任务类型，结束工作流")
         return {"next": "__END__"}
 
 # 创建工作流图
-def create_academic_workflow() -> Graph:
+def create_academic_workflow(speculative_top_k: int | None = None, tools: AcademicTools | None = None) -> Graph:
+    """创建工作流
+
+    Args:
+        speculative_top_k: 每次检索后在后台预取摘要的文献数，默认读取 SPECULATIVE_SUMMARY_TOP_K（0 表示不预取）
+        tools: 节点使用的工具实例，调用方需要同一份缓存、预取器和模型健康状态时传入；默认新建
+    """
     # 创建工作流
     workflow = StateGraph(AgentState)
     
     # 实例化工具
-    tools = AcademicTools()
+    tools = tools or AcademicTools()
+    if speculative_top_k is None:
+        speculative_top_k = int(os.getenv('SPECULATIVE_SUMMARY_TOP_K', '0'))
+    # 预取器与工作流实例绑定，即每个会话一份摘要缓存
+    prefetcher = SummaryPrefetcher(tools, top_k=speculative_top_k) if speculative_top_k > 0 else None
     
     # 添加节点，并绑定工具
     workflow.add_node("route_by_task_type", route_by_task_type)  # 注册路由节点
-    workflow.add_node("scholarly_search", lambda state: scholarly_search_node(state, tools))
-    workflow.add_node("qwen_search", lambda state: qwen_search_node(state, tools))
+    # 检索节点声明 writer 参数，LangGraph 会注入 StreamWriter 用于流式发出检索结果
+    workflow.add_node("scholarly_search", lambda state, writer: scholarly_search_node(state, tools, writer, prefetcher))
+    workflow.add_node("qwen_search", lambda state, writer: qwen_search_node(state, tools, writer, prefetcher))
+    workflow.add_node("local_search", lambda state, writer: local_search_node(state, tools, writer, prefetcher))
     workflow.add_node("parse_bibtex", lambda state: parse_bibtex_node(state, tools))
     workflow.add_node("parse_pdf", lambda state: parse_pdf_node(state, tools)) # 添加 PDF 解析节点
     workflow.add_node("analyze_pdf", lambda state: analyze_pdf_node(state, tools)) # 添加 PDF 分析节点
-    workflow.add_node("summarize_and_explain", lambda state: summarize_and_explain_node(state, tools))
+    workflow.add_node("summarize_and_explain", lambda state: summarize_and_explain_node(state, tools, prefetcher))
+    workflow.add_node("rank_results", lambda state: rank_results_node(state, tools))
+    workflow.add_node("cluster_results", lambda state: cluster_results_node(state, tools))
+    workflow.add_node("record_history", lambda state: record_history_node(state, tools))
+    workflow.add_node("prefetch_summaries", lambda state: prefetch_summaries_node(state, tools, prefetcher))
+    workflow.add_node("deduplicate_results", lambda state: deduplicate_results_node(state, tools))
     workflow.add_node("check_citation_validity", lambda state: check_citation_validity_node(state, tools))
     workflow.add_node("polish_writing", lambda state: polish_writing_node(state, tools))
+    workflow.add_node("load_data", lambda state: load_data_node(state, tools))
     workflow.add_node("analyze_data", lambda state: analyze_data_node(state, tools))
     workflow.add_node("generate_references", lambda state: generate_references_node(state, tools))
     workflow.add_node("__END__", lambda state: state)  # 注册结束节点
@@ -267,26 +501,34 @@ def create_academic_workflow() -> Graph:
         {
             "scholarly_search": "scholarly_search",
             "qwen_search": "qwen_search",
+            "local_search": "local_search",
             "parse_bibtex": "parse_bibtex",
             "parse_pdf": "parse_pdf", # 添加 PDF 解析路由
             "analyze_pdf": "analyze_pdf", # 添加 PDF 分析路由
             "summarize_and_explain": "summarize_and_explain",
             "polish_writing": "polish_writing",
-            "analyze_data": "analyze_data",
+            "load_data": "load_data",
             "generate_references": "generate_references",
             "__END__": "__END__"
         }
     )
     
-    # 添加各任务节点完成后的路由
-    workflow.add_edge("scholarly_search", "__END__")
-    workflow.add_edge("qwen_search", "__END__")
-    workflow.add_edge("parse_bibtex", "__END__")
-    workflow.add_edge("parse_pdf", "__END__") # PDF 解析完成后结束
+    # 添加各任务节点完成后的路由（检索和 BibTeX 解析结果先去重，再经过元数据校验）
+    workflow.add_edge("scholarly_search", "deduplicate_results")
+    workflow.add_edge("qwen_search", "deduplicate_results")
+    workflow.add_edge("local_search", "deduplicate_results")
+    workflow.add_edge("parse_bibtex", "deduplicate_results")
+    workflow.add_edge("deduplicate_results", "check_citation_validity")
+    workflow.add_edge("parse_pdf", "deduplicate_results") # PDF 参考文献同样经过去重和校验
     workflow.add_edge("analyze_pdf", "__END__") # PDF 分析完成后结束
     workflow.add_edge("summarize_and_explain", "__END__")
-    workflow.add_edge("check_citation_validity", "__END__")
+    workflow.add_edge("check_citation_validity", "rank_results")
+    workflow.add_edge("rank_results", "cluster_results")
+    workflow.add_edge("cluster_results", "record_history")
+    workflow.add_edge("record_history", "prefetch_summaries")
+    workflow.add_edge("prefetch_summaries", "__END__")
     workflow.add_edge("polish_writing", "__END__")
+    workflow.add_edge("load_data", "analyze_data")
     workflow.add_edge("analyze_data", "__END__")
     workflow.add_edge("generate_references", "__END__")
     
@@ -1,18 +1,62 @@
 from scholarly import scholarly
 # from dashscope import Generation
 # import dashscope
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Iterable
 import pandas as pd
 import numpy as np
 import os
 from dotenv import load_dotenv
-from openai import OpenAI # 导入 OpenAI 客户端
+from openai import OpenAI, APIConnectionError, APITimeoutError, APIStatusError, RateLimitError # 导入 OpenAI 客户端
 import json # 添加导入 json 库
+import re
+import time
+from types import SimpleNamespace
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, as_completed, FIRST_COMPLETED
 import fitz  # PyMuPDF
+import citation_export
+from citation_validator import CitationValidator, ReferenceCatalog
+from dedup import deduplicate_papers
+from streaming_stats import streaming_describe
+from regression import regression_analysis, regression_analysis_file
+from data_loader import load_dataset
+from token_budget import TokenBudgetPlanner, estimate_message_tokens, estimate_tokens, split_to_tokens
+from json_stream import JSONArrayStream, parse_json_array
+from pdf_references import extract_references
+from llm_cache import ResultCache, content_key, default_cache_path
+from model_router import ModelRouter, tier_models, DEFAULT_DEADLINE
+from history_store import HistoryStore, default_history_path
+from local_index import LocalPaperIndex
+from citation_graph import CitationGraph, default_graph_path
+from topic_clusters import cluster_papers
+from llm_scheduler import (shared_scheduler, call_priority, current_priority, current_deadline, current_owner,
+                           SchedulerTimeout, Preempted)
+from hedging import LatencyTracker, run_hedged, CallCancelled, CallTimeout
+from token_ledger import shared_ledger, current_session, session_scope, bind_session, BudgetExceeded
 
 # 加载环境变量
 load_dotenv()
 
+# 长文本润色：超过该 token 数或包含多个段落时按段落并行润色，并按段落内容哈希缓存结果
+POLISH_DOCUMENT_TOKENS = 800
+# 单个润色单元的 token 上限，超长段落按句子切分
+POLISH_UNIT_TOKENS = 1500
+# 段落润色 prompt 的版本号，修改 prompt 后递增以使旧缓存失效
+POLISH_PROMPT_VERSION = 1
+# 标题、图表题注等短单元（无句末标点）不送去润色
+_HEADING_LIKE = re.compile(r'^[^\n]{0,40}(?<![。！？.!?；;，,:：])$')
+_PARAGRAPH_SPLIT = re.compile(r'(\n\s*\n)')
+# 调用被取消、超时或超出会话预算：原样抛给调用方，不换一种方式重试
+_INTERRUPTED = (CallCancelled, CallTimeout, SchedulerTimeout, Preempted, BudgetExceeded)
+# PDF 章节提取的 prompt
+PDF_SECTION_PROMPT = """
+                请从以下论文文本中提取 {keyword} 章节的内容。只返回该章节的文本，不要添加任何额外说明。
+                
+                论文文本：
+                {text}
+                """
+
+
 class AcademicTools:
     def __init__(self):
         # 从环境变量加载配置
@@ -23,158 +67,433 @@ class AcademicTools:
         self.model_name = os.getenv('QWEN_MODEL_NAME', 'qwen3-235b-a22b')
         self.temperature = float(os.getenv('QWEN_TEMPERATURE', '0.5'))
         self.max_tokens = int(os.getenv('QWEN_MAX_TOKENS', '16384'))
+        # 本地参考目录（Crossref/OpenAlex 转储导入后的 SQLite 索引），未配置时只做本地语法检查
+        self.reference_catalog_path = os.getenv('REFERENCE_CATALOG_DB')
+        self._citation_validator = None
+        # 离线文献检索索引（arXiv / OpenAlex 快照导入后的 SQLite 索引，见 local_index.py）
+        self.local_index_path = os.getenv('LOCAL_INDEX_DB')
+        self._local_index = None
+        # 按任务规划 prompt 长度和输出上限（替代固定的字符截断和 max_tokens）
+        self.budget = TokenBudgetPlanner(max_completion=self.max_tokens)
+        # 按任务档位选择模型，主模型变慢或出错时自动切换到同档位的后备模型
+        self.router = ModelRouter(tier_models(self.model_name), self.model_name)
+        # 所有模型调用经中央调度器领取名额：用户交互优先，后台预取和批处理只占用剩余配额
+        self.scheduler = shared_scheduler()
+        # 单次调用在工作线程中执行：超过任务截止时间放弃等待，超过该任务近期 p95 耗时时发送对冲请求，Ctrl-C 可取消
+        self.latency = LatencyTracker()
+        self.hedging = os.getenv('LLM_HEDGING', 'on').lower() != 'off'
+        self._call_pool = ThreadPoolExecutor(max_workers=32, thread_name_prefix='llm-call')
+        # 按会话记录每次调用的 token 用量并执行会话预算（预算将用完时先降级模型和输出长度，再拒绝调用）
+        self.ledger = shared_ledger()
         
         # 初始化 OpenAI 客户端，指向 DashScope 兼容模式
         self.client = OpenAI(
             api_key=self.api_key,
-            base_url="https://dashscope.aliyuncs.com/compatible-mode/v1"
+            base_url="https://dashscope.aliyuncs.com/compatible-mode/v1",
+            timeout=DEFAULT_DEADLINE
         )
+
+        # 线程本地状态：记录本线程最近一次调用的 token 用量（批处理任务并发调用时互不干扰）
+        self._local = threading.local()
+        # 联网搜索是否请求 JSON 模式输出（接口不支持时自动关闭）
+        self._search_json_mode = True
+        # 模型结果缓存（段落润色等），首次使用时打开
+        self.llm_cache_path = default_cache_path()
+        self._result_cache = None
+        self.last_polish_stats: Dict[str, int] = {}
+        # 本地历史库（结果集、摘要、引用、PDF 分析），HISTORY_DB=off 时不记录
+        self.history_path = default_history_path()
+        self._history = None
+        # 引用图（PDF 参考文献和 BibTeX crossref 构成），用于按 PageRank / 共被引重排检索结果
+        self.citation_graph_path = default_graph_path()
+        self.citation_rank_method = os.getenv('CITATION_RANK_METHOD', 'pagerank')
+        self._citation_graph = None
+        self._citation_graph_lock = threading.Lock()
+        # 文献数达到该值时按主题聚类（哈希 TF-IDF + 小批量 k-means，不调用模型）
+        self.topic_cluster_min_results = int(os.getenv('TOPIC_CLUSTER_MIN_RESULTS', '20'))
+
+    def _plan_request(self, task: Optional[str], kwargs: Dict[str, Any]) -> int:
+        """指定 task 且未显式传入 max_tokens 时，由 TokenBudgetPlanner 选择输出上限；返回 prompt 的本地估计"""
+        estimated = estimate_message_tokens(kwargs.get('messages', []))
+        if task and 'max_tokens' not in kwargs:
+            kwargs['max_tokens'] = self.budget.completion_limit(
+                task, int(estimated * self.budget.scale), kwargs.get('model') or self.router.primary(task))
+        return estimated
+
+    def _admit(self, kwargs: Dict[str, Any], estimated: int) -> Dict[str, Any]:
+        """检查当前会话的 token 预算并预留额度，需要降级时缩短 max_tokens；返回结算时用到的信息"""
+        session = current_session()
+        max_tokens, degraded, reserved = self.ledger.admit(
+            session, int(estimated * self.budget.scale), kwargs.get('max_tokens') or self.max_tokens)
+        if degraded:
+            kwargs['max_tokens'] = max_tokens
+        # open 为尚未结算的请求数：被放弃但仍在后台执行的请求结束前不归还预留额度
+        return {'session': session, 'reserved': reserved, 'degraded': degraded, 'open': 1,
+                'lock': threading.Lock()}
+
+    def _charge(self, charge: Dict[str, Any], task: Optional[str], priority: str, model: Optional[str],
+                usage: Any):
+        """把一个请求的 token 用量记入会话账本；没有用量信息（调用失败或流被提前关闭）时不记录。
+        同一次调用的最后一个请求结算时归还预留额度"""
+        with charge['lock']:
+            charge['open'] -= 1
+            reserved = charge['reserved'] if charge['open'] <= 0 else 0
+            charge['reserved'] -= reserved
+        if usage is None:
+            self.ledger.release(charge['session'], reserved)
+            return
+        self.ledger.record(charge['session'], task, model, priority,
+                           getattr(usage, 'prompt_tokens', 0) or 0, getattr(usage, 'completion_tokens', 0) or 0,
+                           reserved, charge['degraded'])
+
+    def _charge_discarded(self, charge: Dict[str, Any], task: Optional[str], priority: str, future):
+        """结果未被采用的请求（对冲落败、超时或取消后仍在执行）结束后照常计费，任务名记为 <task>/discarded"""
+        with charge['lock']:
+            charge['open'] += 1
+
+        def settle(done):
+            response, model = None, None
+            if not done.cancelled() and done.exception() is None:
+                response, _, model = done.result()
+            usage = getattr(response, 'usage', None)
+            if usage is None and response is not None:
+                # 被放弃的流式响应不再读取，关闭连接（服务端不再返回用量）
+                close = getattr(response, 'close', None)
+                if close:
+                    close()
+            self._charge(charge, f"{task or 'chat'}/discarded", priority, model, usage)
+        future.add_done_callback(settle)
+
+    def _record_usage(self, task: Optional[str], usage: Any, finish_reason: Optional[str],
+                      kwargs: Dict[str, Any], estimated: int):
+        """记录本次调用的 token 用量，并把实际输出长度反馈给规划器"""
+        if usage is None:
+            return
+        self._local.last_usage = {
+            'prompt_tokens': getattr(usage, 'prompt_tokens', 0) or 0,
+            'completion_tokens': getattr(usage, 'completion_tokens', 0) or 0,
+            'total_tokens': getattr(usage, 'total_tokens', 0) or 0
+        }
+        if task:
+            if finish_reason == 'length':
+                print(f"[DEBUG] {task} 输出达到 max_tokens={kwargs.get('max_tokens')} 被截断")
+            self.budget.observe(task, self._local.last_usage['completion_tokens'], finish_reason,
+                                self._local.last_usage['prompt_tokens'], estimated)
+
+    @staticmethod
+    def _should_fallback(error: Exception) -> bool:
+        """连接失败、超时、限流、服务端错误和模型不存在时切换后备模型；请求本身有误时直接抛出"""
+        if isinstance(error, (APIConnectionError, APITimeoutError, RateLimitError)):
+            return True
+        return isinstance(error, APIStatusError) and (error.status_code >= 500 or error.status_code == 404)
+
+    def _create(self, task: Optional[str], kwargs: Dict[str, Any], degraded: bool = False):
+        """调用 Chat Completions：未显式指定 model 时由 ModelRouter 选择（degraded 时用低一档的模型），失败时依次尝试后备模型"""
+        models = [kwargs['model']] if kwargs.get('model') else self.router.candidates(task, degraded)
+        for i, model in enumerate(models):
+            kwargs['model'] = model
+            start = time.monotonic()
+            try:
+                response = self.client.chat.completions.create(**kwargs)
+            except Exception as e:
+                if not self._should_fallback(e):
+                    raise
+                self.router.record(model, time.monotonic() - start, False)
+                if i == len(models) - 1:
+                    raise
+                print(f"[DEBUG] {task or 'chat'} 调用 {model} 失败，切换到 {models[i + 1]}: {str(e)}")
+                continue
+            return response, start
+        raise RuntimeError("没有可用的模型")
+
+    def _call(self, task: Optional[str], kwargs: Dict[str, Any], priority: str, generation: int,
+              hedge: bool = True, charge: Optional[Dict[str, Any]] = None):
+        """在工作线程中发出请求并等待：超过任务截止时间抛出 CallTimeout，被 cancel_inflight() 取消时抛出 CallCancelled；
+        超过该任务近期 p95 耗时仍未返回且调度器有空闲名额时，再发送一个相同的请求，采用先返回的结果。
+        结果未被采用的请求在后台结束后同样记入 charge 对应的会话账本"""
+        degraded = bool(charge and charge['degraded'])
+        timeout = kwargs.pop('timeout', None) or self.router.deadline(task)
+
+        def attempt():
+            attempt_kwargs = {**kwargs, 'timeout': timeout}
+            response, start = self._create(task, attempt_kwargs, degraded)
+            return response, start, attempt_kwargs['model']
+
+        started = time.monotonic()
+        hedge_after = self.latency.hedge_delay(task) if hedge and self.hedging else None
+        (response, start, model), hedged = run_hedged(
+            attempt, self._call_pool, timeout, hedge_after,
+            cancelled=lambda: self.scheduler.generation(priority) != generation,
+            acquire_hedge=lambda: self.scheduler.try_acquire(priority),
+            release_hedge=lambda: self.scheduler.release(priority),
+            on_discard=(lambda future: self._charge_discarded(charge, task, priority, future)) if charge else None)
+        if hedged:
+            print(f"[DEBUG] {task or 'chat'} 超过 {hedge_after:.1f} 秒未返回，采用对冲请求的结果")
+        kwargs['model'] = model
+        self.latency.record(task, time.monotonic() - started)
+        return response, start
+
+    def cancel_inflight(self) -> int:
+        """取消所有前台（interactive / normal）模型调用，返回受影响的调用数；会话状态不受影响"""
+        return self.scheduler.cancel_inflight()
+
+    def _chat(self, task: Optional[str] = None, **kwargs):
+        """统一的 Chat Completions 调用入口，并记录本次调用的 token 用量
+
+        未显式传入 model 时按任务档位路由（见 model_router），主模型失败时自动切换后备模型。
+        指定 task 且未显式传入 max_tokens 时，由 TokenBudgetPlanner 按该任务的输出长度分布选择输出上限，
+        调用结束后把实际用量反馈给规划器，并记入当前会话的 token 账本（会话预算将用完时降级或抛出 BudgetExceeded）。
+        """
+        self._local.last_usage = None
+        estimated = self._plan_request(task, kwargs)
+        charge = self._admit(kwargs, estimated)
+        priority = current_priority(task)
+        generation = self.scheduler.generation(priority)
+        try:
+            with self.scheduler.slot(priority, current_deadline(), current_owner()):
+                response, start = self._call(task, kwargs, priority, generation, charge=charge)
+        except BaseException:
+            self._charge(charge, task, priority, kwargs.get('model'), None)
+            raise
+        self.router.record(kwargs['model'], time.monotonic() - start, True)
+        choices = getattr(response, 'choices', None) or []
+        finish_reason = getattr(choices[0], 'finish_reason', None) if choices else None
+        self._charge(charge, task, priority, kwargs.get('model'), getattr(response, 'usage', None))
+        self._record_usage(task, getattr(response, 'usage', None), finish_reason, kwargs, estimated)
+        return response
+
+    def _chat_stream(self, task: Optional[str] = None, **kwargs):
+        """流式版本的 _chat：逐段产出回复文本，流结束后记录 token 用量"""
+        self._local.last_usage = None
+        estimated = self._plan_request(task, kwargs)
+        charge = self._admit(kwargs, estimated)
+        kwargs['stream'] = True
+        kwargs.setdefault('stream_options', {"include_usage": True})
+        # 流式调用在整个读取过程中占用调度名额
+        priority = current_priority(task)
+        generation = self.scheduler.generation(priority)
+        try:
+            self.scheduler.acquire(priority, current_deadline(), current_owner())
+        except BaseException:
+            self._charge(charge, task, priority, kwargs.get('model'), None)
+            raise
+        try:
+            # 流式调用不对冲（已经开始输出的流无法切换），截止时间同时作为读取每个分块的超时
+            response, start = self._call(task, kwargs, priority, generation, hedge=False, charge=charge)
+        except BaseException:
+            self.scheduler.release(priority)
+            self._charge(charge, task, priority, kwargs.get('model'), None)
+            raise
+        usage, finish_reason = None, None
+        received = []
+        try:
+            for chunk in response:
+                if self.scheduler.generation(priority) != generation:
+                    raise CallCancelled("模型调用已取消")
+                usage = getattr(chunk, 'usage', None) or usage
+                for choice in getattr(chunk, 'choices', None) or []:
+                    finish_reason = getattr(choice, 'finish_reason', None) or finish_reason
+                    content = getattr(choice.delta, 'content', None)
+                    if content:
+                        received.append(content)
+                        yield content
+        except GeneratorExit:
+            # 调用方够用后提前关闭：服务端不会再返回用量，按预留时的 prompt 估计和已收到的输出估算计费
+            if usage is None:
+                prompt_tokens = int(estimated * self.budget.scale)
+                completion_tokens = estimate_tokens(''.join(received))
+                usage = SimpleNamespace(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens,
+                                        total_tokens=prompt_tokens + completion_tokens)
+                # 估算值不反馈给输出长度规划器（输出被截短，会拉低分布）
+                self._local.last_usage = vars(usage).copy()
+            self.router.record(kwargs['model'], time.monotonic() - start, True)
+            raise
+        except Exception as e:
+            if self._should_fallback(e):
+                self.router.record(kwargs['model'], time.monotonic() - start, False)
+            raise
+        finally:
+            # 调用方提前停止读取时关闭底层连接
+            close = getattr(response, 'close', None)
+            if close:
+                close()
+            self.scheduler.release(priority)
+            # 正常结束、出错或提前关闭都在这里结算 token（出错且没有收到用量时只归还预留额度）
+            self._charge(charge, task, priority, kwargs.get('model'), usage)
+        self.router.record(kwargs['model'], time.monotonic() - start, True)
+        self._record_usage(task, usage, finish_reason, kwargs, estimated)
+
+    @staticmethod
+    def priority(priority: str, timeout: Optional[float] = None):
+        """为当前上下文内的模型调用指定优先级（interactive / normal / background）和最长排队时间，用作 with 语句"""
+        return call_priority(priority, timeout)
+
+    @staticmethod
+    def session(session_id: str):
+        """把当前上下文内模型调用的 token 用量记到指定会话（按会话统计和执行预算），用作 with 语句"""
+        return session_scope(session_id)
+
+    def usage_report(self, session: Optional[str] = None) -> Dict[str, Any]:
+        """当前（或指定）会话的 token 用量汇总，没有记录时返回空汇总"""
+        session = session or current_session()
+        try:
+            report = self.ledger.report(session)
+        except Exception as e:
+            print(f"[DEBUG] 读取 token 账本时出错: {str(e)}")
+            report = []
+        return report[0] if report else {'session': session, 'calls': 0, 'total_tokens': 0,
+                                          'budget': self.ledger.budget(session)}
+
+    def last_usage(self) -> Optional[Dict[str, int]]:
+        """返回当前线程最近一次 API 调用的 token 用量，没有可用信息时返回 None"""
+        return getattr(self._local, 'last_usage', None)
     
     def search_papers(self, query: str, max_results: int = 5) -> List[Dict[str, Any]]:
         """搜索学术论文并生成友好摘要"""
         results = []
         try:
-            # 1. 使用 scholarly 进行谷歌学术搜索
-            print(f"[DEBUG] 使用 scholarly 搜索: {query}")
-            search_query = scholarly.search_pubs(query)
-            
-            scholarly_results = []
-            for _ in range(max_results):
+            for event in self.iter_search_papers(query, max_results):
+                # 摘要事件直接更新同一个文献字典，这里只需收集文献
+                if event['event'] == 'paper':
+                    results.append(event['paper'])
+            return results
+                
+        except Exception as e:
+            print(f"[DEBUG] 搜索论文时发生错误: {str(e)}")
+            return []
+
+    def iter_search_papers(self, query: str, max_results: int = 5, summary_workers: int = 4):
+        """流式的 scholarly 搜索：每拿到一条检索结果立即产出，友好摘要在后台并发生成，完成后再产出
+
+        产出的事件：
+            {'event': 'paper', 'index': i, 'paper': {...}}：第 i 篇文献的元数据
+            {'event': 'summary', 'index': i, 'friendly_summary': '...'}：第 i 篇文献的友好摘要（同时写入 paper 字典）
+        """
+        # 1. 使用 scholarly 进行谷歌学术搜索
+        print(f"[DEBUG] 使用 scholarly 搜索: {query}")
+        search_query = scholarly.search_pubs(query)
+        papers = []
+        pending = {}
+
+        def finished(block: bool):
+            # 产出已完成的友好摘要；block 为 True 时等待全部完成
+            while pending:
+                done, _ = wait(list(pending), timeout=None if block else 0, return_when=FIRST_COMPLETED)
+                if not done:
+                    return
+                for future in done:
+                    index = pending.pop(future)
+                    summary = future.result()
+                    if summary is not None:
+                        papers[index]['friendly_summary'] = summary
+                        yield {'event': 'summary', 'index': index, 'friendly_summary': summary}
+
+        with ThreadPoolExecutor(max_workers=summary_workers) as executor:
+            for index in range(max_results):
                 try:
-                    paper = next(search_query)
-                    # 使用 get 方法安全地获取属性
-                    scholarly_results.append({
-                        'title': getattr(paper, 'bib', {}).get('title', ''),
-                        'authors': getattr(paper, 'bib', {}).get('author', ''),
-                        'year': getattr(paper, 'bib', {}).get('year', ''),
-                        'abstract': getattr(paper, 'bib', {}).get('abstract', ''),
-                        'url': getattr(paper, 'bib', {}).get('url', '')
-                    })
+                    hit = next(search_query)
                 except StopIteration:
                     break
-                    
-            print(f"[DEBUG] scholarly 找到 {len(scholarly_results)} 篇文献")
-                    
-            # 2. 使用 Qwen API 处理搜索结果，生成友好摘要
-            for paper in scholarly_results:
-                title = paper.get('title', '未知标题')
-                abstract = paper.get('abstract', '无摘要')
-                
-                # 如果没有摘要，跳过 Qwen 处理
-                if not abstract or abstract == '无摘要':
-                    results.append(paper)
-                    continue
-                    
-                prompt = f"""
-                请用一两句话概括以下论文的摘要，使其更易于快速理解。只返回概括性的句子，不要添加任何额外说明。
-                
-                论文标题: {title}
-                论文摘要: {abstract}
-                """
-                
-                messages = [
-                    {"role": "system", "content": "你是一个论文摘要精炼助手，请用简洁友好的语言概括提供的摘要。"},
-                    {"role": "user", "content": prompt}
-                ]
-                
-                try:
-                    response = self.client.chat.completions.create(
-                        model=self.model_name,
-                        messages=messages,
-                        temperature=0.3, # 较低温度以保持摘要准确性
-                        max_tokens=200, # 限制摘要长度
-                        extra_body={"enable_thinking": False}
-                    )
-                    
-                    friendly_summary = ""
-                    if response and response.choices and response.choices[0].message.content:
-                        friendly_summary = response.choices[0].message.content.strip()
-                        
-                    # 将友好摘要添加到结果中
-                    paper['friendly_summary'] = friendly_summary
-                    results.append(paper)
-                    
-                except Exception as e:
-                    print(f"[DEBUG] 使用 Qwen 生成友好摘要时出错: {str(e)}")
-                    # 如果出错，仍然添加原始文献信息
-                    results.append(paper)
+                # scholarly 返回的是字典（Publication），兼容带 bib 属性的旧版对象
+                bib = hit.get('bib', {}) if isinstance(hit, dict) else getattr(hit, 'bib', {})
+                paper = {
+                    'title': bib.get('title', ''),
+                    'authors': bib.get('author', ''),
+                    'year': bib.get('pub_year', bib.get('year', '')),
+                    'abstract': bib.get('abstract', ''),
+                    'url': (hit.get('pub_url', '') if isinstance(hit, dict) else '') or bib.get('url', '')
+                }
+                papers.append(paper)
+                yield {'event': 'paper', 'index': index, 'paper': paper}
 
-            return results
-                
+                # 2. 使用 Qwen API 生成友好摘要（没有摘要时跳过）
+                if paper['abstract'] and paper['abstract'] != '无摘要':
+                    pending[executor.submit(bind_session(self.friendly_summary), paper)] = index
+                yield from finished(block=False)
+
+            print(f"[DEBUG] scholarly 找到 {len(papers)} 篇文献")
+            yield from finished(block=True)
+
+    def friendly_summary(self, paper: Dict[str, Any]) -> Optional[str]:
+        """用一两句话概括论文摘要，出错时返回 None"""
+        title = paper.get('title', '未知标题')
+        abstract = paper.get('abstract', '无摘要')
+        prompt = f"""
+        请用一两句话概括以下论文的摘要，使其更易于快速理解。只返回概括性的句子，不要添加任何额外说明。
+        
+        论文标题: {title}
+        论文摘要: {abstract}
+        """
+        
+        messages = [
+            {"role": "system", "content": "你是一个论文摘要精炼助手，请用简洁友好的语言概括提供的摘要。"},
+            {"role": "user", "content": prompt}
+        ]
+        
+        try:
+            response = self._chat(
+                task='friendly_summary', # 输出上限由预算规划器按历史摘要长度决定
+                messages=messages,
+                temperature=0.3, # 较低温度以保持摘要准确性
+                extra_body={"enable_thinking": False}
+            )
+            
+            if response and response.choices and response.choices[0].message.content:
+                return response.choices[0].message.content.strip()
+            return ""
+            
         except Exception as e:
-            print(f"[DEBUG] 搜索论文时发生错误: {str(e)}")
+            print(f"[DEBUG] 使用 Qwen 生成友好摘要时出错: {str(e)}")
+            return None
+
+    def local_search_papers(self, query: str, max_results: int = 5, year_from: Optional[int] = None,
+                            year_to: Optional[int] = None) -> List[Dict[str, Any]]:
+        """在本地元数据快照索引中检索文献（完全离线，不生成友好摘要），未配置 LOCAL_INDEX_DB 时返回空列表
+
+        查询可带 title:/author:/abstract: 字段过滤和 year:2018-2020 年份范围。
+        """
+        if not self.local_index_path or not os.path.exists(self.local_index_path):
+            print("[DEBUG] 未配置本地检索索引（LOCAL_INDEX_DB）")
+            return []
+        try:
+            if self._local_index is None:
+                self._local_index = LocalPaperIndex(self.local_index_path)
+            papers = self._local_index.search(query, max_results, year_from, year_to)
+            print(f"[DEBUG] 本地索引找到 {len(papers)} 篇文献")
+            return papers
+        except Exception as e:
+            print(f"[DEBUG] 本地索引检索时发生错误: {str(e)}")
             return []
 
-    def qwen_search_papers(self, query: str, max_results: int = 5) -> List[Dict[str, Any]]:
-        """使用 Qwen 模型自带联网搜索功能搜索学术论文"""
-        results = []
+    def qwen_search_papers(self, query: str, max_results: int = 5, structured: bool = True) -> List[Dict[str, Any]]:
+        """使用 Qwen 模型自带联网搜索功能搜索学术论文
+
+        Args:
+            query: 搜索关键词
+            max_results: 最多返回的文献数
+            structured: True 时在联网搜索调用中直接要求 JSON 输出（一次调用）；False 时先搜索再单独转换为 JSON（两次调用）
+        """
         try:
+            if structured:
+                return list(self.iter_qwen_search_papers(query, max_results))
+
             print(f"[DEBUG] 使用 Qwen 联网搜索: {query}")
             messages = [
                 {"role": "system", "content": "你是一个帮助用户搜索学术论文的助手，请根据用户的搜索请求利用你的联网能力查找相关文献。"},
                 {"role": "user", "content": f"请帮我搜索关于\"{query}\"的学术论文。请提供找到的文献的标题、作者、发表年份、摘要和可能的链接。请尝试找到至少 {max_results} 篇相关文献。"}
             ]
             
-            response = self.client.chat.completions.create(
-                model="qwen-plus",  # 暂时固定为 qwen-plus 模型
+            response = self._chat(
+                task='search',
                 messages=messages,
                 temperature=0.5,
-                max_tokens=8192,
                 extra_body={"enable_search": True, "enable_thinking": False}  # 确保 enable_thinking 为 False
             )
             
             if response and response.choices and response.choices[0].message.content:
                 raw_content = response.choices[0].message.content
                 print(f"[DEBUG] Qwen 联网搜索原始返回内容: {raw_content[:500]}...")
-                
-                # 尝试提示模型以 JSON 格式返回，并解析
-                prompt_for_json = f"""
-                请根据您刚才关于\"{query}\"的联网搜索结果，将找到的文献信息 정리하여 以 JSON 数组格式返回。每个对象包含以下字段：title, authors (作者列表), year, abstract, url (如果可用)。如果找不到文献，返回空数组 []。
-                """
-                
-                messages_for_json = [
-                     {"role": "system", "content": "你是一个学术文献信息提取助手，请将提供的文本中的文献信息转化为指定的 JSON 格式。"},
-                     {"role": "user", "content": f"原始搜索结果:\n{raw_content}\n\n请将其转换为 JSON 数组格式，字段包括 title, authors, year, abstract, url。"}
-                ]
-                
-                try:
-                    response_json = self.client.chat.completions.create(
-                        model=self.model_name,
-                        messages=messages_for_json,
-                        temperature=0.1,
-                        max_tokens=self.max_tokens,
-                        extra_body={"enable_thinking": False}
-                    )
-                    
-                    if response_json and response_json.choices and response_json.choices[0].message.content:
-                        json_text = response_json.choices[0].message.content.strip()
-                        # 清理可能的Markdown代码块
-                        if json_text.startswith('```json'):
-                             json_text = json_text[len('```json'):].strip()
-                        if json_text.endswith('```'):
-                             json_text = json_text[:-len('```')].strip()
-                             
-                        parsed_results = json.loads(json_text)
-                        if isinstance(parsed_results, list):
-                             # 进一步处理结果，如生成 friendly_summary (可选)
-                             final_results = []
-                             for paper_info in parsed_results:
-                                 # 在这里可以添加生成 friendly_summary 的逻辑，或者在工作流后续步骤处理
-                                 final_results.append(paper_info)
-                             return final_results[:max_results]
-                        else:
-                             print(f"[DEBUG] Qwen 联网搜索 JSON 解析结果非列表: {parsed_results}")
-                             return []
-                    else:
-                         print("[DEBUG] Qwen 联网搜索 JSON 提取失败或返回为空")
-                         return []
-                         
-                except json.JSONDecodeError:
-                    print(f"[DEBUG] 无法解析 Qwen 联网搜索返回的 JSON 数据: {json_text}")
-                    return []
-                except Exception as json_e:
-                     print(f"[DEBUG] 处理 Qwen 联网搜索结果时发生错误: {str(json_e)}")
-                     return []
+                return self._papers_from_text(raw_content)[:max_results]
             else:
                 print("[DEBUG] Qwen 联网搜索 API 返回为空或格式不正确")
                 return []
@@ -183,6 +502,96 @@ class AcademicTools:
             print(f"[DEBUG] Qwen 联网搜索时发生错误: {str(e)}")
             return []
 
+    def iter_qwen_search_papers(self, query: str, max_results: int = 5):
+        """单次调用的结构化联网搜索：流式读取模型输出，每解析出一篇完整的文献就立即产出
+
+        模型被要求输出 {"papers": [...]}，回复由 JSONArrayStream 增量解析，可容忍代码块标记、
+        前后说明文字和被截断的数组。模型仍返回了非 JSON 文本时，退回用第二次调用转换格式。
+        """
+        print(f"[DEBUG] 使用 Qwen 结构化联网搜索: {query}")
+        messages = [
+            {"role": "system", "content": "你是一个帮助用户搜索学术论文的助手，请利用你的联网能力查找相关文献，并严格按照要求的 JSON 格式输出，不要输出任何其他文字。"},
+            {"role": "user", "content": f"""请帮我搜索关于\"{query}\"的学术论文，尽量找到 {max_results} 篇相关文献。
+请以 JSON 对象返回，格式如下：
+{{"papers": [{{"title": "标题", "authors": ["作者1", "作者2"], "year": "发表年份", "abstract": "摘要", "url": "链接，没有则为空字符串"}}]}}"""}
+        ]
+        request = dict(
+            task='search',
+            messages=messages,
+            temperature=0.5,
+            extra_body={"enable_search": True, "enable_thinking": False}
+        )
+        if self._search_json_mode:
+            request['response_format'] = {"type": "json_object"}
+
+        stream = JSONArrayStream()
+        raw_parts = []
+        count = 0
+        deltas = self._chat_stream(**request)
+        try:
+            for delta in deltas:
+                raw_parts.append(delta)
+                for paper in stream.feed(delta):
+                    if paper.get('title'):
+                        count += 1
+                        yield paper
+                        if count >= max_results:
+                            # 已经够数：关闭流，不再等待剩余输出
+                            deltas.close()
+                            return
+            for paper in stream.finish():
+                if paper.get('title'):
+                    print("[DEBUG] Qwen 结构化搜索输出被截断，已恢复最后一篇不完整的文献")
+                    count += 1
+                    yield paper
+        except _INTERRUPTED:
+            raise
+        except Exception as e:
+            if 'response_format' in request and not raw_parts and self._rejects_json_mode(e):
+                # 接口不支持联网搜索与 JSON 模式同时使用：关闭后重试一次
+                print(f"[DEBUG] Qwen 联网搜索不支持 JSON 模式，改用提示词约束: {str(e)}")
+                self._search_json_mode = False
+                yield from self.iter_qwen_search_papers(query, max_results)
+                return
+            print(f"[DEBUG] Qwen 结构化联网搜索时发生错误: {str(e)}")
+
+        raw_content = ''.join(raw_parts)
+        if count == 0 and raw_content.strip() and not stream.started:
+            print("[DEBUG] Qwen 联网搜索未返回 JSON，改用第二次调用转换格式")
+            yield from self._papers_from_text(raw_content)[:max_results]
+
+    @staticmethod
+    def _rejects_json_mode(error: Exception) -> bool:
+        """接口以 400 拒绝 response_format（或它与 enable_search 的组合）"""
+        message = str(getattr(error, 'message', '') or error).lower()
+        return (isinstance(error, APIStatusError) and error.status_code == 400
+                and any(word in message for word in ('response_format', 'enable_search', 'json_object')))
+
+    def _papers_from_text(self, raw_content: str) -> List[Dict[str, Any]]:
+        """将联网搜索返回的文字结果转换为文献列表（第二次模型调用，容错解析 JSON）"""
+        messages_for_json = [
+             {"role": "system", "content": "你是一个学术文献信息提取助手，请将提供的文本中的文献信息转化为指定的 JSON 格式。"},
+             {"role": "user", "content": f"原始搜索结果:\n{raw_content}\n\n请将其转换为 JSON 数组格式，字段包括 title, authors, year, abstract, url。"}
+        ]
+        try:
+            response_json = self._chat(
+                task='search_json', # 输出长度与原始搜索结果成正比
+                messages=messages_for_json,
+                temperature=0.1,
+                extra_body={"enable_thinking": False}
+            )
+            if response_json and response_json.choices and response_json.choices[0].message.content:
+                # 容忍 Markdown 代码块、前后说明文字和被截断的数组
+                papers = [p for p in parse_json_array(response_json.choices[0].message.content) if p.get('title')]
+                if not papers:
+                    print("[DEBUG] 无法从 Qwen 返回内容中解析出文献 JSON")
+                return papers
+            print("[DEBUG] Qwen 联网搜索 JSON 提取失败或返回为空")
+            return []
+        except Exception as json_e:
+            print(f"[DEBUG] 处理 Qwen 联网搜索结果时发生错误: {str(json_e)}")
+            return []
+
     def parse_bibtex(self, bibtex_string: str) -> List[Dict[str, Any]]:
         """解析 BibTeX 字符串，提取文献信息"""
         results = []
@@ -199,7 +608,8 @@ class AcademicTools:
                 # 提取常用字段，并进行一些基本的清理和格式化
                 title = entry.get('title', '').replace('{', '').replace('}', '')
                 authors_str = entry.get('author', '')
-                authors = [a.strip() for a in authors_str.replace('and', ',').split(',')] if authors_str else []
+                # BibTeX 作者以 " and " 分隔，逐个保留 "Last, First" 形式（不能按逗号拆分）
+                authors = [a.strip() for a in re.split(r'\s+and\s+', authors_str.replace('\n', ' ')) if a.strip()] if authors_str else []
                 year = entry.get('year', '')
                 abstract = entry.get('abstract', '').replace('{', '').replace('}', '')
                 # 尝试从多个字段获取 URL
@@ -212,6 +622,14 @@ class AcademicTools:
                     'year': year,
                     'abstract': abstract,
                     'url': url,
+                    'bibtex_key': entry.get('ID', ''), # 保留引用键，便于批处理任务断点续跑
+                    'entry_type': entry.get('ENTRYTYPE', ''),
+                    'journal': entry.get('journal', entry.get('booktitle', '')).replace('{', '').replace('}', ''),
+                    'volume': entry.get('volume', ''),
+                    'number': entry.get('number', ''),
+                    'pages': entry.get('pages', ''),
+                    'doi': entry.get('doi', ''),
+                    'crossref': entry.get('crossref', ''), # 交叉引用的条目键，用于构建引用图
                     'source_type': 'bibtex' # 标记来源
                 }
                 
@@ -227,14 +645,26 @@ class AcademicTools:
             print(f"[DEBUG] 解析 BibTeX 时出错: {str(e)}")
             return []
 
-    def summarize_paper(self, paper: Dict[str, Any]) -> str:
-        """生成论文摘要"""
+    def summarize_paper(self, paper: Dict[str, Any], strict: bool = False) -> str:
+        """生成论文摘要；失败时返回提示文本，strict=True 时改为抛出 RuntimeError
+        （批处理、预取等需要区分失败结果、不能把提示文本当作摘要保存的调用方使用）"""
+        summary, error = self._generate_summary(paper)
+        if summary is None:
+            if strict:
+                raise RuntimeError(error)
+            return error
+        return summary
+
+    def _generate_summary(self, paper: Dict[str, Any]) -> tuple:
+        """调用模型生成摘要，返回 (摘要, None)；失败时返回 (None, 提示文本)"""
         # 确保必要的字段存在
         title = paper.get('title', '未知标题')
         authors = paper.get('authors', '未知作者')
         year = paper.get('year', '未知年份')
         # 优先使用 friendly_summary，如果没有，再使用原始 abstract
         abstract = paper.get('friendly_summary', paper.get('abstract', '无摘要'))
+        abstract = self.budget.fit_text('summary', str(abstract), f"{title}{authors}{year}",
+                                        self.router.primary('summary'))
         
         prompt = f"""
         请对以下论文进行详细摘要：
@@ -256,37 +686,37 @@ class AcademicTools:
         ]
 
         try:
-            response = self.client.chat.completions.create(
-                model=self.model_name,
+            response = self._chat(
+                task='summary',
                 messages=messages,
                 temperature=self.temperature,
-                max_tokens=self.max_tokens,
                 extra_body={"enable_thinking": False}
             )
             if response and response.choices and response.choices[0].message.content:
-                return response.choices[0].message.content
+                return response.choices[0].message.content, None
             else:
                 print("[DEBUG] 无法生成摘要，Qwen API 返回为空或格式不正确")
-                return "无法生成摘要，请检查 API 响应"
+                return None, "无法生成摘要，请检查 API 响应"
         except Exception as e:
             print(f"[DEBUG] 生成摘要时出错: {str(e)}")
-            return "生成摘要时发生错误"
+            return None, "生成摘要时发生错误"
 
     def identify_intent(self, user_input: str) -> Dict[str, Any]:
         """识别用户输入意图并提取参数"""
         prompt = f"""
         你是一个负责理解用户关于学术研究意图的助手。请分析用户输入的文本，识别用户的意图以及任何相关的参数。支持的意图包括：
         - search: 搜索学术文献。参数：query (搜索关键词)。
-        - summarize: 总结指定文献。参数：paper_id (文献ID)。
+        - summarize: 总结指定文献。参数：paper_id (文献ID)，history_ref (可选，指向以前的结果：s5 表示第5个历史结果集，s5:3 表示其中第3篇，#12 表示历史文献编号，也可以是用于在历史中全文匹配的关键词)。
         - polish: 润色文本。参数：text (需要润色的文本)。
-        - analyze: 数据分析。参数：data_type (数据类型，如 descriptive)。
-        - cite: 生成文献引用。参数：paper_id (文献ID)，style (引用格式，apa或mla，默认为apa)。
+        - analyze: 数据分析。参数：data_type (分析类型：descriptive 或 regression)，data_path (数据文件路径，支持 csv/parquet/arrow/feather)，columns (可选，只加载的列名列表)，sample (可选，随机抽样行数)，targets (回归分析的响应变量列名列表)，features (可选，回归分析的自变量列名列表)，method (可选，ols/ridge/logistic)。
+        - cite: 生成文献引用。参数：paper_id (文献ID，可以是单个编号、"1,3,5-7" 这样的列表或 all)，style (引用格式：apa, mla, chicago, gbt7714, bibtex, ris, csl-json，默认为apa)，output_path (可选，导出引用的文件路径)，history_ref (可选，含义同 summarize)。
+        - history: 查看或检索历史记录。参数：query (可选，在历史文献中全文检索的关键词)。
         - help: 查看帮助信息。
         - exit: 退出程序。
         - unknown: 无法识别的意图。
 
         请以 JSON 格式返回结果，包含以下字段：
-        - intent: 识别到的意图（search, summarize, polish, analyze, cite, help, exit, unknown）。
+        - intent: 识别到的意图（search, summarize, polish, analyze, cite, history, help, exit, unknown）。
         - parameters: 一个字典，包含与意图相关的参数。如果意图没有参数，parameters 字段应为空字典 {{}}。
 
         用户输入：{user_input}
@@ -300,11 +730,10 @@ class AcademicTools:
         ]
         
         try:
-            response = self.client.chat.completions.create(
-                model=self.model_name,
+            response = self._chat(
+                task='intent', # 意图识别通常不需要很多 token
                 messages=messages,
                 temperature=0.2, # 使用较低的温度以获得更稳定的意图识别结果
-                max_tokens=200, # 限制 token 数，意图识别通常不需要很多 token
                 extra_body={"enable_thinking": False}
             )
             
@@ -336,12 +765,152 @@ class AcademicTools:
             return {"intent": "unknown", "parameters": {}}
 
     def check_citation(self, citation: Dict[str, Any]) -> bool:
-        """验证引用信息"""
-        required_fields = ['title', 'authors', 'year']
-        return all(field in citation and citation[field] for field in required_fields)
+        """验证引用信息（必填字段、DOI 语法、年份范围，以及与本地参考目录的一致性）"""
+        return self.validate_citations([citation])[0]['valid']
+
+    def deduplicate_papers(self, papers: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """合并近似重复的文献（大小写、花括号、预印本与正式版本等差异），每组保留一条代表记录"""
+        results = deduplicate_papers(papers)
+        if len(results) < len(papers):
+            print(f"[DEBUG] 去重: {len(papers)} 条文献合并为 {len(results)} 条")
+        return results
+
+    def cluster_papers(self, papers: List[Dict[str, Any]], n_clusters: Optional[int] = None) -> List[Dict[str, Any]]:
+        """按标题和摘要把文献聚成若干主题，返回 [{id, label, terms, size, indices}]（按规模从大到小），出错时返回空列表"""
+        try:
+            start = time.time()
+            result = cluster_papers(papers, n_clusters)
+            clusters = [{**cluster, 'label': ' / '.join(cluster['terms'][:3])} for cluster in result['clusters']]
+            print(f"[DEBUG] 主题聚类: {len(papers)} 篇文献分为 {len(clusters)} 组，用时 {time.time() - start:.2f} 秒")
+            return clusters
+        except Exception as e:
+            print(f"[DEBUG] 主题聚类时出错: {str(e)}")
+            return []
+
+    def validate_citations(self, papers: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """批量校验文献元数据，返回与输入一一对应的校验报告
+
+        每份报告包含 valid, errors, warnings, matched_by（'doi'/'title'/None）和 catalog_doi。
+        """
+        if self._citation_validator is None:
+            catalog = None
+            if self.reference_catalog_path and os.path.exists(self.reference_catalog_path):
+                catalog = ReferenceCatalog(self.reference_catalog_path)
+            self._citation_validator = CitationValidator(catalog)
+        return self._citation_validator.validate(papers)
+
+    def _cache(self) -> Optional[ResultCache]:
+        """打开模型结果缓存，失败时返回 None（不使用缓存）"""
+        if self._result_cache is None:
+            try:
+                self._result_cache = ResultCache(self.llm_cache_path)
+            except Exception as e:
+                print(f"[DEBUG] 打开结果缓存失败，本次不使用缓存: {str(e)}")
+                return None
+        return self._result_cache
+
+    def history(self) -> Optional[HistoryStore]:
+        """打开本地历史库；未启用或打开失败时返回 None"""
+        if self._history is None and self.history_path:
+            try:
+                self._history = HistoryStore(self.history_path)
+            except Exception as e:
+                print(f"[DEBUG] 打开历史库失败，本次不记录历史: {str(e)}")
+                self.history_path = None
+        return self._history
+
+    def citation_graph(self) -> Optional[CitationGraph]:
+        """加载引用图；未启用或加载失败时返回 None"""
+        if self._citation_graph is None and self.citation_graph_path:
+            try:
+                self._citation_graph = CitationGraph.load(self.citation_graph_path)
+            except Exception as e:
+                print(f"[DEBUG] 加载引用图失败，本次不使用引用图: {str(e)}")
+                self.citation_graph_path = None
+        return self._citation_graph
+
+    def add_citations(self, citing: Any, references: List[Dict[str, Any]]) -> int:
+        """把一篇文档（PDF 路径或文献记录）的参考文献加入引用图并保存，返回新增的边数"""
+        graph = self.citation_graph()
+        if graph is None or not references:
+            return 0
+        try:
+            with self._citation_graph_lock:
+                if isinstance(citing, str) and os.path.exists(citing):
+                    citing = f"pdf:{os.path.abspath(citing)}"
+                count = graph.add_citations(citing, references)
+                graph.save(self.citation_graph_path)
+            print(f"[DEBUG] 引用图新增 {count} 条边，共 {len(graph)} 个节点")
+            return count
+        except Exception as e:
+            print(f"[DEBUG] 更新引用图时出错: {str(e)}")
+            return 0
+
+    def add_bibtex_crossrefs(self, entries: List[Dict[str, Any]]) -> int:
+        """把 BibTeX 条目的 crossref 关系加入引用图并保存，返回新增的边数"""
+        graph = self.citation_graph()
+        if graph is None or not any(entry.get('crossref') for entry in entries):
+            return 0
+        try:
+            with self._citation_graph_lock:
+                count = graph.add_bibtex_crossrefs(entries)
+                graph.save(self.citation_graph_path)
+            print(f"[DEBUG] 引用图新增 {count} 条 crossref 边")
+            return count
+        except Exception as e:
+            print(f"[DEBUG] 更新引用图时出错: {str(e)}")
+            return 0
+
+    def update_citation_graph(self, remove: Iterable[Any] = (), documents: Iterable[tuple] = (),
+                              entries: Optional[List[Dict[str, Any]]] = None) -> Dict[str, int]:
+        """批量更新引用图并只保存一次（增量导入文件夹时使用）
+
+        Args:
+            remove: 需要删除全部引用关系的文档（已删除或将重新解析的文件）
+            documents: (citing, references) 序列，citing 为 PDF 路径或文献记录
+            entries: 需要加入 crossref 关系的 BibTeX 条目
+
+        Returns:
+            {'removed': 删除的边数, 'added': 新增的边数}
+        """
+        stats = {'removed': 0, 'added': 0}
+        graph = self.citation_graph()
+        if graph is None:
+            return stats
+        try:
+            with self._citation_graph_lock:
+                stats['removed'] = graph.remove_documents(remove)
+                for citing, references in documents:
+                    if isinstance(citing, str) and os.path.exists(citing):
+                        citing = f"pdf:{os.path.abspath(citing)}"
+                    if references:
+                        stats['added'] += graph.add_citations(citing, references)
+                if entries:
+                    stats['added'] += graph.add_bibtex_crossrefs(entries)
+                if stats['removed'] or stats['added']:
+                    graph.save(self.citation_graph_path)
+            print(f"[DEBUG] 引用图删除 {stats['removed']} 条边，新增 {stats['added']} 条边，共 {len(graph)} 个节点")
+        except Exception as e:
+            print(f"[DEBUG] 更新引用图时出错: {str(e)}")
+        return stats
+
+    def rank_by_citations(self, papers: List[Dict[str, Any]], method: Optional[str] = None) -> List[Dict[str, Any]]:
+        """按引用图得分（pagerank 或 cocitation）重排文献；引用图为空或未启用时原样返回"""
+        method = method or self.citation_rank_method
+        graph = self.citation_graph()
+        if graph is None or method == 'off' or not graph.n_edges:
+            return papers
+        try:
+            with self._citation_graph_lock:
+                return graph.rank_papers(papers, method)
+        except Exception as e:
+            print(f"[DEBUG] 引用图排序时出错: {str(e)}")
+            return papers
 
     def polish_text(self, text: str, target_language: str = 'zh') -> str:
-        """润色文本"""
+        """润色文本（长文本或多段落文本交给 polish_document 按段落并行润色）"""
+        if self.budget.count(text) > POLISH_DOCUMENT_TOKENS or len(_PARAGRAPH_SPLIT.split(text.strip())) > 1:
+            return self.polish_document(text, target_language)
         messages = [
             {"role": "system", "content": "你是一个学术写作助手，请对提供的文本进行润色和优化。"},
             {"role": "user", "content": f"""
@@ -356,11 +925,10 @@ class AcademicTools:
             """}
         ]
         try:
-            response = self.client.chat.completions.create(
-                model=self.model_name,
+            response = self._chat(
+                task='polish', # 输出上限随待润色文本长度变化
                 messages=messages,
                 temperature=self.temperature,
-                max_tokens=self.max_tokens,
                 extra_body={"enable_thinking": False}
             )
             if response and response.choices and response.choices[0].message.content:
@@ -371,31 +939,158 @@ class AcademicTools:
             print(f"润色文本时出错: {str(e)}")
             return "润色文本时发生错误"
 
-    def analyze_data(self, data: pd.DataFrame, analysis_type: str) -> Dict[str, Any]:
-        """数据分析"""
+    def _polish_units(self, text: str) -> List[str]:
+        """按空行切分段落（保留分隔符），超长段落再按句子切分；各单元拼接后与原文完全一致"""
+        units = []
+        for part in _PARAGRAPH_SPLIT.split(text):
+            if part and self.budget.count(part) > POLISH_UNIT_TOKENS:
+                units.extend(split_to_tokens(part, int(POLISH_UNIT_TOKENS / self.budget.scale)))
+            elif part:
+                units.append(part)
+        return units
+
+    def _polish_paragraph(self, paragraph: str, target_language: str) -> Optional[str]:
+        """润色单个段落，失败时返回 None"""
+        messages = [
+            {"role": "system", "content": "你是一个学术写作助手，请对提供的段落进行润色和优化。"},
+            {"role": "user", "content": f"""请对下面这一段学术文本进行润色和优化，要求：
+1. 保持学术严谨性和原意，不增删论点
+2. 提高语言流畅度，确保逻辑连贯
+3. 使用规范的学术用语，保留原有的引用标记和公式
+4. 只返回润色后的段落文本，不要添加任何说明
+
+待润色段落：
+{paragraph}"""}
+        ]
+        try:
+            response = self._chat(
+                task='polish',
+                messages=messages,
+                temperature=self.temperature,
+                extra_body={"enable_thinking": False}
+            )
+            if response and response.choices and response.choices[0].message.content:
+                return response.choices[0].message.content.strip()
+        except Exception as e:
+            print(f"润色段落时出错: {str(e)}")
+        return None
+
+    def polish_document(self, text: str, target_language: str = 'zh', max_workers: int = 4) -> str:
+        """按段落并行润色长文本，并按段落内容哈希增量复用润色结果
+
+        每个段落以 (模型, prompt 版本, 段落文本) 的哈希为键缓存在 ResultCache 中（prompt 不含目标语言，键中也不含），
+        重新润色修改过的论文章节时只有改动的段落会调用模型。标题等短单元和空白保持原样，
+        某个段落润色失败时保留原文（且不写入缓存）。
+
+        Args:
+            text: 待润色文本
+            target_language: 目标语言（与 polish_text 一致，目前不影响 prompt）
+            max_workers: 并发调用模型的线程数
+        """
+        units = self._polish_units(text)
+        results: List[Optional[str]] = [None] * len(units)
+        keys: Dict[int, str] = {}
+        for i, unit in enumerate(units):
+            core = unit.strip()
+            if not core or _HEADING_LIKE.match(core):
+                results[i] = unit
+            else:
+                keys[i] = content_key(self.router.primary('polish'), POLISH_PROMPT_VERSION, core)
+
+        cache = self._cache()
+        cached = cache.get_many('polish', list(keys.values())) if cache and keys else {}
+
+        def restore(unit: str, polished: str) -> str:
+            # 保留原单元首尾的空白，保证拼接后的段落结构不变
+            core = unit.strip()
+            start = unit.index(core)
+            return unit[:start] + polished + unit[start + len(core):]
+
+        pending = []
+        for i, key in keys.items():
+            if key in cached:
+                results[i] = restore(units[i], cached[key])
+            else:
+                pending.append(i)
+
+        failed = 0
+        if pending:
+            with ThreadPoolExecutor(max_workers=max(min(max_workers, len(pending)), 1)) as executor:
+                polish = bind_session(self._polish_paragraph)
+                futures = {executor.submit(polish, units[i].strip(), target_language): i for i in pending}
+                for future in as_completed(futures):
+                    i = futures[future]
+                    polished = future.result()
+                    if polished is None:
+                        failed += 1
+                        results[i] = units[i]
+                        continue
+                    results[i] = restore(units[i], polished)
+                    if cache:
+                        cache.put('polish', keys[i], polished)
+
+        self.last_polish_stats = {
+            'units': len(keys),
+            'cached': len(keys) - len(pending),
+            'polished': len(pending) - failed,
+            'failed': failed
+        }
+        print(f"[DEBUG] 段落润色: 共 {len(keys)} 段，缓存命中 {len(keys) - len(pending)} 段，"
+              f"调用模型 {len(pending)} 段，失败 {failed} 段")
+        return ''.join(results)
+
+    def load_data(self, path: str, columns: Optional[List[str]] = None, downcast: bool = False,
+                  sample: Optional[int] = None, sample_frac: Optional[float] = None, **kwargs) -> pd.DataFrame:
+        """加载 CSV/Parquet/Arrow 数据文件（内存映射 + 列投影，CSV 使用列式缓存），参数见 data_loader.load_dataset"""
+        return load_dataset(path, columns=columns, downcast=downcast, sample=sample, sample_frac=sample_frac, **kwargs)
+
+    def analyze_data(self, data: pd.DataFrame | str, analysis_type: str, chunk_size: int = 100000,
+                     workers: int = 1, targets: Optional[List[str]] = None, features: Optional[List[str]] = None,
+                     method: str = 'ols', alpha: float = 0.0) -> Dict[str, Any]:
+        """数据分析
+
+        Args:
+            data: 已加载的 DataFrame，或 CSV/Parquet 文件路径（按路径传入时分块流式计算，适合 GB 级文件）
+            analysis_type: 分析类型，descriptive 或 regression
+            chunk_size: 流式模式下每块的行数
+            workers: 流式模式下并行计算块统计量的线程数
+            targets: 回归分析的响应变量列名（可以多个，共享同一设计矩阵一次求解）
+            features: 回归分析的自变量列名，None 表示其余全部数值列
+            method: 回归方法，ols, ridge 或 logistic
+            alpha: 岭回归/逻辑回归的 L2 惩罚系数
+        """
         results = {}
         if analysis_type == 'descriptive':
+            if isinstance(data, str):
+                return streaming_describe(data, chunk_size=chunk_size, workers=workers)
+            # 非数值列不参与相关系数计算
             results['summary'] = data.describe().to_dict()
-            results['correlation'] = data.corr().to_dict()
+            results['correlation'] = data.corr(numeric_only=True).to_dict()
         elif analysis_type == 'regression':
-            # TODO: 实现回归分析
-            pass
+            if not targets:
+                raise ValueError("回归分析需要指定响应变量 targets")
+            if isinstance(data, str):
+                return regression_analysis_file(data, targets, features, method, alpha, chunk_size)
+            return regression_analysis(data, targets, features, method, alpha)
         return results
 
     def generate_reference(self, paper: Dict[str, Any], style: str = 'apa') -> str:
-        """生成格式化引用"""
-        # 确保必要的字段存在
-        authors = paper.get('authors', '未知作者')
-        year = paper.get('year', '未知年份')
-        title = paper.get('title', '未知标题')
-        journal = paper.get('journal', '')
-        
-        if style == 'apa':
-            return f"{authors} ({year}). {title}. {journal}"
-        elif style == 'mla':
-            return f"{authors}. \"{title}.\" {journal} {year}"
-        else:
-            return f"{authors} ({year}). {title}"
+        """生成格式化引用
+
+        支持的格式见 citation_export.SUPPORTED_STYLES（apa, mla, chicago, gbt7714, bibtex, ris, csl-json），
+        作者字段可以是字符串或列表。
+        """
+        return citation_export.format_reference(paper, style)
+
+    def generate_references(self, papers: List[Dict[str, Any]], style: str = 'apa') -> List[str]:
+        """批量生成格式化引用（样式模板只编译一次，BibTeX 等格式会为重复的引用键加后缀）"""
+        return citation_export.format_references(papers, style)
+
+    def export_references(self, papers: List[Dict[str, Any]], output_path: str, style: str = 'apa') -> int:
+        """将一批文献按指定格式流式导出到文件，返回导出的条数"""
+        count = citation_export.export_references(papers, output_path, style)
+        print(f"[DEBUG] 已导出 {count} 条 {style} 引用到 {output_path}")
+        return count
 
     def test_placeholder(self):
         """这是一个占位函数"""
@@ -456,6 +1151,18 @@ class AcademicTools:
                 'error': str(e)
             }
 
+    def extract_pdf_references(self, pdf_path: str) -> List[Dict[str, Any]]:
+        """按版面从 PDF 的参考文献章节中提取文献列表（本地解析，不调用模型），记录结构与 literature_results 相同"""
+        references = extract_references(pdf_path)
+        print(f"[DEBUG] 从 {os.path.basename(pdf_path)} 提取到 {len(references)} 条参考文献")
+        return references
+
+    def pdf_section_text(self, pdf_path: str) -> str:
+        """章节提取的本地解析阶段：解析整个 PDF，并按上下文预算在段落/句子边界裁剪全文（代替按字符截断）"""
+        pdf_content = self.parse_pdf(pdf_path)
+        full_text = pdf_content['text'].lower()
+        return self.budget.fit_text('pdf_section', full_text, PDF_SECTION_PROMPT, self.router.primary('pdf_section'))
+
     def extract_pdf_sections(self, pdf_path: str, section_keywords: List[str] = None) -> Dict[str, str]:
         """从 PDF 中提取特定章节
         
@@ -470,20 +1177,13 @@ class AcademicTools:
             section_keywords = ['abstract', 'introduction', 'methodology', 'results', 'conclusion']
             
         try:
-            # 首先解析整个 PDF
-            pdf_content = self.parse_pdf(pdf_path)
-            full_text = pdf_content['text'].lower()
-            
+            section_text = self.pdf_section_text(pdf_path)
+
             # 提取各个章节
             sections = {}
             for keyword in section_keywords:
                 # 使用 Qwen API 帮助定位章节
-                prompt = f"""
-                请从以下论文文本中提取 {keyword} 章节的内容。只返回该章节的文本，不要添加任何额外说明。
-                
-                论文文本：
-                {full_text[:5000]}  # 限制文本长度以避免 token 超限
-                """
+                prompt = PDF_SECTION_PROMPT.format(keyword=keyword, text=section_text)
                 
                 messages = [
                     {"role": "system", "content": "你是一个论文章节提取助手，请准确提取指定章节的内容。"},
@@ -491,11 +1191,10 @@ class AcademicTools:
                 ]
                 
                 try:
-                    response = self.client.chat.completions.create(
-                        model=self.model_name,
+                    response = self._chat(
+                        task='pdf_section',
                         messages=messages,
                         temperature=0.3,
-                        max_tokens=1000,
                         extra_body={"enable_thinking": False}
                     )
                     
@@ -532,7 +1231,7 @@ class AcademicTools:
             pdf_content = self.parse_pdf(pdf_path)
             
             # 使用 Qwen API 分析内容
-            prompt = f"""
+            prompt_template = """
             请分析以下学术论文内容，并提供：
             1. 简要摘要
             2. 3-5个关键点
@@ -540,7 +1239,7 @@ class AcademicTools:
             4. 主要发现
             
             论文内容：
-            {pdf_content['text'][:3000]}  # 限制文本长度
+            {text}
             
             请以 JSON 格式返回结果，包含以下字段：
             - summary: 摘要
@@ -548,17 +1247,20 @@ class AcademicTools:
             - methodology: 研究方法
             - findings: 主要发现
             """
+            # 按上下文预算在段落/句子边界裁剪全文（代替按字符截断）
+            paper_text = self.budget.fit_text('pdf_analysis', pdf_content['text'], prompt_template,
+                                                self.router.primary('pdf_analysis'))
+            prompt = prompt_template.format(text=paper_text)
             
             messages = [
                 {"role": "system", "content": "你是一个学术论文分析助手，请提供结构化的分析结果。"},
                 {"role": "user", "content": prompt}
             ]
             
-            response = self.client.chat.completions.create(
-                model=self.model_name,
+            response = self._chat(
+                task='pdf_analysis',
                 messages=messages,
                 temperature=0.5,
-                max_tokens=2000,
                 extra_body={"enable_thinking": False}
             )
             
@@ -0,0 +1,281 @@
+import argparse
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import List, Dict, Any, Optional, Iterable
+
+from academic_tools import AcademicTools
+from llm_scheduler import call_priority
+from pdf_references import extract_references_many
+
+
+
+def record_key(paper: Dict[str, Any]) -> str:
+    """为一条文献记录生成稳定的任务键（优先使用 BibTeX 引用键）"""
+    if paper.get('bibtex_key'):
+        return f"bib:{paper['bibtex_key']}"
+    authors = paper.get('authors', '')
+    if isinstance(authors, list):
+        authors = authors[0] if authors else ''
+    title = re.sub(r'\W+', ' ', str(paper.get('title', ''))).strip().lower()
+    raw = f"{title}|{paper.get('year', '')}|{str(authors).strip().lower()}"
+    return "sha1:" + hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+def load_records(source: str, tools: Optional[AcademicTools] = None,
+                 pdf_workers: Optional[int] = None) -> List[Dict[str, Any]]:
+    """从 .bib 文件（经 parse_bibtex）、JSON/JSONL 文献库，或 PDF 文件/目录（提取参考文献列表）中读取记录"""
+    if os.path.isdir(source) or source.lower().endswith('.pdf'):
+        pdf_paths = [source] if os.path.isfile(source) else sorted(
+            os.path.join(root, name) for root, _, names in os.walk(source)
+            for name in names if name.lower().endswith('.pdf'))
+        # 多进程并行解析，按文件顺序合并
+        references = extract_references_many(pdf_paths, workers=pdf_workers)
+        return [paper for path in pdf_paths for paper in references.get(path, [])]
+
+    if source.lower().endswith('.bib'):
+        tools = tools or AcademicTools()
+        with open(source, 'r', encoding='utf-8') as f:
+            return tools.parse_bibtex(f.read())
+
+    records = []
+    with open(source, 'r', encoding='utf-8') as f:
+        if source.lower().endswith('.json'):
+            data = json.load(f)
+            return data if isinstance(data, list) else []
+        for line in f:
+            line = line.strip()
+            if line:
+                records.append(json.loads(line))
+    return records
+
+
+class RateLimiter:
+    """线程安全的令牌桶限速器"""
+
+    def __init__(self, rate_per_sec: float, burst: int = 1):
+        self.rate = rate_per_sec
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """阻塞直到获得一个令牌"""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait_time = (1 - self.tokens) / self.rate
+            time.sleep(wait_time)
+
+
+class JobJournal:
+    """只追加的 JSONL 任务日志，每条完成的结果写入一行并立即落盘"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+        self.tail_checked = False
+
+    def load_completed(self) -> Dict[str, Dict[str, Any]]:
+        """读取日志中已完成的记录，容忍崩溃时写了一半的最后一行"""
+        completed = {}
+        if not os.path.exists(self.path):
+            return completed
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line_no, line in enumerate(f, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    print(f"[DEBUG] 跳过日志中损坏的第 {line_no} 行")
+                    continue
+                if entry.get('status') == 'done':
+                    completed[entry['key']] = entry
+        return completed
+
+    def append(self, entry: Dict[str, Any]):
+        """追加一条记录并 fsync，保证崩溃后不丢失已完成的结果"""
+        line = json.dumps(entry, ensure_ascii=False) + "\n"
+        with self.lock:
+            if not self.tail_checked:
+                # 上次崩溃可能留下没有换行的半行，先补上换行，避免新记录与其粘连
+                if os.path.exists(self.path) and os.path.getsize(self.path) > 0:
+                    with open(self.path, 'rb') as f:
+                        f.seek(-1, os.SEEK_END)
+                        if f.read(1) != b"\n":
+                            line = "\n" + line
+                self.tail_checked = True
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+
+
+class BatchSummarizationJob:
+    """可断点续跑的离线批量摘要任务
+
+    Args:
+        tools: AcademicTools 实例
+        journal_path: JSONL 任务日志路径，重启时据此跳过已完成的记录
+        concurrency: 最大并发请求数
+        rate_limit: 每秒最多发起的请求数，None 表示不限速
+        max_retries: 单条记录失败后的重试次数
+        progress_interval: 进度报告的间隔秒数
+    """
+
+    def __init__(self, tools: AcademicTools, journal_path: str, concurrency: int = 4,
+                 rate_limit: Optional[float] = None, max_retries: int = 2,
+                 progress_interval: float = 10.0):
+        self.tools = tools
+        self.journal = JobJournal(journal_path)
+        self.concurrency = max(1, concurrency)
+        self.limiter = RateLimiter(rate_limit, burst=self.concurrency) if rate_limit else None
+        self.max_retries = max_retries
+        self.progress_interval = progress_interval
+        self.stats_lock = threading.Lock()
+        self._reset_stats(0, 0)
+
+    def _reset_stats(self, pending: int, skipped: int):
+        self.stats = {'pending': pending, 'skipped': skipped, 'done': 0, 'failed': 0,
+                      'prompt_tokens': 0, 'completion_tokens': 0, 'started': time.monotonic()}
+
+    def _summarize(self, key: str, paper: Dict[str, Any]) -> Dict[str, Any]:
+        """处理单条记录（在工作线程中执行），返回写入日志的条目"""
+        usage_total = {'prompt_tokens': 0, 'completion_tokens': 0}
+        error = ""
+        for attempt in range(self.max_retries + 1):
+            if self.limiter:
+                self.limiter.acquire()
+            # 批量任务以后台优先级调用模型，不挤占交互请求的配额
+            with call_priority('background'):
+                try:
+                    summary = self.tools.summarize_paper(paper, strict=True)
+                except Exception as e:
+                    summary, error = None, str(e)
+            # 失败的调用同样计费，重试的 token 也要记入
+            usage = self.tools.last_usage() or {}
+            usage_total['prompt_tokens'] += usage.get('prompt_tokens', 0)
+            usage_total['completion_tokens'] += usage.get('completion_tokens', 0)
+            if summary:
+                return {'key': key, 'status': 'done', 'title': paper.get('title', ''),
+                        'summary': summary, 'usage': usage_total, 'attempts': attempt + 1,
+                        'finished_at': time.time()}
+            if attempt < self.max_retries:
+                time.sleep(min(2 ** attempt, 30))
+        return {'key': key, 'status': 'failed', 'title': paper.get('title', ''),
+                'error': error, 'usage': usage_total, 'attempts': self.max_retries + 1,
+                'finished_at': time.time()}
+
+    def _record(self, entry: Dict[str, Any]):
+        """写入日志并更新统计"""
+        self.journal.append(entry)
+        with self.stats_lock:
+            self.stats['done' if entry['status'] == 'done' else 'failed'] += 1
+            self.stats['prompt_tokens'] += entry['usage']['prompt_tokens']
+            self.stats['completion_tokens'] += entry['usage']['completion_tokens']
+
+    def progress(self) -> Dict[str, Any]:
+        """返回当前进度：吞吐量（篇/分钟）、预计剩余时间（秒）和 token 花费"""
+        with self.stats_lock:
+            stats = dict(self.stats)
+        elapsed = max(time.monotonic() - stats['started'], 1e-6)
+        processed = stats['done'] + stats['failed']
+        remaining = stats['pending'] - processed
+        rate = processed / elapsed
+        return {
+            'processed': processed,
+            'pending': stats['pending'],
+            'skipped': stats['skipped'],
+            'done': stats['done'],
+            'failed': stats['failed'],
+            'throughput_per_min': rate * 60,
+            'eta_seconds': remaining / rate if rate > 0 else None,
+            'prompt_tokens': stats['prompt_tokens'],
+            'completion_tokens': stats['completion_tokens'],
+            'elapsed_seconds': elapsed
+        }
+
+    def _report(self):
+        p = self.progress()
+        eta = f"{p['eta_seconds'] / 60:.1f} 分钟" if p['eta_seconds'] is not None else "未知"
+        print(f"[BATCH] 进度 {p['processed']}/{p['pending']}（跳过 {p['skipped']}，失败 {p['failed']}）"
+              f" | 吞吐 {p['throughput_per_min']:.1f} 篇/分钟 | ETA {eta}"
+              f" | tokens 输入 {p['prompt_tokens']} / 输出 {p['completion_tokens']}")
+
+    def run(self, records: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+        """执行批量摘要，返回最终统计信息"""
+        completed = self.journal.load_completed()
+        todo = []
+        seen = set(completed)
+        skipped = 0
+        for paper in records:
+            key = record_key(paper)
+            if key in seen:
+                skipped += 1
+                continue
+            seen.add(key)
+            todo.append((key, paper))
+
+        self._reset_stats(len(todo), skipped)
+        print(f"[BATCH] 共 {len(todo) + skipped} 条记录，已完成 {skipped} 条，待处理 {len(todo)} 条")
+
+        last_report = time.monotonic()
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            in_flight = set()
+            queue = iter(todo)
+            exhausted = False
+            while in_flight or not exhausted:
+                # 控制在途任务数量，避免一次性提交数万个 future
+                while not exhausted and len(in_flight) < self.concurrency * 2:
+                    item = next(queue, None)
+                    if item is None:
+                        exhausted = True
+                        break
+                    in_flight.add(executor.submit(self._summarize, *item))
+                if not in_flight:
+                    break
+                finished, in_flight = wait(in_flight, timeout=self.progress_interval,
+                                           return_when=FIRST_COMPLETED)
+                for future in finished:
+                    self._record(future.result())
+                if time.monotonic() - last_report >= self.progress_interval:
+                    self._report()
+                    last_report = time.monotonic()
+
+        self._report()
+        return self.progress()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="离线批量生成文献摘要（支持断点续跑）")
+    parser.add_argument("source", help=".bib 文件、JSON/JSONL 文献库，或 PDF 文件/目录（提取参考文献）")
+    parser.add_argument("--journal", default="summaries.jsonl", help="JSONL 任务日志路径")
+    parser.add_argument("--concurrency", type=int, default=4, help="最大并发请求数")
+    parser.add_argument("--rate", type=float, default=None, help="每秒最多请求数")
+    parser.add_argument("--retries", type=int, default=2, help="失败重试次数")
+    parser.add_argument("--progress-interval", type=float, default=10.0, help="进度报告间隔（秒）")
+    parser.add_argument("--pdf-workers", type=int, default=None, help="解析 PDF 参考文献的进程数（默认 CPU 核数）")
+    args = parser.parse_args()
+
+    tools = AcademicTools()
+    records = load_records(args.source, tools, pdf_workers=args.pdf_workers)
+    job = BatchSummarizationJob(tools, args.journal, concurrency=args.concurrency,
+                                rate_limit=args.rate, max_retries=args.retries,
+                                progress_interval=args.progress_interval)
+    job.run(records)
+
+
+if __name__ == "__main__":
+    main()
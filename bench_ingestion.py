@@ -0,0 +1,315 @@
+import argparse
+import contextlib
+import gc
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import List, Dict, Any, Optional, Tuple
+
+# 默认（快速）规模，适合每次提交运行；--full 时使用完整规模
+QUICK_PDF_PAGES = (10, 100)
+QUICK_BIB_ENTRIES = (1000, 2000)
+FULL_PDF_PAGES = (10, 100, 500, 2000)
+FULL_BIB_ENTRIES = (1000, 10000, 100000, 500000)
+
+# 重复测量时累计耗时超过该秒数后不再重复（大用例的波动相对较小，只测一次）
+REPEAT_BUDGET_SECONDS = 2.0
+
+# 各用例：输入类型、吞吐量单位
+CASES = {
+    'parse_pdf': ('pdf', 'pages'),
+    'pdf_sections': ('pdf', 'pages'),
+    'parse_bibtex': ('bib', 'entries')
+}
+
+_WORDS = ("learning model network data analysis method results training graph neural attention transformer "
+          "optimization evaluation benchmark dataset performance accuracy robust efficient framework proposed "
+          "approach experiments baseline inference representation retrieval language vision sparse dense").split()
+_SECTIONS = ('Introduction', 'Related Work', 'Methodology', 'Experiments', 'Results', 'Discussion', 'Conclusion')
+
+
+def default_workdir() -> str:
+    """生成的测试文件的缓存目录（同一规模只生成一次）"""
+    base = os.getenv('DATA_CACHE_DIR') or os.path.join(os.path.expanduser('~'), '.cache', 'acagent')
+    return os.path.join(base, 'bench')
+
+
+def _sentence(rng: random.Random, words: int) -> str:
+    return ' '.join(rng.choice(_WORDS) for _ in range(words)).capitalize() + '.'
+
+
+def generate_pdf(path: str, pages: int, seed: int = 0):
+    """生成合成的会议论文集 PDF：每页约 3000 字符正文，含标题、摘要、章节标题和末尾的参考文献"""
+    import fitz
+    rng = random.Random(seed)
+    doc = fitz.open()
+    reference_start = max(1, pages - max(1, pages // 20))
+    for number in range(pages):
+        page = doc.new_page()
+        lines = []
+        if number == 0:
+            lines += [_sentence(rng, 8), '', 'Abstract', ' '.join(_sentence(rng, 15) for _ in range(6)), '']
+        if number >= reference_start:
+            if number == reference_start:
+                lines += ['References', '']
+            for i in range(12):
+                index = (number - reference_start) * 12 + i + 1
+                lines.append(f"[{index}] A. Author and B. Author. {_sentence(rng, 8)} "
+                             f"In Proceedings of the Conference, pages {index}-{index + 9}, {2000 + index % 25}.")
+        else:
+            if number % max(1, reference_start // len(_SECTIONS)) == 0:
+                lines += [f"{number % len(_SECTIONS) + 1} {_SECTIONS[number % len(_SECTIONS)]}", '']
+            for _ in range(6):
+                lines.append(' '.join(_sentence(rng, 12) for _ in range(4)))
+                lines.append('')
+        page.insert_textbox(fitz.Rect(50, 50, 545, 792), '\n'.join(lines), fontsize=8)
+    tmp_path = path + '.tmp'
+    doc.save(tmp_path, garbage=3, deflate=True)
+    doc.close()
+    os.replace(tmp_path, path)
+
+
+def generate_bib(path: str, entries: int, seed: int = 0):
+    """生成合成的 .bib 导出：期刊、会议论文（带 crossref）、带大括号的标题和部分摘要"""
+    rng = random.Random(seed)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        for i in range(entries):
+            authors = ' and '.join(f"Author{rng.randrange(10000)}, {chr(65 + rng.randrange(26))}."
+                                   for _ in range(rng.randint(1, 6)))
+            fields = [f"  title = {{{{{_sentence(rng, 3)}}} {_sentence(rng, 7)}}}", f"  author = {{{authors}}}",
+                      f"  year = {{{1990 + rng.randrange(35)}}}", f"  doi = {{10.{1000 + i % 9000}/bench.{i}}}"]
+            if i % 3:
+                kind = 'article'
+                fields += [f"  journal = {{Journal of {rng.choice(_WORDS).capitalize()}}}",
+                           f"  volume = {{{rng.randrange(1, 80)}}}", f"  pages = {{{i % 900}--{i % 900 + 12}}}"]
+            else:
+                kind = 'inproceedings'
+                fields += [f"  booktitle = {{Proceedings of {rng.choice(_WORDS).capitalize()}}}"]
+                if i >= 3:
+                    fields.append(f"  crossref = {{bench{i - 3}}}")
+            if i % 4 == 0:
+                fields.append(f"  abstract = {{{' '.join(_sentence(rng, 14) for _ in range(4))}}}")
+            f.write(f"@{kind}{{bench{i},\n" + ',\n'.join(fields) + "\n}\n\n")
+    os.replace(tmp_path, path)
+
+
+def fixture(workdir: str, kind: str, size: int) -> str:
+    """返回指定规模的测试文件路径，不存在时生成"""
+    os.makedirs(workdir, exist_ok=True)
+    path = os.path.join(workdir, f"synthetic-{size}.{kind}")
+    if not os.path.exists(path):
+        start = time.perf_counter()
+        (generate_pdf if kind == 'pdf' else generate_bib)(path, size)
+        print(f"[DEBUG] 生成 {path}，耗时 {time.perf_counter() - start:.1f}s", file=sys.stderr)
+    return path
+
+
+def _run_stage(tools, case: str, path: str) -> Tuple[int, Any]:
+    """执行一次被测的解析阶段，返回 (处理的单元数, 结果对象)"""
+    if case == 'parse_pdf':
+        result = tools.parse_pdf(path)
+        if result.get('error'):
+            raise RuntimeError(result['error'])
+        return result['parsed_pages'], result
+    if case == 'pdf_sections':
+        import fitz
+        with fitz.open(path) as doc:
+            pages = len(doc)
+        return pages, tools.pdf_section_text(path)
+    with open(path, encoding='utf-8') as f:
+        text = f.read()
+    result = tools.parse_bibtex(text)
+    if not result:
+        raise RuntimeError("parse_bibtex 没有返回任何条目")
+    return len(result), result
+
+
+def _peak_rss_mb() -> float:
+    """进程的峰值常驻内存（MB），Linux 上 ru_maxrss 的单位为 KB，macOS 上为字节"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def measure_case(case: str, path: str, repeat: int = 1, trace: bool = False, top: int = 10) -> Dict[str, Any]:
+    """在当前进程中测量一个用例（峰值 RSS 是进程级的，应在独立子进程中调用）
+
+    trace 为 False 时测量耗时、吞吐量和峰值 RSS（最多重复 repeat 次取最快，累计超过 REPEAT_BUDGET_SECONDS 后停止）；
+    trace 为 True 时用 tracemalloc 记录 Python 分配的峰值和结果仍存活时占用最多的代码位置（会显著变慢，不计吞吐量）
+    """
+    # 被测阶段不调用模型，这里只为满足 AcademicTools 的初始化检查
+    os.environ.setdefault('DASHSCOPE_API_KEY', 'benchmark')
+    from academic_tools import AcademicTools
+    with contextlib.redirect_stdout(sys.stderr):
+        tools = AcademicTools()
+    gc.collect()
+    if trace:
+        tracemalloc.start()
+        with contextlib.redirect_stdout(sys.stderr):
+            units, result = _run_stage(tools, case, path)
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap*>')))
+        traced_peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        del result
+        return {
+            'traced_peak_mb': round(traced_peak / 2 ** 20, 2),
+            'top_allocations': [{'where': f"{os.path.basename(stat.traceback[0].filename)}:{stat.traceback[0].lineno}",
+                                 'size_mb': round(stat.size / 2 ** 20, 2), 'count': stat.count}
+                                for stat in snapshot.statistics('lineno')[:top]]
+        }
+
+    baseline_rss = _peak_rss_mb()
+    best, spent = None, 0.0
+    for _ in range(max(1, repeat)):
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(sys.stderr):
+            units, result = _run_stage(tools, case, path)
+        elapsed = time.perf_counter() - start
+        del result
+        gc.collect()
+        best = elapsed if best is None else min(best, elapsed)
+        spent += elapsed
+        if spent > REPEAT_BUDGET_SECONDS:
+            break
+    peak_rss = _peak_rss_mb()
+    return {
+        'units': units,
+        'unit': CASES[case][1],
+        'seconds': round(best, 4),
+        'rate': round(units / best, 2) if best else None,
+        'peak_rss_mb': round(peak_rss, 1),
+        'rss_delta_mb': round(peak_rss - baseline_rss, 1),
+        'file_mb': round(os.path.getsize(path) / 2 ** 20, 2)
+    }
+
+
+def run_isolated(case: str, path: str, repeat: int = 1, trace: bool = False) -> Dict[str, Any]:
+    """在新的 Python 子进程中执行 measure_case，保证各用例的峰值 RSS 互不影响"""
+    with tempfile.TemporaryDirectory() as tmp:
+        output = os.path.join(tmp, 'result.json')
+        command = [sys.executable, os.path.abspath(__file__), '--measure', case, path, output,
+                   '--repeat', str(repeat)] + (['--trace'] if trace else [])
+        completed = subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+        if completed.returncode != 0 or not os.path.exists(output):
+            raise RuntimeError(f"{case} 测量失败: {completed.stderr.strip()[-2000:]}")
+        with open(output, encoding='utf-8') as f:
+            return json.load(f)
+
+
+def run_suite(pdf_pages=QUICK_PDF_PAGES, bib_entries=QUICK_BIB_ENTRIES, cases=tuple(CASES),
+              workdir: Optional[str] = None, repeat: int = 3, trace: bool = True) -> Dict[str, Dict[str, Any]]:
+    """运行整个基准，返回 {"用例/规模": 指标}"""
+    workdir = workdir or default_workdir()
+    results = {}
+    for case in cases:
+        kind = CASES[case][0]
+        for size in (pdf_pages if kind == 'pdf' else bib_entries):
+            path = fixture(workdir, kind, size)
+            name = f"{case}/{size}"
+            metrics = run_isolated(case, path, repeat)
+            if trace:
+                metrics.update(run_isolated(case, path, trace=True))
+            results[name] = metrics
+            print(f"[DEBUG] {name}: {metrics['rate']} {metrics['unit']}/s，峰值 RSS {metrics['peak_rss_mb']} MB"
+                  f"（增加 {metrics['rss_delta_mb']} MB）", file=sys.stderr)
+    return results
+
+
+def compare(results: Dict[str, Dict[str, Any]], baseline: Dict[str, Dict[str, Any]], max_regression: float = 0.2,
+            min_memory_mb: float = 5.0, max_rss_mb: Optional[float] = None) -> List[str]:
+    """与基线比较，返回回归说明列表（为空表示通过）
+
+    - 吞吐量低于基线的 (1 - max_regression) 倍
+    - 内存增量（RSS 增量、tracemalloc 峰值）超过基线的 (1 + max_regression) 倍再加 min_memory_mb（避免小用例的噪声）
+    - 任一用例的峰值 RSS 超过 max_rss_mb
+    """
+    regressions = []
+    for name, metrics in results.items():
+        if max_rss_mb and metrics.get('peak_rss_mb', 0) > max_rss_mb:
+            regressions.append(f"{name}: 峰值 RSS {metrics['peak_rss_mb']} MB 超过上限 {max_rss_mb} MB")
+        reference = baseline.get(name)
+        if not reference:
+            continue
+        if reference.get('rate') and metrics.get('rate') is not None \
+                and metrics['rate'] < reference['rate'] * (1 - max_regression):
+            regressions.append(f"{name}: 吞吐量 {metrics['rate']} {metrics.get('unit', '')}/s，"
+                               f"基线 {reference['rate']}（下降 {1 - metrics['rate'] / reference['rate']:.0%}）")
+        for field in ('rss_delta_mb', 'traced_peak_mb'):
+            if field in reference and field in metrics \
+                    and metrics[field] > reference[field] * (1 + max_regression) + min_memory_mb:
+                regressions.append(f"{name}: {field} {metrics[field]} MB，基线 {reference[field]} MB")
+    return regressions
+
+
+def _sizes(value: str) -> Tuple[int, ...]:
+    return tuple(int(v) for v in value.split(',') if v.strip())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="PDF / BibTeX 解析的内存与吞吐量回归基准")
+    parser.add_argument("--full", action="store_true", help="使用完整规模（PDF 10-2000 页，.bib 1k-500k 条）")
+    parser.add_argument("--pdf-pages", type=_sizes, default=None, help="PDF 页数列表，逗号分隔")
+    parser.add_argument("--bib-entries", type=_sizes, default=None, help=".bib 条目数列表，逗号分隔")
+    parser.add_argument("--cases", default=','.join(CASES), help=f"要运行的用例（{', '.join(CASES)}）")
+    parser.add_argument("--workdir", default=default_workdir(), help="生成的测试文件目录")
+    parser.add_argument("--repeat", type=int, default=3, help="每个小用例最多重复的次数（取最快一次）")
+    parser.add_argument("--no-trace", action="store_true", help="跳过 tracemalloc 分配统计")
+    parser.add_argument("--output", default=None, help="结果 JSON 路径")
+    parser.add_argument("--baseline", default=None, help="基线 JSON 路径，指定时与之比较，出现回归则以状态码 1 退出")
+    parser.add_argument("--save-baseline", default=None, help="把本次结果保存为基线")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="允许的回归比例（默认 0.2）")
+    parser.add_argument("--max-rss-mb", type=float, default=None, help="任一用例峰值 RSS 的绝对上限（MB）")
+    parser.add_argument("--measure", nargs=3, metavar=("CASE", "PATH", "OUTPUT"), help=argparse.SUPPRESS)
+    parser.add_argument("--trace", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        # 子进程：测量单个用例并写出结果
+        case, path, output = args.measure
+        metrics = measure_case(case, path, args.repeat, args.trace)
+        with open(output, 'w', encoding='utf-8') as f:
+            json.dump(metrics, f)
+        return
+
+    cases = [c.strip() for c in args.cases.split(',') if c.strip()]
+    unknown = [c for c in cases if c not in CASES]
+    if unknown:
+        parser.error(f"未知的用例: {', '.join(unknown)}")
+    pdf_pages = args.pdf_pages or (FULL_PDF_PAGES if args.full else QUICK_PDF_PAGES)
+    bib_entries = args.bib_entries or (FULL_BIB_ENTRIES if args.full else QUICK_BIB_ENTRIES)
+    results = run_suite(pdf_pages, bib_entries, cases, args.workdir, args.repeat, not args.no_trace)
+
+    print(f"{'用例':<24}{'吞吐量':>16}{'耗时(s)':>10}{'峰值RSS(MB)':>14}{'RSS增量(MB)':>14}{'traced(MB)':>12}")
+    for name, metrics in results.items():
+        print(f"{name:<24}{metrics['rate']:>12} {metrics['unit'][:3]}/s{metrics['seconds']:>10}"
+              f"{metrics['peak_rss_mb']:>14}{metrics['rss_delta_mb']:>14}{metrics.get('traced_peak_mb', '-'):>12}")
+        for allocation in metrics.get('top_allocations', [])[:3]:
+            print(f"    {allocation['where']:<40}{allocation['size_mb']:>8} MB  ({allocation['count']} 个对象)")
+    for path in filter(None, (args.output, args.save_baseline)):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+    regressions = compare(results, baseline, args.max_regression, max_rss_mb=args.max_rss_mb)
+    if regressions:
+        print("\n性能回归：")
+        for line in regressions:
+            print(f"- {line}")
+        sys.exit(1)
+    if args.baseline or args.max_rss_mb:
+        print("\n未发现性能回归")
+
+
+if __name__ == "__main__":
+    main()
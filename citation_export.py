@@ -0,0 +1,399 @@
+import json
+import re
+from functools import lru_cache
+from typing import List, Dict, Any, Optional, Iterable, Callable, TextIO, Tuple
+
+# 支持的引用格式：文本样式由模板编译而来，结构化格式由专门的写出函数生成
+TEXT_STYLES = ['apa', 'mla', 'chicago', 'gbt7714']
+STRUCTURED_STYLES = ['bibtex', 'ris', 'csl-json']
+SUPPORTED_STYLES = TEXT_STYLES + STRUCTURED_STYLES
+
+# 样式别名，便于命令行和意图识别传入不同写法
+STYLE_ALIASES = {
+    'gb/t 7714': 'gbt7714', 'gb/t7714': 'gbt7714', 'gbt': 'gbt7714', 'gb': 'gbt7714',
+    'bib': 'bibtex', 'csl': 'csl-json', 'csljson': 'csl-json', 'csl_json': 'csl-json'
+}
+
+_CJK = re.compile(r'[㐀-鿿]')
+_AUTHOR_SPLIT = re.compile(r'\s+and\s+|\s*;\s*|\s*&\s*|、|，')
+_BRACES = re.compile(r'[{}]')
+_SPACES = re.compile(r'\s+')
+_PAGES = re.compile(r'\s*-+\s*|\s*–\s*')
+_PLACEHOLDER = re.compile(r'\{(\w+)\}')
+_OPTIONAL = re.compile(r'<([^<>]*)>')
+_KEY_WORD = re.compile(r'[A-Za-z]+')
+_DOUBLE_PERIOD = re.compile(r'(?<!\.)\.("?)\.(?!\.)')
+_INITIAL_SPLIT = re.compile(r'[\s.\-]+')
+_YEAR = re.compile(r'\d{4}')
+_DOI_IN_URL = re.compile(r'(10\.\d{4,9}/\S+)')
+_DOI_PREFIX = re.compile(r'^(https?://(dx\.)?doi\.org/|doi:\s*)', re.I)
+
+# 文本样式模板：{field} 为字段占位符，<...> 内为可选片段，片段中任一字段为空时整体省略
+STYLE_TEMPLATES = {
+    'apa': '{authors} ({year}). {title}.< {journal}><, {volume}><({number})><, {pages}>.< https://doi.org/{doi}>',
+    'mla': '{authors}. "{title}."< {journal}><, vol. {volume}><, no. {number}><, {year}><, pp. {pages}>.',
+    'chicago': '{authors}. {year}. "{title}."< {journal}>< {volume}>< ({number})><: {pages}>.< https://doi.org/{doi}>',
+    'gbt7714': '{authors}. {title}[{type_code}].< {source}><, {volume}><({number})><: {pages}>.< DOI: {doi}.>'
+}
+
+# GB/T 7714 文献类型标识
+_GBT_TYPE_CODES = {
+    'article': 'J', 'inproceedings': 'C', 'conference': 'C', 'book': 'M', 'incollection': 'M',
+    'phdthesis': 'D', 'mastersthesis': 'D', 'techreport': 'R', 'misc': 'Z', 'online': 'EB/OL'
+}
+
+_RIS_TYPES = {'article': 'JOUR', 'inproceedings': 'CPAPER', 'conference': 'CPAPER', 'book': 'BOOK',
+              'incollection': 'CHAP', 'phdthesis': 'THES', 'mastersthesis': 'THES', 'techreport': 'RPRT'}
+
+_CSL_TYPES = {'article': 'article-journal', 'inproceedings': 'paper-conference', 'conference': 'paper-conference',
+              'book': 'book', 'incollection': 'chapter', 'phdthesis': 'thesis', 'mastersthesis': 'thesis',
+              'techreport': 'report'}
+
+
+def normalize_style(style: Optional[str]) -> str:
+    """将样式名称规范化为 SUPPORTED_STYLES 中的取值，未知样式原样返回（小写）"""
+    style = (style or 'apa').strip().lower()
+    return STYLE_ALIASES.get(style, style)
+
+
+def _clean(value: Any) -> str:
+    """去掉 BibTeX 花括号并压缩空白（无需处理时跳过正则替换）"""
+    if not value:
+        return ''
+    text = str(value)
+    if '{' in text or '}' in text:
+        text = _BRACES.sub('', text)
+    if '  ' in text or '\n' in text or '\t' in text:
+        text = _SPACES.sub(' ', text)
+    return text.strip()
+
+
+@lru_cache(maxsize=65536)
+def _split_name(name: str) -> Tuple[str, str]:
+    """将单个作者姓名拆分为 (family, given)，同名作者在大批量导出中只解析一次"""
+    name = _clean(name).strip(' ,.')
+    if not name:
+        return '', ''
+    if _CJK.search(name):
+        # 中文姓名不拆分
+        return name.replace(' ', ''), ''
+    if ',' in name:
+        family, _, given = name.partition(',')
+        return family.strip(), given.strip()
+    parts = name.split(' ')
+    if len(parts) == 1:
+        return parts[0], ''
+    return parts[-1], ' '.join(parts[:-1])
+
+
+def normalize_authors(authors: Any) -> List[Dict[str, str]]:
+    """将字符串或列表形式的作者统一为 [{'family': ..., 'given': ...}, ...]
+
+    支持 "Smith, John and Doe, Jane"、"John Smith; Jane Doe"、"张三、李四" 以及列表输入。
+    """
+    if not authors:
+        return []
+    if isinstance(authors, str):
+        text = _clean(authors)
+        names = _AUTHOR_SPLIT.split(text)
+        # "Smith, J., Doe, J." 这类仅用逗号分隔的列表：每两个逗号片段组成一个姓名
+        if len(names) == 1 and text.count(',') > 1:
+            pieces = [p.strip() for p in text.split(',') if p.strip()]
+            if all(' ' not in p for p in pieces[::2]):
+                names = [', '.join(pieces[i:i + 2]) for i in range(0, len(pieces), 2)]
+            else:
+                names = pieces
+    else:
+        names = []
+        for item in authors:
+            if isinstance(item, dict):
+                names.append(f"{item.get('family', '')}, {item.get('given', '')}")
+            else:
+                names.append(str(item))
+    authors_list = []
+    for name in names:
+        family, given = _split_name(name)
+        if family:
+            authors_list.append({'family': family, 'given': given})
+    return authors_list
+
+
+@lru_cache(maxsize=65536)
+def _initials(given: str, with_dots: bool = True) -> str:
+    parts = [p for p in _INITIAL_SPLIT.split(given) if p]
+    if with_dots:
+        return ' '.join(p[0].upper() + '.' for p in parts)
+    return ''.join(p[0].upper() for p in parts)
+
+
+def _full_name(author: Dict[str, str]) -> str:
+    if not author['given'] or _CJK.search(author['family']):
+        return author['family']
+    return f"{author['given']} {author['family']}"
+
+
+def _inverted_name(author: Dict[str, str]) -> str:
+    if not author['given'] or _CJK.search(author['family']):
+        return author['family']
+    return f"{author['family']}, {author['given']}"
+
+
+def _authors_apa(authors: List[Dict[str, str]]) -> str:
+    names = []
+    for a in authors:
+        if a['given'] and not _CJK.search(a['family']):
+            names.append(f"{a['family']}, {_initials(a['given'])}")
+        else:
+            names.append(a['family'])
+    if len(names) > 20:
+        return ', '.join(names[:19]) + ', ... ' + names[-1]
+    if len(names) == 1:
+        return names[0]
+    return ', '.join(names[:-1]) + ', & ' + names[-1]
+
+
+def _authors_mla(authors: List[Dict[str, str]]) -> str:
+    if len(authors) == 1:
+        return _inverted_name(authors[0])
+    if len(authors) == 2:
+        return f"{_inverted_name(authors[0])}, and {_full_name(authors[1])}"
+    return f"{_inverted_name(authors[0])}, et al"
+
+
+def _authors_chicago(authors: List[Dict[str, str]]) -> str:
+    if len(authors) == 1:
+        return _inverted_name(authors[0])
+    if len(authors) > 10:
+        return ', '.join([_inverted_name(authors[0])] + [_full_name(a) for a in authors[1:7]]) + ', et al'
+    rest = [_full_name(a) for a in authors[1:]]
+    return ', '.join([_inverted_name(authors[0])] + rest[:-1]) + ', and ' + rest[-1]
+
+
+def _authors_gbt(authors: List[Dict[str, str]]) -> str:
+    names = []
+    for a in authors[:3]:
+        if _CJK.search(a['family']):
+            names.append(a['family'])
+        else:
+            names.append(f"{a['family'].upper()} {_initials(a['given'], with_dots=False)}".strip())
+    if len(authors) > 3:
+        names.append('等' if _CJK.search(authors[0]['family']) else 'et al')
+    return ', '.join(names)
+
+
+_AUTHOR_FORMATTERS = {
+    'apa': _authors_apa, 'mla': _authors_mla, 'chicago': _authors_chicago, 'gbt7714': _authors_gbt
+}
+
+
+def _compile_template(template: str) -> Callable[[Dict[str, str]], str]:
+    """将样式模板编译为渲染函数：模板只在模块加载时解析一次，渲染时只做 format_map 拼接"""
+    segments = []  # (可选片段依赖的字段，None 表示必选片段；片段的 format_map)
+    pos = 0
+    for m in _OPTIONAL.finditer(template):
+        if m.start() > pos:
+            segments.append((None, template[pos:m.start()].format_map))
+        segments.append((tuple(_PLACEHOLDER.findall(m.group(1))), m.group(1).format_map))
+        pos = m.end()
+    if pos < len(template):
+        segments.append((None, template[pos:].format_map))
+
+    def render(fields: Dict[str, str]) -> str:
+        return ''.join(fmt(fields) for required, fmt in segments
+                       if required is None or all(fields[name] for name in required))
+
+    return render
+
+
+_COMPILED_TEMPLATES = {style: _compile_template(t) for style, t in STYLE_TEMPLATES.items()}
+
+
+def _venue(paper: Dict[str, Any]) -> str:
+    return _clean(paper.get('journal') or paper.get('venue') or paper.get('booktitle') or '')
+
+
+def _year(paper: Dict[str, Any]) -> str:
+    year = str(paper.get('year') or '')
+    if len(year) == 4 and year.isdigit():
+        return year
+    match = _YEAR.search(year)
+    return match.group(0) if match else ''
+
+
+def _doi(paper: Dict[str, Any]) -> str:
+    doi = _clean(paper.get('doi'))
+    if not doi:
+        url = str(paper.get('url') or '')
+        match = _DOI_IN_URL.search(url) if '10.' in url else None
+        doi = match.group(1) if match else ''
+    if doi[:4].lower() in ('http', 'doi:'):
+        doi = _DOI_PREFIX.sub('', doi)
+    return doi
+
+
+def _pages(paper: Dict[str, Any], dash: str = '-') -> str:
+    pages = _clean(paper.get('pages'))
+    return _PAGES.sub(dash, pages) if pages else ''
+
+
+def format_reference(paper: Dict[str, Any], style: str = 'apa') -> str:
+    """按指定样式格式化单条文献引用"""
+    style = normalize_style(style)
+    if style in STRUCTURED_STYLES:
+        return _STRUCTURED_FORMATTERS[style](paper, None)
+    if style not in _COMPILED_TEMPLATES:
+        style = 'apa'
+
+    authors = normalize_authors(paper.get('authors'))
+    year = _year(paper)
+    fields = {
+        'authors': _AUTHOR_FORMATTERS[style](authors) if authors else '未知作者',
+        'year': year or ('n.d.' if style in ('apa', 'chicago') else ''),
+        'title': _clean(paper.get('title', '')).rstrip('.') or '未知标题',
+        'journal': _venue(paper),
+        'volume': _clean(paper.get('volume', '')),
+        'number': _clean(paper.get('number', paper.get('issue', ''))),
+        'pages': _pages(paper, '–' if style in ('apa', 'chicago') else '-'),
+        'doi': _doi(paper),
+        # GB/T 7714 的出处“刊名, 年”，缺少其中一项时不留多余的逗号
+        'source': ', '.join(part for part in (_venue(paper), year) if part),
+        'type_code': _GBT_TYPE_CODES.get(str(paper.get('entry_type', 'article')).lower(), 'J')
+    }
+    text = _COMPILED_TEMPLATES[style](fields)
+    if '..' in text or '.".' in text:
+        text = _DOUBLE_PERIOD.sub(r'.\1', text)
+    return text
+
+
+def _bibtex_key(paper: Dict[str, Any], authors: List[Dict[str, str]], used: Optional[Dict[str, int]]) -> str:
+    key = _clean(paper.get('bibtex_key', ''))
+    if not key:
+        family = _KEY_WORD.findall(authors[0]['family']) if authors else []
+        word = _KEY_WORD.findall(_clean(paper.get('title', '')))
+        key = f"{(family[0] if family else 'anon').lower()}{_year(paper)}{(word[0] if word else '').lower()}"
+    if used is not None:
+        # used 记录每个键已分配的次数，重复键依次追加 a, b, c...；生成的键也登记在内，
+        # 与已有的同名键（如原始键本身就是 smith2020a）冲突时继续顺延
+        count = used.get(key, 0)
+        used[key] = count + 1
+        if count:
+            while True:
+                suffixed = f"{key}{chr(ord('a') + (count - 1) % 26)}{(count - 1) // 26 or ''}"
+                if suffixed not in used:
+                    break
+                count += 1
+            used[key] = count + 1
+            used[suffixed] = 1
+            key = suffixed
+    return key
+
+
+def _format_bibtex(paper: Dict[str, Any], used: Optional[Dict[str, int]]) -> str:
+    authors = normalize_authors(paper.get('authors'))
+    entry_type = str(paper.get('entry_type', 'article')).lower()
+    venue_field = 'booktitle' if entry_type in ('inproceedings', 'conference', 'incollection') else 'journal'
+    fields = [
+        ('title', _clean(paper.get('title', ''))),
+        ('author', ' and '.join(_inverted_name(a) for a in authors)),
+        (venue_field, _venue(paper)),
+        ('year', _year(paper)),
+        ('volume', _clean(paper.get('volume', ''))),
+        ('number', _clean(paper.get('number', paper.get('issue', '')))),
+        ('pages', _pages(paper, '--')),
+        ('doi', _doi(paper)),
+        ('url', _clean(paper.get('url', ''))),
+    ]
+    body = ',\n'.join(f"  {name} = {{{value}}}" for name, value in fields if value)
+    return f"@{entry_type}{{{_bibtex_key(paper, authors, used)},\n{body}\n}}\n"
+
+
+def _format_ris(paper: Dict[str, Any], used: Optional[Dict[str, int]]) -> str:
+    authors = normalize_authors(paper.get('authors'))
+    lines = [f"TY  - {_RIS_TYPES.get(str(paper.get('entry_type', 'article')).lower(), 'JOUR')}"]
+    lines.extend(f"AU  - {_inverted_name(a)}" for a in authors)
+    pages = _pages(paper).split('-')
+    for tag, value in (('TI', _clean(paper.get('title', ''))), ('PY', _year(paper)), ('T2', _venue(paper)),
+                       ('VL', _clean(paper.get('volume', ''))),
+                       ('IS', _clean(paper.get('number', paper.get('issue', '')))),
+                       ('SP', pages[0]), ('EP', pages[1] if len(pages) > 1 else ''),
+                       ('DO', _doi(paper)), ('UR', _clean(paper.get('url', ''))),
+                       ('AB', _clean(paper.get('abstract', '')))):
+        if value:
+            lines.append(f"{tag}  - {value}")
+    lines.append("ER  - ")
+    return '\n'.join(lines) + '\n'
+
+
+def to_csl_json(paper: Dict[str, Any], used: Optional[Dict[str, int]] = None) -> Dict[str, Any]:
+    """转换为 CSL-JSON 条目（dict）"""
+    authors = normalize_authors(paper.get('authors'))
+    item = {
+        'id': _bibtex_key(paper, authors, used),
+        'type': _CSL_TYPES.get(str(paper.get('entry_type', 'article')).lower(), 'article-journal'),
+        'title': _clean(paper.get('title', '')),
+        'author': [{k: v for k, v in a.items() if v} for a in authors]
+    }
+    year = _year(paper)
+    if year:
+        item['issued'] = {'date-parts': [[int(year)]]}
+    for key, value in (('container-title', _venue(paper)), ('volume', _clean(paper.get('volume', ''))),
+                       ('issue', _clean(paper.get('number', paper.get('issue', '')))),
+                       ('page', _pages(paper)), ('DOI', _doi(paper)), ('URL', _clean(paper.get('url', ''))),
+                       ('abstract', _clean(paper.get('abstract', '')))):
+        if value:
+            item[key] = value
+    return item
+
+
+_STRUCTURED_FORMATTERS = {
+    'bibtex': _format_bibtex,
+    'ris': _format_ris,
+    'csl-json': lambda paper, used: json.dumps(to_csl_json(paper, used), ensure_ascii=False)
+}
+
+
+def format_references(papers: Iterable[Dict[str, Any]], style: str = 'apa') -> List[str]:
+    """批量格式化文献引用"""
+    style = normalize_style(style)
+    if style in STRUCTURED_STYLES:
+        used = {}
+        return [_STRUCTURED_FORMATTERS[style](paper, used) for paper in papers]
+    return [format_reference(paper, style) for paper in papers]
+
+
+def write_references(papers: Iterable[Dict[str, Any]], out: TextIO, style: str = 'apa',
+                     buffer_size: int = 1000) -> int:
+    """将引用以流式方式写入文件对象，返回写出的条数
+
+    CSL-JSON 输出为一个 JSON 数组，其余格式每条记录占一段。
+    """
+    style = normalize_style(style)
+    used = {}
+    buffer = []
+    count = 0
+    is_csl = style == 'csl-json'
+    if is_csl:
+        out.write('[\n')
+    for paper in papers:
+        if style in STRUCTURED_STYLES:
+            text = _STRUCTURED_FORMATTERS[style](paper, used)
+        else:
+            text = format_reference(paper, style)
+        if is_csl:
+            buffer.append(('  ' if count == 0 else ',\n  ') + text)
+        else:
+            buffer.append(text + '\n')
+        count += 1
+        if len(buffer) >= buffer_size:
+            out.writelines(buffer)
+            buffer.clear()
+    out.writelines(buffer)
+    if is_csl:
+        out.write('\n]\n')
+    return count
+
+
+def export_references(papers: Iterable[Dict[str, Any]], path: str, style: str = 'apa') -> int:
+    """将文献列表按指定格式导出到文件，返回导出的条数"""
+    with open(path, 'w', encoding='utf-8') as f:
+        return write_references(papers, f, style)
@@ -0,0 +1,273 @@
+import argparse
+import os
+from typing import List, Dict, Any, Optional, Iterable
+import numpy as np
+
+from citation_validator import normalize_title, normalize_doi
+
+
+def default_graph_path() -> Optional[str]:
+    """引用图文件路径，可通过 CITATION_GRAPH_PATH 环境变量配置，设为 off 时不使用引用图"""
+    path = os.getenv('CITATION_GRAPH_PATH')
+    if path and path.lower() == 'off':
+        return None
+    return path or os.path.join(os.path.expanduser('~'), '.cache', 'acagent', 'citation_graph.npz')
+
+
+def paper_key(paper: Any) -> Optional[str]:
+    """文献在引用图中的节点键：优先 DOI，其次归一化标题；传入字符串时原样使用。
+    既没有 DOI 也没有标题的文献无法区分，返回 None（不加入引用图）"""
+    if isinstance(paper, str):
+        return paper or None
+    doi = normalize_doi(paper.get('doi'))
+    if doi:
+        return f"doi:{doi}"
+    title = normalize_title(paper.get('title'))
+    return f"title:{title}" if title else None
+
+
+class CitationGraph:
+    """增量维护的引用图（节点为文献，边为 引用方 → 被引文献），用于 PageRank 和共被引打分
+
+    - 边保存在按容量倍增的 NumPy 数组中，添加文档只追加新边
+    - 邻接矩阵为 SciPy CSR，新增文档时只构造新边的增量矩阵并与已有矩阵相加，不重建整个图
+    - PageRank 以上一次的结果为初值做幂迭代，图只变化一小部分时几次迭代即可收敛
+    - 未安装 SciPy 时用 np.bincount 完成稀疏矩阵向量乘
+    """
+
+    def __init__(self):
+        self._keys: List[str] = []
+        self._index: Dict[str, int] = {}
+        self._src = np.empty(1024, dtype=np.int64)
+        self._dst = np.empty(1024, dtype=np.int64)
+        self._edges = 0
+        self._matrix = None
+        self._matrix_edges = 0
+        self._ranks: Optional[np.ndarray] = None
+        self._ranked_edges = -1
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    @property
+    def n_edges(self) -> int:
+        return self._edges
+
+    def _node(self, key: str) -> int:
+        node = self._index.get(key)
+        if node is None:
+            node = self._index[key] = len(self._keys)
+            self._keys.append(key)
+        return node
+
+    def _append_edges(self, src: np.ndarray, dst: np.ndarray):
+        needed = self._edges + len(src)
+        if needed > len(self._src):
+            capacity = max(needed, 2 * len(self._src))
+            self._src = np.resize(self._src, capacity)
+            self._dst = np.resize(self._dst, capacity)
+        self._src[self._edges:needed] = src
+        self._dst[self._edges:needed] = dst
+        self._edges = needed
+
+    def add_citations(self, citing: Any, cited: Iterable[Any]) -> int:
+        """添加一篇文档的引用关系（citing 引用了 cited 中的每一篇），返回新增的边数；无法生成键的文献被跳过"""
+        citing_key = paper_key(citing)
+        if citing_key is None:
+            return 0
+        source = self._node(citing_key)
+        targets = [self._node(key) for key in {paper_key(p) for p in cited} if key and key != citing_key]
+        if targets:
+            self._append_edges(np.full(len(targets), source, dtype=np.int64), np.array(targets, dtype=np.int64))
+        return len(targets)
+
+    def remove_citations(self, citing: Any) -> int:
+        """删除一篇文档的全部引用关系（文档被删除或重新解析前调用），返回删除的边数；节点保留"""
+        return self.remove_documents([citing])
+
+    def remove_documents(self, citings: Iterable[Any]) -> int:
+        """批量删除多篇文档的引用关系，返回删除的边数"""
+        nodes = [self._index[key] for key in {paper_key(c) for c in citings} if key and key in self._index]
+        if not nodes or not self._edges:
+            return 0
+        keep = ~np.isin(self._src[:self._edges], nodes)
+        removed = self._edges - int(keep.sum())
+        if removed:
+            src, dst = self._src[:self._edges][keep], self._dst[:self._edges][keep]
+            self._edges = 0
+            self._append_edges(src, dst)
+            # 删除边后邻接矩阵需要重建，PageRank 仍以上一次的结果为初值
+            self._matrix = None
+            self._matrix_edges = 0
+            self._ranked_edges = -1
+        return removed
+
+    def add_documents(self, documents: Iterable[tuple]) -> int:
+        """批量添加 (citing, cited_list) 形式的文档，返回新增的边数"""
+        return sum(self.add_citations(citing, cited) for citing, cited in documents)
+
+    def add_bibtex_crossrefs(self, entries: List[Dict[str, Any]]) -> int:
+        """把 BibTeX 条目的 crossref 字段作为 条目 → 被引条目 的边加入图中"""
+        by_key = {entry.get('bibtex_key'): entry for entry in entries if entry.get('bibtex_key')}
+        count = 0
+        for entry in entries:
+            targets = [t.strip() for t in str(entry.get('crossref') or '').split(',') if t.strip()]
+            if targets:
+                count += self.add_citations(entry, [by_key.get(t, f"bibtex:{t}") for t in targets])
+        return count
+
+    def matrix(self):
+        """邻接矩阵（CSR，行为引用方，值为 0/1），只把上次之后新增的边合并进去"""
+        from scipy.sparse import csr_matrix
+        n = len(self._keys)
+        if self._matrix is None:
+            self._matrix = csr_matrix((n, n), dtype=np.float64)
+        if self._matrix.shape[0] < n:
+            self._matrix.resize((n, n))
+        if self._matrix_edges < self._edges:
+            start, end = self._matrix_edges, self._edges
+            delta = csr_matrix((np.ones(end - start), (self._src[start:end], self._dst[start:end])), shape=(n, n))
+            self._matrix = self._matrix + delta
+            # 重复引用只计一次
+            np.minimum(self._matrix.data, 1.0, out=self._matrix.data)
+            self._matrix_edges = end
+        return self._matrix
+
+    def pagerank(self, damping: float = 0.85, tol: float = 1e-10, max_iter: int = 100) -> np.ndarray:
+        """计算（或增量更新）PageRank，以上一次结果为初值"""
+        n = len(self._keys)
+        if n == 0:
+            return np.zeros(0)
+        if self._ranks is not None and self._ranked_edges == self._edges and len(self._ranks) == n:
+            return self._ranks
+
+        try:
+            adjacency = self.matrix()
+            out_degree = np.asarray(adjacency.sum(axis=1)).ravel()
+            transposed = adjacency.T.tocsr()
+
+            def propagate(weights):
+                return transposed @ weights
+        except ImportError:
+            src, dst = self._src[:self._edges], self._dst[:self._edges]
+            out_degree = np.bincount(src, minlength=n).astype(np.float64)
+
+            def propagate(weights):
+                return np.bincount(dst, weights=weights[src], minlength=n)
+
+        ranks = np.full(n, 1.0 / n)
+        if self._ranks is not None and len(self._ranks):
+            # 增量更新：已有节点沿用上次的分数，新节点取均值，再归一化
+            ranks[:len(self._ranks)] = self._ranks
+            ranks /= ranks.sum()
+        dangling = out_degree == 0
+        inverse_degree = np.divide(1.0, out_degree, out=np.zeros(n), where=~dangling)
+        for iteration in range(max_iter):
+            updated = damping * propagate(ranks * inverse_degree)
+            updated += (damping * ranks[dangling].sum() + 1.0 - damping) / n
+            delta = np.abs(updated - ranks).sum()
+            ranks = updated
+            if delta < tol:
+                break
+        print(f"[DEBUG] PageRank: {n} 个节点，{self._edges} 条边，迭代 {iteration + 1} 次")
+        self._ranks = ranks
+        self._ranked_edges = self._edges
+        return ranks
+
+    def _node_of(self, paper: Any) -> int:
+        """文献对应的节点编号，不在图中或无法生成键时为 -1"""
+        key = paper_key(paper)
+        return self._index.get(key, -1) if key else -1
+
+    def cocitation_scores(self, papers: List[Any]) -> np.ndarray:
+        """共被引强度：每篇文献与列表中其他文献被同一文档同时引用的次数之和"""
+        nodes = np.array([self._node_of(p) for p in papers], dtype=np.int64)
+        scores = np.zeros(len(papers))
+        if not self._edges or (nodes < 0).all():
+            return scores
+        src, dst = self._src[:self._edges], self._dst[:self._edges]
+        position = np.full(len(self._keys), -1, dtype=np.int64)
+        position[nodes[nodes >= 0]] = np.flatnonzero(nodes >= 0)
+        mask = position[dst] >= 0
+        pairs = np.unique(np.stack([src[mask], position[dst[mask]]], axis=1), axis=0)
+        if not len(pairs):
+            return scores
+        # 每个引用方同时引用了列表中的 k 篇文献，则这 k 篇各获得 k - 1
+        per_citing = np.bincount(pairs[:, 0])
+        return np.bincount(pairs[:, 1], weights=per_citing[pairs[:, 0]] - 1, minlength=len(papers)).astype(float)
+
+    def scores(self, papers: List[Any], method: str = 'pagerank') -> np.ndarray:
+        """列表中每篇文献的得分（不在图中的文献为 0）"""
+        if method == 'cocitation':
+            return self.cocitation_scores(papers)
+        ranks = self.pagerank()
+        nodes = [self._node_of(p) for p in papers]
+        # 换算为相对均值的倍数，便于阅读
+        return np.array([ranks[i] * len(ranks) if i >= 0 else 0.0 for i in nodes])
+
+    def rank_papers(self, papers: List[Dict[str, Any]], method: str = 'pagerank') -> List[Dict[str, Any]]:
+        """按引用图得分重新排序文献（得分相同的保持原顺序），并写入 citation_score 字段"""
+        if not papers or not self._edges:
+            return papers
+        scores = self.scores(papers, method)
+        order = sorted(range(len(papers)), key=lambda i: (-scores[i], i))
+        return [{**papers[i], 'citation_score': round(float(scores[i]), 4)} for i in order]
+
+    def save(self, path: str):
+        """保存到 .npz 文件（节点键、边和最近一次的 PageRank）"""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        keys = np.frombuffer('\n'.join(self._keys).encode('utf-8'), dtype=np.uint8)
+        ranks = self._ranks if self._ranks is not None else np.zeros(0)
+        tmp_path = path + '.tmp.npz'
+        np.savez(tmp_path, keys=keys, src=self._src[:self._edges], dst=self._dst[:self._edges], ranks=ranks,
+                 ranked_edges=np.array([self._ranked_edges]))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> 'CitationGraph':
+        """从 save() 生成的文件加载；文件不存在时返回空图"""
+        graph = cls()
+        if not os.path.exists(path):
+            return graph
+        with np.load(path) as data:
+            text = data['keys'].tobytes().decode('utf-8')
+            graph._keys = text.split('\n') if text else []
+            graph._index = {key: i for i, key in enumerate(graph._keys)}
+            graph._append_edges(data['src'], data['dst'])
+            if len(data['ranks']):
+                graph._ranks = data['ranks']
+                graph._ranked_edges = int(data['ranked_edges'][0])
+        return graph
+
+
+def main():
+    parser = argparse.ArgumentParser(description="从 PDF 参考文献和 BibTeX crossref 构建引用图")
+    parser.add_argument("sources", nargs='+', help="PDF 文件/目录或 .bib 文件")
+    parser.add_argument("--graph", default=default_graph_path() or 'citation_graph.npz', help="引用图文件路径")
+    parser.add_argument("--workers", type=int, default=None, help="解析 PDF 的进程数（默认 CPU 核数）")
+    args = parser.parse_args()
+
+    from pdf_references import extract_references_many
+    graph = CitationGraph.load(args.graph)
+    pdfs, edges = [], 0
+    for source in args.sources:
+        if os.path.isdir(source):
+            pdfs.extend(os.path.join(source, name) for name in sorted(os.listdir(source))
+                        if name.lower().endswith('.pdf'))
+        elif source.lower().endswith('.pdf'):
+            pdfs.append(source)
+        elif source.lower().endswith('.bib'):
+            from academic_tools import AcademicTools
+            with open(source, encoding='utf-8') as f:
+                edges += graph.add_bibtex_crossrefs(AcademicTools().parse_bibtex(f.read()))
+    for path, references in extract_references_many(pdfs, args.workers).items():
+        edges += graph.add_citations(f"pdf:{os.path.abspath(path)}", references)
+    graph.pagerank()
+    graph.save(args.graph)
+    print(f"新增 {edges} 条引用，引用图共有 {len(graph)} 个节点、{graph.n_edges} 条边")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,325 @@
+import argparse
+import datetime
+import difflib
+import gzip
+import json
+import os
+import re
+import sqlite3
+import unicodedata
+from typing import List, Dict, Any, Optional, Iterable, Iterator
+
+from citation_export import normalize_authors
+
+# Crossref 推荐的 DOI 语法（大小写不敏感）
+DOI_PATTERN = re.compile(r'^10\.\d{4,9}/[-._;()/:a-z0-9<>\[\]+]+$', re.I)
+_DOI_PREFIX = re.compile(r'^(https?://(dx\.)?doi\.org/|doi:\s*)', re.I)
+_NON_WORD = re.compile(r'[\W_]+', re.UNICODE)
+_BAD_AUTHOR = re.compile(r'[{}\\0-9@]')
+
+# 批量查询时单条 SQL 中 IN (...) 的最大参数个数
+_BATCH_SIZE = 500
+
+
+def normalize_doi(doi: Any) -> str:
+    """去掉 doi.org 前缀并转为小写"""
+    if not doi:
+        return ''
+    return _DOI_PREFIX.sub('', str(doi).strip()).lower()
+
+
+def normalize_title(title: Any) -> str:
+    """标题归一化：去掉花括号、标点和变音符号，小写并压缩空白"""
+    if not title:
+        return ''
+    text = str(title)
+    if not text.isascii():
+        text = unicodedata.normalize('NFKD', text)
+        text = ''.join(ch for ch in text if not unicodedata.combining(ch))
+    return _NON_WORD.sub(' ', text).strip().lower()
+
+
+def _similarity(a: str, b: str) -> float:
+    if not a or not b:
+        return 0.0
+    if a == b:
+        return 1.0
+    return difflib.SequenceMatcher(None, a, b).ratio()
+
+
+def _open_dump(path: str):
+    return gzip.open(path, 'rt', encoding='utf-8') if path.endswith('.gz') else open(path, 'r', encoding='utf-8')
+
+
+def _iter_dump(path: str) -> Iterator[Dict[str, Any]]:
+    """流式读取转储记录：JSONL（每行一条，OpenAlex 快照格式），
+    或 Crossref 公共数据文件那样的 {"items": [...]} JSON 文件（均支持 .gz）"""
+    with _open_dump(path) as f:
+        if path.endswith('.json') or path.endswith('.json.gz'):
+            data = json.load(f)
+            yield from (data if isinstance(data, list) else data.get('items', []))
+            return
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+def crossref_to_row(item: Dict[str, Any]) -> Optional[tuple]:
+    """将 Crossref works 记录转换为目录行"""
+    doi = normalize_doi(item.get('DOI'))
+    titles = item.get('title') or []
+    title = titles[0] if isinstance(titles, list) and titles else (titles or '')
+    if not doi and not title:
+        return None
+    authors = [a.get('family') or a.get('name', '') for a in item.get('author', []) if isinstance(a, dict)]
+    year = None
+    for key in ('issued', 'published-print', 'published-online', 'created'):
+        parts = (item.get(key) or {}).get('date-parts') or [[None]]
+        if parts and parts[0] and parts[0][0]:
+            year = int(parts[0][0])
+            break
+    venues = item.get('container-title') or []
+    venue = venues[0] if isinstance(venues, list) and venues else (venues or '')
+    return (doi or None, normalize_title(title), title, json.dumps(authors, ensure_ascii=False), year, venue)
+
+
+def openalex_to_row(item: Dict[str, Any]) -> Optional[tuple]:
+    """将 OpenAlex works 记录转换为目录行"""
+    doi = normalize_doi(item.get('doi'))
+    title = item.get('title') or item.get('display_name') or ''
+    if not doi and not title:
+        return None
+    authors = []
+    for authorship in item.get('authorships', []):
+        name = (authorship.get('author') or {}).get('display_name', '')
+        if name:
+            authors.append(name.split(' ')[-1])
+    source = ((item.get('primary_location') or {}).get('source') or item.get('host_venue') or {})
+    venue = source.get('display_name', '') if isinstance(source, dict) else ''
+    return (doi or None, normalize_title(title), title, json.dumps(authors, ensure_ascii=False),
+            item.get('publication_year'), venue)
+
+
+class ReferenceCatalog:
+    """基于 SQLite 的本地文献目录，按 DOI 与归一化标题建立磁盘索引
+
+    Args:
+        db_path: 目录数据库路径，不存在时自动创建
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA mmap_size = 268435456")
+        self.conn.execute("PRAGMA temp_store = MEMORY")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS works (
+                id INTEGER PRIMARY KEY,
+                doi TEXT UNIQUE,
+                norm_title TEXT,
+                title TEXT,
+                authors TEXT,
+                year INTEGER,
+                venue TEXT
+            )""")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_works_norm_title ON works(norm_title)")
+        self.conn.commit()
+
+    def import_dump(self, path: str, source: str = 'crossref', batch_size: int = 10000) -> int:
+        """流式导入 Crossref 或 OpenAlex 转储，返回导入的记录数"""
+        convert = crossref_to_row if source == 'crossref' else openalex_to_row
+        count = 0
+        batch = []
+        # 大批量导入时关闭同步写盘并把回滚日志放在内存中，结束（包括出错）后恢复原来的设置，
+        # 避免之后的写入在没有磁盘日志的情况下进行
+        synchronous = self.conn.execute("PRAGMA synchronous").fetchone()[0]
+        journal_mode = self.conn.execute("PRAGMA journal_mode").fetchone()[0]
+        self.conn.execute("PRAGMA synchronous = OFF")
+        self.conn.execute("PRAGMA journal_mode = MEMORY")
+        try:
+            for item in _iter_dump(path):
+                row = convert(item)
+                if row is None:
+                    continue
+                batch.append(row)
+                if len(batch) >= batch_size:
+                    count += self._insert(batch)
+                    batch = []
+            if batch:
+                count += self._insert(batch)
+        finally:
+            self.conn.commit()
+            self.conn.execute(f"PRAGMA journal_mode = {journal_mode}")
+            self.conn.execute(f"PRAGMA synchronous = {int(synchronous)}")
+        self.conn.execute("ANALYZE")
+        self.conn.commit()
+        print(f"[DEBUG] 已向参考目录导入 {count} 条 {source} 记录")
+        return count
+
+    def add_works(self, works: Iterable[Dict[str, Any]]) -> int:
+        """直接添加 {'doi', 'title', 'authors', 'year', 'venue'} 形式的记录"""
+        rows = []
+        for work in works:
+            authors = [a['family'] for a in normalize_authors(work.get('authors'))]
+            rows.append((normalize_doi(work.get('doi')) or None, normalize_title(work.get('title')),
+                         work.get('title', ''), json.dumps(authors, ensure_ascii=False),
+                         int(work['year']) if str(work.get('year', '')).isdigit() else None,
+                         work.get('venue', '')))
+        count = self._insert(rows)
+        self.conn.commit()
+        return count
+
+    def _insert(self, rows: List[tuple]) -> int:
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO works (doi, norm_title, title, authors, year, venue) VALUES (?, ?, ?, ?, ?, ?)",
+                rows)
+        return len(rows)
+
+    @staticmethod
+    def _to_record(row: tuple) -> Dict[str, Any]:
+        return {'doi': row[0], 'norm_title': row[1], 'title': row[2], 'authors': json.loads(row[3] or '[]'),
+                'year': row[4], 'venue': row[5] or ''}
+
+    def _lookup(self, column: str, keys: List[str]) -> Dict[str, Dict[str, Any]]:
+        found = {}
+        keys = list({k for k in keys if k})
+        for i in range(0, len(keys), _BATCH_SIZE):
+            chunk = keys[i:i + _BATCH_SIZE]
+            placeholders = ','.join('?' * len(chunk))
+            for row in self.conn.execute(
+                    f"SELECT doi, norm_title, title, authors, year, venue FROM works WHERE {column} IN ({placeholders})",
+                    chunk):
+                record = self._to_record(row)
+                found.setdefault(record[column], record)
+        return found
+
+    def lookup_many(self, dois: List[str], norm_titles: List[str]) -> tuple:
+        """批量查询，返回 (按 DOI 的结果, 按归一化标题的结果) 两个字典"""
+        return self._lookup('doi', dois), self._lookup('norm_title', norm_titles)
+
+    def remove_dois(self, dois: Iterable[str]) -> int:
+        """从目录中删除指定 DOI 的记录"""
+        with self.conn:
+            cursor = self.conn.executemany("DELETE FROM works WHERE doi = ?", [(normalize_doi(d),) for d in dois])
+        return cursor.rowcount
+
+    def __len__(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM works").fetchone()[0]
+
+    def close(self):
+        self.conn.close()
+
+
+class CitationValidator:
+    """文献元数据校验器：检查 DOI 语法、年份范围、作者格式，并与本地参考目录比对标题和期刊
+
+    Args:
+        catalog: 本地参考目录，None 时只做本地语法检查
+        min_year: 允许的最早年份
+        title_threshold: 判定标题一致的最低相似度
+    """
+
+    def __init__(self, catalog: Optional[ReferenceCatalog] = None, min_year: int = 1600,
+                 title_threshold: float = 0.9):
+        self.catalog = catalog
+        self.min_year = min_year
+        self.max_year = datetime.date.today().year + 1
+        self.title_threshold = title_threshold
+
+    def _check_fields(self, paper: Dict[str, Any], errors: List[str], warnings: List[str]):
+        """不依赖参考目录的本地检查"""
+        for field in ('title', 'authors', 'year'):
+            if not paper.get(field):
+                errors.append(f"缺少字段: {field}")
+
+        doi = normalize_doi(paper.get('doi'))
+        if doi and not DOI_PATTERN.match(doi):
+            errors.append(f"DOI 格式无效: {paper.get('doi')}")
+
+        year = str(paper.get('year', '') or '').strip()
+        if year:
+            if not year.isdigit():
+                errors.append(f"年份格式无效: {year}")
+            elif not self.min_year <= int(year) <= self.max_year:
+                errors.append(f"年份超出合理范围: {year}")
+
+        authors = paper.get('authors')
+        if authors:
+            raw_names = authors if isinstance(authors, list) else [authors]
+            if any(not str(a).strip() for a in raw_names):
+                errors.append("作者列表中存在空条目")
+            bad = [str(a) for a in raw_names if _BAD_AUTHOR.search(str(a))]
+            if bad:
+                warnings.append(f"作者姓名包含异常字符: {', '.join(bad[:3])}")
+            parsed = normalize_authors(authors)
+            if any(len(a['family']) == 1 and not a['given'] for a in parsed):
+                warnings.append("作者姓名可能被错误拆分（存在单字母姓名）")
+
+    def _check_catalog(self, paper: Dict[str, Any], record: Dict[str, Any], matched_by: str,
+                       errors: List[str], warnings: List[str]):
+        """与参考目录中的记录比对"""
+        title_score = _similarity(normalize_title(paper.get('title')), record['norm_title'])
+        if matched_by == 'doi' and title_score < self.title_threshold:
+            errors.append(f"标题与 DOI 记录不一致（相似度 {title_score:.2f}）: {record['title']}")
+
+        year = str(paper.get('year', '') or '')
+        if year.isdigit() and record['year'] and abs(int(year) - int(record['year'])) > 1:
+            errors.append(f"年份与目录记录不一致: {year} != {record['year']}")
+
+        venue = normalize_title(paper.get('journal') or paper.get('venue'))
+        if venue and record['venue'] and _similarity(venue, normalize_title(record['venue'])) < 0.6:
+            warnings.append(f"期刊/会议与目录记录不一致: {record['venue']}")
+
+        families = {normalize_title(a['family']) for a in normalize_authors(paper.get('authors'))}
+        catalog_families = {normalize_title(a) for a in record['authors']}
+        if families and catalog_families and not families & catalog_families:
+            warnings.append("作者与目录记录没有重合")
+
+    def validate(self, papers: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """在一次批量查询中校验整个文献列表，返回与输入一一对应的校验报告"""
+        dois = [normalize_doi(p.get('doi')) for p in papers]
+        titles = [normalize_title(p.get('title')) for p in papers]
+        by_doi, by_title = self.catalog.lookup_many(dois, titles) if self.catalog else ({}, {})
+
+        reports = []
+        for paper, doi, title in zip(papers, dois, titles):
+            errors, warnings = [], []
+            self._check_fields(paper, errors, warnings)
+
+            record, matched_by = None, None
+            if doi and doi in by_doi:
+                record, matched_by = by_doi[doi], 'doi'
+            elif title and title in by_title:
+                record, matched_by = by_title[title], 'title'
+            if record:
+                self._check_catalog(paper, record, matched_by, errors, warnings)
+            elif self.catalog is not None:
+                warnings.append("未在本地参考目录中找到匹配记录")
+
+            reports.append({
+                'valid': not errors,
+                'errors': errors,
+                'warnings': warnings,
+                'matched_by': matched_by,
+                'catalog_doi': record['doi'] if record else None
+            })
+        return reports
+
+
+def main():
+    parser = argparse.ArgumentParser(description="导入 Crossref/OpenAlex 转储，构建本地参考目录")
+    parser.add_argument("dump", help="JSONL 转储文件（支持 .gz）")
+    parser.add_argument("--source", choices=['crossref', 'openalex'], default='crossref')
+    parser.add_argument("--db", default=os.getenv('REFERENCE_CATALOG_DB', 'reference_catalog.db'),
+                        help="目录数据库路径")
+    args = parser.parse_args()
+    catalog = ReferenceCatalog(args.db)
+    catalog.import_dump(args.dump, args.source)
+    print(f"目录中共有 {len(catalog)} 条记录")
+    catalog.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,20 @@
 from academic_agent import create_academic_workflow
 from academic_tools import AcademicTools
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+import argparse
+import contextlib
+import signal
+import threading
+import time
 import json
+import sys
 import os
+from citation_export import SUPPORTED_STYLES, normalize_style
+from llm_scheduler import set_priority
+from token_ledger import PROCESS_SESSION
+from profiling import command_profiler
 
 def print_welcome():
     print("""
@@ -18,6 +30,8 @@ def print_welcome():
 您可以直接用自然语言描述您的需求，例如：
 "请帮我搜索关于人工智能在教育领域的应用" 或 "总结我找到的第1篇文献" 或 "解析以下 BibTeX 文本：..."
 输入 'help' 查看帮助信息
+输入 'usage' 查看本次会话的 token 用量
+按 Ctrl-C 取消正在进行的请求
 输入 'exit' 退出程序
     """)
 
@@ -27,12 +41,17 @@ def print_help():
 - **文献搜索与总结**: 询问关于某个主题的文献，例如 "找一些关于气候变化的论文"。
 - **文献总结**: 请求总结已经找到的文献列表中的某一篇，例如 "总结第2篇文献"。
 - **文本润色**: 提供一段文本并请求润色，例如 "请帮我润色这段文字：..."。
-- **数据分析**: 询问进行某种类型的数据分析。
+- **数据分析**: 对 CSV/Parquet/Arrow 数据文件进行描述统计或回归分析，例如 "对 data.csv 做描述性统计"、"用 data.csv 以 yield 为响应变量做回归"。
+  CSV 首次加载后会缓存为列式文件，重复分析同一数据时无需重新解析。
 - **生成引用**: 请求生成找到的文献的引用格式，例如 "请给我第1篇文献的 APA 引用"。
+  支持 APA、MLA、Chicago、GB/T 7714、BibTeX、RIS、CSL-JSON，可一次引用多篇（如 "第1-3篇"、"全部"）并导出到文件。
 - **解析 BibTeX**: 提供 BibTeX 格式的文献信息进行解析，例如 "解析以下 BibTeX：..."
 - **PDF 处理**: 
   * 解析 PDF 文件：例如 "解析这个 PDF 文件：/path/to/paper.pdf"
   * 分析 PDF 内容：例如 "分析这个 PDF 文件：/path/to/paper.pdf"
+- **历史记录**: 每次检索/解析的结果、摘要、引用和 PDF 分析都会保存在本地历史库，例如 "查看历史记录"、"在历史中查找 图神经网络"。
+  总结和引用可以直接指向以前的结果，例如 "总结 s5 的第3篇"（第5个历史结果集）、"引用 #12"（历史文献编号）、"总结昨天找到的那篇关于图神经网络的论文"。
+- **用量**: 输入 'usage' 查看本次会话的 token 用量（按任务和模型汇总）。
 - **帮助**: 输入 'help'。
 - **退出**: 输入 'exit'。
 
@@ -46,13 +65,55 @@ def print_help():
 分析这个 PDF 文件：/path/to/paper.pdf
     """)
 
-def main():
-    # 初始化工具和工作流
-    tools = AcademicTools()
-    workflow = create_academic_workflow()
-    
-    # 存储会话状态
-    session_state = {
+def parse_paper_ids(paper_id_str: str, total: int) -> List[int]:
+    """将 "3"、"1,3,5-7"、"all" 等文献编号转换为列表索引（从 0 开始）
+
+    编号格式不正确时抛出 ValueError。
+    """
+    text = str(paper_id_str).strip().lower()
+    if text in ('all', '全部', '所有'):
+        return list(range(total))
+    indices = []
+    for part in text.replace('，', ',').split(','):
+        part = part.strip()
+        if not part:
+            continue
+        if '-' in part:
+            start, end = (int(x) for x in part.split('-', 1))
+            indices.extend(range(start - 1, end))
+        else:
+            indices.append(int(part) - 1)
+    if not indices:
+        raise ValueError(f"无效的文献编号: {paper_id_str}")
+    return indices
+
+def print_stream_event(event: Dict[str, Any]):
+    """实时展示检索节点发出的事件：文献元数据到达即显示，友好摘要生成后补充显示"""
+    index = event.get('index', 0) + 1
+    if event.get('event') == 'paper':
+        paper = event.get('paper', {})
+        authors = paper.get('authors', '未知作者')
+        if isinstance(authors, list):
+            authors = ', '.join(authors)
+        print(f"\n[{index}] {paper.get('title', '无标题')}")
+        print(f"    作者：{authors}  年份：{paper.get('year', '未知年份')}")
+    elif event.get('event') == 'summary':
+        summary = event.get('friendly_summary', '')
+        print(f"[{index}] 摘要：{summary[:200]}..." if len(summary) > 200 else f"[{index}] 摘要：{summary}")
+
+def run_workflow(workflow, state: Dict[str, Any]) -> Dict[str, Any]:
+    """以流式方式执行工作流：custom 事件实时展示，values 事件的最后一个即最终状态"""
+    result = state
+    for mode, chunk in workflow.stream(state, stream_mode=["custom", "values"]):
+        if mode == "custom":
+            print_stream_event(chunk)
+        else:
+            result = chunk
+    return result
+
+def new_session_state() -> Dict[str, Any]:
+    """新会话的初始状态"""
+    return {
         "messages": [],
         "task_type": None,
         "search_query": None,
@@ -61,16 +122,326 @@ def main():
         "summary": None,
         "citations": [],
         "analysis_results": None,
+        "data_path": None,
+        "analysis_type": None,
+        "analysis_options": None,
+        "data_options": None,
+        "dataset": None,
         "user_input": None,
         "text_to_polish": None,
         "paper_to_summarize_index": None,
         "paper_to_cite_index": None,
         "citation_style": None,
+        "citation_export_path": None,
         "bibtex_input": None,
         "pdf_path": None, # 添加 PDF 文件路径
         "pdf_sections": None, # 添加 PDF 章节内容
-        "pdf_analysis": None # 添加 PDF 分析结果
+        "pdf_analysis": None, # 添加 PDF 分析结果
+        "history_set_id": None, # 当前文献列表在历史库中的结果集编号
+        "topic_clusters": None # 文献列表的主题聚类
     }
+
+def reset_turn_state(session_state: Dict[str, Any]):
+    """出错或取消时只重置当前任务相关的状态，保留 literature_results 等会话数据"""
+    for field in ("task_type", "bibtex_input", "user_input", "text_to_polish", "paper_to_summarize_index",
+                  "paper_to_cite_index", "citation_style", "citation_export_path", "pdf_path", "pdf_sections",
+                  "pdf_analysis"):
+        session_state[field] = None
+
+def interrupt_handler(tools: AcademicTools):
+    """SIGINT 处理函数：先让进行中的前台模型调用放弃等待（工作线程中的调用也会及时退出），再抛出 KeyboardInterrupt"""
+    def handler(signum, frame):
+        tools.cancel_inflight()
+        raise KeyboardInterrupt
+    return handler
+
+def print_usage(report: Dict[str, Any]):
+    """显示会话的 token 用量汇总"""
+    budget = report.get('budget') or 0
+    total = report.get('total_tokens', 0)
+    print(f"\n会话 {report['session']}：共 {report.get('calls', 0)} 次模型调用，{total} token" +
+          (f"（预算 {budget}，已用 {total / budget:.0%}）" if budget else ""))
+    if report.get('calls'):
+        print(f"  输入 {report['prompt_tokens']} token，输出 {report['completion_tokens']} token" +
+              (f"，其中 {report['degraded_calls']} 次因预算降级" if report.get('degraded_calls') else ""))
+    for task, bucket in sorted((report.get('by_task') or {}).items(),
+                               key=lambda item: -(item[1]['prompt_tokens'] + item[1]['completion_tokens'])):
+        print(f"  - {task}: {bucket['calls']} 次，{bucket['prompt_tokens'] + bucket['completion_tokens']} token")
+    for model, bucket in (report.get('by_model') or {}).items():
+        print(f"  - 模型 {model}: {bucket['calls']} 次，{bucket['prompt_tokens'] + bucket['completion_tokens']} token")
+
+def load_history_ref(tools: AcademicTools, intent: str, parameters: Dict[str, Any],
+                     session_state: Dict[str, Any]) -> int:
+    """按 parameters['history_ref'] 从历史库取回以前的文献并载入为当前文献列表，返回载入的文献数
+
+    history_ref 可以是 s5（结果集）、s5:3 / s5:1-3（结果集中的位置）、#12（历史文献编号）或全文检索关键词。
+    未指定 paper_id 时，总结默认取第 1 篇，引用默认取全部。找不到时抛出 ValueError。
+    """
+    history = tools.history()
+    if history is None:
+        raise ValueError("未启用历史库（HISTORY_DB=off）")
+    papers = history.resolve(parameters['history_ref'])
+    if not papers:
+        raise ValueError(f"历史记录中没有找到：{parameters['history_ref']}")
+    session_state["literature_results"] = papers
+    session_state["history_set_id"] = None
+    session_state["topic_clusters"] = None
+    parameters.setdefault('paper_id', '1' if intent == "summarize" else 'all')
+    return len(papers)
+
+def history_lookup(tools: AcademicTools, query: Optional[str] = None, limit: int = 20) -> Dict[str, Any]:
+    """列出最近的历史结果集，或按关键词全文检索历史文献（本地查询，不调用网络）"""
+    history = tools.history()
+    if history is None:
+        raise ValueError("未启用历史库（HISTORY_DB=off）")
+    if query:
+        return {"papers": history.search(query, limit)}
+    return {"result_sets": history.result_sets(limit)}
+
+def print_history(listing: Dict[str, Any]):
+    """展示历史结果集或历史文献检索结果"""
+    if "result_sets" in listing:
+        if not listing["result_sets"]:
+            print("历史记录为空。")
+        for item in listing["result_sets"]:
+            created = time.strftime('%Y-%m-%d %H:%M', time.localtime(item['created']))
+            print(f"s{item['id']}  {created}  {item['kind']}  {item.get('query') or ''}  （{item['count']} 篇）")
+    else:
+        if not listing["papers"]:
+            print("历史记录中没有匹配的文献。")
+        for paper in listing["papers"]:
+            print(f"#{paper['history_id']}  {paper.get('title', '无标题')} ({paper.get('year') or '未知年份'})")
+
+def print_topic_clusters(clusters: List[Dict[str, Any]], papers: List[Dict[str, Any]], per_cluster: int = 5):
+    """按主题分组展示文献列表：每组显示标签词和前 per_cluster 篇（编号与完整列表一致）"""
+    print(f"\n共 {len(papers)} 篇文献，按主题分为 {len(clusters)} 组（后续总结、引用请使用此编号）：")
+    for cluster in clusters:
+        print(f"\n[主题 {cluster['id'] + 1}] {', '.join(cluster['terms'])}（{cluster['size']} 篇）")
+        for i in cluster['indices'][:per_cluster]:
+            paper = papers[i]
+            print(f"  {i + 1}. {paper.get('title', '无标题')} ({paper.get('year') or '未知年份'})")
+        if cluster['size'] > per_cluster:
+            numbers = ', '.join(str(i + 1) for i in cluster['indices'][per_cluster:per_cluster + 20])
+            more = ' …' if cluster['size'] > per_cluster + 20 else ''
+            print(f"  另有 {cluster['size'] - per_cluster} 篇：{numbers}{more}")
+    unclustered = [i + 1 for i, paper in enumerate(papers) if paper.get('topic_cluster') is None]
+    if unclustered:
+        print(f"\n[未归类] {', '.join(str(i) for i in unclustered[:20])}{' …' if len(unclustered) > 20 else ''}")
+
+# 批处理模式：各意图的结果字段
+BATCH_RESULT_FIELDS = {
+    "search": ["literature_results", "citation_validation", "topic_clusters"],
+    "parse_bibtex": ["literature_results", "citation_validation", "topic_clusters"],
+    "parse_pdf": ["literature_results", "citation_validation", "pdf_sections", "topic_clusters"],
+    "analyze_pdf": ["pdf_analysis"],
+    "summarize": ["summary"],
+    "polish": ["polished_text"],
+    "analyze": ["analysis_results"],
+    "cite": ["citations"]
+}
+# 批处理模式下跨命令保留的会话状态
+BATCH_SESSION_FIELDS = ["literature_results", "citation_validation", "data_path", "history_set_id"]
+
+def _require_pdf(parameters: Dict[str, Any]) -> str:
+    pdf_path = parameters.get('pdf_path')
+    if not pdf_path:
+        raise ValueError("缺少 pdf_path")
+    if not os.path.exists(pdf_path):
+        raise ValueError(f"找不到文件：{pdf_path}")
+    if not pdf_path.lower().endswith('.pdf'):
+        raise ValueError(f"不是 PDF 文件：{pdf_path}")
+    return pdf_path
+
+def command_to_state(intent: str, parameters: Dict[str, Any], session_state: Dict[str, Any]) -> Dict[str, Any]:
+    """把批处理命令转换为工作流的输入状态
+
+    与交互模式的参数处理一致，但不做任何确认或追问：参数缺失或无效时抛出 ValueError。
+    """
+    state = new_session_state()
+    state.update({field: session_state.get(field) for field in BATCH_SESSION_FIELDS})
+    literature_results = state.get("literature_results") or []
+
+    if intent == "search":
+        query = parameters.get('query')
+        search_method = (parameters.get('search_method') or 'scholarly').lower()
+        if not query:
+            raise ValueError("缺少搜索关键词 query")
+        if search_method not in ('scholarly', 'qwen', 'local'):
+            raise ValueError(f"无效的搜索方式: {search_method}")
+        state.update(task_type="search", search_query=query, search_method=search_method)
+    elif intent == "parse_bibtex":
+        bibtex_string = parameters.get('bibtex_string') or ''
+        if not bibtex_string.strip().startswith('@'):
+            raise ValueError("缺少以 '@' 开头的 BibTeX 文本 bibtex_string")
+        state.update(task_type="parse_bibtex", bibtex_input=bibtex_string)
+    elif intent in ("parse_pdf", "analyze_pdf"):
+        state.update(task_type=intent, pdf_path=_require_pdf(parameters))
+    elif intent == "summarize":
+        raw_id = str(parameters['paper_id']).strip() if parameters.get('paper_id') is not None else ''
+        if not raw_id:
+            raise ValueError("缺少文献ID paper_id")
+        if not raw_id.isdigit():
+            raise ValueError(f"文献ID {raw_id} 无效，应为从 1 开始的整数")
+        paper_id = int(raw_id) - 1
+        if not 0 <= paper_id < len(literature_results):
+            raise ValueError(f"文献ID {parameters.get('paper_id')} 无效，当前会话共有 {len(literature_results)} 篇文献")
+        state.update(task_type="summary", paper_to_summarize_index=paper_id)
+    elif intent == "polish":
+        if not parameters.get('text'):
+            raise ValueError("缺少需要润色的文本 text")
+        state.update(task_type="writing", text_to_polish=parameters['text'])
+    elif intent == "analyze":
+        data_type = parameters.get('data_type')
+        data_path = parameters.get('data_path') or state.get("data_path")
+        if not data_type:
+            raise ValueError("缺少数据分析类型 data_type")
+        if not data_path or not os.path.exists(data_path):
+            raise ValueError(f"找不到数据文件：{data_path}")
+        analysis_options = {}
+        if data_type == "regression":
+            targets = parameters.get('targets')
+            if isinstance(targets, str):
+                targets = [t.strip() for t in targets.replace('，', ',').split(',') if t.strip()]
+            if not targets:
+                raise ValueError("回归分析缺少响应变量 targets")
+            analysis_options["targets"] = targets
+            for key in ('features', 'method', 'alpha'):
+                if parameters.get(key):
+                    analysis_options[key] = parameters[key]
+        state.update(task_type="analysis", data_path=data_path, analysis_type=data_type,
+                     analysis_options=analysis_options,
+                     data_options={"columns": parameters.get('columns') or None,
+                                   "sample": parameters.get('sample') or None})
+    elif intent == "cite":
+        style = normalize_style(parameters.get('style') or 'apa')
+        if style not in SUPPORTED_STYLES:
+            raise ValueError(f"不支持的引用格式: {style}")
+        paper_ids = parse_paper_ids(parameters.get('paper_id', ''), len(literature_results))
+        if not literature_results or not all(0 <= i < len(literature_results) for i in paper_ids):
+            raise ValueError(f"文献ID {parameters.get('paper_id')} 无效，当前会话共有 {len(literature_results)} 篇文献")
+        state.update(task_type="references", paper_to_cite_index=paper_ids[0] if len(paper_ids) == 1 else paper_ids,
+                     citation_style=style, citation_export_path=parameters.get('output_path'))
+    else:
+        raise ValueError(f"不支持的意图: {intent}")
+    return state
+
+def execute_command(workflow, tools: AcademicTools, command: Dict[str, Any],
+                    session_state: Dict[str, Any]) -> Dict[str, Any]:
+    """执行一条批处理命令，返回结果记录；成功时就地更新 session_state 中需要跨命令保留的字段
+
+    命令格式：{"id": ..., "session": ..., "intent": "search", "parameters": {...}}；
+    没有 intent 时对 "input" 中的自然语言做意图识别（parameters 中的显式参数优先）。
+    """
+    start = time.perf_counter()
+    record = {"id": command.get("id"), "session": command.get("session")}
+    try:
+        intent = command.get("intent")
+        parameters = dict(command.get("parameters") or {})
+        if not intent:
+            if not command.get("input"):
+                raise ValueError("命令缺少 intent 或 input")
+            intent_data = tools.identify_intent(command["input"])
+            intent = intent_data.get('intent', 'unknown')
+            parameters = {**(intent_data.get('parameters') or {}), **parameters}
+        record["intent"] = intent
+        if intent == "history":
+            record["ok"] = True
+            record["result"] = history_lookup(tools, parameters.get('query'))
+            record["elapsed"] = round(time.perf_counter() - start, 3)
+            return record
+        if parameters.get('history_ref') and intent in ("summarize", "cite"):
+            load_history_ref(tools, intent, parameters, session_state)
+        state = command_to_state(intent, parameters, session_state)
+        state["user_input"] = command.get("input")
+        result = workflow.invoke(state)
+        for field in BATCH_SESSION_FIELDS:
+            session_state[field] = result.get(field)
+        record["ok"] = True
+        record["result"] = {field: result.get(field) for field in BATCH_RESULT_FIELDS[intent]}
+    except Exception as e:
+        record["ok"] = False
+        record["error"] = str(e)
+    record["elapsed"] = round(time.perf_counter() - start, 3)
+    return record
+
+def run_batch(source: str, output: str = '-', workers: int = 8) -> Dict[str, int]:
+    """非交互批处理模式：从 JSONL 文件或标准输入（'-'）读取命令，结果逐条写入 JSONL
+
+    不同会话（session 字段）的命令并发执行，同一会话内按输入顺序依次执行并共享文献列表等状态；
+    没有 session 字段的命令彼此独立。命令边读边执行，适合由数据管道持续输入。
+    调试输出重定向到标准错误，标准输出只包含结果记录。
+    """
+    out = sys.stdout if output == '-' else open(output, 'a', encoding='utf-8')
+    stats = {"total": 0, "ok": 0, "failed": 0}
+    lock = threading.Lock()
+    queues: Dict[str, deque] = {}
+    sessions: Dict[str, Dict[str, Any]] = {}
+
+    def emit(record: Dict[str, Any]):
+        line = json.dumps(record, ensure_ascii=False, default=str)
+        with lock:
+            stats["total"] += 1
+            stats["ok" if record.get("ok") else "failed"] += 1
+            out.write(line + "\n")
+            out.flush()
+
+    def drain(session: str):
+        # 依次执行同一会话排队的命令，队列清空后退出（下一条命令到达时重新提交）
+        while True:
+            with lock:
+                if not queues[session]:
+                    del queues[session]
+                    # 没有 session 字段的命令各占一个一次性会话，执行完即丢弃其状态
+                    if session.startswith("__line"):
+                        sessions.pop(session, None)
+                    return
+                command = queues[session].popleft()
+                session_state = sessions.setdefault(session, {})
+            # 有 session 字段的命令按会话记账和执行 token 预算
+            with tools.session(str(command.get("session") or PROCESS_SESSION)), \
+                    profiler.command(f"{session}-{command.get('id')}"):
+                emit(execute_command(workflow, tools, command, session_state))
+
+    with contextlib.redirect_stdout(sys.stderr):
+        tools = AcademicTools()
+        workflow = create_academic_workflow(speculative_top_k=0, tools=tools)
+        profiler = command_profiler()
+        stream = sys.stdin if source == '-' else open(source, encoding='utf-8')
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for line_no, line in enumerate(stream, 1):
+                if not line.strip():
+                    continue
+                try:
+                    command = json.loads(line)
+                except json.JSONDecodeError as e:
+                    emit({"id": None, "line": line_no, "ok": False, "error": f"无效的 JSON: {str(e)}"})
+                    continue
+                session = str(command.get("session") or f"__line{line_no}")
+                with lock:
+                    idle = session not in queues
+                    queues.setdefault(session, deque()).append(command)
+                if idle:
+                    executor.submit(drain, session)
+        if stream is not sys.stdin:
+            stream.close()
+    if out is not sys.stdout:
+        out.close()
+    print(f"批处理完成: 共 {stats['total']} 条，成功 {stats['ok']} 条，失败 {stats['failed']} 条", file=sys.stderr)
+    return stats
+
+def main():
+    # 初始化工具和工作流
+    tools = AcademicTools()
+    workflow = create_academic_workflow(tools=tools)
+    # 交互模式下用户在等待结果，模型调用优先于后台预取
+    set_priority('interactive')
+    # Ctrl-C 取消正在进行的请求而不退出程序
+    signal.signal(signal.SIGINT, interrupt_handler(tools))
+    # 设置 PROFILE_DIR（或 --profile）时对意图识别和每次工作流执行分别采样
+    profiler = command_profiler()
+    
+    # 存储会话状态
+    session_state = new_session_state()
     
     print_welcome()
     
@@ -87,14 +458,29 @@ def main():
             elif user_input.lower() == 'help':
                 print_help()
                 continue
+            elif user_input.lower() == 'usage':
+                print_usage(tools.usage_report())
+                continue
             
             # 使用意图识别工具
-            intent_data = tools.identify_intent(user_input)
+            with profiler.command("intent"):
+                intent_data = tools.identify_intent(user_input)
             intent = intent_data.get('intent', 'unknown')
             parameters = intent_data.get('parameters', {})
 
             print(f"[DEBUG] 识别到意图: {intent}, 参数: {parameters}")
 
+            if intent == "history":
+                print_history(history_lookup(tools, parameters.get('query')))
+                continue
+            if parameters.get('history_ref') and intent in ("summarize", "cite"):
+                try:
+                    count = load_history_ref(tools, intent, parameters, session_state)
+                    print(f"已从历史记录载入 {count} 篇文献作为当前文献列表。")
+                except ValueError as e:
+                    print(f"抱歉，{str(e)}")
+                    continue
+
             # 根据意图设置任务类型和相关参数到状态中
             if intent == "search":
                 query = parameters.get('query')
@@ -106,14 +492,14 @@ def main():
                 confirm = input(f"您想让我搜索关于 '{query}' 的学术文献并总结吗？(是/否): ").strip().lower()
                 if confirm == '是':
                     # 询问用户偏好的搜索方法
-                    search_method_choice = input("请选择搜索方式 (scholarly/qwen): ").strip().lower()
-                    if search_method_choice in ['scholarly', 'qwen']:
+                    search_method_choice = input("请选择搜索方式 (scholarly/qwen/local): ").strip().lower()
+                    if search_method_choice in ['scholarly', 'qwen', 'local']:
                         session_state["task_type"] = "search"
                         session_state["search_query"] = query
                         session_state["search_method"] = search_method_choice # 将搜索方法存入状态
                         # workflow.invoke(session_state) 将在循环末尾调用
                     else:
-                        print("无效的搜索方式选择，请选择 'scholarly' 或 'qwen'。")
+                        print("无效的搜索方式选择，请选择 'scholarly'、'qwen' 或 'local'。")
                         session_state["task_type"] = None # 重置 task_type
                         continue # 跳过工作流调用
                 else:
@@ -184,7 +570,7 @@ def main():
                              session_state["task_type"] = None # 重置 task_type
                              continue # 跳过工作流调用
                     else:
-                        print(f"抱歉，文献ID {paper_id_str} 无效。当前已找到 {len(session_state.get("literature_results", []))} 篇文献。")
+                        print(f"抱歉，文献ID {paper_id_str} 无效。当前已找到 {len(session_state.get('literature_results', []))} 篇文献。")
                         print("请先进行文献搜索或解析。")
                         session_state["task_type"] = None # 重置 task_type
                         continue # 跳过工作流调用
@@ -213,14 +599,44 @@ def main():
                       print("请指定数据分析的类型，例如：进行描述性统计分析。")
                       session_state["task_type"] = None
                       continue
-                 # 注意：当前没有数据输入和加载逻辑，此处仅设置任务类型
-                 print("当前数据分析功能尚未完全实现，需要先加载数据。")
-                 session_state["task_type"] = None # 暂时不执行，或设置为analysis等待数据
-                 continue # 暂时跳过工作流调用
+                 data_path = parameters.get('data_path') or session_state.get("data_path")
+                 if not data_path:
+                      data_path = input("请输入数据文件路径（支持 CSV/Parquet/Arrow）：").strip()
+                 if not data_path or not os.path.exists(data_path):
+                      print(f"抱歉，找不到数据文件：{data_path}")
+                      session_state["task_type"] = None
+                      continue
+
+                 analysis_options = {}
+                 if data_type == "regression":
+                      targets = parameters.get('targets')
+                      if not targets:
+                           targets = input("请输入回归分析的响应变量（多个用逗号分隔）：").strip()
+                      if isinstance(targets, str):
+                           targets = [t.strip() for t in targets.replace('，', ',').split(',') if t.strip()]
+                      if not targets:
+                           print("未指定响应变量，取消回归分析。")
+                           session_state["task_type"] = None
+                           continue
+                      analysis_options["targets"] = targets
+                      if parameters.get('features'):
+                           analysis_options["features"] = parameters['features']
+                      if parameters.get('method'):
+                           analysis_options["method"] = parameters['method']
+
+                 session_state["task_type"] = "analysis"
+                 session_state["data_path"] = data_path # 保留数据路径，后续分析可直接复用
+                 session_state["analysis_type"] = data_type
+                 session_state["analysis_options"] = analysis_options
+                 session_state["data_options"] = {
+                      "columns": parameters.get('columns') or None,
+                      "sample": parameters.get('sample') or None
+                 }
 
             elif intent == "cite":
                 paper_id_str = parameters.get('paper_id')
-                style = parameters.get('style', 'apa').lower() # 默认为 apa 格式
+                style = normalize_style(parameters.get('style') or 'apa') # 默认为 apa 格式
+                output_path = parameters.get('output_path') # 指定时将引用批量导出到文件
 
                 if not paper_id_str:
                     print("请指定需要生成引用的文献ID，例如：生成第1篇文献的引用。")
@@ -228,24 +644,27 @@ def main():
                     continue
 
                 try:
-                    paper_id = int(paper_id_str) - 1 # 文献ID通常从1开始，转换为列表索引
-                    if session_state.get("literature_results") and 0 <= paper_id < len(session_state["literature_results"]):
-                         if style not in ['apa', 'mla']:
-                             print(f"不支持的引用格式: {style}。支持的格式有 APA 和 MLA。")
+                    total = len(session_state.get("literature_results") or [])
+                    paper_ids = parse_paper_ids(paper_id_str, total) # 文献ID通常从1开始，转换为列表索引
+                    if total and all(0 <= paper_id < total for paper_id in paper_ids):
+                         if style not in SUPPORTED_STYLES:
+                             print(f"不支持的引用格式: {style}。支持的格式有 {', '.join(SUPPORTED_STYLES)}。")
                              session_state["task_type"] = None
                              continue
                          session_state["task_type"] = "references"
-                         session_state["paper_to_cite_index"] = paper_id # 将要引用的文献索引存入状态
+                         # 将要引用的文献索引存入状态（单篇时保持为整数）
+                         session_state["paper_to_cite_index"] = paper_ids[0] if len(paper_ids) == 1 else paper_ids
                          session_state["citation_style"] = style # 将引用格式存入状态
+                         session_state["citation_export_path"] = output_path
                          # workflow.invoke(session_state) 将在循环末尾调用
                     else:
-                        print(f"抱歉，文献ID {paper_id_str} 无效。当前已找到 {len(session_state.get("literature_results", []))} 篇文献。")
+                        print(f"抱歉，文献ID {paper_id_str} 无效。当前已找到 {len(session_state.get('literature_results', []))} 篇文献。")
                         print("请先进行文献搜索或解析。")
                         session_state["task_type"] = None # 重置 task_type
                         continue # 跳过工作流调用
 
                 except ValueError:
-                    print("抱歉，文献ID格式不正确。请输入一个数字，例如：生成第1篇文献的引用。")
+                    print("抱歉，文献ID格式不正确。请输入编号、编号列表或 all，例如：生成第1篇文献的引用、生成第1-3篇文献的引用。")
                     session_state["task_type"] = None # 重置 task_type
                     continue # 跳过工作流调用
 
@@ -272,6 +691,8 @@ def main():
                       print("[DEBUG] 准备解析 PDF 文件...")
                  elif session_state['task_type'] == 'analyze_pdf':
                       print("[DEBUG] 准备分析 PDF 内容...")
+                 elif session_state['task_type'] == 'analysis':
+                      print(f"[DEBUG] 准备加载并分析数据文件 {session_state['data_path']}...")
 
                  print(f"[DEBUG] 执行工作流，任务类型: {session_state['task_type']}")
 
@@ -287,15 +708,19 @@ def main():
                  session_state["pdf_sections"] = None
                  session_state["pdf_analysis"] = None
 
-                 result = workflow.invoke(session_state)
+                 with profiler.command(session_state['task_type']):
+                     result = run_workflow(workflow, session_state)
 
                  # 更新会话状态
                  session_state.update(result)
 
                  # 显示结果
                  if intent == "search" or intent == "parse_bibtex":
-                     if session_state.get("literature_results"):
-                         print("\n找到以下文献：")
+                     if session_state.get("topic_clusters"):
+                         # 文献较多时按主题分组展示
+                         print_topic_clusters(session_state["topic_clusters"], session_state["literature_results"])
+                     elif session_state.get("literature_results"):
+                         print("\n找到以下文献（已去重和校验，后续总结、引用请使用此编号）：")
                          for i, paper in enumerate(session_state["literature_results"]):
                              print(f"\n{i + 1}. {paper.get('title', '无标题')}")
                              authors = paper.get('authors', '未知作者')
@@ -304,11 +729,16 @@ def main():
                              else:
                                  print(f"   作者：{authors}")
                              print(f"   年份：{paper.get('year', '未知年份')}")
+                             if paper.get('duplicate_count'):
+                                 print(f"   （已合并 {paper['duplicate_count']} 条重复记录）")
                              # 优先显示 friendly_summary，如果没有则显示 abstract
                              display_summary = paper.get('friendly_summary', paper.get('abstract', '无摘要'))
                              print(f"   摘要：{display_summary[:200]}..." if len(display_summary) > 200 else f"   摘要：{display_summary}") # 限制摘要显示长度
                              if paper.get('url'):
                                  print(f"   链接：{paper['url']}")
+                             validation = paper.get('validation')
+                             if validation and (validation.get('errors') or validation.get('warnings')):
+                                 print(f"   校验：{'; '.join(validation.get('errors', []) + validation.get('warnings', []))}")
                      else:
                          print("抱歉，没有找到相关的文献或解析失败。")
 
@@ -320,6 +750,12 @@ def main():
                              print(content[:500] + "..." if len(content) > 500 else content)
                      else:
                          print("抱歉，无法解析 PDF 文件。")
+                     references = [p for p in session_state.get("literature_results") or []
+                                   if p.get('source_type') == 'pdf_reference']
+                     if references:
+                         print(f"\n从参考文献章节提取到 {len(references)} 条文献（可继续使用编号进行总结或引用）：")
+                         for i, paper in enumerate(session_state["literature_results"]):
+                             print(f"{i + 1}. {paper.get('title', '无标题')} ({paper.get('year') or '未知年份'})")
 
                  elif intent == "analyze_pdf":
                      if session_state.get("pdf_analysis"):
@@ -357,8 +793,7 @@ def main():
                       # 数据分析结果已在 workflow 中生成并更新到 session_state['analysis_results']
                       if session_state.get("analysis_results"):
                           print("\n数据分析结果：")
-                          # 根据 analysis_results 的结构进行打印，目前没有具体实现，先简单打印
-                          print(session_state["analysis_results"])
+                          print(json.dumps(session_state["analysis_results"], ensure_ascii=False, indent=2, default=str))
                       else:
                           print("抱歉，无法进行数据分析。")
 
@@ -379,30 +814,39 @@ def main():
             session_state["summary"] = None
             session_state["citations"] = []
             session_state["analysis_results"] = None
+            session_state["dataset"] = None # 已加载的数据不跨轮保留，重复分析命中列式缓存即可快速加载
+            session_state["analysis_options"] = None
+            session_state["data_options"] = None
             session_state["user_input"] = None # 保留 user_input 吗？根据需要决定
             session_state["text_to_polish"] = None
             session_state["paper_to_summarize_index"] = None
             session_state["paper_to_cite_index"] = None
             session_state["citation_style"] = None
+            session_state["citation_export_path"] = None
             session_state["pdf_path"] = None
             session_state["pdf_sections"] = None
             session_state["pdf_analysis"] = None
 
+        except KeyboardInterrupt:
+            # Ctrl-C 只取消当前请求，会话（文献列表等）保留
+            print("\n已取消当前请求（输入 exit 退出）。")
+            reset_turn_state(session_state)
+
         except Exception as e:
             print(f"\n发生错误：{str(e)}")
             # 错误发生时也只重置当前任务相关的状态
-            session_state["task_type"] = None
-            session_state["bibtex_input"] = None
-            session_state["user_input"] = None # 保留 user_input 吗？根据需要决定
-            session_state["text_to_polish"] = None
-            session_state["paper_to_summarize_index"] = None
-            session_state["paper_to_cite_index"] = None
-            session_state["citation_style"] = None
-            session_state["pdf_path"] = None
-            session_state["pdf_sections"] = None
-            session_state["pdf_analysis"] = None
-            # 保留 literature_results
-            # session_state["literature_results"] = None # 移除这行或注释掉
+            reset_turn_state(session_state)
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="学术智能体命令行")
+    parser.add_argument("--batch", metavar="FILE", help="非交互批处理模式：从 JSONL 文件读取命令（- 表示标准输入）")
+    parser.add_argument("--output", default="-", help="批处理结果 JSONL 路径（默认标准输出）")
+    parser.add_argument("--workers", type=int, default=8, help="批处理时并发执行的会话数")
+    parser.add_argument("--profile", metavar="DIR", help="对每条命令采样分析耗时，结果写入该目录（同 PROFILE_DIR）")
+    args = parser.parse_args()
+    if args.profile:
+        os.environ['PROFILE_DIR'] = args.profile
+    if args.batch:
+        run_batch(args.batch, args.output, args.workers)
+    else:
+        main()
@@ -0,0 +1,216 @@
+import os
+import time
+import hashlib
+import threading
+from typing import List, Optional
+import numpy as np
+import pandas as pd
+
+# 缓存格式版本号，转换逻辑变化时递增以使旧缓存失效
+_CACHE_VERSION = 1
+# 流式转换 CSV 时每次解析的字节数
+_CSV_BLOCK_SIZE = 64 << 20
+_ARROW_SUFFIXES = ('.arrow', '.feather', '.ipc')
+_PARQUET_SUFFIXES = ('.parquet', '.pq')
+
+
+def default_cache_dir() -> str:
+    """CSV 列式缓存目录，可通过 DATA_CACHE_DIR 环境变量配置"""
+    return os.getenv('DATA_CACHE_DIR') or os.path.join(os.path.expanduser('~'), '.cache', 'acagent')
+
+
+def _cache_path(path: str, cache_dir: str) -> str:
+    """缓存文件名：源文件路径的哈希 + 文件大小/修改时间的哈希，源文件变化后自动失效"""
+    stat = os.stat(path)
+    path_key = hashlib.sha1(os.path.abspath(path).encode('utf-8')).hexdigest()[:16]
+    version_key = hashlib.sha1(f"{stat.st_size}:{stat.st_mtime_ns}:{_CACHE_VERSION}".encode()).hexdigest()[:8]
+    return os.path.join(cache_dir, f"{path_key}-{version_key}.arrow")
+
+
+def _convert_csv(path: str, target: str):
+    """将 CSV 流式转换为未压缩的 Arrow IPC 文件（写临时文件后原子替换）"""
+    import pyarrow as pa
+    import pyarrow.csv as pacsv
+
+    # 批处理模式下多个会话线程可能同时转换同一个 CSV，临时文件按进程和线程区分
+    tmp = f"{target}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        try:
+            reader = pacsv.open_csv(path, read_options=pacsv.ReadOptions(block_size=_CSV_BLOCK_SIZE))
+            with pa.OSFile(tmp, 'wb') as sink, pa.ipc.new_file(sink, reader.schema) as writer:
+                for batch in reader:
+                    writer.write_batch(batch)
+        except pa.ArrowInvalid:
+            # 流式读取只根据第一块推断类型，后续块类型不一致时退回整体读取
+            table = pacsv.read_csv(path)
+            with pa.OSFile(tmp, 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        os.replace(tmp, target)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+    # 删除同一源文件的过期缓存
+    prefix = os.path.basename(target).split('-')[0]
+    for name in os.listdir(os.path.dirname(target)):
+        if name.startswith(prefix + '-') and name.endswith('.arrow') and name != os.path.basename(target):
+            try:
+                os.remove(os.path.join(os.path.dirname(target), name))
+            except FileNotFoundError:
+                # 其他线程已经删除
+                pass
+
+
+def _read_ipc(path: str, columns: Optional[List[str]]):
+    """内存映射读取 Arrow IPC / Feather 文件，只物化需要的列"""
+    import pyarrow as pa
+    import pyarrow.feather as feather
+
+    try:
+        table = pa.ipc.open_file(pa.memory_map(path, 'r')).read_all()
+        return table.select(columns) if columns else table
+    except pa.ArrowInvalid:
+        # Feather v1 或 IPC 流格式
+        return feather.read_table(path, columns=columns, memory_map=True)
+
+
+def _read_table(path: str, columns: Optional[List[str]], use_cache: bool, cache_dir: Optional[str]):
+    """按文件类型读取为 pyarrow.Table，返回 (table, 是否命中缓存)"""
+    lower = path.lower()
+    if lower.endswith(_PARQUET_SUFFIXES):
+        import pyarrow.parquet as pq
+        return pq.read_table(path, columns=columns, memory_map=True), False
+    if lower.endswith(_ARROW_SUFFIXES):
+        return _read_ipc(path, columns), False
+
+    import pyarrow as pa
+    if use_cache:
+        cached = None
+        try:
+            cache_dir = cache_dir or default_cache_dir()
+            os.makedirs(cache_dir, exist_ok=True)
+            cached = _cache_path(path, cache_dir)
+            hit = os.path.exists(cached)
+            if not hit:
+                _convert_csv(path, cached)
+            return _read_ipc(cached, columns), hit
+        except (OSError, pa.ArrowException) as e:
+            print(f"[DEBUG] 列式缓存不可用，直接解析 CSV: {str(e)}")
+            # 损坏（如写了一半）的缓存文件删除，下次重新转换
+            if cached and os.path.exists(cached):
+                try:
+                    os.remove(cached)
+                except OSError:
+                    pass
+
+    import pyarrow.csv as pacsv
+    convert_options = pacsv.ConvertOptions(include_columns=columns) if columns else None
+    try:
+        return pacsv.read_csv(path, convert_options=convert_options), False
+    except pa.ArrowInvalid as e:
+        # pyarrow 拒绝的 CSV（如行的列数不一致）退回 pandas 解析
+        print(f"[DEBUG] pyarrow 无法解析 CSV，改用 pandas: {str(e)}")
+        return pa.Table.from_pandas(pd.read_csv(path, usecols=columns), preserve_index=False), False
+
+
+def _sample_indices(n: int, sample: Optional[int], sample_frac: Optional[float], seed: int) -> Optional[np.ndarray]:
+    """无放回抽样的行号（排序后返回，保持原始行顺序）"""
+    if sample_frac is not None:
+        sample = int(round(n * sample_frac))
+    if sample is None or sample >= n:
+        return None
+    rng = np.random.default_rng(seed)
+    return np.sort(rng.choice(n, size=sample, replace=False))
+
+
+def _downcast_table(table, categorical_threshold: float):
+    """在 Arrow 层面压缩类型：float64 -> float32，整数按取值范围缩小，低基数字符串转为字典编码（pandas 分类类型）"""
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    n = max(table.num_rows, 1)
+    for i, field in enumerate(table.schema):
+        column = table.column(i)
+        if pa.types.is_float64(field.type):
+            column = pc.cast(column, pa.float32())
+        elif pa.types.is_integer(field.type) and column.null_count < len(column):
+            bounds = pc.min_max(column).as_py()
+            for candidate in (pa.int8(), pa.int16(), pa.int32()):
+                info = np.iinfo(candidate.to_pandas_dtype())
+                if info.min <= bounds['min'] and bounds['max'] <= info.max:
+                    if candidate.bit_width < field.type.bit_width:
+                        column = pc.cast(column, candidate)
+                    break
+        elif pa.types.is_string(field.type) or pa.types.is_large_string(field.type):
+            if pc.count_distinct(column).as_py() / n <= categorical_threshold:
+                column = pc.dictionary_encode(column)
+        else:
+            continue
+        table = table.set_column(i, field.name, column)
+    return table
+
+
+def downcast_frame(data: pd.DataFrame, categorical_threshold: float = 0.5) -> pd.DataFrame:
+    """在 pandas 层面压缩类型（未安装 pyarrow 时使用）"""
+    result = {}
+    for name, column in data.items():
+        if pd.api.types.is_float_dtype(column):
+            column = column.astype(np.float32)
+        elif pd.api.types.is_integer_dtype(column):
+            column = pd.to_numeric(column, downcast='integer')
+        elif pd.api.types.is_object_dtype(column) and column.nunique() / max(len(column), 1) <= categorical_threshold:
+            column = column.astype('category')
+        result[name] = column
+    return pd.DataFrame(result, index=data.index)
+
+
+def load_dataset(path: str, columns: Optional[List[str]] = None, downcast: bool = False,
+                 categorical_threshold: float = 0.5, sample: Optional[int] = None,
+                 sample_frac: Optional[float] = None, seed: int = 0, use_cache: bool = True,
+                 cache_dir: Optional[str] = None) -> pd.DataFrame:
+    """加载 CSV / Parquet / Arrow IPC (Feather) 数据文件
+
+    Parquet 和 Arrow 文件以内存映射方式打开，只读取 columns 指定的列；CSV 首次加载时
+    流式转换为 Arrow IPC 缓存，之后同一文件（大小和修改时间未变）直接内存映射缓存，无需重新解析。
+    抽样和类型压缩都在转换为 DataFrame 之前完成，避免物化完整数据。
+
+    Args:
+        path: 数据文件路径
+        columns: 需要的列，None 表示全部列
+        downcast: 是否压缩类型（float32、较小的整数类型、低基数字符串转分类类型）
+        categorical_threshold: 不同取值数 / 行数 不超过该比例的字符串列转为分类类型
+        sample: 随机抽取的行数
+        sample_frac: 随机抽取的行比例（与 sample 同时指定时优先）
+        seed: 抽样随机种子
+        use_cache: CSV 是否使用列式缓存
+        cache_dir: 缓存目录，默认见 default_cache_dir()
+
+    Returns:
+        pd.DataFrame
+    """
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"找不到数据文件: {path}")
+    start = time.perf_counter()
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        if not path.lower().endswith('.csv'):
+            raise ImportError("读取 Parquet/Arrow 文件需要安装 pyarrow：pip install pyarrow")
+        # 没有 pyarrow 时退回 pandas 解析 CSV（无缓存）
+        data = pd.read_csv(path, usecols=columns)
+        indices = _sample_indices(len(data), sample, sample_frac, seed)
+        if indices is not None:
+            data = data.iloc[indices].reset_index(drop=True)
+        return downcast_frame(data, categorical_threshold) if downcast else data
+
+    table, cache_hit = _read_table(path, columns, use_cache, cache_dir)
+    indices = _sample_indices(table.num_rows, sample, sample_frac, seed)
+    if indices is not None:
+        table = table.take(indices)
+    if downcast:
+        table = _downcast_table(table, categorical_threshold)
+    # split_blocks 避免合并为二维块时的额外复制
+    data = table.to_pandas(split_blocks=True)
+    print(f"[DEBUG] 加载数据 {os.path.basename(path)}: {len(data)} 行 x {len(data.columns)} 列，"
+          f"耗时 {time.perf_counter() - start:.2f}s{'（命中列式缓存）' if cache_hit else ''}")
+    return data
@@ -0,0 +1,257 @@
+from typing import List, Dict, Any, Optional, Tuple
+import re
+import numpy as np
+
+from citation_export import normalize_authors
+from citation_validator import normalize_title, normalize_doi
+
+# 滚动哈希的基数（奇数，按 uint64 溢出取模）
+_ROLLING_BASE = np.uint64(1099511628211)
+# 标记为预印本的期刊/来源关键词，挑选代表记录时优先正式发表版本
+_PREPRINT_MARKERS = ('arxiv', 'biorxiv', 'medrxiv', 'ssrn', 'preprint', 'research square')
+# 合并重复记录时按此顺序从其他版本补齐缺失字段
+_MERGE_FIELDS = ('abstract', 'doi', 'journal', 'volume', 'number', 'pages', 'url', 'friendly_summary')
+_YEAR = re.compile(r'(1[5-9]|20)\d{2}')
+# 标题中的编号（数字、罗马数字、中文序数）：Part I / Part II 这类系列文章仅靠编号区分
+_TITLE_NUMBERS = re.compile(r'\b(?:\d+|[ivxlc]+)\b|第[一二三四五六七八九十\d]+')
+
+
+def _shingle_text(paper: Dict[str, Any]) -> str:
+    """生成用于 MinHash 的文本：归一化标题 + 作者姓氏（排序后拼接）"""
+    title = normalize_title(paper.get('title'))
+    families = sorted({normalize_title(a['family']) for a in normalize_authors(paper.get('authors'))})
+    return f"{title} # {' '.join(families)}"
+
+
+def _year_of(paper: Dict[str, Any]) -> int:
+    """发表年份，缺失或无法识别时为 0"""
+    match = _YEAR.search(str(paper.get('year') or ''))
+    return int(match.group()) if match else 0
+
+
+def _title_numbers(paper: Dict[str, Any]) -> Tuple[str, ...]:
+    """标题中的编号序列"""
+    return tuple(_TITLE_NUMBERS.findall(normalize_title(paper.get('title'))))
+
+
+def _connected_components(n: int, left: np.ndarray, right: np.ndarray) -> np.ndarray:
+    """根据边列表计算连通分量标签，优先使用 SciPy，未安装时退回纯 Python 并查集"""
+    try:
+        from scipy.sparse import coo_matrix
+        from scipy.sparse.csgraph import connected_components
+        graph = coo_matrix((np.ones(len(left), dtype=np.int8), (left, right)), shape=(n, n))
+        _, labels = connected_components(graph, directed=False)
+        return labels
+    except ImportError:
+        parent = list(range(n))
+
+        def find(x):
+            while parent[x] != x:
+                parent[x] = parent[parent[x]]
+                x = parent[x]
+            return x
+
+        for a, b in zip(left.tolist(), right.tolist()):
+            ra, rb = find(a), find(b)
+            if ra != rb:
+                parent[max(ra, rb)] = min(ra, rb)
+        return np.array([find(i) for i in range(n)])
+
+
+def record_quality(paper: Dict[str, Any]) -> Tuple:
+    """代表记录的优先级：正式发表 > 有 DOI > 字段完整 > 摘要更长"""
+    venue = str(paper.get('journal') or paper.get('venue') or '').lower()
+    url = str(paper.get('url') or '').lower()
+    is_preprint = any(marker in venue or marker in url for marker in _PREPRINT_MARKERS)
+    filled = sum(1 for field in _MERGE_FIELDS + ('title', 'authors', 'year') if paper.get(field))
+    return (not is_preprint and bool(venue), bool(paper.get('doi')), filled, len(str(paper.get('abstract') or '')))
+
+
+class MinHashDeduplicator:
+    """基于 MinHash + LSH 的近似重复文献检测
+
+    签名计算和分桶均为 NumPy 向量化实现，只比较落在同一 LSH 桶中的候选对，
+    总体复杂度近似线性，可在单机上处理百万级记录。
+
+    Args:
+        num_perm: MinHash 置换个数（签名长度）
+        bands: LSH 分带数，num_perm 必须能被其整除
+        shingle_size: 字节级 shingle 长度
+        threshold: 候选对被判定为重复所需的最低估计 Jaccard 相似度；此外年份（均有时）和标题编号必须一致，
+            标题为空的记录只按 DOI 合并
+        block_size: 分块计算签名时每块的记录数，用于控制内存
+        seed: 随机种子，保证多次运行签名一致
+    """
+
+    def __init__(self, num_perm: int = 64, bands: int = 16, shingle_size: int = 4,
+                 threshold: float = 0.8, block_size: int = 50000, seed: int = 42):
+        if num_perm % bands:
+            raise ValueError("num_perm 必须能被 bands 整除")
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        self.threshold = threshold
+        self.block_size = block_size
+        rng = np.random.default_rng(seed)
+        # 乘法-移位哈希族：h(x) = (a * x + b) >> 32，a 取奇数
+        self.perm_a = rng.integers(1, 2 ** 63, size=num_perm, dtype=np.uint64) | np.uint64(1)
+        self.perm_b = rng.integers(0, 2 ** 63, size=num_perm, dtype=np.uint64)
+        self.band_mult = rng.integers(1, 2 ** 63, size=self.rows, dtype=np.uint64) | np.uint64(1)
+
+    def _block_signatures(self, texts: List[str]) -> np.ndarray:
+        """计算一块记录的 MinHash 签名，返回 (len(texts), num_perm) 的 uint32 矩阵"""
+        k = self.shingle_size
+        encoded = [t.encode('utf-8').ljust(k, b'_') for t in texts]
+        lengths = np.fromiter((len(e) for e in encoded), dtype=np.int64, count=len(encoded))
+        buf = np.frombuffer(b''.join(encoded), dtype=np.uint8).astype(np.uint64)
+        total = len(buf)
+
+        # 所有位置上的 k-gram 滚动哈希
+        hashes = np.zeros(total - k + 1, dtype=np.uint64)
+        with np.errstate(over='ignore'):
+            for j in range(k):
+                hashes = hashes * _ROLLING_BASE + buf[j:total - k + 1 + j]
+
+        # 只保留不跨越记录边界的 k-gram
+        record_ids = np.repeat(np.arange(len(encoded)), lengths)
+        valid = record_ids[:total - k + 1] == record_ids[k - 1:]
+        hashes = hashes[valid]
+        starts = np.concatenate(([0], np.cumsum(lengths - k + 1)[:-1]))
+
+        signatures = np.empty((len(encoded), self.num_perm), dtype=np.uint32)
+        with np.errstate(over='ignore'):
+            for i in range(self.num_perm):
+                permuted = (hashes * self.perm_a[i] + self.perm_b[i]) >> np.uint64(32)
+                signatures[:, i] = np.minimum.reduceat(permuted, starts)
+        return signatures
+
+    def signatures(self, papers: List[Dict[str, Any]]) -> np.ndarray:
+        """分块计算全部记录的 MinHash 签名"""
+        signatures = np.empty((len(papers), self.num_perm), dtype=np.uint32)
+        for start in range(0, len(papers), self.block_size):
+            block = papers[start:start + self.block_size]
+            signatures[start:start + len(block)] = self._block_signatures([_shingle_text(p) for p in block])
+        return signatures
+
+    def _candidate_pairs(self, signatures: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """LSH 分桶：同一桶内的记录与桶首及相邻记录组成候选对"""
+        n = len(signatures)
+        banded = signatures.reshape(n, self.bands, self.rows).astype(np.uint64)
+        with np.errstate(over='ignore'):
+            band_keys = (banded * self.band_mult).sum(axis=2)
+
+        pairs = []
+        for b in range(self.bands):
+            order = np.argsort(band_keys[:, b], kind='stable')
+            keys = band_keys[order, b]
+            same = keys[1:] == keys[:-1]
+            if not same.any():
+                continue
+            # 每个位置所在桶的起始下标
+            boundaries = np.concatenate(([True], ~same))
+            head = np.maximum.accumulate(np.where(boundaries, np.arange(n), 0))
+            idx = np.nonzero(same)[0] + 1
+            pairs.append(np.stack([order[idx - 1], order[idx]], axis=1))
+            pairs.append(np.stack([order[head[idx]], order[idx]], axis=1))
+        if not pairs:
+            empty = np.empty(0, dtype=np.int64)
+            return empty, empty
+
+        pairs = np.concatenate(pairs)
+        pairs = pairs[pairs[:, 0] != pairs[:, 1]]
+        pairs.sort(axis=1)
+        pairs = np.unique(pairs, axis=0)
+        return pairs[:, 0], pairs[:, 1]
+
+    def _matches(self, signatures: np.ndarray, years: np.ndarray, numbers: np.ndarray, titled: np.ndarray,
+                 left: np.ndarray, right: np.ndarray) -> np.ndarray:
+        """分块校验记录对：估计 Jaccard 相似度达到阈值、年份一致或缺失、标题编号一致且标题非空"""
+        keep = np.zeros(len(left), dtype=bool)
+        for start in range(0, len(left), 200000):
+            a, b = left[start:start + 200000], right[start:start + 200000]
+            similarity = (signatures[a] == signatures[b]).mean(axis=1)
+            same_year = (years[a] == years[b]) | (years[a] == 0) | (years[b] == 0)
+            keep[start:start + len(a)] = ((similarity >= self.threshold) & same_year & (numbers[a] == numbers[b])
+                                          & titled[a] & titled[b])
+        return keep
+
+    def cluster(self, papers: List[Dict[str, Any]], signatures: Optional[np.ndarray] = None) -> np.ndarray:
+        """返回每条记录的簇标签，标签相同的记录互为近似重复"""
+        n = len(papers)
+        if n == 0:
+            return np.empty(0, dtype=np.int64)
+        if signatures is None:
+            signatures = self.signatures(papers)
+        years = np.fromiter((_year_of(p) for p in papers), dtype=np.int64, count=n)
+        # 编号序列映射为整数便于向量化比较
+        number_ids = {}
+        numbers = np.fromiter((number_ids.setdefault(_title_numbers(p), len(number_ids)) for p in papers),
+                              dtype=np.int64, count=n)
+        titled = np.fromiter((bool(normalize_title(p.get('title'))) for p in papers), dtype=bool, count=n)
+        left, right = self._candidate_pairs(signatures)
+        keep = self._matches(signatures, years, numbers, titled, left, right)
+
+        # 同一 DOI 的记录直接视为重复
+        dois = [normalize_doi(p.get('doi')) for p in papers]
+        first_by_doi = {}
+        doi_left, doi_right = [], []
+        for i, doi in enumerate(dois):
+            if doi:
+                if doi in first_by_doi:
+                    doi_left.append(first_by_doi[doi])
+                    doi_right.append(i)
+                else:
+                    first_by_doi[doi] = i
+        left = np.concatenate([left[keep], np.array(doi_left, dtype=np.int64)])
+        right = np.concatenate([right[keep], np.array(doi_right, dtype=np.int64)])
+        labels = _connected_components(n, left, right)
+
+        # 传递合并可能把 A~B、B~C 但 A≁C 的记录连成一簇：每簇以首条记录为代表复核，
+        # 与代表既不相似也不同 DOI 的记录单独成簇
+        order = np.argsort(labels, kind='stable')
+        sorted_labels = labels[order]
+        is_head = np.concatenate(([True], sorted_labels[1:] != sorted_labels[:-1]))
+        heads = order[np.maximum.accumulate(np.where(is_head, np.arange(n), 0))]
+        members = order[~is_head]
+        if len(members):
+            representatives = heads[~is_head]
+            confirmed = self._matches(signatures, years, numbers, titled, representatives, members)
+            confirmed |= np.array([bool(dois[r]) and dois[r] == dois[m]
+                                   for r, m in zip(representatives.tolist(), members.tolist())], dtype=bool)
+            labels = labels.copy()
+            labels[members[~confirmed]] = labels.max() + 1 + np.arange(int((~confirmed).sum()))
+        return labels
+
+    def deduplicate(self, papers: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """对文献列表去重，每个簇输出一条代表记录（保持簇首次出现的顺序）
+
+        代表记录会从同簇其他版本补齐缺失字段，并附加 duplicate_count 和 merged_sources。
+        """
+        labels = self.cluster(papers)
+        clusters = {}
+        for i, label in enumerate(labels.tolist()):
+            clusters.setdefault(label, []).append(i)
+
+        results = []
+        for members in clusters.values():
+            if len(members) == 1:
+                results.append(papers[members[0]])
+                continue
+            best = max(members, key=lambda i: record_quality(papers[i]))
+            canonical = dict(papers[best])
+            for i in members:
+                for field in _MERGE_FIELDS:
+                    if not canonical.get(field) and papers[i].get(field):
+                        canonical[field] = papers[i][field]
+            canonical['duplicate_count'] = len(members) - 1
+            canonical['merged_sources'] = sorted({str(papers[i].get('source_type', 'search')) for i in members})
+            results.append(canonical)
+        return results
+
+
+def deduplicate_papers(papers: List[Dict[str, Any]], **kwargs) -> List[Dict[str, Any]]:
+    """使用默认参数对文献列表去重"""
+    if len(papers) < 2:
+        return list(papers)
+    return MinHashDeduplicator(**kwargs).deduplicate(papers)
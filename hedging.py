@@ -0,0 +1,108 @@
+import time
+import threading
+from collections import deque
+from concurrent.futures import Executor, Future, wait, FIRST_COMPLETED
+from typing import Callable, Dict, Optional, Tuple, Any
+
+
+class CallTimeout(TimeoutError):
+    """模型调用超过任务的截止时间"""
+
+
+class CallCancelled(RuntimeError):
+    """模型调用被用户取消（Ctrl-C）"""
+
+
+class LatencyTracker:
+    """按任务记录最近的调用耗时，给出触发对冲请求的等待时间（p95）
+
+    Args:
+        window: 每个任务保留的耗时记录数
+        min_samples: 记录数少于该值时不对冲（还不知道该任务的正常耗时）
+        quantile: 触发对冲的耗时分位数
+        min_delay: 对冲等待时间的下限（秒），避免对很快的调用也发送重复请求
+    """
+
+    def __init__(self, window: int = 200, min_samples: int = 20, quantile: float = 0.95, min_delay: float = 1.0):
+        self.window = window
+        self.min_samples = min_samples
+        self.quantile = quantile
+        self.min_delay = min_delay
+        self._latencies: Dict[str, deque] = {}
+        self._lock = threading.Lock()
+
+    def record(self, task: Optional[str], elapsed: float):
+        with self._lock:
+            self._latencies.setdefault(task or '', deque(maxlen=self.window)).append(elapsed)
+
+    def hedge_delay(self, task: Optional[str]) -> Optional[float]:
+        """调用超过该时间仍未返回时发送对冲请求；记录不足时返回 None（不对冲）"""
+        with self._lock:
+            latencies = sorted(self._latencies.get(task or '', ()))
+        if len(latencies) < self.min_samples:
+            return None
+        return max(self.min_delay, latencies[min(len(latencies) - 1, int(len(latencies) * self.quantile))])
+
+
+def run_hedged(call: Callable[[], Any], executor: Executor, timeout: float, hedge_after: Optional[float] = None,
+               cancelled: Optional[Callable[[], bool]] = None, acquire_hedge: Optional[Callable[[], bool]] = None,
+               release_hedge: Optional[Callable[[], None]] = None, poll: float = 0.2,
+               on_discard: Optional[Callable[[Future], None]] = None) -> Tuple[Any, bool]:
+    """在工作线程中执行 call，等待期间可被取消、超时，超过 hedge_after 秒未返回时再发送一个相同的请求
+
+    先成功返回的结果被采用，另一个请求在后台结束后丢弃；其中一个请求出错时继续等待另一个，
+    都出错时抛出最后一个错误（模型降级已在 call 内处理，出错时不再额外对冲）。
+    已发出的请求无法撤回，超时或取消后仍会在后台执行完（并产生费用）。
+
+    Args:
+        call: 发出一次请求并返回结果的函数（可能被并发调用两次）
+        executor: 执行请求的线程池
+        timeout: 截止时间（秒），超过时抛出 CallTimeout
+        hedge_after: 发送对冲请求前等待的秒数，为 None 时不对冲
+        cancelled: 返回 True 时放弃等待并抛出 CallCancelled
+        acquire_hedge: 对冲前调用，返回 False 时不发送（例如没有空闲的调用名额）
+        release_hedge: 对冲请求结束后调用
+        poll: 检查取消状态的间隔（秒）
+        on_discard: 返回或抛出异常前，对每个结果未被采用的请求（对冲中落败的、超时或取消时仍在进行的）调用一次，
+            参数为该请求的 Future（可能尚未完成），用于在请求结束后记录用量
+
+    Returns:
+        (结果, 是否由对冲请求返回)
+    """
+    start = time.monotonic()
+    deadline = start + timeout
+    pending = [executor.submit(call)]
+    submitted = list(pending)
+    hedge = None
+    winner = None
+    try:
+        while True:
+            if cancelled and cancelled():
+                raise CallCancelled("模型调用已取消")
+            now = time.monotonic()
+            if now >= deadline:
+                raise CallTimeout(f"模型调用超过 {timeout:.0f} 秒未返回")
+            wait_for = min(poll, deadline - now)
+            if hedge is None and hedge_after is not None and now < start + hedge_after:
+                wait_for = min(wait_for, start + hedge_after - now)
+            done, _ = wait(pending, timeout=wait_for, return_when=FIRST_COMPLETED)
+            for future in done:
+                pending.remove(future)
+                error = future.exception()
+                if error is None:
+                    winner = future
+                    return future.result(), future is hedge
+                if not pending:
+                    raise error
+            if hedge is None and hedge_after is not None and time.monotonic() - start >= hedge_after \
+                    and (acquire_hedge is None or acquire_hedge()):
+                hedge = executor.submit(call)
+                if release_hedge:
+                    hedge.add_done_callback(lambda _: release_hedge())
+                pending.append(hedge)
+                submitted.append(hedge)
+    finally:
+        if on_discard:
+            for future in submitted:
+                if future is not winner:
+                    on_discard(future)
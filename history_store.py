@@ -0,0 +1,195 @@
+import os
+import re
+import json
+import time
+import sqlite3
+import threading
+from typing import List, Dict, Any, Optional
+
+# 结果集引用：s5（第 5 个结果集全部文献）、s5:3 或 s5:1-3（其中的第 3 篇 / 第 1-3 篇）
+_SET_REF = re.compile(r'^s(\d+)(?::(\d+)(?:-(\d+))?)?$', re.IGNORECASE)
+# 文献引用：#12 或 #12,#15（历史库中的文献编号）
+_PAPER_REF = re.compile(r'^#\d+(\s*,\s*#\d+)*$')
+
+
+def default_history_path() -> Optional[str]:
+    """历史库路径，可通过 HISTORY_DB 环境变量配置，设为 off 时不记录历史"""
+    path = os.getenv('HISTORY_DB')
+    if path and path.lower() == 'off':
+        return None
+    return path or os.path.join(os.path.expanduser('~'), '.cache', 'acagent', 'history.db')
+
+
+def _fts_query(text: str) -> Optional[str]:
+    """把用户输入转换为 FTS5 查询：每个词作为短语（trigram 分词要求至少 3 个字符），词之间为 AND"""
+    terms = [t for t in text.split() if len(t) >= 3]
+    if not terms:
+        return None
+    return ' '.join('"' + t.replace('"', '""') + '"' for t in terms)
+
+
+class HistoryStore:
+    """本地历史库：保存每一次的检索/解析结果集、摘要、引用和 PDF 分析，并建立 FTS5 全文索引
+
+    文献表与 FTS5 表（trigram 分词，支持中文子串匹配）共享 rowid，
+    之后可以按结果集编号、文献编号或全文匹配取回以前的文献，无需重新检索。
+
+    Args:
+        db_path: 数据库路径，不存在时自动创建
+    """
+
+    def __init__(self, db_path: Optional[str] = None):
+        self.db_path = db_path or default_history_path()
+        directory = os.path.dirname(self.db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode = WAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS result_sets (
+                id INTEGER PRIMARY KEY,
+                kind TEXT,
+                query TEXT,
+                created REAL
+            );
+            CREATE TABLE IF NOT EXISTS papers (
+                id INTEGER PRIMARY KEY,
+                set_id INTEGER REFERENCES result_sets(id),
+                position INTEGER,
+                title TEXT,
+                year TEXT,
+                data TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_papers_set ON papers(set_id, position);
+            CREATE TABLE IF NOT EXISTS artifacts (
+                id INTEGER PRIMARY KEY,
+                kind TEXT,
+                paper_id INTEGER,
+                source TEXT,
+                style TEXT,
+                content TEXT,
+                created REAL
+            );
+            CREATE INDEX IF NOT EXISTS idx_artifacts_paper ON artifacts(paper_id, kind);
+            CREATE VIRTUAL TABLE IF NOT EXISTS papers_fts USING fts5(
+                title, authors, abstract, summary, tokenize = 'trigram'
+            );
+        """)
+        self.conn.commit()
+        self._lock = threading.Lock()
+
+    def record_results(self, kind: str, papers: List[Dict[str, Any]], query: Optional[str] = None) -> Dict[str, Any]:
+        """保存一个结果集（search / parse_bibtex / parse_pdf），返回 {'set_id', 'paper_ids'}"""
+        paper_ids = []
+        with self._lock:
+            cursor = self.conn.execute("INSERT INTO result_sets (kind, query, created) VALUES (?, ?, ?)",
+                                       (kind, query, time.time()))
+            set_id = cursor.lastrowid
+            for position, paper in enumerate(papers, 1):
+                data = {k: v for k, v in paper.items() if k != 'history_id'}
+                cursor = self.conn.execute(
+                    "INSERT INTO papers (set_id, position, title, year, data) VALUES (?, ?, ?, ?, ?)",
+                    (set_id, position, paper.get('title', ''), str(paper.get('year') or ''),
+                     json.dumps(data, ensure_ascii=False, default=str)))
+                paper_ids.append(cursor.lastrowid)
+                authors = paper.get('authors', '')
+                if isinstance(authors, list):
+                    authors = ', '.join(str(a) for a in authors)
+                self.conn.execute(
+                    "INSERT INTO papers_fts (rowid, title, authors, abstract, summary) VALUES (?, ?, ?, ?, '')",
+                    (cursor.lastrowid, paper.get('title', ''), str(authors or ''),
+                     str(paper.get('friendly_summary') or paper.get('abstract') or '')))
+            self.conn.commit()
+        return {'set_id': set_id, 'paper_ids': paper_ids}
+
+    def record_artifact(self, kind: str, content: Any, paper_id: Optional[int] = None, source: Optional[str] = None,
+                        style: Optional[str] = None):
+        """保存摘要（summary）、引用（citation）或 PDF 分析（pdf_analysis）；摘要同时写入全文索引"""
+        text = content if isinstance(content, str) else json.dumps(content, ensure_ascii=False, default=str)
+        with self._lock:
+            self.conn.execute(
+                "INSERT INTO artifacts (kind, paper_id, source, style, content, created) VALUES (?, ?, ?, ?, ?, ?)",
+                (kind, paper_id, source, style, text, time.time()))
+            if kind == 'summary' and paper_id is not None:
+                self.conn.execute("UPDATE papers_fts SET summary = ? WHERE rowid = ?", (text, paper_id))
+            self.conn.commit()
+
+    def latest_artifact(self, kind: str, paper_id: Optional[int] = None, source: Optional[str] = None,
+                        style: Optional[str] = None) -> Optional[str]:
+        """返回某篇文献（或某个来源文件）最近一次保存的摘要/引用/分析，没有时返回 None"""
+        sql = "SELECT content FROM artifacts WHERE kind = ?"
+        params: List[Any] = [kind]
+        for column, value in (('paper_id', paper_id), ('source', source), ('style', style)):
+            if value is not None:
+                sql += f" AND {column} = ?"
+                params.append(value)
+        with self._lock:
+            row = self.conn.execute(sql + " ORDER BY id DESC LIMIT 1", params).fetchone()
+        return row['content'] if row else None
+
+    def _papers(self, where: str, params: List[Any], order: str = "p.set_id, p.position") -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = self.conn.execute(f"SELECT p.id, p.data FROM papers p WHERE {where} ORDER BY {order}",
+                                     params).fetchall()
+        return [{**json.loads(row['data']), 'history_id': row['id']} for row in rows]
+
+    def get_papers(self, paper_ids: List[int]) -> List[Dict[str, Any]]:
+        """按文献编号取回文献（保持给定顺序）"""
+        if not paper_ids:
+            return []
+        found = {p['history_id']: p for p in self._papers(f"p.id IN ({','.join('?' * len(paper_ids))})",
+                                                           list(paper_ids))}
+        return [found[i] for i in paper_ids if i in found]
+
+    def get_result_set(self, set_id: int, start: Optional[int] = None, end: Optional[int] = None) -> List[Dict[str, Any]]:
+        """取回某个结果集中的文献，可按位置（从 1 开始，含两端）截取"""
+        where, params = "p.set_id = ?", [set_id]
+        if start is not None:
+            where += " AND p.position BETWEEN ? AND ?"
+            params += [start, end if end is not None else start]
+        return self._papers(where, params)
+
+    def result_sets(self, limit: int = 20) -> List[Dict[str, Any]]:
+        """最近的结果集列表（编号、类型、查询词、时间、文献数）"""
+        with self._lock:
+            rows = self.conn.execute("""
+                SELECT r.id, r.kind, r.query, r.created, COUNT(p.id) AS count
+                FROM result_sets r LEFT JOIN papers p ON p.set_id = r.id
+                GROUP BY r.id ORDER BY r.id DESC LIMIT ?""", (limit,)).fetchall()
+        return [dict(row) for row in rows]
+
+    def search(self, text: str, limit: int = 10) -> List[Dict[str, Any]]:
+        """全文检索历史文献（标题、作者、摘要、已生成的详细摘要），按 BM25 相关度排序；同一标题的多次记录只保留一条"""
+        query = _fts_query(text)
+        with self._lock:
+            if query:
+                rows = self.conn.execute(
+                    "SELECT rowid FROM papers_fts WHERE papers_fts MATCH ? ORDER BY bm25(papers_fts, 10.0, 2.0, 1.0, 1.0) "
+                    "LIMIT ?", (query, limit * 5)).fetchall()
+            else:
+                # 少于 3 个字符的查询无法使用 trigram 索引，退回标题子串匹配
+                rows = self.conn.execute("SELECT id AS rowid FROM papers WHERE title LIKE ? ORDER BY id DESC LIMIT ?",
+                                         (f"%{text.strip()}%", limit * 5)).fetchall()
+        papers, seen = [], set()
+        for paper in self.get_papers([row['rowid'] for row in rows]):
+            key = (paper.get('title') or '').lower()
+            if key in seen:
+                continue
+            seen.add(key)
+            papers.append(paper)
+        return papers[:limit]
+
+    def resolve(self, ref: str, limit: int = 10) -> List[Dict[str, Any]]:
+        """解析历史引用：s5 / s5:3 / s5:1-3（结果集及位置）、#12,#15（文献编号），其余按全文检索"""
+        ref = str(ref).strip()
+        match = _SET_REF.match(ref)
+        if match:
+            set_id, start, end = match.groups()
+            return self.get_result_set(int(set_id), int(start) if start else None, int(end) if end else None)
+        if _PAPER_REF.match(ref):
+            return self.get_papers([int(part.strip().lstrip('#')) for part in ref.split(',')])
+        return self.search(ref, limit)
+
+    def close(self):
+        self.conn.close()
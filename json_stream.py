@@ -0,0 +1,132 @@
+import re
+import json
+from typing import List, Dict, Any, Optional
+
+# 修复常见的非标准 JSON：对象/数组末尾多余的逗号
+_TRAILING_COMMA = re.compile(r',\s*([}\]])')
+_CLOSERS = {'{': '}', '[': ']'}
+
+
+def _loads_lenient(text: str) -> Optional[Any]:
+    """解析 JSON，失败时去掉末尾多余逗号后重试，仍失败返回 None"""
+    for candidate in (text, _TRAILING_COMMA.sub(r'\1', text)):
+        try:
+            return json.loads(candidate)
+        except json.JSONDecodeError:
+            continue
+    return None
+
+
+class JSONArrayStream:
+    """增量、容错的 JSON 数组解析器
+
+    逐段喂入模型输出（可以是流式返回的增量片段），每当数组中的一个对象完整时立即返回该对象。
+    自动跳过数组之前的说明文字和 Markdown 代码块标记，也支持 {"papers": [...]} 这样包在对象里的数组；
+    输出被截断时，finish() 会尝试补全最后一个不完整的对象。
+
+    用法：
+        stream = JSONArrayStream()
+        for delta in deltas:
+            for item in stream.feed(delta):
+                ...
+        items = stream.finish()
+    """
+
+    def __init__(self):
+        self.started = False     # 是否已进入目标数组
+        self.done = False        # 数组是否已经闭合
+        self._pending_open = False  # 刚看到 '['，等待下一个非空白字符确认
+        self._element: List[str] = []
+        self._stack: List[str] = []  # 当前元素内未闭合的 { / [
+        self._in_string = False
+        self._escape = False
+        self._last_comma = -1    # 当前元素最外层最后一个逗号的位置（截断恢复用）
+
+    def feed(self, text: str) -> List[Any]:
+        """喂入一段文本，返回本段中新完成的数组元素（只返回对象）"""
+        items = []
+        for ch in text:
+            if self.done:
+                break
+            if not self.started:
+                self._scan_prefix(ch)
+                continue
+            item = self._consume(ch)
+            if item is not None:
+                items.append(item)
+        return items
+
+    def _scan_prefix(self, ch: str):
+        """在数组开始前查找 '[' 且其后紧跟 '{' 或 ']'（避免把说明文字中的 [1] 当作数组）"""
+        if self._pending_open:
+            if ch.isspace():
+                return
+            if ch == '{' or ch == ']':
+                self.started = True
+                self._pending_open = False
+                self._consume(ch)
+                return
+            self._pending_open = False
+        if ch == '[':
+            self._pending_open = True
+
+    def _consume(self, ch: str) -> Optional[Any]:
+        if self._in_string:
+            self._element.append(ch)
+            if self._escape:
+                self._escape = False
+            elif ch == '\\':
+                self._escape = True
+            elif ch == '"':
+                self._in_string = False
+            return None
+
+        if not self._stack:
+            # 元素之间：只关心对象开始和数组结束
+            if ch == ']':
+                self.done = True
+            elif ch == '{':
+                self._element = ['{']
+                self._stack = ['{']
+                self._last_comma = -1
+            return None
+
+        self._element.append(ch)
+        if ch == '"':
+            self._in_string = True
+        elif ch in '{[':
+            self._stack.append(ch)
+        elif ch in '}]':
+            self._stack.pop()
+            if not self._stack:
+                item = _loads_lenient(''.join(self._element))
+                self._element = []
+                return item if isinstance(item, dict) else None
+        elif ch == ',' and len(self._stack) == 1:
+            self._last_comma = len(self._element) - 1
+        return None
+
+    def finish(self) -> List[Any]:
+        """输入结束：尝试补全被截断的最后一个对象，返回恢复出的元素（可能为空）"""
+        if not self._stack:
+            return []
+        text = ''.join(self._element)
+        closers = ''.join(_CLOSERS[c] for c in reversed(self._stack))
+        candidates = [text + ('"' if self._in_string else '') + closers]
+        if self._last_comma > 0:
+            # 截断在某个键值对中间：丢弃最后一个不完整的字段
+            candidates.append(text[:self._last_comma] + '}')
+        self._stack = []
+        self._element = []
+        for candidate in candidates:
+            item = _loads_lenient(candidate)
+            if isinstance(item, dict):
+                return [item]
+        return []
+
+
+def parse_json_array(text: str) -> List[Dict[str, Any]]:
+    """从模型输出中容错地解析对象数组（忽略代码块标记和前后说明，恢复被截断的数组）"""
+    stream = JSONArrayStream()
+    items = stream.feed(text or '')
+    return items + stream.finish()
@@ -0,0 +1,73 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from typing import List, Dict, Any, Optional
+
+
+def default_cache_path() -> str:
+    """模型结果缓存数据库路径，可通过 LLM_CACHE_DB 环境变量配置"""
+    return os.getenv('LLM_CACHE_DB') or os.path.join(os.path.expanduser('~'), '.cache', 'acagent', 'llm_cache.db')
+
+
+def content_key(*parts: Any) -> str:
+    """由模型名、任务参数和输入内容计算缓存键（SHA-256）"""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(str(part).encode('utf-8'))
+        digest.update(b'\x1f')
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """基于 SQLite 的模型结果缓存，按 (namespace, key) 存取，跨进程、跨会话复用
+
+    Args:
+        db_path: 数据库路径，不存在时自动创建
+    """
+
+    def __init__(self, db_path: Optional[str] = None):
+        self.db_path = db_path or default_cache_path()
+        directory = os.path.dirname(self.db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode = WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS results (
+                namespace TEXT,
+                key TEXT,
+                value TEXT,
+                created REAL,
+                PRIMARY KEY (namespace, key)
+            )""")
+        self.conn.commit()
+        self._lock = threading.Lock()
+
+    def get_many(self, namespace: str, keys: List[str]) -> Dict[str, Any]:
+        """批量查询，返回命中的 {key: value}"""
+        found = {}
+        unique = list(dict.fromkeys(keys))
+        with self._lock:
+            for start in range(0, len(unique), 500):
+                batch = unique[start:start + 500]
+                placeholders = ','.join('?' * len(batch))
+                rows = self.conn.execute(
+                    f"SELECT key, value FROM results WHERE namespace = ? AND key IN ({placeholders})",
+                    [namespace] + batch).fetchall()
+                found.update((key, json.loads(value)) for key, value in rows)
+        return found
+
+    def get(self, namespace: str, key: str) -> Optional[Any]:
+        return self.get_many(namespace, [key]).get(key)
+
+    def put(self, namespace: str, key: str, value: Any):
+        with self._lock:
+            self.conn.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)",
+                              (namespace, key, json.dumps(value, ensure_ascii=False), time.time()))
+            self.conn.commit()
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,256 @@
+import os
+import time
+import heapq
+import itertools
+import threading
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Any, Optional
+
+# 优先级类别，数字越小越优先
+PRIORITIES = {'interactive': 0, 'normal': 1, 'background': 2}
+# 未通过 call_priority 指定时各任务的默认类别（意图识别总是用户在等待）
+TASK_PRIORITIES = {'intent': 'interactive'}
+
+_priority: ContextVar[Optional[str]] = ContextVar('llm_priority', default=None)
+_deadline: ContextVar[Optional[float]] = ContextVar('llm_deadline', default=None)
+_owner: ContextVar[Any] = ContextVar('llm_owner', default=None)
+
+
+class SchedulerTimeout(TimeoutError):
+    """排队超过截止时间仍未获得调用名额"""
+
+
+class Preempted(RuntimeError):
+    """排队中的低优先级调用被取消（让位于更高优先级的请求）"""
+
+
+@contextmanager
+def call_priority(priority: str, timeout: Optional[float] = None, owner: Any = None):
+    """在当前上下文（线程或 LangGraph 节点）内为模型调用指定优先级类别和排队截止时间
+
+    Args:
+        priority: interactive / normal / background
+        timeout: 从现在起最多排队的秒数，超过时抛出 SchedulerTimeout；为 None 时不限
+        owner: 发起调用的对象，cancel_queued(owner=...) 只取消它自己排队中的调用；为 None 时沿用外层的设置
+    """
+    if priority not in PRIORITIES:
+        raise ValueError(f"未知的优先级: {priority}")
+    priority_token = _priority.set(priority)
+    deadline_token = _deadline.set(time.monotonic() + timeout if timeout is not None else None)
+    owner_token = _owner.set(owner if owner is not None else _owner.get())
+    try:
+        yield
+    finally:
+        _priority.reset(priority_token)
+        _deadline.reset(deadline_token)
+        _owner.reset(owner_token)
+
+
+def set_priority(priority: str):
+    """设置当前上下文（例如交互式命令行的主线程）之后所有模型调用的默认优先级类别"""
+    if priority not in PRIORITIES:
+        raise ValueError(f"未知的优先级: {priority}")
+    _priority.set(priority)
+
+
+def current_priority(task: Optional[str] = None) -> str:
+    """当前上下文的优先级类别：call_priority 指定的 > 任务默认 > normal"""
+    return _priority.get() or TASK_PRIORITIES.get(task or '') or 'normal'
+
+
+def current_deadline() -> Optional[float]:
+    """当前上下文的排队截止时间（time.monotonic() 时间点），未指定时为 None"""
+    return _deadline.get()
+
+
+def current_owner() -> Any:
+    """当前上下文中发起模型调用的对象（call_priority 的 owner），未指定时为 None"""
+    return _owner.get()
+
+
+class _Waiter:
+    __slots__ = ('priority', 'deadline', 'owner', 'event', 'granted', 'cancelled')
+
+    def __init__(self, priority: str, deadline: Optional[float], owner: Any = None):
+        self.priority = priority
+        self.deadline = deadline
+        self.owner = owner
+        self.event = threading.Event()
+        self.granted = False
+        self.cancelled = False
+
+
+class LLMScheduler:
+    """模型调用的中央调度器：所有调用先领取名额再请求 API
+
+    - 总并发不超过 max_concurrency（对应 API 配额），每个优先级类别另有并发上限；
+      默认 normal 至少给 interactive 留 1 个名额，background 最多占用一半，保证用户请求随时有空位
+    - 名额释放时按 (优先级, 截止时间, 到达顺序) 分配给排队的调用，interactive 总是排在所有后台任务之前
+    - 排队超过截止时间的调用抛出 SchedulerTimeout；cancel_queued() 可取消排队中的低优先级调用（抛出 Preempted），
+      指定 owner 时只取消该对象发起的调用
+    - 已经发出的请求不会被打断
+
+    Args:
+        max_concurrency: 总并发上限
+        class_limits: 各优先级类别的并发上限
+        history: 每个类别保留的排队耗时记录数（用于统计 p95）
+    """
+
+    def __init__(self, max_concurrency: int = 8, class_limits: Optional[Dict[str, int]] = None, history: int = 500):
+        self.max_concurrency = max(1, max_concurrency)
+        self.class_limits = {
+            'interactive': self.max_concurrency,
+            'normal': max(1, self.max_concurrency - 1),
+            'background': max(1, self.max_concurrency // 2)
+        }
+        self.class_limits.update(class_limits or {})
+        self._running = {priority: 0 for priority in PRIORITIES}
+        self._queue: list = []
+        self._sequence = itertools.count()
+        self._waits = {priority: deque(maxlen=history) for priority in PRIORITIES}
+        # 各类别的取消代数：cancel_inflight() 递增，调用发现代数变化时放弃等待
+        self._generations = {priority: 0 for priority in PRIORITIES}
+        self._lock = threading.Lock()
+
+    def _can_run(self, priority: str) -> bool:
+        return sum(self._running.values()) < self.max_concurrency and \
+            self._running[priority] < self.class_limits[priority]
+
+    def _dispatch(self):
+        """把空出的名额分配给排队的调用（调用方持有锁）；受类别上限限制的调用留在队列中"""
+        skipped = []
+        now = time.monotonic()
+        while self._queue and sum(self._running.values()) < self.max_concurrency:
+            entry = heapq.heappop(self._queue)
+            waiter = entry[-1]
+            if waiter.cancelled or (waiter.deadline is not None and waiter.deadline <= now):
+                continue
+            if self._running[waiter.priority] >= self.class_limits[waiter.priority]:
+                skipped.append(entry)
+                continue
+            self._running[waiter.priority] += 1
+            waiter.granted = True
+            waiter.event.set()
+        for entry in skipped:
+            heapq.heappush(self._queue, entry)
+
+    def acquire(self, priority: str = 'normal', deadline: Optional[float] = None, owner: Any = None):
+        """领取一个调用名额（阻塞），deadline 为 time.monotonic() 时间点，owner 为发起调用的对象"""
+        start = time.monotonic()
+        with self._lock:
+            if not self._queue and self._can_run(priority):
+                self._running[priority] += 1
+                self._waits[priority].append(0.0)
+                return
+            waiter = _Waiter(priority, deadline, owner)
+            heapq.heappush(self._queue, (PRIORITIES[priority], deadline if deadline is not None else float('inf'),
+                                         next(self._sequence), waiter))
+            self._dispatch()
+        timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+        waiter.event.wait(timeout)
+        with self._lock:
+            if not waiter.granted:
+                waiter.cancelled = True
+                if waiter.event.is_set():
+                    raise Preempted(f"{priority} 调用在排队时被取消")
+                raise SchedulerTimeout(f"{priority} 调用排队 {time.monotonic() - start:.1f} 秒仍未获得名额")
+            self._waits[priority].append(time.monotonic() - start)
+
+    def try_acquire(self, priority: str = 'normal') -> bool:
+        """不排队地领取名额（用于对冲请求），没有空闲名额时返回 False"""
+        with self._lock:
+            if self._queue or not self._can_run(priority):
+                return False
+            self._running[priority] += 1
+            return True
+
+    def release(self, priority: str = 'normal'):
+        """归还名额并唤醒排队中的调用"""
+        with self._lock:
+            self._running[priority] -= 1
+            self._dispatch()
+
+    @contextmanager
+    def slot(self, priority: str = 'normal', deadline: Optional[float] = None, owner: Any = None):
+        self.acquire(priority, deadline, owner)
+        try:
+            yield
+        finally:
+            self.release(priority)
+
+    def _cancel_waiters(self, priorities, owner: Any = None) -> int:
+        """取消指定类别中仍在排队的调用（调用方持有锁），owner 不为 None 时只取消该对象的调用"""
+        cancelled = 0
+        for entry in self._queue:
+            waiter = entry[-1]
+            if owner is not None and waiter.owner is not owner:
+                continue
+            if waiter.priority in priorities and not waiter.cancelled and not waiter.granted:
+                waiter.cancelled = True
+                waiter.event.set()
+                cancelled += 1
+        self._queue = [entry for entry in self._queue if not entry[-1].cancelled]
+        heapq.heapify(self._queue)
+        return cancelled
+
+    def cancel_queued(self, priority: str = 'background', owner: Any = None) -> int:
+        """取消该类别（及更低优先级）仍在排队的调用，返回取消的个数；owner 不为 None 时只取消该对象发起的调用"""
+        level = PRIORITIES[priority]
+        with self._lock:
+            cancelled = self._cancel_waiters({p for p, rank in PRIORITIES.items() if rank >= level}, owner)
+        if cancelled:
+            print(f"[DEBUG] 调度器: 取消 {cancelled} 个排队中的 {priority} 及更低优先级调用")
+        return cancelled
+
+    def generation(self, priority: str) -> int:
+        """该类别的取消代数，调用开始时记下，之后发生变化说明调用已被取消"""
+        return self._generations[priority]
+
+    def cancel_inflight(self, priorities=('interactive', 'normal')) -> int:
+        """取消指定类别的所有调用（默认为前台调用，后台预取和批处理不受影响）：
+        排队中的调用抛出 Preempted，进行中的调用放弃等待并抛出 CallCancelled；返回受影响的调用数"""
+        with self._lock:
+            for priority in priorities:
+                self._generations[priority] += 1
+            affected = self._cancel_waiters(set(priorities)) + sum(self._running[p] for p in priorities)
+        return affected
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """各类别的运行数、排队数和排队耗时分位数（秒）"""
+        with self._lock:
+            queued = {priority: 0 for priority in PRIORITIES}
+            for entry in self._queue:
+                if not entry[-1].cancelled:
+                    queued[entry[-1].priority] += 1
+            result = {}
+            for priority in PRIORITIES:
+                waits = sorted(self._waits[priority])
+                result[priority] = {
+                    'running': self._running[priority],
+                    'queued': queued[priority],
+                    'calls': len(waits),
+                    'p50_wait': round(waits[len(waits) // 2], 3) if waits else None,
+                    'p95_wait': round(waits[min(len(waits) - 1, int(len(waits) * 0.95))], 3) if waits else None
+                }
+        return result
+
+
+_shared: Optional[LLMScheduler] = None
+_shared_lock = threading.Lock()
+
+
+def shared_scheduler() -> LLMScheduler:
+    """进程内共享的调度器（同一进程中的所有 AcademicTools 共用一份 API 配额）
+
+    总并发由 LLM_MAX_CONCURRENCY 配置（默认 8），后台任务的并发上限由 LLM_BACKGROUND_CONCURRENCY 配置。
+    """
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            limits = {}
+            if os.getenv('LLM_BACKGROUND_CONCURRENCY'):
+                limits['background'] = int(os.getenv('LLM_BACKGROUND_CONCURRENCY'))
+            _shared = LLMScheduler(int(os.getenv('LLM_MAX_CONCURRENCY', '8')), limits)
+        return _shared
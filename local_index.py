@@ -0,0 +1,318 @@
+import argparse
+import gzip
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import List, Dict, Any, Optional, Iterator
+
+# 查询中的字段过滤：title:xxx author:xxx abstract:xxx year:2018 / year:2018-2020 / year:2018- / year:-2020
+_FIELD_TERM = re.compile(r'(title|author|authors|abstract|year):("[^"]*"|\S+)', re.IGNORECASE)
+_YEAR_RANGE = re.compile(r'^(\d{4})?(-)?(\d{4})?$')
+_FTS_COLUMNS = {'title': 'title', 'author': 'authors', 'authors': 'authors', 'abstract': 'abstract'}
+_ARXIV_YEAR = re.compile(r'\b(19|20)\d{2}\b')
+
+
+def _open_dump(path: str):
+    return gzip.open(path, 'rt', encoding='utf-8') if path.endswith('.gz') else open(path, 'r', encoding='utf-8')
+
+
+def iter_records(path: str) -> Iterator[Dict[str, Any]]:
+    """流式读取元数据转储：JSONL（arXiv OAI 快照、OpenAlex works 快照，支持 .gz）
+
+    arXiv 快照虽然以 .json 结尾，实际是每行一条记录，因此按行解析；
+    只有第一行无法单独解析时才把整个文件当作一个 JSON 数组读取（仅适合小文件）。
+    """
+    with _open_dump(path) as f:
+        first = f.readline()
+        try:
+            record = json.loads(first) if first.strip() else None
+        except json.JSONDecodeError:
+            f.seek(0)
+            data = json.load(f)
+            yield from (data if isinstance(data, list) else data.get('items', data.get('results', [])))
+            return
+        if record is not None:
+            yield record
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+def _abstract_from_inverted_index(index: Optional[Dict[str, List[int]]]) -> str:
+    """还原 OpenAlex 的 abstract_inverted_index"""
+    if not index:
+        return ''
+    positions = {}
+    for word, offsets in index.items():
+        for offset in offsets:
+            positions[offset] = word
+    return ' '.join(positions[i] for i in sorted(positions))
+
+
+def arxiv_to_row(item: Dict[str, Any]) -> Optional[tuple]:
+    """将 arXiv OAI 快照记录转换为索引行"""
+    title = ' '.join(str(item.get('title') or '').split())
+    if not title:
+        return None
+    parsed = item.get('authors_parsed')
+    if parsed:
+        authors = [' '.join(p for p in (parts[1:2] + parts[:1]) if p) for parts in parsed]
+    else:
+        authors = [a.strip() for a in re.split(r',| and ', item.get('authors') or '') if a.strip()]
+    year = None
+    versions = item.get('versions') or []
+    for text in ([versions[0].get('created', '')] if versions else []) + [item.get('update_date') or '']:
+        match = _ARXIV_YEAR.search(text)
+        if match:
+            year = int(match.group(0))
+            break
+    arxiv_id = item.get('id', '')
+    return (f"arxiv:{arxiv_id}", title, ' '.join(str(item.get('abstract') or '').split()), ', '.join(authors),
+            year, item.get('journal-ref') or '', (item.get('doi') or '').lower() or None,
+            f"https://arxiv.org/abs/{arxiv_id}" if arxiv_id else '')
+
+
+def openalex_to_row(item: Dict[str, Any]) -> Optional[tuple]:
+    """将 OpenAlex works 快照记录转换为索引行"""
+    title = item.get('title') or item.get('display_name') or ''
+    if not title:
+        return None
+    authors = [(a.get('author') or {}).get('display_name', '') for a in item.get('authorships', [])]
+    location = item.get('primary_location') or {}
+    source = location.get('source') or {}
+    doi = (item.get('doi') or '').lower().replace('https://doi.org/', '') or None
+    return (item.get('id') or f"doi:{doi}", title, _abstract_from_inverted_index(item.get('abstract_inverted_index')),
+            ', '.join(a for a in authors if a), item.get('publication_year'),
+            source.get('display_name', '') if isinstance(source, dict) else '', doi,
+            location.get('landing_page_url') or (f"https://doi.org/{doi}" if doi else ''))
+
+
+CONVERTERS = {'arxiv': arxiv_to_row, 'openalex': openalex_to_row}
+
+
+def paper_to_row(source_id: str, paper: Dict[str, Any]) -> Optional[tuple]:
+    """将 literature_results 结构的文献记录（BibTeX / PDF 解析结果）转换为索引行"""
+    title = ' '.join(str(paper.get('title') or '').split())
+    if not title:
+        return None
+    authors = paper.get('authors') or []
+    if isinstance(authors, str):
+        authors = [authors]
+    match = _ARXIV_YEAR.search(str(paper.get('year') or ''))
+    doi = str(paper.get('doi') or '').lower() or None
+    return (source_id, title, ' '.join(str(paper.get('abstract') or '').split()), ', '.join(authors),
+            int(match.group(0)) if match else None, paper.get('journal') or '', doi,
+            paper.get('url') or (f"https://doi.org/{doi}" if doi else ''))
+
+
+def parse_query(query: str) -> Dict[str, Any]:
+    """解析检索式：自由文本 + 字段过滤（title:/author:/abstract:）+ 年份范围（year:2018-2020）"""
+    fields: List[tuple] = []
+    year_from = year_to = None
+    for field, value in _FIELD_TERM.findall(query):
+        value = value.strip('"')
+        if field.lower() == 'year':
+            match = _YEAR_RANGE.match(value)
+            if match:
+                start, dash, end = match.groups()
+                year_from = int(start) if start else None
+                year_to = int(end) if end else (None if dash else year_from)
+        elif value:
+            fields.append((_FTS_COLUMNS[field.lower()], value))
+    text = _FIELD_TERM.sub(' ', query).split()
+    return {'terms': text, 'fields': fields, 'year_from': year_from, 'year_to': year_to}
+
+
+def _fts_expression(terms: List[str], fields: List[tuple]) -> Optional[str]:
+    def quote(text: str) -> str:
+        return '"' + text.replace('"', '""') + '"'
+    parts = [quote(t) for t in terms]
+    parts += [f"{column} : {quote(value)}" for column, value in fields]
+    return ' AND '.join(parts) if parts else None
+
+
+class LocalPaperIndex:
+    """离线文献检索后端：把 arXiv / OpenAlex 元数据快照流式导入 SQLite，建立 FTS5 索引
+
+    - works 表保存元数据，FTS5 表以 external content 方式引用 works（正文只存一份）
+    - 标题、摘要、作者全文检索按 BM25 排序（标题权重最高），年份走 B-tree 索引过滤
+    - 检索结果与 search_papers 的 literature_results 结构一致，完全不访问网络
+
+    Args:
+        db_path: 索引数据库路径，不存在时自动创建
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA mmap_size = 1073741824")
+        self.conn.execute("PRAGMA temp_store = MEMORY")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS works (
+                id INTEGER PRIMARY KEY,
+                source_id TEXT UNIQUE,
+                title TEXT,
+                abstract TEXT,
+                authors TEXT,
+                year INTEGER,
+                venue TEXT,
+                doi TEXT,
+                url TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_works_year ON works(year);
+            CREATE VIRTUAL TABLE IF NOT EXISTS works_fts USING fts5(
+                title, abstract, authors, content = 'works', content_rowid = 'id', tokenize = 'porter unicode61'
+            );
+        """)
+        self.conn.commit()
+        self._lock = threading.Lock()
+
+    def import_dump(self, path: str, source: str = 'arxiv', batch_size: int = 20000) -> int:
+        """流式导入 arXiv OAI 或 OpenAlex works 快照，返回新增的记录数（重复导入同一记录会被跳过）"""
+        convert = CONVERTERS[source]
+        start = time.time()
+        count = 0
+        batch = []
+        # 导入期间关闭同步写盘并把回滚日志放在内存中，结束（包括出错）后恢复原来的设置
+        synchronous = self.conn.execute("PRAGMA synchronous").fetchone()[0]
+        journal_mode = self.conn.execute("PRAGMA journal_mode").fetchone()[0]
+        self.conn.execute("PRAGMA synchronous = OFF")
+        self.conn.execute("PRAGMA journal_mode = MEMORY")
+        try:
+            for item in iter_records(path):
+                row = convert(item)
+                if row is None:
+                    continue
+                batch.append(row)
+                if len(batch) >= batch_size:
+                    count += self._insert(batch)
+                    batch = []
+                    print(f"[DEBUG] 已导入 {count} 条记录，{count / max(time.time() - start, 1e-6):.0f} 条/秒")
+            if batch:
+                count += self._insert(batch)
+            # 批量导入后一次性重建全文索引，比逐行维护快得多
+            self.conn.execute("INSERT INTO works_fts(works_fts) VALUES ('rebuild')")
+            self.conn.execute("INSERT INTO works_fts(works_fts) VALUES ('optimize')")
+            self.conn.execute("ANALYZE")
+        finally:
+            self.conn.commit()
+            self.conn.execute(f"PRAGMA journal_mode = {journal_mode}")
+            self.conn.execute(f"PRAGMA synchronous = {int(synchronous)}")
+        print(f"[DEBUG] 已从 {source} 快照导入 {count} 条记录，用时 {time.time() - start:.1f} 秒")
+        return count
+
+    def _insert(self, rows: List[tuple]) -> int:
+        before = self.conn.total_changes
+        self.conn.executemany(
+            "INSERT OR IGNORE INTO works (source_id, title, abstract, authors, year, venue, doi, url) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+        self.conn.commit()
+        return self.conn.total_changes - before
+
+    def add_rows(self, rows: List[tuple]) -> int:
+        """逐条加入记录并同步更新全文索引（用于增量导入少量文件；已存在的 source_id 被跳过），返回新增的记录数"""
+        count = 0
+        with self._lock:
+            for row in rows:
+                cursor = self.conn.execute(
+                    "INSERT OR IGNORE INTO works (source_id, title, abstract, authors, year, venue, doi, url) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)", row)
+                if cursor.rowcount:
+                    self.conn.execute("INSERT INTO works_fts(rowid, title, abstract, authors) VALUES (?, ?, ?, ?)",
+                                      (cursor.lastrowid, row[1], row[2], row[3]))
+                    count += 1
+            self.conn.commit()
+        return count
+
+    def remove_source(self, prefix: str) -> int:
+        """删除 source_id 以 prefix 开头的所有记录（及其全文索引），返回删除的记录数"""
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT id, title, abstract, authors FROM works WHERE source_id >= ? AND source_id < ?",
+                (prefix, prefix + '\uffff')).fetchall()
+            for row in rows:
+                # external content 表删除时需要提供原来的列值
+                self.conn.execute("INSERT INTO works_fts(works_fts, rowid, title, abstract, authors) "
+                                  "VALUES ('delete', ?, ?, ?, ?)", tuple(row))
+            self.conn.executemany("DELETE FROM works WHERE id = ?", [(row[0],) for row in rows])
+            self.conn.commit()
+        return len(rows)
+
+    @staticmethod
+    def _to_paper(row: sqlite3.Row) -> Dict[str, Any]:
+        return {
+            'title': row['title'],
+            'authors': [a for a in (row['authors'] or '').split(', ') if a],
+            'year': str(row['year'] or ''),
+            'abstract': row['abstract'] or '',
+            'url': row['url'] or '',
+            'doi': row['doi'] or '',
+            'journal': row['venue'] or '',
+            'source_type': 'local_index'
+        }
+
+    def search(self, query: str, max_results: int = 10, year_from: Optional[int] = None,
+               year_to: Optional[int] = None) -> List[Dict[str, Any]]:
+        """检索本地索引
+
+        Args:
+            query: 自由文本，可带 title:/author:/abstract: 字段过滤和 year:2018-2020 年份范围
+            max_results: 返回条数
+            year_from, year_to: 年份范围（含两端），与查询中的 year: 同时给出时以参数为准
+        """
+        parsed = parse_query(query)
+        year_from = year_from if year_from is not None else parsed['year_from']
+        year_to = year_to if year_to is not None else parsed['year_to']
+        expression = _fts_expression(parsed['terms'], parsed['fields'])
+
+        conditions, params = [], []
+        if year_from is not None:
+            conditions.append("w.year >= ?")
+            params.append(year_from)
+        if year_to is not None:
+            conditions.append("w.year <= ?")
+            params.append(year_to)
+        if expression:
+            sql = ("SELECT w.* FROM works_fts f JOIN works w ON w.id = f.rowid WHERE works_fts MATCH ?"
+                   + ''.join(f" AND {c}" for c in conditions)
+                   + " ORDER BY bm25(works_fts, 10.0, 1.0, 3.0) LIMIT ?")
+            params = [expression] + params + [max_results]
+        else:
+            # 只有年份过滤：按年份倒序返回
+            sql = ("SELECT w.* FROM works w" + (" WHERE " + " AND ".join(conditions) if conditions else "")
+                   + " ORDER BY w.year DESC LIMIT ?")
+            params.append(max_results)
+        with self._lock:
+            rows = self.conn.execute(sql, params).fetchall()
+        return [self._to_paper(row) for row in rows]
+
+    def __len__(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM works").fetchone()[0]
+
+    def close(self):
+        self.conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="导入 arXiv / OpenAlex 元数据快照，构建离线文献检索索引")
+    parser.add_argument("dump", help="快照文件（JSONL，支持 .gz），可指定多个", nargs='+')
+    parser.add_argument("--source", choices=sorted(CONVERTERS), default='arxiv')
+    parser.add_argument("--db", default=os.getenv('LOCAL_INDEX_DB', 'local_index.db'), help="索引数据库路径")
+    args = parser.parse_args()
+    index = LocalPaperIndex(args.db)
+    for dump in args.dump:
+        index.import_dump(dump, args.source)
+    print(f"索引中共有 {len(index)} 条记录")
+    index.close()
+
+
+if __name__ == "__main__":
+    main()
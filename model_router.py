@@ -0,0 +1,148 @@
+import os
+import time
+import threading
+from collections import deque
+from typing import List, Dict, Any, Optional
+
+# 各任务使用的模型档位：短小任务走快速模型，大模型只留给论文摘要和 PDF 深度分析
+TASK_TIERS = {
+    'intent': 'fast',
+    'friendly_summary': 'fast',
+    'search_json': 'fast',
+    'search': 'search',
+    'polish': 'balanced',
+    'pdf_section': 'balanced',
+    'summary': 'large',
+    'pdf_analysis': 'large'
+}
+
+# 各档位的候选模型（按优先级），可用 QWEN_<档位>_MODELS 环境变量覆盖（逗号分隔）；
+# large 档位的首选模型为 QWEN_MODEL_NAME
+DEFAULT_TIER_MODELS = {
+    'fast': ['qwen-turbo', 'qwen-plus'],
+    'balanced': ['qwen-plus', 'qwen-turbo'],
+    'search': ['qwen-plus', 'qwen-turbo'],  # 需要支持 enable_search 的模型
+    'large': ['qwen-plus']
+}
+
+# 各档位可接受的延迟中位数（秒），超过时优先使用同档位的其他模型
+TIER_LATENCY_LIMITS = {
+    'fast': 8.0,
+    'balanced': 45.0,
+    'search': 90.0,
+    'large': 120.0
+}
+
+# 各档位单次调用的截止时间（秒），超过时放弃等待（未登记的任务使用 DEFAULT_DEADLINE）
+TIER_DEADLINES = {
+    'fast': 30.0,
+    'balanced': 120.0,
+    'search': 180.0,
+    'large': 300.0
+}
+DEFAULT_DEADLINE = 180.0
+
+# 会话 token 预算将要用完时改用的低一档模型（search 档需要支持联网搜索，不降档，只缩短输出）；
+# 未登记的任务默认使用大模型，降级时走 balanced 档
+DEGRADED_TIERS = {
+    'large': 'balanced',
+    'balanced': 'fast',
+    'search': 'search',
+    'fast': 'fast'
+}
+
+
+def tier_models(large_model: str) -> Dict[str, List[str]]:
+    """读取各档位的候选模型列表"""
+    tiers = {}
+    for tier, defaults in DEFAULT_TIER_MODELS.items():
+        override = os.getenv(f'QWEN_{tier.upper()}_MODELS')
+        models = [m.strip() for m in override.split(',') if m.strip()] if override else list(defaults)
+        if tier == 'large' and not override:
+            models = [large_model] + [m for m in models if m != large_model]
+        tiers[tier] = models
+    return tiers
+
+
+class ModelRouter:
+    """按任务档位选择模型，并根据各模型的滚动延迟和失败率自动降级
+
+    - 每个模型保留最近 window 次调用的 (耗时, 是否成功)
+    - 失败率超过 max_failure_rate 或延迟中位数超过档位上限的模型视为不健康，排到同档位健康模型之后
+    - 不健康的模型在 recovery_seconds 内没有新的调用记录时重新参与排序（作为探测），避免永久降级
+
+    Args:
+        tiers: 档位 → 候选模型列表
+        default_model: 未登记的任务使用的模型
+        window: 每个模型保留的调用记录数
+        min_samples: 判断健康状态所需的最少记录数
+        max_failure_rate: 可接受的失败率
+        recovery_seconds: 不健康模型重新探测的间隔
+    """
+
+    def __init__(self, tiers: Dict[str, List[str]], default_model: str, window: int = 50, min_samples: int = 3,
+                 max_failure_rate: float = 0.3, recovery_seconds: float = 60.0):
+        self.tiers = tiers
+        self.default_model = default_model
+        self.window = window
+        self.min_samples = min_samples
+        self.max_failure_rate = max_failure_rate
+        self.recovery_seconds = recovery_seconds
+        self._calls: Dict[str, deque] = {}
+        self._last_call: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def primary(self, task: Optional[str]) -> str:
+        """任务当前首选的模型（用于预算规划和缓存键）"""
+        return self.candidates(task)[0]
+
+    def candidates(self, task: Optional[str], degraded: bool = False) -> List[str]:
+        """按健康状态排序后的候选模型列表，第一个为本次调用使用的模型，其余为失败时的后备；
+        degraded 为 True 时使用 DEGRADED_TIERS 中低一档的模型"""
+        tier = TASK_TIERS.get(task or '')
+        if degraded:
+            tier = DEGRADED_TIERS.get(tier or 'large', tier)
+        models = self.tiers.get(tier) if tier else None
+        if not models:
+            return [self.default_model]
+        limit = TIER_LATENCY_LIMITS.get(tier)
+        healthy = [m for m in models if self._healthy(m, limit)]
+        return healthy + [m for m in models if m not in healthy]
+
+    def deadline(self, task: Optional[str]) -> float:
+        """任务单次调用的截止时间（秒）"""
+        return TIER_DEADLINES.get(TASK_TIERS.get(task or ''), DEFAULT_DEADLINE)
+
+    def _healthy(self, model: str, latency_limit: Optional[float]) -> bool:
+        with self._lock:
+            calls = list(self._calls.get(model, ()))
+            last = self._last_call.get(model, 0.0)
+        if len(calls) < self.min_samples or time.monotonic() - last > self.recovery_seconds:
+            return True
+        failures = sum(1 for _, ok in calls if not ok)
+        if failures / len(calls) > self.max_failure_rate:
+            return False
+        latencies = sorted(elapsed for elapsed, ok in calls if ok)
+        if latency_limit and latencies and latencies[len(latencies) // 2] > latency_limit:
+            return False
+        return True
+
+    def record(self, model: str, elapsed: float, ok: bool):
+        """记录一次调用的耗时和结果"""
+        with self._lock:
+            self._calls.setdefault(model, deque(maxlen=self.window)).append((elapsed, ok))
+            self._last_call[model] = time.monotonic()
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """各模型的调用统计，便于调试"""
+        with self._lock:
+            snapshot = {model: list(calls) for model, calls in self._calls.items()}
+        result = {}
+        for model, calls in snapshot.items():
+            latencies = sorted(elapsed for elapsed, ok in calls if ok)
+            result[model] = {
+                'calls': len(calls),
+                'failure_rate': round(sum(1 for _, ok in calls if not ok) / len(calls), 3),
+                'median_latency': round(latencies[len(latencies) // 2], 3) if latencies else None
+            }
+        return result
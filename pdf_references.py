@@ -0,0 +1,293 @@
+import os
+import re
+import statistics
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Dict, Any, Optional, Tuple
+import fitz  # PyMuPDF
+
+# 参考文献章节标题（可带编号），以及参考文献之后可能出现的章节
+_HEADING_PATTERN = (r'^\s*(?:\d+\.?\s*|[IVX]+\.\s*)?(?:references|bibliography|literature cited|works cited|'
+                    r'参\s*考\s*文\s*献)\s*:?\s*$')
+_HEADING = re.compile(_HEADING_PATTERN, re.I)
+_HEADING_ANYWHERE = re.compile(_HEADING_PATTERN, re.I | re.M)
+_END_HEADING = re.compile(r'^\s*(?:[A-Z]\.?\s+)?(?:appendix|appendices|supplementary|acknowledg(?:e)?ments?|附\s*录|致\s*谢)\b',
+                          re.I)
+# 编号：[12]、12.、(12)
+_NUMBERED = re.compile(r'^\s*(?:\[(\d{1,3})\]|(\d{1,3})\.\s|\((\d{1,3})\))\s*')
+
+_DOI = re.compile(r'\b(10\.\d{4,9}/[^\s"<>]+)', re.I)
+_URL = re.compile(r'https?://\S+')
+_YEAR_PAREN = re.compile(r'\(((?:19|20)\d{2})[a-z]?(?:,[^)]*)?\)')
+_YEAR = re.compile(r'(?<!\d)((?:19|20)\d{2})[a-z]?(?!\d)')
+_QUOTED_TITLE = re.compile(r'[“"]\s*([^”"]{5,}?)[,.]?\s*[”"]')
+_GBT_TYPE = re.compile(r'\[(?:J|C|M|D|R|P|S|N|Z|A|G|EB/OL|J/OL|C/OL|M/OL|DB/OL)\]')
+_VOLUME_ISSUE = re.compile(r'\b(\d{1,4})\s*\((\d{1,4}(?:[-–]\d{1,4})?)\)')
+_VOLUME = re.compile(r'\bvol(?:ume)?\.?\s*(\d{1,4})', re.I)
+_ISSUE = re.compile(r'\b(?:no|issue)\.?\s*(\d{1,4})', re.I)
+_PAGES = re.compile(r'(?:\bpp?\.\s*)?(?<![\d.])(\d{1,6}\s*[-–—]\s*\d{1,6})(?![\d/])')
+# 句子切分：句末标点前是小写字母、数字或右括号/引号（大写缩写如 "J." 不切分）
+_SENTENCE = re.compile(r'(?<=[a-z0-9\)\]”"?!\u4e00-\u9fff])[.?!。]\s+')
+_INITIALS = re.compile(r'^(?:[A-Z]\.?\s*-?\s*){1,4}$')
+_AND = re.compile(r',?\s+(?:and|&)\s+|，|、')
+_ET_AL = re.compile(r',?\s*(?:et\s+al\.?|等)\s*$', re.I)
+_VENUE_END = re.compile(r',\s*(?:vol|no|pp|\d)|\s+\d{1,4}\s*[(:]|$', re.I)
+
+
+def _join_lines(lines: List[str]) -> str:
+    """拼接一条参考文献的多行文本，处理行尾连字符断词"""
+    text = ''
+    for line in lines:
+        if text.endswith('-') and line[:1].islower():
+            text = text[:-1] + line
+        elif text and not ('\u4e00' <= text[-1] <= '\u9fff' and '\u4e00' <= line[:1] <= '\u9fff'):
+            text += ' ' + line
+        else:
+            text += line
+    return re.sub(r'\s+', ' ', text).strip()
+
+
+def _page_lines(page) -> List[Tuple[float, float, float, str]]:
+    """按内容流顺序返回页面上的文本行 (x0, y0, y1, text)，保持双栏排版的阅读顺序"""
+    lines = []
+    for block in page.get_text("dict", flags=0)['blocks']:
+        for line in block.get('lines', ()):
+            text = ''.join(span['text'] for span in line['spans']).strip()
+            if text:
+                x0, y0, _, y1 = line['bbox']
+                lines.append((x0, y0, y1, text))
+    return lines
+
+
+def _reference_lines(doc) -> List[Tuple[float, float, float, str, int, bool]]:
+    """定位最后一个参考文献标题，返回其后的文本行 (x0, y0, y1, text, 栏编号, 是否换栏/换页)"""
+    start_page = None
+    for page_num in range(len(doc) - 1, -1, -1):
+        if _HEADING_ANYWHERE.search(doc[page_num].get_text()):
+            start_page = page_num
+            break
+    if start_page is None:
+        return []
+
+    result = []
+    for page_num in range(start_page, len(doc)):
+        page = doc[page_num]
+        lines = _page_lines(page)
+        if page_num == start_page:
+            heading = max((i for i, line in enumerate(lines) if _HEADING.match(line[3])), default=None)
+            if heading is None:
+                continue
+            lines = lines[heading + 1:]
+        middle = page.rect.width / 2
+        previous_column = None
+        for x0, y0, y1, text in lines:
+            if _END_HEADING.match(text) and len(text) < 40:
+                return result
+            column = 1 if x0 >= middle - 10 else 0
+            new_column = column != previous_column
+            previous_column = column
+            result.append((x0, y0, y1, text, page_num * 2 + column, new_column))
+    return result
+
+
+def _split_entries(lines: List[Tuple[float, float, float, str, int, bool]]) -> List[str]:
+    """按编号、悬挂缩进或行距将参考文献行切分为条目"""
+    if not lines:
+        return []
+
+    # 1. 编号格式：编号连续递增的行开始新条目
+    numbers = [_NUMBERED.match(line[3]) for line in lines]
+    numbered = [i for i, m in enumerate(numbers) if m]
+    if len(numbered) >= 3:
+        starts, expected = [], None
+        for i in numbered:
+            m = numbers[i]
+            value = int(m.group(1) or m.group(2) or m.group(3))
+            if expected is None or value == expected:
+                starts.append(i)
+                expected = value + 1
+        if len(starts) >= 3:
+            entries = []
+            for k, start in enumerate(starts):
+                end = starts[k + 1] if k + 1 < len(starts) else len(lines)
+                chunk = [line[3] for line in lines[start:end]]
+                chunk[0] = _NUMBERED.sub('', chunk[0], count=1)
+                entries.append(_join_lines(chunk))
+            return entries
+
+    # 2. 悬挂缩进：每栏左边界处的行开始新条目，缩进的行为续行
+    base = {}
+    for x0, _, _, _, column, _ in lines:
+        base[column] = min(base.get(column, x0), x0)
+    indented = [line[0] - base[line[4]] > 3 for line in lines]
+    use_indent = 0.15 <= sum(indented) / len(lines) < 0.9
+
+    # 3. 否则按行距：明显大于正常行距的空隙视为条目分隔
+    heights = [line[2] - line[1] for line in lines]
+    line_height = statistics.median(heights) if heights else 0
+
+    entries, current = [], []
+    previous = None
+    for i, (x0, y0, y1, text, column, new_column) in enumerate(lines):
+        if use_indent:
+            starts_entry = not indented[i]
+        else:
+            gap = y0 - previous[2] if previous is not None and not new_column else 0
+            starts_entry = previous is None or gap > 0.6 * line_height
+        if starts_entry and current:
+            entries.append(_join_lines(current))
+            current = []
+        current.append(text)
+        previous = (x0, y0, y1)
+    if current:
+        entries.append(_join_lines(current))
+    return entries
+
+
+def split_authors(text: str) -> List[str]:
+    """将作者字符串拆分为作者列表（支持 "Smith, J., & Doe, A."、"A. Smith and B. Doe"、"张三, 李四" 等）"""
+    text = _ET_AL.sub('', text.strip().rstrip('.,;: '))
+    if not text:
+        return []
+    if ';' in text:
+        return [t.strip().rstrip('.,') for t in text.split(';') if t.strip()]
+    tokens = [t.strip() for t in _AND.sub(', ', text).split(',') if t.strip()]
+    authors, i = [], 0
+    while i < len(tokens):
+        token = tokens[i]
+        following = tokens[i + 1] if i + 1 < len(tokens) else ''
+        # "Smith, J." 形式：姓 + 首字母；MLA 第一作者 "Smith, John"
+        mla_first = (i == 0 and ' ' not in token and ' ' not in following and (token + following).isascii()
+                     and (len(tokens) == 2 or ' ' in tokens[2]))
+        if following and (_INITIALS.match(following) or mla_first):
+            authors.append(f"{token}, {following}")
+            i += 2
+        else:
+            authors.append(token)
+            i += 1
+    return authors
+
+
+def _sentences(text: str) -> List[str]:
+    text = re.sub(r'\bet al\.', 'et al', text)
+    return [s.strip() for s in _SENTENCE.split(text) if s.strip()]
+
+
+def _venue(text: str) -> str:
+    """从 "Journal of X, 12(3), 45-67" 中取出期刊/会议名"""
+    text = re.sub(r'^(?:in:?|in proceedings of)\s+', '', text.strip(), flags=re.I)
+    match = _VENUE_END.search(text)
+    return text[:match.start()].strip(' .,') if match else text.strip(' .,')
+
+
+def parse_reference(text: str) -> Dict[str, Any]:
+    """解析一条参考文献文本，返回与 literature_results 相同结构的记录（不调用模型）"""
+    raw = text.strip()
+    body = _NUMBERED.sub('', raw, count=1)
+    doi_match = _DOI.search(body)
+    doi = doi_match.group(1).rstrip('.,;') if doi_match else ''
+    url_match = _URL.search(body)
+    url = url_match.group(0).rstrip('.,;') if url_match else (f"https://doi.org/{doi}" if doi else '')
+    # 去掉 DOI/URL 后再解析其余字段
+    body = _URL.sub('', _DOI.sub('', body)).replace('doi:', '').replace('DOI:', '').strip(' .')
+
+    authors, title, venue, year = '', '', '', ''
+    quoted = _QUOTED_TITLE.search(body)
+    gbt = _GBT_TYPE.search(body)
+    paren_year = _YEAR_PAREN.search(body)
+
+    if quoted:
+        # IEEE 等：A. Author and B. Author, "Title," Venue, vol. 1, pp. 1-2, 2020.
+        authors = body[:quoted.start()]
+        title = quoted.group(1)
+        venue = _venue(body[quoted.end():].lstrip(' ,.'))
+    elif gbt:
+        # GB/T 7714：作者. 题名[J]. 刊名, 年, 卷(期): 页码.
+        head = body[:gbt.start()].strip()
+        split = re.search(r'[.。]\s*', head)
+        if split:
+            authors, title = head[:split.start()], head[split.end():]
+        else:
+            title = head
+        venue = re.split(r'[,，:]', body[gbt.end():].lstrip(' .。'), maxsplit=1)[0].strip()
+    elif paren_year and paren_year.start() < len(body) * 0.6:
+        # APA：Author, A., & Author, B. (2020). Title. Venue, 1(2), 3-4.
+        authors = body[:paren_year.start()]
+        year = paren_year.group(1)
+        rest = _sentences(body[paren_year.end():].lstrip(' .'))
+        title = rest[0] if rest else ''
+        venue = _venue(rest[1]) if len(rest) > 1 else ''
+    else:
+        # MLA / Chicago / Harvard：Author. (Year.) Title. Venue ...
+        parts = _sentences(body)
+        if parts:
+            authors = parts[0]
+            year_in_authors = _YEAR.search(authors)
+            if year_in_authors and year_in_authors.end() >= len(authors) - 2:
+                year = year_in_authors.group(1)
+                authors = authors[:year_in_authors.start()]
+            rest = parts[1:]
+            if rest and _YEAR.fullmatch(rest[0].strip('() ')):
+                rest = rest[1:]
+            title = rest[0] if rest else ''
+            venue = _venue(rest[1]) if len(rest) > 1 else ''
+
+    if not year:
+        years = _YEAR.findall(body)
+        year = years[-1] if years else ''
+    volume, number, pages = '', '', ''
+    volume_issue = _VOLUME_ISSUE.search(body)
+    if volume_issue and volume_issue.group(1) != year:
+        volume, number = volume_issue.group(1), volume_issue.group(2)
+    else:
+        volume_match, issue_match = _VOLUME.search(body), _ISSUE.search(body)
+        volume = volume_match.group(1) if volume_match else ''
+        number = issue_match.group(1) if issue_match else ''
+    pages_match = _PAGES.search(body)
+    if pages_match:
+        pages = re.sub(r'\s*[–—-]\s*', '-', pages_match.group(1))
+
+    title = title.strip(' .,"“”')
+    return {
+        'title': title or raw[:200],
+        'authors': split_authors(authors),
+        'year': year,
+        'journal': venue,
+        'volume': volume,
+        'number': number,
+        'pages': pages,
+        'doi': doi,
+        'url': url,
+        'abstract': '',
+        'source_type': 'pdf_reference',
+        'raw': raw
+    }
+
+
+def extract_references(pdf_path: str) -> List[Dict[str, Any]]:
+    """从 PDF 的参考文献章节中提取文献记录（纯本地解析，不调用模型）"""
+    try:
+        with fitz.open(pdf_path) as doc:
+            entries = _split_entries(_reference_lines(doc))
+    except Exception as e:
+        print(f"[DEBUG] 提取 PDF 参考文献时出错: {str(e)}")
+        return []
+    references = []
+    for entry in entries:
+        # 过短的行多为页眉页脚或残留的标题
+        if len(entry) < 20:
+            continue
+        reference = parse_reference(entry)
+        reference['source_pdf'] = os.path.basename(pdf_path)
+        references.append(reference)
+    return references
+
+
+def extract_references_many(pdf_paths: List[str], workers: Optional[int] = None) -> Dict[str, List[Dict[str, Any]]]:
+    """多进程并行提取多个 PDF 的参考文献，返回 {pdf_path: references}"""
+    if not pdf_paths:
+        return {}
+    if workers == 1 or len(pdf_paths) == 1:
+        return {path: extract_references(path) for path in pdf_paths}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        results = executor.map(extract_references, pdf_paths, chunksize=max(len(pdf_paths) // 32, 1))
+        return dict(zip(pdf_paths, results))
@@ -0,0 +1,254 @@
+import json
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from typing import List, Dict, Any, Optional, Tuple
+
+# 本仓库源码所在目录：只统计调用栈中包含本仓库代码的线程（空闲的线程池工作线程等被忽略）
+_SOURCE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# 调用栈中出现这些函数时，把样本归为模型调用等待（从叶子往根找，最深的一个生效）：
+# 调度器排队、等待对冲请求返回、工作线程中的 HTTP 请求、读取流式响应。
+# 工作线程中的 HTTP 请求与调用方线程的 [LLM wait] 是同一次调用，有线程处于 [LLM wait] 时只计入调用栈、不计入耗时分类
+LLM_MARKERS = {
+    ('llm_scheduler.py', 'acquire'): '[LLM queue]',
+    ('academic_tools.py', '_call'): '[LLM wait]',
+    ('academic_tools.py', '_create'): '[LLM request]',
+    ('academic_tools.py', '_chat_stream'): '[LLM stream]'
+}
+# 样本归类
+CATEGORIES = ('llm', 'cpu', 'wait')
+
+
+def _is_source(filename: str) -> bool:
+    return filename.startswith(_SOURCE_DIR) and 'site-packages' not in filename
+
+
+def default_profile_dir() -> Optional[str]:
+    """性能分析输出目录，由 PROFILE_DIR 环境变量（或命令行 --profile）开启，未设置时不做分析"""
+    return os.getenv('PROFILE_DIR') or None
+
+
+def _thread_cpu_time(ident: int) -> Optional[float]:
+    """线程的 CPU 时间（秒），平台不支持或线程已结束时返回 None"""
+    try:
+        return time.clock_gettime(time.pthread_getcpuclockid(ident))
+    except (AttributeError, OSError, ValueError):
+        return None
+
+
+class SamplingProfiler:
+    """在后台线程中定时采样所有线程的 Python 调用栈（sys._current_frames），按调用栈累计墙钟时间
+
+    - 每个样本按距上一次采样的实际间隔计权，结果为各调用栈的耗时（秒）
+    - 模型调用相关的样本（见 LLM_MARKERS）在栈顶追加 [LLM ...] 标记；
+      其余样本按线程 CPU 时间是否增长分为 CPU 和 [off-cpu] 等待（网络、磁盘、锁）
+    - 只统计调用栈中含有本仓库代码的线程，线程名中的序号被去掉，同一线程池的栈合并显示
+
+    Args:
+        interval: 采样间隔（秒）
+    """
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.totals = {category: 0.0 for category in CATEGORIES}
+        self.samples = 0
+        self.wall = 0.0
+        self._frames: Dict[Any, Tuple[str, str, int]] = {}
+        self._cpu: Dict[int, float] = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._started = 0.0
+
+    def _frame(self, code) -> Tuple[str, str, int]:
+        """(显示名, 文件, 行号)，按 code 对象缓存"""
+        frame = self._frames.get(code)
+        if frame is None:
+            filename = code.co_filename
+            frame = self._frames[code] = (f"{code.co_name} ({os.path.basename(filename)}:{code.co_firstlineno})",
+                                          filename, code.co_firstlineno)
+        return frame
+
+    def _sample(self, elapsed: float):
+        me = threading.get_ident()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        samples = []
+        for ident, top in sys._current_frames().items():
+            if ident == me:
+                continue
+            codes = []
+            frame = top
+            while frame is not None:
+                codes.append(frame.f_code)
+                frame = frame.f_back
+            if not any(_is_source(code.co_filename) for code in codes):
+                continue
+            codes.reverse()
+            stack = [self._frame(code) for code in codes]
+            marker = None
+            for depth in range(len(codes) - 1, -1, -1):
+                code = codes[depth]
+                marker = LLM_MARKERS.get((os.path.basename(code.co_filename), code.co_name))
+                # 流式调用只有在等待下一个分块（栈顶在库代码中）时才算等待
+                if marker == '[LLM stream]' and depth == len(codes) - 1:
+                    marker = None
+                if marker:
+                    break
+            cpu = _thread_cpu_time(ident)
+            previous = self._cpu.get(ident)
+            if cpu is not None:
+                self._cpu[ident] = cpu
+            if marker:
+                category = 'llm'
+            elif cpu is not None and previous is not None and cpu - previous < elapsed * 0.5:
+                category, marker = 'wait', '[off-cpu]'
+            else:
+                category = 'cpu'
+            thread = re.sub(r'[_-]\d+$', '', names.get(ident, 'thread'))
+            key = (f"[thread {thread}]",) + tuple(frame[0] for frame in stack) + ((marker,) if marker else ())
+            samples.append((key, category, marker))
+        waiting = any(marker == '[LLM wait]' for _, _, marker in samples)
+        for key, category, marker in samples:
+            self.stacks[key] += elapsed
+            if not (waiting and marker == '[LLM request]'):
+                self.totals[category] += elapsed
+            self.samples += 1
+
+    def _run(self):
+        last = time.perf_counter()
+        while not self._stop.wait(self.interval):
+            now = time.perf_counter()
+            self._sample(now - last)
+            last = now
+
+    def start(self):
+        self._started = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name='profiler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+        self.wall = time.perf_counter() - self._started
+
+    def summary(self) -> Dict[str, Any]:
+        """墙钟时间和各类样本的累计时间（秒）；多个线程同时活动时各类之和可能大于墙钟时间"""
+        return {
+            'wall': round(self.wall, 3),
+            'samples': self.samples,
+            'llm_wait': round(self.totals['llm'], 3),
+            'cpu': round(self.totals['cpu'], 3),
+            'other_wait': round(self.totals['wait'], 3)
+        }
+
+    def collapsed(self) -> str:
+        """折叠栈格式（flamegraph.pl / speedscope / inferno 可读），每行 "帧;帧;... 毫秒数" """
+        lines = [f"{';'.join(frame.replace(';', ',') for frame in stack)} {max(1, round(weight * 1000))}"
+                 for stack, weight in self.stacks.most_common()]
+        return '\n'.join(lines) + '\n' if lines else ''
+
+    def speedscope(self, name: str) -> Dict[str, Any]:
+        """speedscope 文件格式（sampled profile，权重单位为秒）"""
+        frames: List[Dict[str, Any]] = []
+        index: Dict[str, int] = {}
+        files = {display: (filename, line) for display, filename, line in self._frames.values()}
+        samples, weights = [], []
+        for stack, weight in self.stacks.most_common():
+            sample = []
+            for display in stack:
+                if display not in index:
+                    index[display] = len(frames)
+                    frame = {'name': display}
+                    if display in files:
+                        frame['file'], frame['line'] = files[display]
+                    frames.append(frame)
+                sample.append(index[display])
+            samples.append(sample)
+            weights.append(round(weight, 6))
+        return {
+            '$schema': 'https://www.speedscope.app/file-format-schema.json',
+            'name': name,
+            'exporter': 'acagent profiling',
+            'shared': {'frames': frames},
+            'profiles': [{
+                'type': 'sampled', 'name': name, 'unit': 'seconds',
+                'startValue': 0, 'endValue': round(sum(weights), 6),
+                'samples': samples, 'weights': weights
+            }]
+        }
+
+
+class CommandProfiler:
+    """按命令输出性能分析结果：每个 command() 块对应一个文件，未开启时不启动采样线程
+
+    Args:
+        output_dir: 输出目录，为 None 时不做分析
+        fmt: collapsed（折叠栈，.collapsed）或 speedscope（.speedscope.json）
+        interval: 采样间隔（秒）
+    """
+
+    def __init__(self, output_dir: Optional[str] = None, fmt: str = 'collapsed', interval: float = 0.005):
+        if fmt not in ('collapsed', 'speedscope'):
+            raise ValueError(f"不支持的性能分析输出格式: {fmt}")
+        self.output_dir = output_dir
+        self.fmt = fmt
+        self.interval = interval
+        self._sequence = 0
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.output_dir)
+
+    def _path(self, label: str) -> str:
+        with self._lock:
+            self._sequence += 1
+            sequence = self._sequence
+        label = re.sub(r'[^\w.-]+', '_', label or 'command').strip('_') or 'command'
+        suffix = '.collapsed' if self.fmt == 'collapsed' else '.speedscope.json'
+        return os.path.join(self.output_dir, f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{sequence:04d}-{label}{suffix}")
+
+    @contextmanager
+    def command(self, label: str):
+        """对块内执行的命令采样，结束（包括出错）时写出结果并打印耗时分类"""
+        if not self.enabled:
+            yield
+            return
+        profiler = SamplingProfiler(self.interval)
+        profiler.start()
+        try:
+            yield
+        finally:
+            profiler.stop()
+            self.write(profiler, label)
+
+    def write(self, profiler: SamplingProfiler, label: str) -> Optional[str]:
+        """写出一次采样结果，返回文件路径；写入失败时只打印提示"""
+        try:
+            os.makedirs(self.output_dir, exist_ok=True)
+            path = self._path(label)
+            with open(path, 'w', encoding='utf-8') as f:
+                if self.fmt == 'collapsed':
+                    f.write(profiler.collapsed())
+                else:
+                    json.dump(profiler.speedscope(label), f, ensure_ascii=False)
+        except Exception as e:
+            print(f"[DEBUG] 写入性能分析结果时出错: {str(e)}")
+            return None
+        summary = profiler.summary()
+        print(f"[DEBUG] 性能分析 {label}: 用时 {summary['wall']}s，模型调用等待 {summary['llm_wait']}s，"
+              f"CPU {summary['cpu']}s，其他等待 {summary['other_wait']}s（{summary['samples']} 个样本）→ {path}")
+        return path
+
+
+def command_profiler() -> CommandProfiler:
+    """按环境变量创建 CommandProfiler：PROFILE_DIR 为输出目录（未设置时不分析），
+    PROFILE_FORMAT 为 collapsed（默认）或 speedscope，PROFILE_INTERVAL_MS 为采样间隔（默认 5 毫秒）"""
+    return CommandProfiler(default_profile_dir(), os.getenv('PROFILE_FORMAT', 'collapsed').lower(),
+                           float(os.getenv('PROFILE_INTERVAL_MS', '5')) / 1000)
@@ -0,0 +1,292 @@
+import math
+from typing import List, Dict, Any, Optional, Iterable
+import numpy as np
+import pandas as pd
+
+# DataFrame 超过该行数时按块累计正规方程，避免一次性构造完整的设计矩阵副本
+CHUNKED_ROWS = 200000
+
+
+def _two_sided_p(stat: np.ndarray, df: Optional[float]) -> np.ndarray:
+    """双侧 p 值：有 SciPy 时用 t 分布（df 为 None 时用正态分布），否则用正态近似"""
+    stat = np.abs(np.asarray(stat, dtype=np.float64))
+    try:
+        from scipy import stats
+        if df is None:
+            return 2 * stats.norm.sf(stat)
+        return 2 * stats.t.sf(stat, df)
+    except ImportError:
+        return np.vectorize(lambda z: math.erfc(z / math.sqrt(2)) if np.isfinite(z) else np.nan)(stat)
+
+
+class NormalEquations:
+    """分块累计的正规方程（按 Chan 公式合并的均值与中心化协矩，数值稳定）
+
+    Z = [X | Y]，只统计所有列都非空的行。
+    """
+
+    def __init__(self, n_features: int, n_targets: int):
+        p = n_features + n_targets
+        self.n_features = n_features
+        self.n = 0
+        self.mean = np.zeros(p)
+        self.comoment = np.zeros((p, p))
+
+    def update(self, x: np.ndarray, y: np.ndarray):
+        z = np.hstack([np.asarray(x, dtype=np.float64).reshape(len(x), -1),
+                       np.asarray(y, dtype=np.float64).reshape(len(y), -1)])
+        z = z[~np.isnan(z).any(axis=1)]
+        m = len(z)
+        if not m:
+            return
+        chunk_mean = z.mean(axis=0)
+        centered = z - chunk_mean
+        chunk_comoment = centered.T @ centered
+        n = self.n + m
+        delta = chunk_mean - self.mean
+        self.comoment += chunk_comoment + np.outer(delta, delta) * self.n * m / n
+        self.mean += delta * m / n
+        self.n = n
+
+    def solve(self, alpha: float = 0.0) -> Dict[str, np.ndarray]:
+        """求解带截距的 OLS（alpha > 0 时为岭回归，截距不惩罚），一次求解所有响应变量"""
+        k = self.n_features
+        cxx = self.comoment[:k, :k]
+        cxy = self.comoment[:k, k:]
+        cyy = self.comoment[k:, k:]
+        x_mean, y_mean = self.mean[:k], self.mean[k:]
+
+        penalized = cxx + alpha * np.eye(k)
+        inverse = np.linalg.pinv(penalized)
+        slopes = inverse @ cxy
+        intercept = y_mean - x_mean @ slopes
+        rss = np.diag(cyy) - np.einsum('ij,ij->j', slopes, cxy) - np.einsum('ij,ij->j', slopes, cxy - cxx @ slopes)
+        tss = np.diag(cyy)
+
+        # 斜率协方差：OLS 为 sigma^2 (Cxx)^-1，岭回归为三明治形式
+        cov_unit = inverse @ cxx @ inverse if alpha > 0 else inverse
+        slope_var = np.diag(cov_unit)
+        intercept_var = 1.0 / self.n + x_mean @ cov_unit @ x_mean
+        return {
+            'coefficients': np.vstack([intercept, slopes]),
+            'unit_variance': np.concatenate([[intercept_var], slope_var]),
+            'rss': rss,
+            'tss': tss,
+            'n': self.n,
+            'rank': int(np.linalg.matrix_rank(cxx)) + 1
+        }
+
+
+def _ols_qr(x: np.ndarray, y: np.ndarray, alpha: float = 0.0) -> Dict[str, np.ndarray]:
+    """内存中的 OLS/岭回归：对设计矩阵做一次 QR 分解，所有响应变量共享同一次分解"""
+    n, k = x.shape
+    design = np.hstack([np.ones((n, 1)), x])
+    y_mean = y.mean(axis=0)
+    tss = ((y - y_mean) ** 2).sum(axis=0)
+
+    if alpha > 0:
+        # 岭回归：追加 sqrt(alpha) * I 行（不惩罚截距），仍然用 QR 求解
+        penalty = np.hstack([np.zeros((k, 1)), np.sqrt(alpha) * np.eye(k)])
+        design_aug = np.vstack([design, penalty])
+        y_aug = np.vstack([y, np.zeros((k, y.shape[1]))])
+    else:
+        design_aug, y_aug = design, y
+
+    q, r = np.linalg.qr(design_aug)
+    diag = np.abs(np.diag(r))
+    if diag.min() <= diag.max() * 1e-10:
+        # 秩亏时退回最小范数 lstsq（同样一次求解全部响应变量）
+        coefficients = np.linalg.lstsq(design_aug, y_aug, rcond=None)[0]
+        r_inv = None
+    else:
+        coefficients = np.linalg.solve(r, q.T @ y_aug)
+        r_inv = np.linalg.solve(r, np.eye(k + 1))
+
+    residuals = y - design @ coefficients
+    rss = (residuals ** 2).sum(axis=0)
+    if r_inv is not None:
+        inverse = r_inv @ r_inv.T  # (X'X + alpha I)^-1
+    else:
+        inverse = np.linalg.pinv(design_aug.T @ design_aug)
+    cov_unit = inverse @ (design.T @ design) @ inverse if alpha > 0 else inverse
+    return {
+        'coefficients': coefficients,
+        'unit_variance': np.diag(cov_unit),
+        'rss': rss,
+        'tss': tss,
+        'n': n,
+        'rank': int(np.linalg.matrix_rank(design))
+    }
+
+
+def _format_linear(solution: Dict[str, np.ndarray], feature_names: List[str], target_names: List[str],
+                   model: str, alpha: float) -> Dict[str, Any]:
+    """计算标准误、t 值、p 值、R²（全部向量化），并整理为按响应变量组织的结果"""
+    n = solution['n']
+    p = len(feature_names) + 1
+    df_resid = max(n - p, 1)
+    sigma2 = solution['rss'] / df_resid                                      # (targets,)
+    std_errors = np.sqrt(np.outer(solution['unit_variance'], sigma2))         # (p, targets)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        t_values = solution['coefficients'] / std_errors
+        r_squared = 1 - solution['rss'] / solution['tss']
+    adj_r_squared = 1 - (1 - r_squared) * (n - 1) / df_resid
+    p_values = _two_sided_p(t_values, df_resid)
+
+    names = ['intercept'] + feature_names
+    results = {}
+    for j, target in enumerate(target_names):
+        results[target] = {
+            'coefficients': dict(zip(names, solution['coefficients'][:, j].tolist())),
+            'std_errors': dict(zip(names, std_errors[:, j].tolist())),
+            't_values': dict(zip(names, t_values[:, j].tolist())),
+            'p_values': dict(zip(names, p_values[:, j].tolist())),
+            'r_squared': float(r_squared[j]),
+            'adj_r_squared': float(adj_r_squared[j]),
+            'sigma': float(np.sqrt(sigma2[j]))
+        }
+    return {'model': model, 'alpha': alpha, 'n': int(n), 'df_resid': int(df_resid),
+            'features': feature_names, 'targets': results}
+
+
+def fit_linear(x: np.ndarray, y: np.ndarray, feature_names: Optional[List[str]] = None,
+               target_names: Optional[List[str]] = None, alpha: float = 0.0) -> Dict[str, Any]:
+    """拟合 OLS（alpha=0）或岭回归，y 可以是多列，所有响应变量在一次分解中求解"""
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    x = x.reshape(len(x), -1)
+    y = y.reshape(len(y), -1)
+    complete = ~(np.isnan(x).any(axis=1) | np.isnan(y).any(axis=1))
+    x, y = x[complete], y[complete]
+    feature_names = feature_names or [f"x{i}" for i in range(x.shape[1])]
+    target_names = target_names or [f"y{j}" for j in range(y.shape[1])]
+    solution = _ols_qr(x, y, alpha)
+    return _format_linear(solution, feature_names, target_names, 'ridge' if alpha > 0 else 'ols', alpha)
+
+
+def fit_linear_chunked(chunks: Iterable[pd.DataFrame], features: List[str], targets: List[str],
+                       alpha: float = 0.0) -> Dict[str, Any]:
+    """对按块到达的数据累计正规方程并求解，内存只与特征数有关，适合百万行以上的数据"""
+    equations = NormalEquations(len(features), len(targets))
+    for chunk in chunks:
+        block = chunk.reindex(columns=features + targets).apply(pd.to_numeric, errors='coerce')
+        values = block.to_numpy(dtype=np.float64, na_value=np.nan)
+        equations.update(values[:, :len(features)], values[:, len(features):])
+    if equations.n <= len(features) + 1:
+        raise ValueError("有效样本数不足，无法拟合回归模型")
+    return _format_linear(equations.solve(alpha), features, targets, 'ridge' if alpha > 0 else 'ols', alpha)
+
+
+def fit_logistic(x: np.ndarray, y: np.ndarray, feature_names: Optional[List[str]] = None,
+                 target_names: Optional[List[str]] = None, alpha: float = 0.0,
+                 max_iter: int = 50, tol: float = 1e-8) -> Dict[str, Any]:
+    """用 IRLS（牛顿法）拟合逻辑回归，y 的每一列是一个 0/1 响应变量
+
+    alpha > 0 时加入 L2 惩罚（不惩罚截距）；标准误取自 Fisher 信息矩阵的逆，p 值用正态分布。
+    """
+    x = np.asarray(x, dtype=np.float64).reshape(len(x), -1)
+    y = np.asarray(y, dtype=np.float64).reshape(len(y), -1)
+    feature_names = feature_names or [f"x{i}" for i in range(x.shape[1])]
+    target_names = target_names or [f"y{j}" for j in range(y.shape[1])]
+    names = ['intercept'] + feature_names
+    k = x.shape[1] + 1
+    penalty = alpha * np.diag([0.0] + [1.0] * (k - 1))
+
+    results = {}
+    for j, target in enumerate(target_names):
+        complete = ~(np.isnan(x).any(axis=1) | np.isnan(y[:, j]))
+        design = np.hstack([np.ones((complete.sum(), 1)), x[complete]])
+        response = y[complete, j]
+        beta = np.zeros(k)
+        converged = False
+        for _ in range(max_iter):
+            eta = np.clip(design @ beta, -30, 30)
+            prob = 1 / (1 + np.exp(-eta))
+            weights = prob * (1 - prob)
+            hessian = (design * weights[:, None]).T @ design + penalty
+            gradient = design.T @ (response - prob) - penalty @ beta
+            step = np.linalg.lstsq(hessian, gradient, rcond=None)[0]
+            beta = beta + step
+            if np.max(np.abs(step)) < tol:
+                converged = True
+                break
+
+        eta = np.clip(design @ beta, -30, 30)
+        prob = 1 / (1 + np.exp(-eta))
+        weights = prob * (1 - prob)
+        covariance = np.linalg.pinv((design * weights[:, None]).T @ design + penalty)
+        std_errors = np.sqrt(np.diag(covariance))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            z_values = beta / std_errors
+        p_values = _two_sided_p(z_values, None)
+
+        eps = 1e-12
+        log_likelihood = np.sum(response * np.log(prob + eps) + (1 - response) * np.log(1 - prob + eps))
+        base_rate = response.mean()
+        null_likelihood = len(response) * (base_rate * np.log(base_rate + eps) +
+                                           (1 - base_rate) * np.log(1 - base_rate + eps))
+        results[target] = {
+            'coefficients': dict(zip(names, beta.tolist())),
+            'std_errors': dict(zip(names, std_errors.tolist())),
+            'z_values': dict(zip(names, z_values.tolist())),
+            'p_values': dict(zip(names, p_values.tolist())),
+            'log_likelihood': float(log_likelihood),
+            'pseudo_r_squared': float(1 - log_likelihood / null_likelihood) if null_likelihood else None,
+            'n': int(complete.sum()),
+            'converged': converged
+        }
+    return {'model': 'logistic', 'alpha': alpha, 'features': feature_names, 'targets': results}
+
+
+def regression_analysis(data: pd.DataFrame, targets: List[str], features: Optional[List[str]] = None,
+                        method: str = 'ols', alpha: float = 0.0) -> Dict[str, Any]:
+    """对 DataFrame 做回归分析
+
+    Args:
+        data: 输入数据
+        targets: 响应变量列名（可以多个，共享同一设计矩阵）
+        features: 自变量列名，None 表示除响应变量外的全部数值列
+        method: ols, ridge 或 logistic
+        alpha: 岭回归/逻辑回归的 L2 惩罚系数（method 为 ridge 且 alpha 为 0 时默认取 1.0）
+    """
+    if features is None:
+        numeric = data.select_dtypes(include=['number', 'bool']).columns
+        features = [c for c in numeric if c not in targets]
+    if not features or not targets:
+        raise ValueError("回归分析需要至少一个自变量和一个响应变量")
+    if method == 'ridge' and alpha <= 0:
+        alpha = 1.0
+
+    if method == 'logistic':
+        x = data[features].apply(pd.to_numeric, errors='coerce').to_numpy(dtype=np.float64, na_value=np.nan)
+        y = data[targets].apply(pd.to_numeric, errors='coerce').to_numpy(dtype=np.float64, na_value=np.nan)
+        return fit_logistic(x, y, features, targets, alpha)
+
+    if len(data) > CHUNKED_ROWS:
+        chunks = (data.iloc[start:start + CHUNKED_ROWS] for start in range(0, len(data), CHUNKED_ROWS))
+        return fit_linear_chunked(chunks, features, targets, alpha)
+
+    block = data[features + targets].apply(pd.to_numeric, errors='coerce').to_numpy(dtype=np.float64, na_value=np.nan)
+    return fit_linear(block[:, :len(features)], block[:, len(features):], features, targets, alpha)
+
+
+def regression_analysis_file(path: str, targets: List[str], features: Optional[List[str]] = None,
+                             method: str = 'ols', alpha: float = 0.0, chunk_size: int = 100000) -> Dict[str, Any]:
+    """对 CSV/Parquet 文件做回归分析：线性模型按块累计正规方程，只读取用到的列"""
+    from streaming_stats import iter_chunks
+
+    if features is None:
+        first = next(iter_chunks(path, chunk_size=1000), None)
+        if first is None:
+            raise ValueError("数据文件为空")
+        numeric = first.select_dtypes(include=['number', 'bool']).columns
+        features = [c for c in numeric if c not in targets]
+    if method == 'ridge' and alpha <= 0:
+        alpha = 1.0
+
+    columns = features + targets
+    if method == 'logistic':
+        # IRLS 需要多次迭代，这里只加载用到的列后在内存中求解
+        data = pd.concat(iter_chunks(path, chunk_size, columns), ignore_index=True)
+        return regression_analysis(data, targets, features, method, alpha)
+    return fit_linear_chunked(iter_chunks(path, chunk_size, columns), features, targets, alpha)
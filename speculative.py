@@ -0,0 +1,101 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import List, Dict, Any, Optional
+from llm_cache import content_key
+from llm_scheduler import call_priority
+from token_ledger import bind_session
+
+
+def paper_key(paper: Dict[str, Any]) -> str:
+    """按 summarize_paper 实际使用的字段计算文献的缓存键"""
+    return content_key(paper.get('title'), paper.get('authors'), paper.get('year'),
+                       paper.get('friendly_summary', paper.get('abstract')))
+
+
+class SummaryPrefetcher:
+    """检索结果到达后在后台预先生成前 top_k 篇文献的详细摘要（会话内缓存）
+
+    - 后台只用 workers 个线程按排名顺序依次生成，不与前台请求争抢并发
+    - 新的检索替换文献列表时取消尚未开始的预取任务，已在进行中的任务结果被丢弃
+    - 用户请求某篇文献的摘要时：已完成则直接返回；正在生成则等待其完成；尚未开始则取消，由调用方立即生成
+
+    Args:
+        tools: AcademicTools 实例
+        top_k: 预取的文献数
+        workers: 后台线程数
+    """
+
+    def __init__(self, tools, top_k: int = 3, workers: int = 1):
+        self.tools = tools
+        self.top_k = top_k
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='summary-prefetch')
+        self._summaries: Dict[str, str] = {}
+        self._pending: Dict[str, Future] = {}
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def schedule(self, papers: Optional[List[Dict[str, Any]]]):
+        """为新的检索结果安排预取（会先取消上一批未完成的任务）"""
+        self.cancel()
+        with self._lock:
+            generation = self._generation
+            # 预取的 token 记到发起检索的会话
+            summarize = bind_session(self._summarize)
+            for paper in (papers or [])[:self.top_k]:
+                key = paper_key(paper)
+                if key in self._summaries or key in self._pending:
+                    continue
+                self._pending[key] = self._executor.submit(summarize, generation, key, paper)
+            print(f"[DEBUG] 预取摘要: 已安排 {len(self._pending)} 篇")
+
+    def cancel(self):
+        """取消所有尚未完成的预取任务"""
+        with self._lock:
+            self._generation += 1
+            cancelled = sum(1 for future in self._pending.values() if future.cancel())
+            running = len(self._pending) - cancelled
+            self._pending.clear()
+        scheduler = getattr(self.tools, 'scheduler', None)
+        if running and scheduler:
+            # 已经开始但仍在排队等待调用名额的预取直接放弃（只取消本预取器的调用，批处理等其他后台调用不受影响）
+            scheduler.cancel_queued('background', owner=self)
+        if cancelled:
+            print(f"[DEBUG] 预取摘要: 取消 {cancelled} 个未开始的任务")
+
+    def _summarize(self, generation: int, key: str, paper: Dict[str, Any]) -> Optional[str]:
+        if generation != self._generation:
+            return None
+        # 预取只使用前台请求剩下的配额，并在新的检索到来时可被取消
+        try:
+            with call_priority('background', owner=self):
+                summary = self.tools.summarize_paper(paper, strict=True)
+        except Exception as e:
+            # 失败的结果不缓存，用户请求时重新生成
+            print(f"[DEBUG] 预取摘要失败: {str(e)}")
+            summary = None
+        with self._lock:
+            self._pending.pop(key, None)
+            if summary is None or generation != self._generation:
+                return None
+            self._summaries[key] = summary
+        return summary
+
+    def lookup(self, paper: Dict[str, Any]) -> Optional[str]:
+        """返回预取的摘要；没有可用结果时返回 None，由调用方自行生成"""
+        key = paper_key(paper)
+        with self._lock:
+            if key in self._summaries:
+                return self._summaries[key]
+            future = self._pending.get(key)
+            if future is None or future.cancel():
+                self._pending.pop(key, None)
+                return None
+        try:
+            return future.result()
+        except Exception as e:
+            print(f"[DEBUG] 预取摘要失败: {str(e)}")
+            return None
+
+    def shutdown(self):
+        self.cancel()
+        self._executor.shutdown(wait=False)
@@ -0,0 +1,254 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional, Iterator, Sequence
+import numpy as np
+import pandas as pd
+
+
+class QuantileSketch:
+    """可合并的近似分位数草图（KLL 风格的多层压缩器）
+
+    每层最多保存 k 个样本，超出时排序后隔一取一提升到上一层，第 h 层样本的权重为 2^h。
+    秩误差约为 O(1/k)，内存为 O(k log(n/k))。
+
+    Args:
+        k: 每层容量，越大越精确
+        seed: 随机种子（决定压缩时保留奇数位还是偶数位）
+    """
+
+    def __init__(self, k: int = 256, seed: int = 0):
+        self.k = k
+        self.levels: List[np.ndarray] = [np.empty(0)]
+        self.rng = np.random.default_rng(seed)
+
+    def update(self, values: np.ndarray):
+        values = values[~np.isnan(values)]
+        if len(values):
+            self.levels[0] = np.concatenate([self.levels[0], values])
+            self._compress()
+
+    def _compress(self):
+        level = 0
+        while level < len(self.levels):
+            items = self.levels[level]
+            if len(items) > self.k:
+                items = np.sort(items)
+                # 奇数个时留下一个，保证总权重不变
+                keep = items[-1:] if len(items) % 2 else items[:0]
+                pairs = items[:len(items) - len(keep)]
+                promoted = pairs[self.rng.integers(0, 2)::2]
+                self.levels[level] = keep
+                if level + 1 == len(self.levels):
+                    self.levels.append(np.empty(0))
+                self.levels[level + 1] = np.concatenate([self.levels[level + 1], promoted])
+            level += 1
+
+    def merge(self, other: 'QuantileSketch'):
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.empty(0))
+        for level, items in enumerate(other.levels):
+            self.levels[level] = np.concatenate([self.levels[level], items])
+        self._compress()
+
+    def quantiles(self, qs: Sequence[float]) -> List[Optional[float]]:
+        items = np.concatenate(self.levels)
+        if not len(items):
+            return [None] * len(qs)
+        weights = np.concatenate([np.full(len(level), 2.0 ** h) for h, level in enumerate(self.levels)])
+        order = np.argsort(items)
+        items, weights = items[order], weights[order]
+        cumulative = np.cumsum(weights) - weights / 2
+        positions = np.asarray(qs) * weights.sum()
+        return np.interp(positions, cumulative, items).tolist()
+
+
+class StreamingStats:
+    """一次遍历的描述统计累加器，可分块更新、可合并
+
+    均值/方差使用 Welford/Chan 的分块合并公式；相关系数按列对分别累计
+    成对完整观测的均值和协矩（与 pandas 的 pairwise 相关一致），避免原始平方和相减带来的数值误差。
+    """
+
+    def __init__(self, columns: List[str], sketch_size: int = 256):
+        p = len(columns)
+        self.columns = columns
+        self.rows = 0
+        self.count = np.zeros(p)
+        self.mean = np.zeros(p)
+        self.m2 = np.zeros(p)
+        self.min = np.full(p, np.inf)
+        self.max = np.full(p, -np.inf)
+        # 成对统计：pair_n[i, j] 为 i、j 同时非空的行数，pair_mean[i, j] 为这些行上第 i 列的均值
+        self.pair_n = np.zeros((p, p))
+        self.pair_mean = np.zeros((p, p))
+        self.pair_m2 = np.zeros((p, p))
+        self.comoment = np.zeros((p, p))
+        self.sketches = [QuantileSketch(sketch_size, seed=i) for i in range(p)]
+
+    @classmethod
+    def from_chunk(cls, values: np.ndarray, columns: List[str], sketch_size: int = 256) -> 'StreamingStats':
+        """从一块数据（行 x 列的 float 矩阵，缺失值为 NaN）计算局部统计量"""
+        stats = cls(columns, sketch_size)
+        stats.rows = len(values)
+        if not len(values):
+            return stats
+        mask = ~np.isnan(values)
+        m = mask.astype(np.float64)
+        count = m.sum(axis=0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            center = np.where(count > 0, np.nansum(values, axis=0) / np.maximum(count, 1), 0.0)
+        # 先按本块均值中心化，块内平方和不会出现大数相消
+        centered = np.where(mask, values - center, 0.0)
+
+        stats.count = count
+        stats.mean = center
+        stats.m2 = (centered ** 2).sum(axis=0)
+        has_values = count > 0
+        stats.min = np.where(has_values, np.nanmin(np.where(mask, values, np.inf), axis=0), np.inf)
+        stats.max = np.where(has_values, np.nanmax(np.where(mask, values, -np.inf), axis=0), -np.inf)
+
+        pair_n = m.T @ m
+        sums = centered.T @ m            # sums[i, j]: 第 j 列非空的行上，第 i 列（中心化后）的和
+        squares = (centered ** 2).T @ m
+        cross = centered.T @ centered
+        with np.errstate(invalid='ignore', divide='ignore'):
+            pair_mean_c = np.where(pair_n > 0, sums / np.maximum(pair_n, 1), 0.0)
+        stats.pair_n = pair_n
+        stats.pair_mean = pair_mean_c + center[:, None]
+        stats.pair_m2 = squares - pair_n * pair_mean_c ** 2
+        stats.comoment = cross - pair_n * pair_mean_c * pair_mean_c.T
+
+        for i, sketch in enumerate(stats.sketches):
+            sketch.update(values[:, i])
+        return stats
+
+    def merge(self, other: 'StreamingStats') -> 'StreamingStats':
+        """按 Chan 等人的并行合并公式并入另一个累加器"""
+        self.rows += other.rows
+
+        n = self.count + other.count
+        with np.errstate(invalid='ignore', divide='ignore'):
+            delta = other.mean - self.mean
+            ratio = np.where(n > 0, other.count / np.maximum(n, 1), 0.0)
+            self.mean = self.mean + delta * ratio
+            self.m2 = self.m2 + other.m2 + delta ** 2 * self.count * ratio
+        self.count = n
+        self.min = np.minimum(self.min, other.min)
+        self.max = np.maximum(self.max, other.max)
+
+        pn = self.pair_n + other.pair_n
+        with np.errstate(invalid='ignore', divide='ignore'):
+            pd_delta = other.pair_mean - self.pair_mean
+            pratio = np.where(pn > 0, other.pair_n / np.maximum(pn, 1), 0.0)
+            weight = self.pair_n * pratio
+            self.comoment = self.comoment + other.comoment + pd_delta * pd_delta.T * weight
+            self.pair_m2 = self.pair_m2 + other.pair_m2 + pd_delta ** 2 * weight
+            self.pair_mean = self.pair_mean + pd_delta * pratio
+        self.pair_n = pn
+
+        for sketch, other_sketch in zip(self.sketches, other.sketches):
+            sketch.merge(other_sketch)
+        return self
+
+    def summary(self, quantiles: Sequence[float] = (0.25, 0.5, 0.75)) -> Dict[str, Dict[str, Any]]:
+        """返回与 DataFrame.describe().to_dict() 结构相同的统计摘要"""
+        result = {}
+        with np.errstate(invalid='ignore', divide='ignore'):
+            std = np.sqrt(self.m2 / (self.count - 1))
+        for i, column in enumerate(self.columns):
+            has_values = self.count[i] > 0
+            entry = {
+                'count': float(self.count[i]),
+                'mean': float(self.mean[i]) if has_values else None,
+                'std': float(std[i]) if self.count[i] > 1 else None,
+                'min': float(self.min[i]) if has_values else None
+            }
+            for q, value in zip(quantiles, self.sketches[i].quantiles(quantiles)):
+                entry[f"{q * 100:g}%"] = value
+            entry['max'] = float(self.max[i]) if has_values else None
+            result[column] = entry
+        return result
+
+    def correlation(self) -> Dict[str, Dict[str, Any]]:
+        """返回成对完整观测的 Pearson 相关矩阵（与 DataFrame.corr().to_dict() 结构相同）"""
+        with np.errstate(invalid='ignore', divide='ignore'):
+            corr = self.comoment / np.sqrt(self.pair_m2 * self.pair_m2.T)
+        corr = np.where(self.pair_n > 1, corr, np.nan)
+        np.fill_diagonal(corr, np.where(self.count > 1, 1.0, np.nan))
+        return {
+            col_j: {col_i: (None if np.isnan(corr[i, j]) else float(corr[i, j]))
+                    for i, col_i in enumerate(self.columns)}
+            for j, col_j in enumerate(self.columns)
+        }
+
+
+def iter_chunks(path: str, chunk_size: int = 100000, columns: Optional[List[str]] = None) -> Iterator[pd.DataFrame]:
+    """按块读取 CSV 或 Parquet 文件"""
+    if path.lower().endswith(('.parquet', '.pq')):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError("读取 Parquet 需要安装 pyarrow：pip install pyarrow")
+        parquet_file = pq.ParquetFile(path)
+        for batch in parquet_file.iter_batches(batch_size=chunk_size, columns=columns):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(path, chunksize=chunk_size, usecols=columns)
+
+
+def _numeric_block(chunk: pd.DataFrame, columns: List[str]) -> np.ndarray:
+    """将一块数据中的数值列转为 float 矩阵（布尔列按 0/1 处理）"""
+    block = chunk.reindex(columns=columns)
+    return block.apply(pd.to_numeric, errors='coerce').to_numpy(dtype=np.float64, na_value=np.nan)
+
+
+def streaming_describe(path: str, chunk_size: int = 100000, columns: Optional[List[str]] = None,
+                       quantiles: Sequence[float] = (0.25, 0.5, 0.75), workers: int = 1,
+                       sketch_size: int = 256) -> Dict[str, Any]:
+    """分块读取大文件并计算描述统计和相关矩阵，内存占用与文件大小无关
+
+    Args:
+        path: CSV 或 Parquet 文件路径
+        chunk_size: 每块的行数
+        columns: 只读取这些列，None 表示全部列
+        quantiles: 需要估计的分位数
+        workers: 并行计算块统计量的线程数（NumPy 矩阵运算会释放 GIL）
+        sketch_size: 分位数草图每层容量
+
+    Returns:
+        Dict 包含 summary（同 describe().to_dict()）、correlation、rows 和 non_numeric_columns
+    """
+    chunks = iter_chunks(path, chunk_size, columns)
+    first = next(chunks, None)
+    if first is None:
+        return {'summary': {}, 'correlation': {}, 'rows': 0, 'non_numeric_columns': []}
+
+    numeric = first.select_dtypes(include=['number', 'bool']).columns.tolist()
+    non_numeric = [c for c in first.columns if c not in numeric]
+    total = StreamingStats(numeric, sketch_size)
+
+    def compute(chunk: pd.DataFrame) -> StreamingStats:
+        return StreamingStats.from_chunk(_numeric_block(chunk, numeric), numeric, sketch_size)
+
+    if workers <= 1:
+        total.merge(compute(first))
+        for chunk in chunks:
+            total.merge(compute(chunk))
+    else:
+        # 限制在途块数，保证内存有界；按提交顺序合并，结果可复现
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            pending = [executor.submit(compute, first)]
+            for chunk in chunks:
+                pending.append(executor.submit(compute, chunk))
+                if len(pending) >= workers * 2:
+                    total.merge(pending.pop(0).result())
+            for future in pending:
+                total.merge(future.result())
+
+    print(f"[DEBUG] 流式统计完成: {os.path.basename(path)}，共 {total.rows} 行，{len(numeric)} 个数值列")
+    return {
+        'summary': total.summary(quantiles),
+        'correlation': total.correlation(),
+        'rows': total.rows,
+        'non_numeric_columns': non_numeric
+    }
@@ -1,6 +1,36 @@
 import unittest
+import os
+import tempfile
 from academic_tools import AcademicTools
-from academic_agent import create_academic_workflow
+from academic_agent import create_academic_workflow, cluster_results_node
+from batch_jobs import BatchSummarizationJob, JobJournal
+import citation_export
+from citation_validator import CitationValidator, ReferenceCatalog
+from dedup import MinHashDeduplicator, deduplicate_papers
+from streaming_stats import streaming_describe
+from regression import regression_analysis, fit_logistic
+from data_loader import load_dataset
+from token_budget import TokenBudgetPlanner, estimate_tokens, trim_to_tokens, split_to_tokens
+from json_stream import JSONArrayStream, parse_json_array
+from pdf_references import extract_references, parse_reference
+from batch_jobs import load_records
+from model_router import ModelRouter
+from speculative import SummaryPrefetcher
+from history_store import HistoryStore
+from local_index import LocalPaperIndex
+from citation_graph import CitationGraph
+from topic_clusters import cluster_papers
+from llm_scheduler import LLMScheduler, SchedulerTimeout, Preempted
+from hedging import LatencyTracker, run_hedged, CallTimeout, CallCancelled
+from token_ledger import TokenLedger, BudgetExceeded
+from profiling import CommandProfiler, SamplingProfiler
+import bench_ingestion
+from watch_folder import FolderIngestor, IngestManifest
+
+# 测试期间的历史记录写入临时目录
+os.environ.setdefault('HISTORY_DB', os.path.join(tempfile.mkdtemp(), 'history.db'))
+os.environ.setdefault('CITATION_GRAPH_PATH', os.path.join(tempfile.mkdtemp(), 'citation_graph.npz'))
+os.environ.setdefault('TOKEN_LEDGER_DB', os.path.join(tempfile.mkdtemp(), 'token_ledger.db'))
 
 class TestAcademicAgent(unittest.TestCase):
     def setUp(self):
@@ -51,6 +81,48 @@ class TestAcademicAgent(unittest.TestCase):
         self.assertIsInstance(apa_ref, str)
         self.assertIsInstance(mla_ref, str)
 
+    def test_parse_bibtex_authors(self):
+        """测试 BibTeX 作者按 and 拆分且保留 "姓, 名" 形式"""
+        bibtex = "@article{doe2020, title={{Deep} Learning}, author={Anderson, Jane and Doe, John}, year={2020}, journal={AI Journal}}"
+        results = self.tools.parse_bibtex(bibtex)
+        self.assertEqual(results[0]['authors'], ['Anderson, Jane', 'Doe, John'])
+        self.assertEqual(results[0]['bibtex_key'], 'doe2020')
+
+    def test_bibtex_workflow_validation(self):
+        """测试 BibTeX 解析结果经过元数据校验节点"""
+        state = {
+            "messages": [],
+            "task_type": "parse_bibtex",
+            "bibtex_input": "@article{a, title={Valid Paper}, author={Doe, John}, year={2020}, doi={10.1000/abc}}\n"
+                            "@article{b, title={Bad Paper}, author={Roe, Ann}, year={3020}, doi={doi-missing}}"
+        }
+        result = self.workflow.invoke(state)
+        reports = result["citation_validation"]
+        self.assertEqual([r['valid'] for r in reports], [True, False])
+        self.assertIn('validation', result["literature_results"][1])
+
+    def test_regression_workflow(self):
+        """测试回归分析通过工作流 analysis 任务执行"""
+        import numpy as np
+        import pandas as pd
+        rng = np.random.default_rng(0)
+        x = rng.normal(size=(500, 2))
+        df = pd.DataFrame({'x1': x[:, 0], 'x2': x[:, 1], 'y': 1 + 2 * x[:, 0] - x[:, 1] + rng.normal(0, 0.1, 500)})
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'data.csv')
+            df.to_csv(path, index=False)
+            result = self.workflow.invoke({
+                "messages": [],
+                "task_type": "analysis",
+                "data_path": path,
+                "analysis_type": "regression",
+                "analysis_options": {"targets": ["y"], "chunk_size": 100},
+                "data_options": {"cache_dir": tmp}
+            })
+        coefficients = result["analysis_results"]["targets"]["y"]["coefficients"]
+        self.assertAlmostEqual(coefficients['x1'], 2, places=1)
+        self.assertAlmostEqual(coefficients['x2'], -1, places=1)
+
     def test_workflow(self):
         """测试工作流功能"""
         initial_state = {
@@ -66,5 +138,1317 @@ class TestAcademicAgent(unittest.TestCase):
         self.assertIsNotNone(result)
         self.assertIsInstance(result, dict)
 
+class _FakeSummaryTools:
+    """批处理测试用的替身工具，不发起网络请求"""
+    def __init__(self):
+        self.calls = 0
+
+    def summarize_paper(self, paper, strict=False):
+        self.calls += 1
+        return f"summary of {paper['title']}"
+
+    def last_usage(self):
+        return {'prompt_tokens': 10, 'completion_tokens': 5, 'total_tokens': 15}
+
+class TestBatchJobs(unittest.TestCase):
+    def test_resume_skips_completed(self):
+        """测试批量摘要任务重启后跳过已完成记录"""
+        records = [{'title': f'Paper {i}', 'year': '2024', 'bibtex_key': f'k{i}'} for i in range(6)]
+        with tempfile.TemporaryDirectory() as tmp:
+            journal_path = os.path.join(tmp, 'journal.jsonl')
+            tools = _FakeSummaryTools()
+            stats = BatchSummarizationJob(tools, journal_path, concurrency=3).run(records[:4])
+            self.assertEqual(stats['done'], 4)
+            self.assertEqual(stats['prompt_tokens'], 40)
+
+            # 模拟崩溃时写了一半的最后一行
+            with open(journal_path, 'a', encoding='utf-8') as f:
+                f.write('{"key": "bib:k4", "sta')
+
+            tools = _FakeSummaryTools()
+            stats = BatchSummarizationJob(tools, journal_path, concurrency=3).run(records)
+            self.assertEqual(stats['skipped'], 4)
+            self.assertEqual(tools.calls, 2)
+            self.assertEqual(len(JobJournal(journal_path).load_completed()), 6)
+
+    def test_failed_summary_is_not_completed(self):
+        """测试 summarize_paper 失败时记为失败（即使模型回复恰好是提示文本也按成功处理），重启后重试"""
+        import json
+
+        class FailingTools(_FakeSummaryTools):
+            def summarize_paper(self, paper, strict=False):
+                self.calls += 1
+                if paper['title'] == 'Broken':
+                    if strict:
+                        raise RuntimeError("生成摘要时发生错误")
+                    return "生成摘要时发生错误"
+                return "生成摘要时发生错误" if paper['title'] == 'Echo' else f"summary of {paper['title']}"
+
+        records = [{'title': 'Broken', 'bibtex_key': 'b'}, {'title': 'Echo', 'bibtex_key': 'e'}]
+        with tempfile.TemporaryDirectory() as tmp:
+            journal_path = os.path.join(tmp, 'journal.jsonl')
+            stats = BatchSummarizationJob(FailingTools(), journal_path, max_retries=0).run(records)
+            self.assertEqual((stats['done'], stats['failed']), (1, 1))
+            with open(journal_path, encoding='utf-8') as f:
+                entries = {e['key']: e for e in map(json.loads, f)}
+            self.assertEqual(entries['bib:b']['error'], "生成摘要时发生错误")
+            self.assertEqual(set(JobJournal(journal_path).load_completed()), {'bib:e'})
+
+class TestCitationExport(unittest.TestCase):
+    def setUp(self):
+        self.paper = {
+            'title': 'Deep {Learning} for Education',
+            'authors': ['Smith, John', 'Jane Doe'],
+            'year': '2021',
+            'journal': 'Journal of AI',
+            'volume': '12',
+            'number': '3',
+            'pages': '100--120',
+            'doi': '10.1000/xyz'
+        }
+
+    def test_text_styles(self):
+        """测试列表形式作者在各文本样式下的格式化"""
+        self.assertEqual(citation_export.format_reference(self.paper, 'apa'),
+                         'Smith, J., & Doe, J. (2021). Deep Learning for Education. Journal of AI, 12(3), 100–120. https://doi.org/10.1000/xyz')
+        self.assertEqual(citation_export.format_reference(self.paper, 'gb/t 7714'),
+                         'SMITH J, DOE J. Deep Learning for Education[J]. Journal of AI, 2021, 12(3): 100-120. DOI: 10.1000/xyz.')
+        self.assertTrue(citation_export.format_reference(self.paper, 'mla').startswith('Smith, John, and Jane Doe. "Deep Learning'))
+
+    def test_stream_export(self):
+        """测试流式导出 CSL-JSON 与 BibTeX 引用键去重"""
+        import io
+        import json
+        out = io.StringIO()
+        count = citation_export.write_references([self.paper] * 3, out, 'csl-json')
+        items = json.loads(out.getvalue())
+        self.assertEqual(count, 3)
+        self.assertEqual([item['id'] for item in items], ['smith2021deep', 'smith2021deepa', 'smith2021deepb'])
+        self.assertEqual(items[0]['author'][1], {'family': 'Doe', 'given': 'Jane'})
+
+    def test_missing_fields_and_key_collisions(self):
+        """测试 GB/T 7714 缺少刊名或年份时不留多余标点，生成的引用键不与已有键冲突"""
+        paper = {'title': 'X', 'authors': ['张三', '李四']}
+        self.assertEqual(citation_export.format_reference(paper, 'gbt7714'), '张三, 李四. X[J].')
+        self.assertEqual(citation_export.format_reference({**paper, 'year': '2020'}, 'gbt7714'), '张三, 李四. X[J]. 2020.')
+        self.assertEqual(citation_export.format_reference({**paper, 'journal': '计算机学报', 'volume': '8'}, 'gbt7714'),
+                         '张三, 李四. X[J]. 计算机学报, 8.')
+        used = {}
+        keys = [citation_export._bibtex_key({'bibtex_key': key}, [], used)
+                for key in ('smith2020a', 'smith2020', 'smith2020', 'smith2020', 'smith2020b')]
+        self.assertEqual(len(set(keys)), len(keys))
+        self.assertEqual(keys[:4], ['smith2020a', 'smith2020', 'smith2020b', 'smith2020c'])
+
+class TestCitationValidator(unittest.TestCase):
+    def test_catalog_batch_validation(self):
+        """测试基于本地参考目录的批量元数据校验"""
+        with tempfile.TemporaryDirectory() as tmp:
+            catalog = ReferenceCatalog(os.path.join(tmp, 'catalog.db'))
+            catalog.add_works([{'doi': '10.1000/ABC', 'title': 'Deep Learning for Education',
+                                'authors': ['Smith, John'], 'year': '2021', 'venue': 'Journal of AI'}])
+            validator = CitationValidator(catalog)
+            reports = validator.validate([
+                {'title': 'Deep {Learning} for education', 'authors': ['Smith, John'], 'year': '2021',
+                 'doi': 'https://doi.org/10.1000/abc'},
+                {'title': 'Something Else', 'authors': ['Smith, John'], 'year': '2021', 'doi': '10.1000/abc'},
+                {'title': 'deep learning for education!', 'authors': 'John Smith', 'year': '2015'}
+            ])
+            catalog.close()
+        self.assertTrue(reports[0]['valid'])
+        self.assertEqual(reports[0]['matched_by'], 'doi')
+        self.assertFalse(reports[1]['valid'])
+        self.assertEqual(reports[2]['matched_by'], 'title')
+        self.assertEqual(reports[2]['catalog_doi'], '10.1000/abc')
+        self.assertFalse(reports[2]['valid'])
+
+    def test_import_dump_restores_journal_mode(self):
+        """测试导入转储后（包括导入出错时）恢复原来的回滚日志和同步写盘设置"""
+        import json
+        with tempfile.TemporaryDirectory() as tmp:
+            catalog = ReferenceCatalog(os.path.join(tmp, 'catalog.db'))
+            catalog.conn.execute("PRAGMA journal_mode = WAL")
+            settings = lambda: (catalog.conn.execute("PRAGMA journal_mode").fetchone()[0],
+                                catalog.conn.execute("PRAGMA synchronous").fetchone()[0])
+            before = settings()
+            dump = os.path.join(tmp, 'crossref.json')
+            with open(dump, 'w', encoding='utf-8') as f:
+                json.dump({'items': [{'DOI': '10.1/a', 'title': ['A Paper'], 'issued': {'date-parts': [[2020]]}}]}, f)
+            self.assertEqual(catalog.import_dump(dump), 1)
+            self.assertEqual(settings(), before)
+            broken = os.path.join(tmp, 'broken.jsonl')
+            with open(broken, 'w', encoding='utf-8') as f:
+                f.write('{"DOI": "10.1/b", "title": ["B"]}\nnot json\n')
+            with self.assertRaises(ValueError):
+                catalog.import_dump(broken)
+            self.assertEqual(settings(), before)
+            self.assertEqual(catalog.conn.execute("SELECT COUNT(*) FROM works").fetchone()[0], 1)
+
+class TestDedup(unittest.TestCase):
+    def test_near_duplicates_merged(self):
+        """测试预印本与正式版本等近似重复记录被合并为一条代表记录"""
+        papers = [
+            {'title': 'Attention Is All You Need', 'authors': ['Vaswani, Ashish', 'Shazeer, Noam'],
+             'year': '2017', 'journal': 'arXiv preprint', 'source_type': 'qwen'},
+            {'title': '{A}ttention is all you need', 'authors': 'Ashish Vaswani and Noam Shazeer',
+             'year': '2017', 'journal': 'NeurIPS', 'doi': '10.5555/3295222', 'source_type': 'bibtex'},
+            {'title': 'Attention is not all you need', 'authors': ['Dong, Yihe'], 'year': '2021'},
+            {'title': 'BERT: Pre-training of Deep Bidirectional Transformers', 'authors': ['Devlin, Jacob'], 'year': '2019'}
+        ]
+        results = deduplicate_papers(papers)
+        self.assertEqual(len(results), 3)
+        self.assertEqual(results[0]['journal'], 'NeurIPS')
+        self.assertEqual(results[0]['duplicate_count'], 1)
+        self.assertEqual(results[0]['merged_sources'], ['bibtex', 'qwen'])
+
+    def test_distinct_papers_not_merged(self):
+        """测试同作者的相近标题、系列文章的不同部分和空标题记录不被合并"""
+        authors = ['Zhang, Wei', 'Li, Ming', 'Wang, Fang']
+        cases = [
+            [{'title': 'Deep spatio-temporal graph networks for traffic forecasting', 'authors': authors, 'year': '2019'},
+             {'title': 'Deep spatio-temporal graph networks for weather forecasting', 'authors': authors, 'year': '2021'}],
+            [{'title': 'Robust optimization under uncertainty, Part I: Theory', 'authors': authors, 'year': '2020'},
+             {'title': 'Robust optimization under uncertainty, Part II: Theory', 'authors': authors, 'year': '2020'}],
+            [{'title': 'Graph neural networks for molecule property prediction', 'authors': authors, 'year': '2018'},
+             {'title': 'Graph neural networks for molecule property prediction', 'authors': authors, 'year': '2022'}],
+            [{'title': '', 'authors': authors}, {'title': '', 'authors': ['Smith, John']}, {'title': None, 'authors': authors}]
+        ]
+        for papers in cases:
+            self.assertEqual(len(deduplicate_papers(papers)), len(papers), papers[0]['title'])
+        # 同一 DOI 的记录仍然合并
+        self.assertEqual(len(deduplicate_papers([{'title': '', 'doi': '10.1/x'}, {'title': 'X', 'doi': '10.1/X'}])), 1)
+
+    def test_signatures_deterministic(self):
+        """测试相同输入的 MinHash 签名稳定，互不相同的记录各自成簇"""
+        import hashlib
+        papers = [{'title': hashlib.md5(str(i).encode()).hexdigest(), 'authors': [f'Author{i}']} for i in range(50)]
+        first = MinHashDeduplicator().signatures(papers)
+        second = MinHashDeduplicator().signatures(papers)
+        self.assertTrue((first == second).all())
+        self.assertEqual(len(set(MinHashDeduplicator().cluster(papers).tolist())), 50)
+
+class TestStreamingStats(unittest.TestCase):
+    def test_matches_in_memory_describe(self):
+        """测试分块流式统计与 pandas 全量计算结果一致（含缺失值和非数值列）"""
+        import numpy as np
+        import pandas as pd
+        rng = np.random.default_rng(0)
+        df = pd.DataFrame({'a': rng.normal(1e6, 1, 5000), 'b': rng.normal(0, 5, 5000),
+                           'label': ['x'] * 5000})
+        df['b'] += df['a'] - 1e6
+        df.loc[rng.random(5000) < 0.1, 'b'] = np.nan
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'data.csv')
+            df.to_csv(path, index=False)
+            result = streaming_describe(path, chunk_size=700, workers=2)
+        expected = df.describe().to_dict()
+        for column in ('a', 'b'):
+            for key in ('count', 'mean', 'std', 'min', 'max'):
+                self.assertAlmostEqual(result['summary'][column][key], expected[column][key], places=6)
+            self.assertAlmostEqual(result['summary'][column]['50%'], expected[column]['50%'], delta=0.1)
+        self.assertAlmostEqual(result['correlation']['a']['b'], df.corr(numeric_only=True)['a']['b'], places=9)
+        self.assertEqual(result['non_numeric_columns'], ['label'])
+
+class TestRegression(unittest.TestCase):
+    def test_chunked_matches_qr(self):
+        """测试分块正规方程与 QR 求解结果一致，并一次拟合多个响应变量"""
+        import numpy as np
+        import pandas as pd
+        import regression
+        rng = np.random.default_rng(1)
+        x = rng.normal(size=(3000, 3))
+        x[:, 0] += 1000
+        y = x @ np.array([[1.0, 0.5], [2.0, 0.0], [-1.0, 3.0]]) + rng.normal(size=(3000, 2))
+        df = pd.DataFrame(np.hstack([x, y]), columns=['a', 'b', 'c', 'y1', 'y2'])
+        direct = regression_analysis(df, ['y1', 'y2'])
+        chunks = (df.iloc[i:i + 250] for i in range(0, len(df), 250))
+        chunked = regression.fit_linear_chunked(chunks, ['a', 'b', 'c'], ['y1', 'y2'])
+        for target in ('y1', 'y2'):
+            for key in ('coefficients', 'std_errors', 'p_values'):
+                for name, value in direct['targets'][target][key].items():
+                    self.assertAlmostEqual(value, chunked['targets'][target][key][name], places=6)
+            self.assertAlmostEqual(direct['targets'][target]['r_squared'],
+                                   chunked['targets'][target]['r_squared'], places=9)
+        self.assertAlmostEqual(direct['targets']['y2']['coefficients']['c'], 3.0, places=1)
+
+    def test_logistic(self):
+        """测试逻辑回归 IRLS 收敛并恢复系数"""
+        import numpy as np
+        rng = np.random.default_rng(2)
+        x = rng.normal(size=(20000, 2))
+        prob = 1 / (1 + np.exp(-(0.5 + x[:, 0] - 2 * x[:, 1])))
+        y = (rng.random(20000) < prob).astype(float)
+        result = fit_logistic(x, y, ['a', 'b'], ['y'])['targets']['y']
+        self.assertTrue(result['converged'])
+        self.assertAlmostEqual(result['coefficients']['b'], -2, delta=0.15)
+        self.assertLess(result['p_values']['a'], 1e-6)
+
+class TestDataLoader(unittest.TestCase):
+    def test_csv_cache_projection_and_sampling(self):
+        """测试 CSV 列式缓存、列投影、抽样和类型压缩"""
+        import pandas as pd
+        df = pd.DataFrame({'x': [float(i) for i in range(1000)], 'n': list(range(1000)),
+                           'group': ['a', 'b'] * 500})
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'data.csv')
+            df.to_csv(path, index=False)
+            cache_dir = os.path.join(tmp, 'cache')
+            first = load_dataset(path, cache_dir=cache_dir)
+            self.assertEqual(len(os.listdir(cache_dir)), 1)
+            pd.testing.assert_frame_equal(first, load_dataset(path, cache_dir=cache_dir))
+
+            loaded = load_dataset(path, columns=['x', 'group'], downcast=True, sample=100, cache_dir=cache_dir)
+            self.assertEqual(list(loaded.columns), ['x', 'group'])
+            self.assertEqual(len(loaded), 100)
+            self.assertEqual(str(loaded['x'].dtype), 'float32')
+            self.assertEqual(str(loaded['group'].dtype), 'category')
+            self.assertTrue(loaded['x'].is_monotonic_increasing)
+
+            # 源文件变化后缓存失效并替换旧缓存
+            df.head(10).to_csv(path, index=False)
+            os.utime(path, ns=(0, 10 ** 9))
+            self.assertEqual(len(load_dataset(path, cache_dir=cache_dir)), 10)
+            self.assertEqual(len(os.listdir(cache_dir)), 1)
+
+            # 损坏的缓存文件被删除，直接解析 CSV；下次重新生成缓存
+            cached = os.path.join(cache_dir, os.listdir(cache_dir)[0])
+            with open(cached, 'r+b') as f:
+                f.truncate(100)
+            self.assertEqual(len(load_dataset(path, cache_dir=cache_dir)), 10)
+            self.assertFalse(os.path.exists(cached))
+            self.assertEqual(len(load_dataset(path, cache_dir=cache_dir)), 10)
+            self.assertTrue(os.path.exists(cached))
+
+            # pyarrow 拒绝的 CSV（列数不一致）退回 pandas 解析
+            ragged = os.path.join(tmp, 'ragged.csv')
+            with open(ragged, 'w', encoding='utf-8') as f:
+                f.write('a,b,c\n1,2,3\n4,5\n')
+            loaded = load_dataset(ragged, cache_dir=cache_dir)
+            self.assertEqual(loaded['a'].tolist(), [1, 4])
+            self.assertTrue(pd.isna(loaded['c'].iloc[1]))
+
+    def test_concurrent_conversion(self):
+        """测试同一进程的多个线程同时转换同一个 CSV 时互不干扰"""
+        import pandas as pd
+        from concurrent.futures import ThreadPoolExecutor
+        df = pd.DataFrame({'x': [float(i) for i in range(20000)], 'group': ['a', 'b'] * 10000})
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'data.csv')
+            df.to_csv(path, index=False)
+            cache_dir = os.path.join(tmp, 'cache')
+            with ThreadPoolExecutor(max_workers=8) as executor:
+                frames = list(executor.map(lambda _: load_dataset(path, cache_dir=cache_dir), range(8)))
+            self.assertTrue(all(len(frame) == 20000 for frame in frames))
+            self.assertEqual([name for name in os.listdir(cache_dir) if name.endswith('.tmp')], [])
+
+    def test_parquet_and_arrow(self):
+        """测试以内存映射方式读取 Parquet 和 Arrow IPC 文件"""
+        import pandas as pd
+        df = pd.DataFrame({'a': [1, 2, 3], 'b': [0.5, 1.5, 2.5]})
+        with tempfile.TemporaryDirectory() as tmp:
+            parquet_path = os.path.join(tmp, 'data.parquet')
+            arrow_path = os.path.join(tmp, 'data.feather')
+            df.to_parquet(parquet_path)
+            df.to_feather(arrow_path)
+            self.assertEqual(load_dataset(parquet_path, columns=['b'])['b'].tolist(), [0.5, 1.5, 2.5])
+            self.assertEqual(load_dataset(arrow_path, columns=['a'])['a'].tolist(), [1, 2, 3])
+
+class _FakeCompletions:
+    """记录请求参数的 Chat Completions 替身"""
+    def __init__(self, completion_tokens, finish_reason='stop', reply=None):
+        self.requests = []
+        self.completion_tokens = completion_tokens
+        self.finish_reason = finish_reason
+        self.reply = reply
+
+    def create(self, **kwargs):
+        from types import SimpleNamespace
+        self.requests.append(kwargs)
+        message = SimpleNamespace(content=self.reply(kwargs) if self.reply else 'ok')
+        usage = SimpleNamespace(prompt_tokens=100, completion_tokens=self.completion_tokens, total_tokens=0)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message, finish_reason=self.finish_reason)],
+                               usage=usage)
+
+class TestTokenBudget(unittest.TestCase):
+    def test_trim_on_sentence_boundaries(self):
+        """测试按句子边界裁剪文本"""
+        text = '这是第一句话。这是第二句话！' * 20 + 'Final sentence in English. Another one.'
+        trimmed = trim_to_tokens(text, 30)
+        self.assertLessEqual(estimate_tokens(trimmed), 30)
+        self.assertTrue(trimmed.endswith(('。', '！')))
+        self.assertEqual(trim_to_tokens('short text.', 30), 'short text.')
+        pieces = split_to_tokens(text, 30)
+        self.assertEqual(''.join(pieces), text)
+        self.assertTrue(all(estimate_tokens(piece) <= 30 for piece in pieces))
+
+    def test_pdf_section_input_limit(self):
+        """测试章节提取的输入上限保持在原来 5000 字符的量级（每个关键词各调用一次）"""
+        planner = TokenBudgetPlanner()
+        section = planner.fit_text('pdf_section', 'The method improves outcomes, as shown in Table 3. ' * 2000)
+        self.assertLessEqual(estimate_tokens(section), 1600)
+        self.assertTrue(section.endswith('.'))
+
+    def test_completion_limit_learns_from_outputs(self):
+        """测试输出上限根据观测分布调整，截断后放宽"""
+        planner = TokenBudgetPlanner(max_completion=16384)
+        self.assertEqual(planner.completion_limit('summary'), 1536)
+        for i in range(40):
+            planner.observe('summary', 300 + i)
+        learned = planner.completion_limit('summary')
+        self.assertTrue(339 < learned < 600)
+        planner.observe('summary', 600, 'length')
+        self.assertEqual(planner.completion_limit('summary'), learned * 2)
+        self.assertGreater(planner.completion_limit('polish', prompt_tokens=5000), 5000)
+
+    def test_chat_uses_planned_max_tokens(self):
+        """测试 _chat 使用规划的 max_tokens 并反馈实际用量"""
+        tools = AcademicTools()
+        completions = _FakeCompletions(completion_tokens=250)
+        tools.client = type('FakeClient', (), {})()
+        tools.client.chat = type('FakeChat', (), {})()
+        tools.client.chat.completions = completions
+        tools.summarize_paper({'title': 'T', 'authors': 'A', 'year': '2024', 'abstract': 'x' * 100})
+        self.assertEqual(completions.requests[0]['max_tokens'], 1536)
+        self.assertEqual(tools.budget.stats()['summary']['samples'], 1)
+
+class _FakeStreamCompletions:
+    """按固定长度分片流式返回文本的 Chat Completions 替身"""
+    def __init__(self, text):
+        self.text = text
+        self.requests = []
+
+    def create(self, **kwargs):
+        from types import SimpleNamespace
+        self.requests.append(kwargs)
+
+        def chunks():
+            for i in range(0, len(self.text), 5):
+                delta = SimpleNamespace(content=self.text[i:i + 5])
+                yield SimpleNamespace(choices=[SimpleNamespace(delta=delta, finish_reason=None)], usage=None)
+            usage = SimpleNamespace(prompt_tokens=20, completion_tokens=40, total_tokens=60)
+            yield SimpleNamespace(choices=[], usage=usage)
+        return chunks()
+
+class TestStructuredSearch(unittest.TestCase):
+    def test_incremental_parser(self):
+        """测试增量解析器逐个产出对象，并恢复被截断的数组"""
+        text = '结果如下 [1]:\n```json\n{"papers": [{"title": "A ] \\" {", "authors": ["x"],}, {"title": "B"}, {"title": "C", "ye'
+        stream = JSONArrayStream()
+        items = []
+        for ch in text:
+            items.extend(stream.feed(ch))
+        self.assertEqual([p['title'] for p in items], ['A ] " {', 'B'])
+        self.assertEqual(stream.finish(), [{'title': 'C'}])
+        self.assertEqual(parse_json_array('没有找到相关文献。'), [])
+
+    def test_single_call_search(self):
+        """测试结构化联网搜索只调用一次模型"""
+        from types import SimpleNamespace
+        tools = AcademicTools()
+        completions = _FakeStreamCompletions('{"papers": [{"title": "P1", "year": "2023"}, {"title": "P2"}]}')
+        tools.client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+        papers = tools.qwen_search_papers('test', max_results=5)
+        self.assertEqual([p['title'] for p in papers], ['P1', 'P2'])
+        self.assertEqual(len(completions.requests), 1)
+        self.assertTrue(completions.requests[0]['stream'])
+        self.assertEqual(tools.last_usage()['completion_tokens'], 40)
+
+    def test_json_mode_fallback_only_on_rejection(self):
+        """测试只有接口拒绝 response_format 时才关闭 JSON 模式重试，超时等错误原样抛出"""
+        import httpx
+        from types import SimpleNamespace
+        from openai import BadRequestError
+        from hedging import CallTimeout
+        tools = AcademicTools()
+        completions = _FakeStreamCompletions('{"papers": [{"title": "P1"}]}')
+        failures = [CallTimeout("模型调用超时")]
+        create = completions.create
+
+        def flaky_create(**kwargs):
+            if failures:
+                completions.requests.append(kwargs)
+                raise failures.pop(0)
+            return create(**kwargs)
+        completions.create = flaky_create
+        tools.client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+        with self.assertRaises(CallTimeout):
+            list(tools.iter_qwen_search_papers('test'))
+        self.assertTrue(tools._search_json_mode)
+
+        response = httpx.Response(400, request=httpx.Request('POST', 'https://example.invalid'))
+        failures.append(BadRequestError("response_format is not supported with enable_search",
+                                        response=response, body=None))
+        papers = list(tools.iter_qwen_search_papers('test'))
+        self.assertEqual([p['title'] for p in papers], ['P1'])
+        self.assertFalse(tools._search_json_mode)
+        self.assertIn('response_format', completions.requests[-2])
+        self.assertNotIn('response_format', completions.requests[-1])
+
+    def test_early_closed_search_is_charged(self):
+        """测试够数后提前关闭的联网搜索流按估算用量记账，并归还预留额度"""
+        from types import SimpleNamespace
+        tools = AcademicTools()
+        completions = _FakeStreamCompletions('{"papers": [{"title": "P1"}, {"title": "P2"}, {"title": "P3"}]}')
+        tools.client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+        with tools.session('early-close'):
+            papers = tools.qwen_search_papers('test', max_results=2)
+            report = tools.usage_report()
+        self.assertEqual([p['title'] for p in papers], ['P1', 'P2'])
+        self.assertEqual(report['calls'], 1)
+        self.assertGreater(report['total_tokens'], 0)
+        self.assertEqual(tools.ledger._reserved.get('early-close', 0), 0)
+        self.assertGreater(tools.last_usage()['completion_tokens'], 0)
+
+class TestSearchStreaming(unittest.TestCase):
+    def test_stream_events_before_final_state(self):
+        """测试检索结果通过 custom 流式事件先于最终状态到达"""
+        from unittest import mock
+
+        def fake_iter(tools, query, max_results=5):
+            papers = [{'title': 'Paper One', 'year': '2024', 'abstract': 'a'},
+                      {'title': 'Paper Two', 'year': '2023', 'abstract': 'b'}]
+            for i, paper in enumerate(papers):
+                yield {'event': 'paper', 'index': i, 'paper': paper}
+            for i, paper in enumerate(papers):
+                paper['friendly_summary'] = f"summary {i}"
+                yield {'event': 'summary', 'index': i, 'friendly_summary': paper['friendly_summary']}
+
+        with mock.patch.object(AcademicTools, 'iter_search_papers', fake_iter):
+            workflow = create_academic_workflow()
+            stream = workflow.stream({"messages": [], "task_type": "search", "search_query": "q",
+                                      "search_method": "scholarly"}, stream_mode=["custom", "values"])
+            events = list(stream)
+        custom = [chunk for mode, chunk in events if mode == "custom"]
+        self.assertEqual([e['event'] for e in custom], ['paper', 'paper', 'summary', 'summary'])
+        self.assertEqual(custom[0]['node'], 'scholarly_search')
+        final = [chunk for mode, chunk in events if mode == "values"][-1]
+        self.assertEqual(final['literature_results'][1]['friendly_summary'], 'summary 1')
+
+def _write_reference_pdf(path, references, numbered=True):
+    """生成带参考文献章节的测试 PDF（编号格式或悬挂缩进格式）"""
+    import textwrap
+    import fitz
+    doc = fitz.open()
+    doc.new_page().insert_text((72, 72), "Introduction. Prior work [1] studied this.", fontsize=10)
+    page = doc.new_page()
+    page.insert_text((72, 72), "References", fontsize=12)
+    y = 92
+    for i, reference in enumerate(references):
+        text = f"[{i + 1}] {reference}" if numbered else reference
+        for k, line in enumerate(textwrap.wrap(text, 70)):
+            if y > 760:
+                page = doc.new_page()
+                y = 72
+            page.insert_text((72 if k == 0 else 90, y), line, fontsize=9)
+            y += 11
+    doc.save(path)
+    doc.close()
+
+class TestPDFReferences(unittest.TestCase):
+    IEEE = ('A. Smith, B. Jones, and C. Lee, "Deep learning for education: a survey," IEEE Trans. Learn. '
+            'Technol., vol. 12, no. 3, pp. 45-67, 2020, doi: 10.1109/TLT.2020.123.')
+    APA = ('Wang, L., Zhang, Y., & Chen, X. (2019). Adaptive tutoring systems for large classrooms. '
+           'Journal of AI in Education, 29(4), 500-521.')
+
+    def test_numbered_and_hanging_indent(self):
+        """测试按编号和悬挂缩进切分参考文献并解析字段"""
+        with tempfile.TemporaryDirectory() as tmp:
+            numbered_path = os.path.join(tmp, 'ieee.pdf')
+            hanging_path = os.path.join(tmp, 'apa.pdf')
+            _write_reference_pdf(numbered_path, [self.IEEE] * 60)
+            _write_reference_pdf(hanging_path, [self.APA] * 40, numbered=False)
+
+            references = extract_references(numbered_path)
+            self.assertEqual(len(references), 60)
+            self.assertEqual(references[0]['title'], 'Deep learning for education: a survey')
+            self.assertEqual(references[0]['authors'], ['A. Smith', 'B. Jones', 'C. Lee'])
+            self.assertEqual((references[0]['year'], references[0]['volume'], references[0]['pages']),
+                             ('2020', '12', '45-67'))
+            self.assertEqual(references[0]['doi'], '10.1109/TLT.2020.123')
+
+            references = extract_references(hanging_path)
+            self.assertEqual(len(references), 40)
+            self.assertEqual(references[-1]['journal'], 'Journal of AI in Education')
+            self.assertEqual(references[-1]['authors'][0], 'Wang, L.')
+
+            # 批处理入口：目录中的多个 PDF 并行解析
+            records = load_records(tmp, pdf_workers=2)
+            self.assertEqual(len(records), 100)
+
+    def test_parse_gbt_reference(self):
+        """测试解析 GB/T 7714 格式的中文参考文献"""
+        reference = parse_reference('张三, 李四. 深度学习在教育中的应用[J]. 计算机学报, 2020, 43(5): 100-110.')
+        self.assertEqual(reference['title'], '深度学习在教育中的应用')
+        self.assertEqual(reference['authors'], ['张三', '李四'])
+        self.assertEqual((reference['journal'], reference['year'], reference['number']), ('计算机学报', '2020', '5'))
+
+class TestParagraphPolish(unittest.TestCase):
+    def test_only_changed_paragraphs_are_repolished(self):
+        """测试段落并行润色：结果按原顺序拼接，修改一个段落后只重新润色该段落"""
+        def reply(kwargs):
+            return kwargs['messages'][-1]['content'].split('待润色段落：\n', 1)[1].upper()
+
+        with tempfile.TemporaryDirectory() as tmp:
+            tools = AcademicTools()
+            tools.llm_cache_path = os.path.join(tmp, 'cache.db')
+            completions = _FakeCompletions(completion_tokens=50, reply=reply)
+            tools.client = type('FakeClient', (), {})()
+            tools.client.chat = type('FakeChat', (), {})()
+            tools.client.chat.completions = completions
+
+            paragraphs = [f'paragraph number {i} about adaptive learning.' for i in range(6)]
+            text = 'Introduction\n\n' + '\n\n'.join(paragraphs) + '\n'
+            polished = tools.polish_text(text)
+            self.assertEqual(polished, 'Introduction\n\n' + '\n\n'.join(p.upper() for p in paragraphs) + '\n')
+            self.assertEqual(len(completions.requests), 6)
+
+            paragraphs[3] = 'paragraph three was rewritten.'
+            polished = tools.polish_document('Introduction\n\n' + '\n\n'.join(paragraphs) + '\n')
+            self.assertEqual(len(completions.requests), 7)
+            self.assertIn('PARAGRAPH THREE WAS REWRITTEN.', polished)
+            self.assertEqual(tools.last_polish_stats['cached'], 5)
+
+            # prompt 不含目标语言，换一个目标语言得到同样的结果，直接复用缓存
+            tools.polish_document('Introduction\n\n' + '\n\n'.join(paragraphs) + '\n', target_language='en')
+            self.assertEqual(len(completions.requests), 7)
+
+class TestModelRouter(unittest.TestCase):
+    def test_demotes_slow_or_failing_models(self):
+        """测试按档位选择模型，慢或出错的模型被降级到后备模型之后"""
+        router = ModelRouter({'fast': ['turbo', 'plus'], 'large': ['big']}, 'big')
+        self.assertEqual(router.candidates('intent'), ['turbo', 'plus'])
+        self.assertEqual(router.primary('summary'), 'big')
+        self.assertEqual(router.primary('unknown'), 'big')
+        for _ in range(5):
+            router.record('turbo', 20.0, True)
+        self.assertEqual(router.candidates('intent'), ['plus', 'turbo'])
+        for _ in range(5):
+            router.record('plus', 0.5, False)
+        self.assertEqual(router.candidates('intent'), ['turbo', 'plus'])
+
+    def test_chat_falls_back_on_connection_error(self):
+        """测试主模型连接失败时 _chat 自动切换到后备模型"""
+        import httpx
+        from openai import APIConnectionError
+
+        class FlakyCompletions(_FakeCompletions):
+            def create(self, **kwargs):
+                if kwargs['model'] == 'turbo':
+                    self.requests.append(kwargs)
+                    raise APIConnectionError(request=httpx.Request('POST', 'http://test'))
+                return super().create(**kwargs)
+
+        tools = AcademicTools()
+        tools.router = ModelRouter({'fast': ['turbo', 'plus']}, 'big')
+        completions = FlakyCompletions(completion_tokens=10)
+        tools.client = type('FakeClient', (), {})()
+        tools.client.chat = type('FakeChat', (), {})()
+        tools.client.chat.completions = completions
+        tools.identify_intent('搜索 深度学习')
+        self.assertEqual([r['model'] for r in completions.requests], ['turbo', 'plus'])
+        self.assertEqual(tools.router.stats()['turbo']['failure_rate'], 1.0)
+
+class TestSummaryPrefetch(unittest.TestCase):
+    def test_summary_served_from_prefetch(self):
+        """测试检索后预取的摘要被 summarize_and_explain 直接使用"""
+        from unittest import mock
+        calls = []
+
+        def fake_iter(tools, query, max_results=5):
+            for i, title in enumerate(['Paper One', 'Paper Two', 'Paper Three']):
+                yield {'event': 'paper', 'index': i, 'paper': {'title': title, 'year': '2024', 'abstract': title}}
+
+        def fake_summarize(tools, paper, strict=False):
+            calls.append(paper['title'])
+            return f"详细摘要 {paper['title']}"
+
+        with mock.patch.object(AcademicTools, 'iter_search_papers', fake_iter), \
+                mock.patch.object(AcademicTools, 'summarize_paper', fake_summarize), \
+                mock.patch.object(AcademicTools, 'last_usage', lambda tools: {'completion_tokens': 1}):
+            workflow = create_academic_workflow(speculative_top_k=2)
+            state = workflow.invoke({"messages": [], "task_type": "search", "search_query": "q",
+                                     "search_method": "scholarly"})
+            state = workflow.invoke({**state, "task_type": "summary", "paper_to_summarize_index": 1})
+            self.assertEqual(state['summary'], '详细摘要 Paper Two')
+            self.assertEqual(sorted(calls), ['Paper One', 'Paper Two'])
+
+    def test_new_search_cancels_pending(self):
+        """测试新的检索取消尚未开始的预取任务"""
+        import threading
+        import time
+        release = threading.Event()
+        summarized = []
+
+        class SlowTools:
+            def summarize_paper(self, paper, strict=False):
+                release.wait(5)
+                summarized.append(paper['title'])
+                return paper['title']
+
+            def last_usage(self):
+                return {}
+
+        prefetcher = SummaryPrefetcher(SlowTools(), top_k=3)
+        prefetcher.schedule([{'title': 'A'}, {'title': 'B'}, {'title': 'C'}])
+        prefetcher.schedule([{'title': 'D'}])
+        release.set()
+        self.assertIsNone(prefetcher.lookup({'title': 'B'}))
+        for _ in range(100):
+            if 'D' in summarized:
+                break
+            time.sleep(0.05)
+        self.assertEqual(prefetcher.lookup({'title': 'D'}), 'D')
+        prefetcher.shutdown()
+        self.assertNotIn('B', summarized)
+
+class TestBatchCLI(unittest.TestCase):
+    def test_jsonl_commands_keep_session_order(self):
+        """测试批处理模式：同一会话按顺序执行并共享文献列表，结果写成 JSONL"""
+        import json
+        from unittest import mock
+        from cli import run_batch
+
+        def fake_iter(tools, query, max_results=5):
+            yield {'event': 'paper', 'index': 0, 'paper': {'title': f'{query} paper', 'year': '2024', 'abstract': 'a'}}
+
+        instances = []
+        init = AcademicTools.__init__
+
+        def counting_init(tools):
+            instances.append(tools)
+            init(tools)
+
+        commands = [
+            {'id': 1, 'session': 's1', 'intent': 'search', 'parameters': {'query': 'graphs'}},
+            {'id': 2, 'session': 's2', 'intent': 'polish', 'parameters': {'text': '一段文本。'}},
+            {'id': 3, 'session': 's1', 'intent': 'summarize', 'parameters': {'paper_id': 1}},
+            {'id': 4, 'session': 's2', 'intent': 'summarize', 'parameters': {'paper_id': 1}},
+            {'id': 5, 'session': 's3', 'input': '润色：另一段文本。'}
+        ]
+        with tempfile.TemporaryDirectory() as tmp:
+            source = os.path.join(tmp, 'commands.jsonl')
+            output = os.path.join(tmp, 'results.jsonl')
+            with open(source, 'w', encoding='utf-8') as f:
+                f.write('\n'.join(json.dumps(c, ensure_ascii=False) for c in commands) + '\nnot json\n')
+            with mock.patch.object(AcademicTools, 'iter_search_papers', fake_iter), \
+                    mock.patch.object(AcademicTools, '__init__', counting_init), \
+                    mock.patch.object(AcademicTools, 'summarize_paper', lambda tools, paper, strict=False: f"摘要 {paper['title']}"), \
+                    mock.patch.object(AcademicTools, 'polish_text', lambda tools, text: f"润色 {text}"), \
+                    mock.patch.object(AcademicTools, 'identify_intent',
+                                      lambda tools, text: {'intent': 'polish', 'parameters': {'text': text[3:]}}):
+                stats = run_batch(source, output, workers=4)
+            with open(output, encoding='utf-8') as f:
+                records = {r['id']: r for r in map(json.loads, f)}
+
+        self.assertEqual(stats, {'total': 6, 'ok': 4, 'failed': 2})
+        # 工作流与批处理共用一个工具实例
+        self.assertEqual(len(instances), 1)
+        self.assertEqual(records[1]['result']['literature_results'][0]['title'], 'graphs paper')
+        self.assertEqual(records[3]['result']['summary'], '摘要 graphs paper')
+        self.assertEqual(records[2]['result']['polished_text'], '润色 一段文本。')
+        self.assertFalse(records[4]['ok'])
+        self.assertEqual(records[5]['result']['polished_text'], '润色 另一段文本。')
+
+    def test_summarize_rejects_invalid_paper_id(self):
+        """测试批处理总结命令的文献ID缺失、非整数或越界时返回错误记录，而不是回绕到最后一篇"""
+        from cli import execute_command
+        session_state = {'literature_results': [{'title': 'A'}, {'title': 'B'}]}
+        for paper_id, message in [(None, '缺少文献ID'), ('', '缺少文献ID'), ('abc', '无效'), (0, '无效'),
+                                  (-1, '无效'), ('3', '无效')]:
+            command = {'id': 1, 'intent': 'summarize', 'parameters': {'paper_id': paper_id}}
+            record = execute_command(None, None, command, session_state)
+            self.assertFalse(record['ok'], paper_id)
+            self.assertIn(message, record['error'])
+
+class TestHistoryStore(unittest.TestCase):
+    def test_full_text_and_ref_lookup(self):
+        """测试历史结果集的全文检索（含中文子串）和 s/# 引用解析"""
+        with tempfile.TemporaryDirectory() as tmp:
+            store = HistoryStore(os.path.join(tmp, 'history.db'))
+            first = store.record_results('search', [
+                {'title': '图神经网络在推荐系统中的应用', 'authors': ['张三'], 'year': '2021'},
+                {'title': 'Graph Attention Networks', 'authors': ['P. Velickovic'], 'year': '2018'}
+            ], query='图神经网络')
+            second = store.record_results('parse_bibtex', [{'title': 'Deep Residual Learning', 'year': '2016'}])
+            store.record_artifact('summary', '提出了残差连接以训练很深的网络', paper_id=second['paper_ids'][0])
+
+            self.assertEqual(store.search('神经网络')[0]['title'], '图神经网络在推荐系统中的应用')
+            self.assertEqual(store.search('attention graph')[0]['year'], '2018')
+            self.assertEqual(store.search('残差连接')[0]['title'], 'Deep Residual Learning')
+            self.assertEqual([p['title'] for p in store.resolve(f"s{first['set_id']}:2")], ['Graph Attention Networks'])
+            self.assertEqual(len(store.resolve(f"s{first['set_id']}")), 2)
+            self.assertEqual(store.resolve(f"#{second['paper_ids'][0]}")[0]['history_id'], second['paper_ids'][0])
+            self.assertEqual(store.result_sets()[0]['count'], 1)
+            store.close()
+
+    def test_summarize_from_earlier_result_set(self):
+        """测试新会话按历史引用总结以前的文献，已有摘要直接复用"""
+        from unittest import mock
+        from cli import load_history_ref, new_session_state
+        calls = []
+
+        def fake_iter(tools, query, max_results=5):
+            yield {'event': 'paper', 'index': 0, 'paper': {'title': 'Historic Paper', 'year': '2020', 'abstract': 'a'}}
+
+        def fake_summarize(tools, paper, strict=False):
+            calls.append(paper['title'])
+            return '详细摘要'
+
+        with tempfile.TemporaryDirectory() as tmp, \
+                mock.patch.dict(os.environ, {'HISTORY_DB': os.path.join(tmp, 'history.db')}), \
+                mock.patch.object(AcademicTools, 'iter_search_papers', fake_iter), \
+                mock.patch.object(AcademicTools, 'summarize_paper', fake_summarize), \
+                mock.patch.object(AcademicTools, 'last_usage', lambda tools: {'completion_tokens': 1}):
+            workflow = create_academic_workflow()
+            state = workflow.invoke({"messages": [], "task_type": "search", "search_query": "history",
+                                     "search_method": "scholarly"})
+            set_id = state['history_set_id']
+            workflow.invoke({**state, "task_type": "summary", "paper_to_summarize_index": 0})
+
+            tools = AcademicTools()
+            session_state = new_session_state()
+            parameters = {'history_ref': f's{set_id}'}
+            load_history_ref(tools, 'summarize', parameters, session_state)
+            result = workflow.invoke({**session_state, "task_type": "summary",
+                                      "paper_to_summarize_index": int(parameters['paper_id']) - 1})
+        self.assertEqual(result['summary'], '详细摘要')
+        self.assertEqual(calls, ['Historic Paper'])
+
+class TestLocalIndex(unittest.TestCase):
+    def test_import_snapshots_and_search(self):
+        """测试流式导入 arXiv / OpenAlex 快照并按字段、年份离线检索"""
+        import json
+        from unittest import mock
+        arxiv = [
+            {'id': '1706.03762', 'title': 'Attention Is All You Need', 'authors': 'A. Vaswani, N. Shazeer',
+             'authors_parsed': [['Vaswani', 'Ashish', ''], ['Shazeer', 'Noam', '']],
+             'abstract': 'We propose the Transformer, based solely on attention mechanisms.',
+             'versions': [{'created': 'Mon, 12 Jun 2017 17:57:34 GMT'}]},
+            {'id': '1609.02907', 'title': 'Semi-Supervised Classification with Graph Convolutional Networks',
+             'authors': 'T. Kipf, M. Welling', 'abstract': 'Graph convolutional networks for node classification.',
+             'versions': [{'created': 'Fri, 9 Sep 2016 12:00:00 GMT'}]}
+        ]
+        openalex = [{'id': 'https://openalex.org/W1', 'title': 'Graph Attention Networks', 'publication_year': 2018,
+                     'doi': 'https://doi.org/10.1000/gat', 'authorships': [{'author': {'display_name': 'Petar Velickovic'}}],
+                     'abstract_inverted_index': {'Graph': [0], 'attention': [1], 'layers': [2]}}]
+        with tempfile.TemporaryDirectory() as tmp:
+            paths = {}
+            for name, records in (('arxiv.json', arxiv), ('openalex.jsonl', openalex)):
+                paths[name] = os.path.join(tmp, name)
+                with open(paths[name], 'w', encoding='utf-8') as f:
+                    f.write('\n'.join(json.dumps(r) for r in records) + '\n')
+            db = os.path.join(tmp, 'index.db')
+            index = LocalPaperIndex(db)
+            journal_mode = index.conn.execute("PRAGMA journal_mode").fetchone()[0]
+            self.assertEqual(index.import_dump(paths['arxiv.json'], 'arxiv'), 2)
+            # 导入结束后恢复原来的回滚日志模式
+            self.assertEqual(index.conn.execute("PRAGMA journal_mode").fetchone()[0], journal_mode)
+            self.assertEqual(index.import_dump(paths['openalex.jsonl'], 'openalex'), 1)
+            self.assertEqual(index.import_dump(paths['arxiv.json'], 'arxiv'), 0)
+
+            self.assertEqual([p['title'] for p in index.search('attention year:2018-')], ['Graph Attention Networks'])
+            top = index.search('title:attention author:vaswani')[0]
+            self.assertEqual((top['year'], top['authors'][0]), ('2017', 'Ashish Vaswani'))
+            self.assertEqual(index.search('graph', year_to=2016)[0]['url'], 'https://arxiv.org/abs/1609.02907')
+            self.assertEqual(index.search('graph attention')[0]['abstract'], 'Graph attention layers')
+            index.close()
+
+            with mock.patch.dict(os.environ, {'LOCAL_INDEX_DB': db}):
+                workflow = create_academic_workflow()
+                state = workflow.invoke({"messages": [], "task_type": "search", "search_query": "graph networks",
+                                         "search_method": "local"})
+            self.assertEqual(len(state['literature_results']), 2)
+
+
+class TestCitationGraph(unittest.TestCase):
+    def test_incremental_pagerank_and_rerank(self):
+        """测试增量添加文档后 PageRank 与全量重算一致，并按引用图重排文献"""
+        import numpy as np
+        documents = [('A', ['B', 'C']), ('B', ['C']), ('D', ['C', 'B']), ('E', ['A'])]
+        graph = CitationGraph()
+        graph.add_documents(documents[:2])
+        graph.pagerank()
+        graph.add_documents(documents[2:])
+        full = CitationGraph()
+        full.add_documents(documents)
+        np.testing.assert_allclose(graph.pagerank(), full.pagerank(), atol=1e-8)
+        self.assertAlmostEqual(graph.pagerank().sum(), 1.0)
+
+        papers = [{'title': 'E'}, {'title': 'unknown'}, {'title': 'B'}, {'title': 'C'}]
+        graph.add_documents([('title:e', ['title:b']), ('title:a', ['title:c', 'title:b'])])
+        ranked = graph.rank_papers(papers)
+        self.assertEqual([p['title'] for p in ranked], ['B', 'C', 'E', 'unknown'])
+        self.assertEqual(ranked[-1]['citation_score'], 0.0)
+        self.assertEqual(list(graph.cocitation_scores(papers)), [0.0, 0.0, 1.0, 1.0])
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'graph.npz')
+            graph.save(path)
+            loaded = CitationGraph.load(path)
+            self.assertEqual((len(loaded), loaded.n_edges), (len(graph), graph.n_edges))
+            np.testing.assert_allclose(loaded.pagerank(), graph.pagerank())
+
+    def test_bibtex_crossref_edges(self):
+        """测试 BibTeX crossref 字段生成引用边"""
+        entries = [{'bibtex_key': 'conf', 'title': 'Proceedings'},
+                   {'bibtex_key': 'p1', 'title': 'Paper One', 'crossref': 'conf'},
+                   {'bibtex_key': 'p2', 'title': 'Paper Two', 'crossref': 'missing'}]
+        graph = CitationGraph()
+        self.assertEqual(graph.add_bibtex_crossrefs(entries), 2)
+        ranked = graph.rank_papers(entries)
+        self.assertEqual(ranked[0]['bibtex_key'], 'conf')
+
+    def test_untitled_references_are_skipped(self):
+        """测试没有 DOI 和标题的参考文献不会合并成同一个节点，也不参与排序"""
+        graph = CitationGraph()
+        self.assertEqual(graph.add_citations('pdf:/a.pdf', [{'title': ''}, {'title': 'Known Paper'}]), 1)
+        self.assertEqual(graph.add_citations('pdf:/b.pdf', [{'title': '  '}, {'doi': '', 'title': None}]), 0)
+        self.assertEqual(graph.add_citations({'title': ''}, [{'title': 'Known Paper'}]), 0)
+        self.assertEqual((len(graph), graph.n_edges), (3, 1))
+        papers = [{'title': ''}, {'title': 'Known Paper'}]
+        ranked = graph.rank_papers(papers)
+        self.assertEqual([p['title'] for p in ranked], ['Known Paper', ''])
+        self.assertEqual(ranked[1]['citation_score'], 0.0)
+        self.assertEqual(list(graph.cocitation_scores(papers)), [0.0, 0.0])
+        self.assertEqual(graph.remove_documents([{'title': ''}]), 0)
+
+
+class TestTopicClusters(unittest.TestCase):
+    def test_cluster_papers_by_topic(self):
+        """测试哈希 TF-IDF + 小批量 k-means 按主题分组并生成标签词"""
+        topics = {
+            'graph': 'graph neural networks node classification message passing',
+            'language': 'language models transformer pretraining tokens',
+            'quantum': 'quantum circuits qubits error correction'
+        }
+        papers = []
+        for i in range(30):
+            name = list(topics)[i % 3]
+            words = topics[name].split()
+            papers.append({'title': f"{words[i % len(words)]} {words[(i + 1) % len(words)]} study {i}",
+                           'abstract': f"We propose a method for {topics[name]}. Results on benchmark {i}.",
+                           'topic': name})
+        papers.append({'title': '', 'abstract': ''})
+        result = cluster_papers(papers, n_clusters=3)
+        self.assertEqual(len(result['clusters']), 3)
+        self.assertEqual(result['labels'][-1], -1)
+        for cluster in result['clusters']:
+            members = {papers[i]['topic'] for i in cluster['indices']}
+            self.assertEqual(len(members), 1)
+            self.assertIn(cluster['terms'][0], topics[members.pop()].split())
+
+        state = cluster_results_node({"literature_results": papers[:30]}, AcademicTools())
+        self.assertTrue(state['topic_clusters'])
+        self.assertEqual(sum(c['size'] for c in state['topic_clusters']), 30)
+        self.assertTrue(all(p['topic_cluster'] is not None for p in state['literature_results']))
+        state = cluster_results_node({"literature_results": papers[:5]}, AcademicTools())
+        self.assertIsNone(state['topic_clusters'])
+
+    def test_auto_k_merges_duplicate_clusters(self):
+        """测试自动选择聚类数时合并重复聚类，中文标签不含虚字碎片"""
+        topics = {
+            'graph': 'graph neural networks node classification message passing',
+            'language': 'language models transformer pretraining tokens',
+            'quantum': 'quantum circuits qubits error correction'
+        }
+        papers = []
+        for i in range(90):
+            name = list(topics)[i % 3]
+            words = topics[name].split()
+            papers.append({'title': f"{words[i % len(words)]} {words[(i + 1) % len(words)]} study {i}",
+                           'abstract': f"We propose a method for {topics[name]}. Results on benchmark {i}.",
+                           'topic': name})
+        result = cluster_papers(papers)
+        self.assertEqual(len(result['clusters']), 3)
+        self.assertEqual({frozenset(papers[i]['topic'] for i in c['indices']) for c in result['clusters']},
+                         {frozenset([name]) for name in topics})
+
+        zh = {'edu': '深度学习在教育中的应用与个性化推荐', 'med': '医学影像中的肿瘤分割方法研究',
+              'fin': '金融市场的风险预测与量化交易'}
+        papers = [{'title': zh[name] + str(i), 'abstract': zh[name] + '。本文提出了一种新的方法。', 'topic': name}
+                  for i, name in enumerate(list(zh) * 20)]
+        result = cluster_papers(papers)
+        self.assertEqual(len(result['clusters']), 3)
+        for cluster in result['clusters']:
+            self.assertEqual(len({papers[i]['topic'] for i in cluster['indices']}), 1)
+            for term in cluster['terms']:
+                self.assertFalse(set(term) & set('的在与'), term)
+
+
+class TestLLMScheduler(unittest.TestCase):
+    def _wait_queued(self, scheduler, priority, count):
+        import time
+        for _ in range(200):
+            if scheduler.stats()[priority]['queued'] == count:
+                return
+            time.sleep(0.01)
+        self.fail(f"{priority} 排队数未达到 {count}")
+
+    def test_priority_order_deadline_and_preemption(self):
+        """测试名额按优先级分配、排队超时和取消排队中的后台调用"""
+        import threading
+        import time
+        scheduler = LLMScheduler(1)
+        scheduler.acquire('normal')
+        order, errors = [], []
+
+        def call(priority, deadline=None, owner=None):
+            try:
+                with scheduler.slot(priority, deadline, owner):
+                    order.append(priority)
+            except Exception as e:
+                errors.append(type(e))
+
+        background = threading.Thread(target=call, args=('background',))
+        background.start()
+        self._wait_queued(scheduler, 'background', 1)
+        interactive = threading.Thread(target=call, args=('interactive',))
+        interactive.start()
+        self._wait_queued(scheduler, 'interactive', 1)
+        with self.assertRaises(SchedulerTimeout):
+            scheduler.acquire('interactive', time.monotonic() + 0.05)
+        scheduler.release('normal')
+        background.join(2)
+        interactive.join(2)
+        self.assertEqual(order, ['interactive', 'background'])
+
+        scheduler.acquire('normal')
+        queued = threading.Thread(target=call, args=('background',))
+        queued.start()
+        self._wait_queued(scheduler, 'background', 1)
+        self.assertEqual(scheduler.cancel_queued('background'), 1)
+        queued.join(2)
+        self.assertEqual(errors, [Preempted])
+
+        # 指定 owner 时只取消该对象自己排队中的调用
+        prefetcher, batch = object(), object()
+        threads = [threading.Thread(target=call, args=('background', None, owner)) for owner in (prefetcher, batch)]
+        for thread in threads:
+            thread.start()
+        self._wait_queued(scheduler, 'background', 2)
+        self.assertEqual(scheduler.cancel_queued('background', owner=prefetcher), 1)
+        threads[0].join(2)
+        self.assertEqual((errors, scheduler.stats()['background']['queued']), ([Preempted, Preempted], 1))
+        scheduler.release('normal')
+        threads[1].join(2)
+        self.assertEqual(order[-1], 'background')
+
+    def test_class_limit_keeps_capacity_for_interactive(self):
+        """测试后台调用受类别并发上限限制，交互调用仍可立即获得名额"""
+        import threading
+        scheduler = LLMScheduler(2, {'background': 1})
+        scheduler.acquire('background')
+        waiting = threading.Thread(target=scheduler.acquire, args=('background',))
+        waiting.start()
+        self._wait_queued(scheduler, 'background', 1)
+        scheduler.acquire('interactive')
+        self.assertEqual(scheduler.stats()['interactive']['running'], 1)
+        scheduler.release('interactive')
+        scheduler.release('background')
+        waiting.join(2)
+        self.assertEqual(scheduler.stats()['background']['running'], 1)
+
+        tools = AcademicTools()
+        tools.scheduler = LLMScheduler(2)
+        tools.client = type('FakeClient', (), {})()
+        tools.client.chat = type('FakeChat', (), {})()
+        tools.client.chat.completions = _FakeCompletions(completion_tokens=10)
+        with tools.priority('background'):
+            tools._chat(messages=[{"role": "user", "content": "hi"}])
+        tools._chat(task='intent', messages=[{"role": "user", "content": "hi"}])
+        stats = tools.scheduler.stats()
+        self.assertEqual((stats['background']['calls'], stats['interactive']['calls']), (1, 1))
+        self.assertEqual(stats['background']['running'], 0)
+
+
+class _SlowFirstCompletions(_FakeCompletions):
+    """第一次调用等待 delay 秒（模拟长尾延迟），之后的调用立即返回"""
+    def __init__(self, delay):
+        super().__init__(completion_tokens=10)
+        self.delay = delay
+
+    def create(self, **kwargs):
+        import time
+        first = not self.requests
+        response = super().create(**kwargs)
+        if first:
+            time.sleep(self.delay)
+        return response
+
+class TestHedgedCalls(unittest.TestCase):
+    def test_run_hedged_timeout_and_cancel(self):
+        """测试对冲请求先返回时被采用，以及截止时间和取消"""
+        import time
+        from concurrent.futures import ThreadPoolExecutor
+        pool = ThreadPoolExecutor(4)
+        calls = []
+
+        def call():
+            calls.append(len(calls))
+            if len(calls) == 1:
+                time.sleep(0.5)
+                return 'primary'
+            return 'hedge'
+
+        discarded = []
+        self.assertEqual(run_hedged(call, pool, timeout=5, hedge_after=0.05, on_discard=discarded.append),
+                         ('hedge', True))
+        self.assertEqual(run_hedged(lambda: 'fast', pool, timeout=5, hedge_after=1), ('fast', False))
+        with self.assertRaises(CallTimeout):
+            run_hedged(lambda: time.sleep(0.5), pool, timeout=0.1, on_discard=discarded.append)
+        # 落败的对冲请求和超时后仍在执行的请求都交给 on_discard，结束后可记录用量
+        self.assertEqual(len(discarded), 2)
+        self.assertEqual(discarded[0].result(), 'primary')
+        deadline = time.monotonic() + 0.1
+        with self.assertRaises(CallCancelled):
+            run_hedged(lambda: time.sleep(0.5), pool, timeout=5, cancelled=lambda: time.monotonic() > deadline,
+                       poll=0.02)
+        tracker = LatencyTracker(min_samples=3, min_delay=0.1)
+        for elapsed in (0.2, 0.3, 2.0):
+            self.assertIsNone(tracker.hedge_delay('summary'))
+            tracker.record('summary', elapsed)
+        self.assertEqual(tracker.hedge_delay('summary'), 2.0)
+
+    def test_chat_hedges_slow_call_and_can_be_cancelled(self):
+        """测试 _chat 在超过 p95 后发送对冲请求，以及 cancel_inflight 让进行中的调用立即返回"""
+        import threading
+        import time
+        tools = AcademicTools()
+        tools.scheduler = LLMScheduler(4)
+        tools.latency = LatencyTracker(min_samples=1, min_delay=0.05)
+        tools.latency.record('intent', 0.01)
+        tools.client = type('FakeClient', (), {})()
+        tools.client.chat = type('FakeChat', (), {})()
+        tools.client.chat.completions = _SlowFirstCompletions(delay=2)
+        tmp = tempfile.mkdtemp()
+        tools.ledger = TokenLedger(os.path.join(tmp, 'ledger.db'), session_budget=100000)
+        start = time.monotonic()
+        with tools.session('hedge'):
+            tools._chat(task='intent', messages=[{"role": "user", "content": "hi"}])
+        self.assertLess(time.monotonic() - start, 1.5)
+        self.assertEqual(len(tools.client.chat.completions.requests), 2)
+        self.assertEqual(tools.client.chat.completions.requests[0]['timeout'], tools.router.deadline('intent'))
+        # 落败的请求仍在后台执行：预留额度保留到它结束，结束后照常计费
+        self.assertEqual(tools.ledger.spent('hedge'), 110)
+        self.assertGreater(tools.ledger._reserved['hedge'], 0)
+        for _ in range(100):
+            if tools.ledger.spent('hedge') == 220:
+                break
+            time.sleep(0.05)
+        self.assertEqual((tools.ledger.spent('hedge'), tools.ledger._reserved['hedge']), (220, 0))
+        self.assertEqual(set(tools.ledger.report('hedge')[0]['by_task']), {'intent', 'intent/discarded'})
+
+        tools.hedging = False
+        tools.client.chat.completions = _SlowFirstCompletions(delay=2)
+        errors = []
+
+        def call():
+            try:
+                tools._chat(task='summary', messages=[{"role": "user", "content": "hi"}])
+            except CallCancelled as e:
+                errors.append(e)
+
+        worker = threading.Thread(target=call)
+        worker.start()
+        time.sleep(0.1)
+        self.assertEqual(tools.cancel_inflight(), 1)
+        worker.join(1)
+        self.assertFalse(worker.is_alive())
+        self.assertEqual(len(errors), 1)
+        self.assertEqual(tools.scheduler.stats()['normal']['running'], 0)
+class TestTokenLedger(unittest.TestCase):
+    def test_budget_degrades_then_refuses(self):
+        """测试预算接近用完时先缩短输出上限，用完后拒绝，并按会话导出报告"""
+        import csv
+        with tempfile.TemporaryDirectory() as tmp:
+            ledger = TokenLedger(os.path.join(tmp, 'ledger.db'), session_budget=1800, degrade_ratio=0.5)
+            self.assertEqual(ledger.admit('s1', 100, 1000), (1000, False, 1100))
+            ledger.record('s1', 'summary', 'qwen-plus', 'normal', 100, 900, reserved=1100)
+            max_tokens, degraded, reserved = ledger.admit('s1', 100, 1000)
+            self.assertTrue(degraded)
+            self.assertEqual(max_tokens, 500)
+            # 预留的额度计入已用，并发调用不会一起越过预算
+            with self.assertRaises(BudgetExceeded):
+                ledger.admit('s1', 100, 1000)
+            ledger.release('s1', reserved)
+            ledger.record('s1', 'polish', 'qwen-turbo', 'normal', 100, 300, degraded=True)
+            self.assertEqual(ledger.admit('s1', 100, 1000), (300, True, 400))
+            self.assertEqual(ledger.admit('s2', 100, 1000)[1], False)
+
+            # 新的账本实例从数据库续算会话用量
+            reopened = TokenLedger(ledger.db_path, session_budget=1800)
+            self.assertEqual(reopened.spent('s1'), 1400)
+            report = reopened.report('s1')[0]
+            self.assertEqual((report['calls'], report['degraded_calls']), (2, 1))
+            self.assertEqual(report['by_task']['summary']['completion_tokens'], 900)
+            path = os.path.join(tmp, 'usage.csv')
+            self.assertEqual(reopened.export(path), 1)
+            with open(path, encoding='utf-8') as f:
+                rows = list(csv.DictReader(f))
+            self.assertEqual({row['dimension'] for row in rows}, {'total', 'task', 'model'})
+
+    def test_chat_charges_session_and_uses_cheaper_model(self):
+        """测试 _chat 把用量记到当前会话，超过降级比例后改用低一档模型"""
+        tools = AcademicTools()
+        tools.client = type('FakeClient', (), {})()
+        tools.client.chat = type('FakeChat', (), {})()
+        tools.client.chat.completions = _FakeCompletions(completion_tokens=400)
+        tools.ledger.set_budget('ledger-test', 1100)
+        messages = [{"role": "user", "content": "hi"}]
+        with tools.session('ledger-test'):
+            tools._chat(task='summary', messages=messages, max_tokens=1000)
+            # 剩余 600 token 放不下完整调用：降级并缩短输出上限
+            tools._chat(task='summary', messages=messages, max_tokens=1000)
+            with self.assertRaises(BudgetExceeded):
+                tools._chat(task='summary', messages=messages, max_tokens=1000)
+        requests = tools.client.chat.completions.requests
+        self.assertEqual(len(requests), 2)
+        self.assertEqual(requests[0]['model'], tools.router.candidates('summary')[0])
+        self.assertEqual(requests[1]['model'], tools.router.candidates('summary', degraded=True)[0])
+        self.assertLess(requests[1]['max_tokens'], 600)
+        report = tools.usage_report('ledger-test')
+        self.assertEqual((report['calls'], report['total_tokens'], report['degraded_calls']), (2, 1000, 1))
+        self.assertEqual(tools.usage_report('unused-session')['calls'], 0)
+def _busy(seconds):
+    """占用 CPU 的测试函数"""
+    import time
+    end = time.thread_time() + seconds
+    total = 0
+    while time.thread_time() < end:
+        total += sum(range(1000))
+    return total
+
+class TestProfiling(unittest.TestCase):
+    def test_command_profile_separates_llm_wait(self):
+        """测试按命令输出折叠栈，模型调用等待与 CPU 时间分开标记；未开启时不写文件"""
+        import json
+        import threading
+        tools = AcademicTools()
+        tools.hedging = False
+        tools.client = type('FakeClient', (), {})()
+        tools.client.chat = type('FakeChat', (), {})()
+        tools.client.chat.completions = _SlowFirstCompletions(delay=0.3)
+        with tempfile.TemporaryDirectory() as tmp:
+            profiler = CommandProfiler(tmp, interval=0.002)
+            with profiler.command('search'):
+                tools._chat(task='intent', messages=[{"role": "user", "content": "hi"}])
+                _busy(0.2)
+            files = os.listdir(tmp)
+            self.assertEqual(len(files), 1)
+            self.assertTrue(files[0].endswith('-search.collapsed'))
+            with open(os.path.join(tmp, files[0]), encoding='utf-8') as f:
+                lines = f.read().splitlines()
+            weights = {}
+            for line in lines:
+                stack, weight = line.rsplit(' ', 1)
+                frames = stack.split(';')
+                self.assertTrue(frames[0].startswith('[thread '))
+                key = frames[-1] if frames[-1].startswith('[') else 'cpu'
+                weights[key] = weights.get(key, 0) + int(weight)
+                if '_busy' in stack:
+                    self.assertNotIn('[LLM', stack)
+            self.assertGreater(weights.get('[LLM wait]', 0), 150)
+            self.assertGreater(sum(int(line.rsplit(' ', 1)[1]) for line in lines if '_busy' in line), 100)
+
+            speedscope = CommandProfiler(tmp, fmt='speedscope', interval=0.002)
+            with speedscope.command('polish'):
+                _busy(0.05)
+            path = [name for name in os.listdir(tmp) if name.endswith('.speedscope.json')][0]
+            with open(os.path.join(tmp, path), encoding='utf-8') as f:
+                profile = json.load(f)['profiles'][0]
+            self.assertEqual(len(profile['samples']), len(profile['weights']))
+
+        # 调用方线程等待和工作线程中的请求是同一次调用，只计一次
+        tools.client.chat.completions = _SlowFirstCompletions(delay=0.3)
+        sampler = SamplingProfiler(0.002)
+        sampler.start()
+        tools._chat(task='intent', messages=[{"role": "user", "content": "hi"}])
+        sampler.stop()
+        summary = sampler.summary()
+        self.assertGreater(summary['llm_wait'], 0.2)
+        self.assertLessEqual(summary['llm_wait'], summary['wall'])
+
+        threads = threading.active_count()
+        with CommandProfiler(None).command('search'):
+            self.assertEqual(threading.active_count(), threads)
+class TestIngestionBenchmark(unittest.TestCase):
+    def test_suite_measures_and_detects_regressions(self):
+        """测试基准在子进程中测量 PDF / BibTeX 解析，并在吞吐量或内存超过阈值时报告回归"""
+        with tempfile.TemporaryDirectory() as tmp:
+            results = bench_ingestion.run_suite(pdf_pages=(3,), bib_entries=(50,), workdir=tmp, repeat=1,
+                                                trace=False)
+            traced = bench_ingestion.run_isolated('parse_bibtex', os.path.join(tmp, 'synthetic-50.bib'), trace=True)
+        self.assertEqual(set(results), {'parse_pdf/3', 'pdf_sections/3', 'parse_bibtex/50'})
+        self.assertEqual(results['parse_bibtex/50']['units'], 50)
+        self.assertEqual(results['parse_pdf/3']['units'], 3)
+        self.assertTrue(all(metrics['rate'] > 0 and metrics['peak_rss_mb'] > 0 for metrics in results.values()))
+        self.assertTrue(traced['top_allocations'])
+
+        self.assertEqual(bench_ingestion.compare(results, results), [])
+        faster = {name: {**metrics, 'rate': metrics['rate'] * 2} for name, metrics in results.items()}
+        self.assertEqual(len(bench_ingestion.compare(results, faster)), 3)
+        leaner = {'parse_pdf/3': {**results['parse_pdf/3'], 'rss_delta_mb': 0.0}}
+        bloated = {'parse_pdf/3': {**results['parse_pdf/3'], 'rss_delta_mb': 50.0}}
+        self.assertEqual(len(bench_ingestion.compare(bloated, leaner)), 1)
+        self.assertEqual(len(bench_ingestion.compare(results, {}, max_rss_mb=1)), 3)
+class TestWatchFolder(unittest.TestCase):
+    BIB = """@proceedings{conf, title = {Proceedings of Learning Analytics}, year = {2021}}
+@inproceedings{p1, title = {Dashboards for Teachers}, author = {Li, Hua}, crossref = {conf}, year = {2021}}
+"""
+
+    def test_incremental_sync(self):
+        """测试按清单增量导入新增、修改、删除的 PDF 和 BibTeX，未变化的文件不重新解析"""
+        from unittest import mock
+        with tempfile.TemporaryDirectory() as tmp:
+            folder = os.path.join(tmp, 'papers')
+            os.makedirs(os.path.join(folder, 'sub'))
+            _write_reference_pdf(os.path.join(folder, 'a.pdf'), [TestPDFReferences.IEEE] * 3)
+            _write_reference_pdf(os.path.join(folder, 'sub', 'b.pdf'), [TestPDFReferences.APA] * 2, numbered=False)
+            bib = os.path.join(folder, 'refs.bib')
+            with open(bib, 'w', encoding='utf-8') as f:
+                f.write(self.BIB)
+            with mock.patch.dict(os.environ, {'CITATION_GRAPH_PATH': os.path.join(tmp, 'graph.npz')}):
+                tools = AcademicTools()
+            index = LocalPaperIndex(os.path.join(tmp, 'index.db'))
+            ingestor = FolderIngestor(tools, IngestManifest(os.path.join(tmp, 'manifest.db')), index, settle=0)
+            graph = tools.citation_graph()
+
+            stats = ingestor.sync(folder)
+            self.assertEqual((stats['new'], stats['records'], stats['edges']), (3, 4, 3))
+            self.assertEqual(index.search('dashboards')[0]['title'], 'Dashboards for Teachers')
+
+            # 没有变化 / 只改了修改时间：不重新解析
+            with mock.patch.object(tools, 'parse_pdf') as parse_pdf:
+                stats = ingestor.sync(folder)
+                self.assertEqual(stats['unchanged'], 3)
+                os.utime(os.path.join(folder, 'a.pdf'), ns=(1, 1))
+                stats = ingestor.sync(folder)
+                self.assertEqual((stats['touched'], stats['unchanged']), (1, 2))
+                parse_pdf.assert_not_called()
+
+            # 修改 BibTeX：旧条目和旧引用边先被删除
+            with open(bib, 'a', encoding='utf-8') as f:
+                f.write("@inproceedings{p2, title = {Learning Analytics at Scale}, crossref = {conf}}\n")
+            stats = ingestor.sync(folder)
+            self.assertEqual((stats['changed'], stats['removed_records'], stats['records']), (1, 2, 3))
+            self.assertEqual((stats['removed_edges'], stats['edges'], graph.n_edges), (1, 2, 4))
+            self.assertEqual(len(index), 5)
+
+            # 删除文件：索引、引用图和清单同步删除
+            os.remove(os.path.join(folder, 'sub', 'b.pdf'))
+            os.remove(bib)
+            stats = ingestor.sync(folder)
+            self.assertEqual((stats['deleted'], stats['removed_records'], stats['removed_edges']), (2, 4, 3))
+            self.assertEqual((len(index), graph.n_edges, len(ingestor.manifest)), (1, 1, 1))
+            self.assertEqual(index.search('dashboards'), [])
+
+            # 刚写入（可能仍在复制）的文件留到下一轮
+            ingestor.settle = 60
+            with open(bib, 'w', encoding='utf-8') as f:
+                f.write(self.BIB)
+            stats = ingestor.sync(folder)
+            self.assertEqual((stats['pending'], stats['new']), (1, 0))
+            index.close()
+
+
 if __name__ == '__main__':
     unittest.main() 
\ No newline at end of file
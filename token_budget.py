@@ -0,0 +1,204 @@
+import os
+import re
+import threading
+from collections import deque
+from typing import List, Dict, Any, Optional
+
+# 各模型的上下文窗口（token），未列出的模型使用 DEFAULT_CONTEXT_WINDOW，可用 QWEN_CONTEXT_WINDOW 覆盖
+MODEL_CONTEXT_WINDOWS = {
+    'qwen3-235b-a22b': 131072,
+    'qwen-plus': 131072,
+    'qwen-turbo': 131072,
+    'qwen-max': 32768,
+    'qwen-long': 1000000
+}
+DEFAULT_CONTEXT_WINDOW = 32768
+
+# 各任务在没有足够观测数据时的默认输出上限；ratio 表示输出长度与输入成正比的任务（如润色、格式转换）
+TASK_COMPLETION_DEFAULTS = {
+    'intent': {'default': 200},
+    'friendly_summary': {'default': 200},
+    'summary': {'default': 1536},
+    'search': {'default': 4096},
+    'search_json': {'default': 1024, 'ratio': 1.3},
+    'polish': {'default': 512, 'ratio': 1.6},
+    'pdf_section': {'default': 1024},
+    'pdf_analysis': {'default': 2048}
+}
+# 各任务可变输入文本（论文全文等）的 token 上限，同时受上下文窗口约束。
+# 章节提取对同一段文本按每个关键词各调用一次，上限与原来的 5000 字符相当，只是改在句子边界截断
+TASK_INPUT_LIMITS = {
+    'pdf_section': 1600,
+    'pdf_analysis': 12000
+}
+
+# 每条消息的格式开销（角色标记等）
+_MESSAGE_OVERHEAD = 4
+_CJK = re.compile(r'[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff]')
+_WORD = re.compile(r'[A-Za-z]+')
+_DIGITS = re.compile(r'\d+')
+_OTHER = re.compile(r'[^\sA-Za-z\d\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff]')
+# 句子边界（零宽切分，保留原文所有字符）：中文句末标点之后、英文句末标点与空白之间、段落分隔之前
+_SENTENCE_BOUNDARY = re.compile(r'(?<=[。！？!?；])|(?<=[.;:])(?=\s)|(?=\n\s*\n)')
+_PARAGRAPH_START = re.compile(r'\n\s*\n')
+
+
+def estimate_tokens(text: str) -> int:
+    """本地估计文本的 token 数（按 Qwen/BPE 分词器的经验比例，偏保守）
+
+    CJK 字符每个计 1，英文单词每 5 个字母计 1，数字每 3 位计 1，标点符号每个计 1。
+    """
+    if not text:
+        return 0
+    cjk = len(_CJK.findall(text))
+    words = sum((len(w) + 4) // 5 for w in _WORD.findall(text))
+    digits = sum((len(d) + 2) // 3 for d in _DIGITS.findall(text))
+    return cjk + words + digits + len(_OTHER.findall(text))
+
+
+def estimate_message_tokens(messages: List[Dict[str, Any]]) -> int:
+    """估计 Chat 消息列表的 token 数"""
+    return sum(estimate_tokens(str(m.get('content') or '')) + _MESSAGE_OVERHEAD for m in messages)
+
+
+def trim_to_tokens(text: str, max_tokens: int) -> str:
+    """将文本裁剪到 max_tokens 以内，优先在段落边界、其次在句子边界截断
+
+    只有第一句就超出预算时才在句子内部截断。
+    """
+    if not text or estimate_tokens(text) <= max_tokens:
+        return text or ''
+    used = 0
+    end = 0
+    paragraph_end = 0
+    for piece in _SENTENCE_BOUNDARY.split(text):
+        cost = estimate_tokens(piece)
+        if used + cost > max_tokens:
+            if end == 0:
+                # 单句超长：按比例在句内截断
+                return piece[:max(int(len(piece) * max_tokens / max(cost, 1)), 0)].rstrip()
+            break
+        if _PARAGRAPH_START.match(piece):
+            paragraph_end = end
+        used += cost
+        end += len(piece)
+    # 段落边界保留了预算的大部分时优先在段落处截断
+    if paragraph_end and estimate_tokens(text[:paragraph_end]) >= 0.8 * max_tokens:
+        end = paragraph_end
+    return text[:end].rstrip()
+
+
+def split_to_tokens(text: str, max_tokens: int) -> List[str]:
+    """将文本按句子边界切成若干段，每段不超过 max_tokens（单句超长时单独成段），各段拼接后与原文完全一致"""
+    pieces, current, used = [], '', 0
+    for piece in _SENTENCE_BOUNDARY.split(text):
+        cost = estimate_tokens(piece)
+        if current and used + cost > max_tokens:
+            pieces.append(current)
+            current, used = '', 0
+        current += piece
+        used += cost
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def context_window(model: Optional[str]) -> int:
+    """返回模型的上下文窗口大小"""
+    override = os.getenv('QWEN_CONTEXT_WINDOW')
+    if override:
+        return int(override)
+    return MODEL_CONTEXT_WINDOWS.get(model or '', DEFAULT_CONTEXT_WINDOW)
+
+
+class TokenBudgetPlanner:
+    """按任务规划 prompt 长度和输出上限
+
+    - 输出上限：观测足够时取该任务历史输出长度的 P95 再留余量，出现截断（finish_reason == 'length'）时加倍；
+      观测不足时使用 TASK_COMPLETION_DEFAULTS
+    - 输入文本：按上下文窗口减去输出上限、固定部分和安全余量后的预算，在句子/段落边界裁剪
+    - 本地估计与 API 返回的 prompt_tokens 比较，持续校准估计系数
+
+    Args:
+        max_completion: 输出上限的最大值（QWEN_MAX_TOKENS）
+        history: 每个任务保留的观测条数
+        min_samples: 使用观测分布所需的最少样本数
+        safety_margin: 上下文中预留的 token 数
+    """
+
+    def __init__(self, max_completion: int = 16384, history: int = 200, min_samples: int = 20,
+                 safety_margin: int = 256):
+        self.max_completion = max_completion
+        self.min_samples = min_samples
+        self.safety_margin = safety_margin
+        self.scale = 1.0  # 实际 token 数 / 本地估计
+        self._history = history
+        self._outputs: Dict[str, deque] = {}
+        self._truncated: Dict[str, deque] = {}
+        self._lock = threading.Lock()
+
+    def count(self, text: str) -> int:
+        """经过校准的 token 数估计"""
+        return int(estimate_tokens(text) * self.scale) + 1
+
+    def count_messages(self, messages: List[Dict[str, Any]]) -> int:
+        return int(estimate_message_tokens(messages) * self.scale) + 1
+
+    def completion_limit(self, task: str, prompt_tokens: int = 0, model: Optional[str] = None) -> int:
+        """为任务选择输出上限（max_tokens）"""
+        config = TASK_COMPLETION_DEFAULTS.get(task, {'default': self.max_completion})
+        with self._lock:
+            outputs = list(self._outputs.get(task, ()))
+            truncated = list(self._truncated.get(task, ()))
+
+        if len(outputs) >= self.min_samples:
+            outputs.sort()
+            p95 = outputs[min(int(len(outputs) * 0.95), len(outputs) - 1)]
+            limit = int(p95 * 1.25) + 64
+        else:
+            limit = config['default']
+        if 'ratio' in config and prompt_tokens:
+            limit = max(limit, int(prompt_tokens * config['ratio']))
+        # 近期出现过截断：放宽上限
+        if truncated and any(truncated[-10:]):
+            limit *= 2
+
+        available = context_window(model) - prompt_tokens - self.safety_margin
+        return max(min(limit, self.max_completion, available), 16)
+
+    def input_budget(self, task: str, reserved_tokens: int = 0, model: Optional[str] = None) -> int:
+        """可变输入文本可用的 token 数：上下文窗口 - 输出上限 - 固定 prompt - 安全余量"""
+        completion = self.completion_limit(task, model=model)
+        budget = context_window(model) - completion - reserved_tokens - self.safety_margin
+        if task in TASK_INPUT_LIMITS:
+            budget = min(budget, TASK_INPUT_LIMITS[task])
+        return max(budget, 0)
+
+    def fit_text(self, task: str, text: str, reserved_text: str = '', model: Optional[str] = None) -> str:
+        """将 text 裁剪到任务输入预算内（reserved_text 为 prompt 中的固定部分）"""
+        budget = self.input_budget(task, self.count(reserved_text), model)
+        # trim_to_tokens 使用未校准的估计，这里换算回去
+        return trim_to_tokens(text, int(budget / self.scale))
+
+    def observe(self, task: str, completion_tokens: int, finish_reason: Optional[str] = None,
+                prompt_tokens: Optional[int] = None, estimated_prompt_tokens: Optional[int] = None):
+        """记录一次调用的实际输出长度，并用实际 prompt_tokens 校准本地估计（estimated_prompt_tokens 为未校准的估计）"""
+        with self._lock:
+            self._outputs.setdefault(task, deque(maxlen=self._history)).append(completion_tokens)
+            self._truncated.setdefault(task, deque(maxlen=self._history)).append(finish_reason == 'length')
+            if prompt_tokens and estimated_prompt_tokens:
+                ratio = prompt_tokens / estimated_prompt_tokens
+                # 指数滑动平均，限制在合理区间内
+                self.scale = min(max(0.9 * self.scale + 0.1 * ratio, 0.5), 2.0)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """各任务的观测统计，便于调试"""
+        with self._lock:
+            return {
+                task: {
+                    'samples': len(outputs),
+                    'max': max(outputs) if outputs else 0,
+                    'truncated': sum(self._truncated.get(task, ()))
+                }
+                for task, outputs in self._outputs.items()
+            }
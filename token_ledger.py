@@ -0,0 +1,287 @@
+import argparse
+import csv
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, List, Dict, Any, Optional, Tuple
+
+# 未指定会话时使用的会话编号（每个进程一个）
+PROCESS_SESSION = f"proc-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}"
+
+_session: ContextVar[Optional[str]] = ContextVar('llm_session', default=None)
+
+
+def default_ledger_path() -> Optional[str]:
+    """token 账本数据库路径，可通过 TOKEN_LEDGER_DB 环境变量配置，设为 off 时不写入数据库（预算仍在内存中生效）"""
+    path = os.getenv('TOKEN_LEDGER_DB')
+    if path and path.lower() == 'off':
+        return None
+    return path or os.path.join(os.path.expanduser('~'), '.cache', 'acagent', 'token_ledger.db')
+
+
+class BudgetExceeded(RuntimeError):
+    """会话的 token 预算已用完，连降级后的最短调用也放不下"""
+
+
+@contextmanager
+def session_scope(session: str):
+    """在当前上下文（线程或 LangGraph 节点）内把模型调用的 token 用量记到指定会话"""
+    token = _session.set(str(session))
+    try:
+        yield
+    finally:
+        _session.reset(token)
+
+
+def set_session(session: str):
+    """设置当前上下文之后所有模型调用所属的会话"""
+    _session.set(str(session))
+
+
+def current_session() -> str:
+    """当前上下文的会话编号，未指定时为本进程的默认会话"""
+    return _session.get() or PROCESS_SESSION
+
+
+def bind_session(fn: Callable) -> Callable:
+    """包装 fn，使其在线程池中执行时模型调用仍记到当前会话（线程池中的任务不继承 contextvars）"""
+    session = current_session()
+
+    def run(*args, **kwargs):
+        with session_scope(session):
+            return fn(*args, **kwargs)
+    return run
+
+
+class TokenLedger:
+    """按会话记录每次模型调用的 prompt / completion token（及任务、模型、优先级），并执行会话预算
+
+    - 调用前按 prompt 估计和输出上限预留额度（admit），调用结束后按 API 返回的 usage 结算（record），
+      并发调用不会一起越过预算
+    - 已用 + 预留达到预算的 degrade_ratio 后，调用改用低一档的模型并把输出上限减半；
+      剩余额度不足整个调用时进一步缩短输出上限；连 min_completion 的输出都放不下时抛出 BudgetExceeded
+    - 会话累计用量保存在内存中，首次用到某会话时从数据库读取（批处理会话跨进程续算）
+
+    Args:
+        db_path: 数据库路径，为 None 时只在内存中统计
+        session_budget: 每个会话的 token 预算，0 表示不限
+        degrade_ratio: 开始降级的预算比例
+        min_completion: 降级时输出上限的下限
+    """
+
+    def __init__(self, db_path: Optional[str] = None, session_budget: int = 0, degrade_ratio: float = 0.8,
+                 min_completion: int = 256):
+        self.db_path = db_path
+        self.session_budget = session_budget
+        self.degrade_ratio = degrade_ratio
+        self.min_completion = min_completion
+        self._spent: Dict[str, int] = {}
+        self._reserved: Dict[str, int] = {}
+        self._budgets: Dict[str, int] = {}
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _db(self) -> Optional[sqlite3.Connection]:
+        """打开数据库（调用方持有锁）"""
+        if self._conn is None and self.db_path:
+            directory = os.path.dirname(self.db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode = WAL")
+            self._conn.executescript("""
+                CREATE TABLE IF NOT EXISTS calls (
+                    id INTEGER PRIMARY KEY,
+                    session TEXT,
+                    task TEXT,
+                    model TEXT,
+                    priority TEXT,
+                    prompt_tokens INTEGER,
+                    completion_tokens INTEGER,
+                    total_tokens INTEGER,
+                    degraded INTEGER,
+                    created REAL
+                );
+                CREATE INDEX IF NOT EXISTS idx_calls_session ON calls(session, created);
+            """)
+            self._conn.commit()
+        return self._conn
+
+    def _session_spent(self, session: str) -> int:
+        """会话累计用量（调用方持有锁）"""
+        if session not in self._spent:
+            conn = self._db()
+            row = conn.execute("SELECT COALESCE(SUM(total_tokens), 0) FROM calls WHERE session = ?",
+                               (session,)).fetchone() if conn else (0,)
+            self._spent[session] = int(row[0])
+        return self._spent[session]
+
+    def set_budget(self, session: str, budget: int):
+        """为单个会话设置预算（覆盖 session_budget，0 表示不限）"""
+        with self._lock:
+            self._budgets[session] = budget
+
+    def budget(self, session: str) -> int:
+        return self._budgets.get(session, self.session_budget)
+
+    def admit(self, session: str, prompt_tokens: int, max_tokens: int) -> Tuple[int, bool, int]:
+        """调用前检查预算并预留额度
+
+        Returns:
+            (本次调用的输出上限, 是否降级, 预留的 token 数)；预算用完时抛出 BudgetExceeded
+        """
+        with self._lock:
+            budget = self.budget(session)
+            if budget <= 0:
+                return max_tokens, False, 0
+            used = self._session_spent(session) + self._reserved.get(session, 0)
+            remaining = budget - used
+            if remaining < prompt_tokens + self.min_completion:
+                raise BudgetExceeded(f"会话 {session} 的 token 预算已用完（已用 {used} / {budget}）")
+            degraded = used >= budget * self.degrade_ratio
+            if degraded:
+                max_tokens = max(self.min_completion, max_tokens // 2)
+            if prompt_tokens + max_tokens > remaining:
+                degraded = True
+                max_tokens = remaining - prompt_tokens
+            reserved = prompt_tokens + max_tokens
+            self._reserved[session] = self._reserved.get(session, 0) + reserved
+        if degraded:
+            print(f"[DEBUG] 会话 {session} 已用 {used}/{budget} token，本次调用降级（max_tokens={max_tokens}）")
+        return max_tokens, degraded, reserved
+
+    def release(self, session: str, reserved: int):
+        """调用失败时归还预留的额度"""
+        if not reserved:
+            return
+        with self._lock:
+            self._reserved[session] = max(0, self._reserved.get(session, 0) - reserved)
+
+    def record(self, session: str, task: Optional[str], model: Optional[str], priority: Optional[str],
+               prompt_tokens: int, completion_tokens: int, reserved: int = 0, degraded: bool = False) -> int:
+        """结算一次调用：归还预留额度、累加会话用量并写入数据库，返回本次的 token 总数"""
+        total = prompt_tokens + completion_tokens
+        with self._lock:
+            if reserved:
+                self._reserved[session] = max(0, self._reserved.get(session, 0) - reserved)
+            self._spent[session] = self._session_spent(session) + total
+            conn = self._db()
+            if conn:
+                conn.execute(
+                    "INSERT INTO calls (session, task, model, priority, prompt_tokens, completion_tokens, "
+                    "total_tokens, degraded, created) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (session, task or '', model or '', priority or '', prompt_tokens, completion_tokens, total,
+                     int(degraded), time.time()))
+                conn.commit()
+        return total
+
+    def spent(self, session: str) -> int:
+        """会话已结算的 token 数"""
+        with self._lock:
+            return self._session_spent(session)
+
+    def report(self, session: Optional[str] = None, since: Optional[float] = None) -> List[Dict[str, Any]]:
+        """按会话汇总用量（含按任务和模型的明细）；session 为 None 时汇总所有会话，since 为起始时间戳"""
+        with self._lock:
+            conn = self._db()
+            if conn is None:
+                return [{'session': s, 'total_tokens': spent, 'budget': self.budget(s)}
+                        for s, spent in self._spent.items() if session is None or s == session]
+            clauses, params = [], []
+            if session is not None:
+                clauses.append("session = ?")
+                params.append(session)
+            if since is not None:
+                clauses.append("created >= ?")
+                params.append(since)
+            where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+            rows = conn.execute(
+                f"SELECT session, task, model, COUNT(*), SUM(prompt_tokens), SUM(completion_tokens), "
+                f"SUM(total_tokens), SUM(degraded), MIN(created), MAX(created) FROM calls {where} "
+                f"GROUP BY session, task, model ORDER BY MIN(created)", params).fetchall()
+        sessions: Dict[str, Dict[str, Any]] = {}
+        for name, task, model, calls, prompt, completion, total, degraded, first, last in rows:
+            entry = sessions.setdefault(name, {
+                'session': name, 'calls': 0, 'prompt_tokens': 0, 'completion_tokens': 0, 'total_tokens': 0,
+                'degraded_calls': 0, 'budget': self.budget(name), 'first_call': first, 'last_call': last,
+                'by_task': {}, 'by_model': {}
+            })
+            entry['calls'] += calls
+            entry['prompt_tokens'] += prompt
+            entry['completion_tokens'] += completion
+            entry['total_tokens'] += total
+            entry['degraded_calls'] += degraded
+            entry['first_call'] = min(entry['first_call'], first)
+            entry['last_call'] = max(entry['last_call'], last)
+            for field, key in (('by_task', task or 'chat'), ('by_model', model or 'unknown')):
+                bucket = entry[field].setdefault(key, {'calls': 0, 'prompt_tokens': 0, 'completion_tokens': 0})
+                bucket['calls'] += calls
+                bucket['prompt_tokens'] += prompt
+                bucket['completion_tokens'] += completion
+        return list(sessions.values())
+
+    def export(self, path: str, session: Optional[str] = None, since: Optional[float] = None) -> int:
+        """把会话报告导出为 JSON（.json）或 CSV（其他扩展名，每个 会话/任务/模型 一行），返回会话数"""
+        report = self.report(session, since)
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if path.lower().endswith('.json'):
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+            return len(report)
+        with open(path, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['session', 'dimension', 'name', 'calls', 'prompt_tokens', 'completion_tokens'])
+            for entry in report:
+                writer.writerow([entry['session'], 'total', '', entry.get('calls', 0),
+                                 entry.get('prompt_tokens', 0), entry.get('completion_tokens', 0)])
+                for field in ('by_task', 'by_model'):
+                    for name, bucket in entry.get(field, {}).items():
+                        writer.writerow([entry['session'], field[3:], name, bucket['calls'],
+                                         bucket['prompt_tokens'], bucket['completion_tokens']])
+        return len(report)
+
+
+_shared: Optional[TokenLedger] = None
+_shared_lock = threading.Lock()
+
+
+def shared_ledger() -> TokenLedger:
+    """进程内共享的 token 账本（同一进程中的所有 AcademicTools 共用会话预算）
+
+    每个会话的预算由 TOKEN_BUDGET_SESSION 配置（默认 0，不限），开始降级的比例由 TOKEN_BUDGET_DEGRADE_RATIO 配置（默认 0.8）。
+    """
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = TokenLedger(default_ledger_path(), int(os.getenv('TOKEN_BUDGET_SESSION', '0')),
+                                  float(os.getenv('TOKEN_BUDGET_DEGRADE_RATIO', '0.8')))
+        return _shared
+
+
+def main():
+    parser = argparse.ArgumentParser(description="导出模型调用的 token 用量报告")
+    parser.add_argument("--db", default=default_ledger_path(), help="token 账本数据库路径")
+    parser.add_argument("--session", default=None, help="只导出该会话")
+    parser.add_argument("--days", type=float, default=None, help="只统计最近若干天")
+    parser.add_argument("--output", default='-', help="输出文件（.json 或 .csv），默认打印 JSON 到标准输出")
+    args = parser.parse_args()
+
+    if not args.db or not os.path.exists(args.db):
+        parser.error(f"找不到 token 账本数据库: {args.db}")
+    ledger = TokenLedger(args.db)
+    since = time.time() - args.days * 86400 if args.days else None
+    if args.output == '-':
+        print(json.dumps(ledger.report(args.session, since), ensure_ascii=False, indent=2))
+    else:
+        count = ledger.export(args.output, args.session, since)
+        print(f"已导出 {count} 个会话的用量报告到 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
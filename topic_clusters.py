@@ -0,0 +1,289 @@
+import re
+import zlib
+from typing import List, Dict, Any, Optional, Tuple
+import numpy as np
+import pandas as pd
+
+# 分词前把标点、符号替换为空格（str.translate 比逐词正则匹配快一个数量级），文档之间用 \x01 分隔
+_PUNCTUATION = str.maketrans({c: ' ' for c in [chr(i) for i in range(128) if not (chr(i).isalnum() or chr(i) in '-\x01')]
+                              + list('，。；：（）《》“”‘’、！？【】—…·')})
+# 有效词：英文词（可带连字符，至少两个字符）或中文二元组
+_VALID_TOKEN = re.compile(r'^(?:[a-z][a-z0-9]*(?:-[a-z0-9]+)*|[一-鿿]{2})$')
+_CJK_RUN = re.compile(r'[一-鿿]+')
+_CJK = re.compile(r'[一-鿿]')
+# 含这些虚字的中文二元组（"习在"、"中的"、"的应" 等）是跨词的碎片，不参与聚类和标签
+_CJK_FUNCTION = re.compile(r'[的了在是和与及或对为以于将被把从而等其之这那个们也都并]')
+# 常见英文虚词和论文套话，不参与聚类和标签
+STOPWORDS = frozenset('''
+a an and are as at be been but by can could do does for from has have how if in into is it its may more most
+of on or our such than that the their then there these they this those through to using via was we were what
+when where which while who will with within without not no also both each other over under between based new
+paper propose proposed present presents show shows study approach method methods results result use used
+however further well two one first can thus here et al
+'''.split())
+
+
+def _cjk_bigrams(match) -> str:
+    run = match.group(0)
+    return ' ' + ' '.join(run[i:i + 2] for i in range(max(1, len(run) - 1))) + ' '
+
+
+def _tokenize(texts: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """分词：返回 (文档编号, 词) 两个等长数组；连续汉字切为重叠的二元组"""
+    joined = ' \x01 '.join(t.replace('\x01', ' ') for t in texts).lower().translate(_PUNCTUATION)
+    if not joined.isascii() and _CJK.search(joined):
+        joined = _CJK_RUN.sub(_cjk_bigrams, joined)
+    tokens = np.array(joined.split(), dtype=object)
+    separators = tokens == '\x01'
+    doc_ids = np.cumsum(separators)
+    keep = ~separators
+    return doc_ids[keep], tokens[keep]
+
+
+def hashed_tfidf(texts: List[str], n_features: int = 2 ** 18) -> Dict[str, Any]:
+    """把文本转换为 L2 归一化的哈希 TF-IDF 稀疏矩阵（CSR 三元组），维度固定为 n_features
+
+    返回 {'indptr', 'indices', 'data', 'terms'}，terms[桶号] 为落入该桶的最高频词（用于生成聚类标签）。
+    """
+    n = len(texts)
+    doc_ids, tokens = _tokenize(texts)
+    codes, uniques = pd.factorize(tokens)
+    uniques = np.asarray(uniques, dtype=object)
+    # 只对不重复的词计算哈希，再按编码映射到所有词
+    buckets = np.fromiter((zlib.crc32(u.encode('utf-8')) % n_features for u in uniques), dtype=np.int64,
+                          count=len(uniques))
+    # 停用词、数字、单个字母等在不重复的词上一次性过滤
+    stop = np.fromiter((u in STOPWORDS or len(u) < 2 or not _VALID_TOKEN.match(u) or bool(_CJK_FUNCTION.search(u))
+                        for u in uniques), dtype=bool, count=len(uniques))
+    keep = ~stop[codes]
+    doc_ids, codes = doc_ids[keep], codes[keep]
+
+    keys, counts = np.unique(doc_ids.astype(np.int64) * n_features + buckets[codes], return_counts=True)
+    rows, cols = keys // n_features, keys % n_features
+    df = np.bincount(cols, minlength=n_features)
+    idf = np.log((1.0 + n) / (1.0 + df)) + 1.0
+    data = ((1.0 + np.log(counts)) * idf[cols]).astype(np.float32)
+    norms = np.sqrt(np.bincount(rows, weights=data.astype(np.float64) ** 2, minlength=n))
+    data /= np.maximum(norms[rows], 1e-12).astype(np.float32)
+    indptr = np.concatenate([[0], np.cumsum(np.bincount(rows, minlength=n))])
+
+    # 每个桶的标签词：落入该桶的词中出现次数最多的一个
+    frequency = np.bincount(codes, minlength=len(uniques))
+    order = np.argsort(frequency, kind='stable')
+    order = order[~stop[order]]
+    terms = np.empty(n_features, dtype=object)
+    terms[buckets[order]] = uniques[order]
+    return {'indptr': indptr, 'indices': cols, 'data': data, 'terms': terms}
+
+
+def _take_rows(matrix: Dict[str, Any], rows: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """取出若干行的非零元素：(行在 rows 中的位置, 列号, 值)"""
+    starts = matrix['indptr'][rows]
+    lengths = matrix['indptr'][rows + 1] - starts
+    offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+    return np.repeat(np.arange(len(rows)), lengths), matrix['indices'][offsets], matrix['data'][offsets]
+
+
+def _similarity(row_ids: np.ndarray, cols: np.ndarray, values: np.ndarray, n_rows: int,
+                centers: np.ndarray) -> np.ndarray:
+    """稀疏行与聚类中心（n_features × k）的内积，按行分段求和"""
+    scores = np.zeros((n_rows, centers.shape[1]), dtype=np.float32)
+    if len(cols):
+        starts = np.flatnonzero(np.r_[True, row_ids[1:] != row_ids[:-1]])
+        scores[row_ids[starts]] = np.add.reduceat(centers[cols] * values[:, None], starts, axis=0)
+    return scores
+
+
+def _compact(matrix: Dict[str, Any]) -> Dict[str, Any]:
+    """只保留至少出现在两篇文档中的哈希桶，并把列号压缩为连续编号（聚类中心的维度随之缩小）"""
+    df = np.bincount(matrix['indices'], minlength=len(matrix['terms']))
+    used = np.flatnonzero(df >= 2)
+    if not len(used):
+        used = np.flatnonzero(df)
+    column = np.full(len(df), -1, dtype=np.int64)
+    column[used] = np.arange(len(used))
+    keep = column[matrix['indices']] >= 0
+    rows = np.repeat(np.arange(len(matrix['indptr']) - 1), np.diff(matrix['indptr']))[keep]
+    indptr = np.concatenate([[0], np.cumsum(np.bincount(rows, minlength=len(matrix['indptr']) - 1))])
+    return {'indptr': indptr, 'indices': column[matrix['indices'][keep]], 'data': matrix['data'][keep],
+            'terms': matrix['terms'][used], 'dim': len(used)}
+
+
+def _dense_rows(row_ids: np.ndarray, cols: np.ndarray, values: np.ndarray, positions, dim: int,
+                width: Optional[int] = None) -> np.ndarray:
+    """把若干稀疏行展开为 维度 × 行数 的稠密矩阵（width 大于行数时右侧补零）"""
+    dense = np.zeros((dim, width or len(positions)), dtype=np.float32)
+    for t, position in enumerate(positions):
+        mask = row_ids == position
+        dense[cols[mask], t] = values[mask]
+    return dense
+
+
+class TopicClusterer:
+    """哈希 TF-IDF + 小批量球面 k-means 的文献主题聚类（纯 NumPy 向量化，不调用模型）
+
+    - 标题和摘要经哈希 TF-IDF 映射到固定维度，无需维护词表
+    - 只出现在一篇文档中的哈希桶不参与聚类，中心矩阵的维度为实际用到的桶数
+    - k-means++ 在样本上初始化，之后每轮随机取 batch_size 篇更新聚类中心（按中心的累计样本数递减学习率）
+    - 每个聚类以中心权重最高的词作为标签
+    - 自动选择聚类数时，按文献数估计的 k 可能多于实际主题数，中心相似或标签词相同的聚类会被合并
+
+    Args:
+        n_clusters: 聚类数，为 None 时按文献数自动选择（最多 max_clusters 个）
+        max_clusters: 自动选择时的上限
+        batch_size: 小批量大小
+        max_iter: 最多更新轮数
+        n_features: 哈希维度
+        n_terms: 每个聚类的标签词数
+        reassignment_ratio: 累计样本数低于最大聚类的该比例时，重新放置该中心
+        merge_threshold: 自动选择聚类数时，中心余弦相似度不低于该值的聚类合并
+        seed: 随机种子
+    """
+
+    def __init__(self, n_clusters: Optional[int] = None, max_clusters: int = 12, batch_size: int = 1024,
+                 max_iter: int = 200, n_features: int = 2 ** 18, n_terms: int = 5, reassignment_ratio: float = 0.01,
+                 merge_threshold: float = 0.6, seed: int = 42):
+        self.n_clusters = n_clusters
+        self.max_clusters = max_clusters
+        self.batch_size = batch_size
+        self.max_iter = max_iter
+        self.n_features = n_features
+        self.n_terms = n_terms
+        self.reassignment_ratio = reassignment_ratio
+        self.merge_threshold = merge_threshold
+        self.seed = seed
+
+    def _choose_k(self, n: int) -> int:
+        if self.n_clusters:
+            return max(1, min(self.n_clusters, n))
+        return int(min(self.max_clusters, n, max(2, round(np.sqrt(n / 2)))))
+
+    @staticmethod
+    def _top_terms(center: np.ndarray, terms: np.ndarray, n_terms: int) -> List[str]:
+        """中心权重最高的 n_terms 个词"""
+        top = np.argpartition(-center, n_terms - 1)[:n_terms]
+        top = top[np.argsort(-center[top])]
+        return [terms[b] for b in top if center[b] > 0 and terms[b]]
+
+    def _merge_similar(self, centers: np.ndarray, assigned: np.ndarray, terms: np.ndarray,
+                       n_terms: int) -> Tuple[np.ndarray, np.ndarray]:
+        """合并重复的聚类（中心余弦相似度不低于 merge_threshold，或标签词相同），返回 (合并后的中心, 新的聚类编号)；
+        合并后的中心为按规模加权的平均，被合并的中心列清零"""
+        k = centers.shape[1]
+        sizes = np.bincount(assigned, minlength=k).astype(np.float32)
+        similarity = centers.T @ centers
+        labels = [frozenset(self._top_terms(centers[:, j], terms, n_terms)) for j in range(k)]
+        parent = list(range(k))
+
+        def find(j):
+            while parent[j] != j:
+                parent[j] = parent[parent[j]]
+                j = parent[j]
+            return j
+
+        for a in range(k):
+            for b in range(a + 1, k):
+                if sizes[a] and sizes[b] and (similarity[a, b] >= self.merge_threshold
+                                              or (labels[a] and labels[a] == labels[b])):
+                    parent[find(b)] = find(a)
+        roots = np.array([find(j) for j in range(k)])
+        if (roots == np.arange(k)).all():
+            return centers, assigned
+        merged = np.zeros_like(centers)
+        for j in range(k):
+            merged[:, roots[j]] += centers[:, j] * sizes[j]
+        merged /= np.maximum(np.linalg.norm(merged, axis=0), 1e-12)
+        print(f"[DEBUG] 主题聚类: 合并重复聚类 {k} -> {len(set(roots[sizes > 0].tolist()))}")
+        return merged, roots[assigned]
+
+    def _init_centers(self, matrix: Dict[str, Any], rows: np.ndarray, k: int, rng) -> np.ndarray:
+        """在样本上做贪心 k-means++ 初始化（每步比较若干候选，取使总距离最小者），返回 维度 × k 的中心矩阵"""
+        sample = rng.choice(rows, size=min(len(rows), max(2000, 20 * k)), replace=False)
+        row_ids, cols, values = _take_rows(matrix, sample)
+        dim = matrix['dim']
+        trials = 2 + int(np.log(k))
+        centers = _dense_rows(row_ids, cols, values, [rng.integers(len(sample))], dim, k)
+        distance = np.maximum(2.0 - 2.0 * _similarity(row_ids, cols, values, len(sample), centers[:, :1])[:, 0], 0.0)
+        for j in range(1, k):
+            total = distance.sum()
+            chosen = rng.choice(len(sample), size=trials, p=distance / total) if total > 0 \
+                else rng.integers(len(sample), size=1)
+            candidates = _dense_rows(row_ids, cols, values, chosen, dim)
+            similarity = _similarity(row_ids, cols, values, len(sample), candidates)
+            candidate_distance = np.minimum(distance[:, None], np.maximum(2.0 - 2.0 * similarity, 0.0))
+            best = candidate_distance.sum(axis=0).argmin()
+            centers[:, j] = candidates[:, best]
+            distance = candidate_distance[:, best]
+        return centers
+
+    def fit_predict(self, texts: List[str]) -> Dict[str, Any]:
+        """聚类文本，返回 {'labels': 每篇的聚类编号（无有效词时为 -1）, 'clusters': [{id, terms, size, indices}]}
+
+        聚类编号按规模从大到小排列。
+        """
+        n = len(texts)
+        matrix = _compact(hashed_tfidf(texts, self.n_features))
+        labels = np.full(n, -1, dtype=np.int64)
+        rows = np.flatnonzero(np.diff(matrix['indptr']) > 0)
+        if not len(rows):
+            return {'labels': labels, 'clusters': []}
+        k = self._choose_k(len(rows))
+        rng = np.random.default_rng(self.seed)
+        centers = self._init_centers(matrix, rows, k, rng)
+        dim = matrix['dim']
+        counts = np.zeros(k)
+
+        batch_size = min(self.batch_size, len(rows))
+        n_batches = min(self.max_iter, max(20, 3 * -(-len(rows) // batch_size)))
+        for step in range(n_batches):
+            batch = rng.choice(rows, size=batch_size, replace=False)
+            row_ids, cols, values = _take_rows(matrix, batch)
+            scores = _similarity(row_ids, cols, values, batch_size, centers)
+            assigned = scores.argmax(axis=1)
+            sizes = np.bincount(assigned, minlength=k)
+            counts += sizes
+            sums = np.bincount(cols * k + assigned[row_ids], weights=values, minlength=dim * k).reshape(dim, k)
+            rate = np.divide(sizes, counts, out=np.zeros(k), where=sizes > 0)
+            centers *= (1.0 - rate).astype(np.float32)
+            centers += (sums / np.maximum(counts, 1.0)).astype(np.float32)
+            centers /= np.maximum(np.linalg.norm(centers, axis=0), 1e-12)
+            # 前半程定期把几乎没有样本的中心移到当前批次中离所属中心最远的文献上，避免多个中心挤在同一主题
+            if step % 10 == 9 and step < n_batches // 2:
+                starved = np.flatnonzero(counts < self.reassignment_ratio * counts.max())
+                if len(starved):
+                    farthest = np.argsort(scores.max(axis=1))[:len(starved)]
+                    centers[:, starved] = _dense_rows(row_ids, cols, values, farthest, dim)
+                    counts[starved] = counts[np.setdiff1d(np.arange(k), starved)].min()
+
+        for start in range(0, len(rows), 4096):
+            chunk = rows[start:start + 4096]
+            row_ids, cols, values = _take_rows(matrix, chunk)
+            labels[chunk] = _similarity(row_ids, cols, values, len(chunk), centers).argmax(axis=1)
+
+        n_terms = min(self.n_terms, dim)
+        if self.n_clusters is None and k > 1:
+            centers, labels[rows] = self._merge_similar(centers, labels[rows], matrix['terms'], n_terms)
+
+        # 按规模重新编号，去掉空聚类
+        sizes = np.bincount(labels[rows], minlength=k)
+        order = [j for j in np.argsort(-sizes, kind='stable') if sizes[j] > 0]
+        remap = np.full(k, -1, dtype=np.int64)
+        remap[order] = np.arange(len(order))
+        labels[rows] = remap[labels[rows]]
+        clusters = []
+        for new_id, j in enumerate(order):
+            terms = self._top_terms(centers[:, j], matrix['terms'], n_terms)
+            clusters.append({'id': new_id, 'terms': terms, 'size': int(sizes[j]),
+                             'indices': np.flatnonzero(labels == new_id).tolist()})
+        return {'labels': labels, 'clusters': clusters}
+
+
+def paper_text(paper: Dict[str, Any]) -> str:
+    """用于聚类的文本：标题（重复一次以提高权重）+ 摘要"""
+    title = str(paper.get('title') or '')
+    return f"{title} {title} {paper.get('abstract') or paper.get('friendly_summary') or ''}"
+
+
+def cluster_papers(papers: List[Dict[str, Any]], n_clusters: Optional[int] = None, **kwargs) -> Dict[str, Any]:
+    """按标题和摘要聚类文献，返回 {'labels', 'clusters'}（参数同 TopicClusterer）"""
+    return TopicClusterer(n_clusters=n_clusters, **kwargs).fit_predict([paper_text(p) for p in papers])
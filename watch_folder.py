@@ -0,0 +1,365 @@
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import List, Dict, Any, Optional, Tuple
+
+from citation_graph import paper_key
+from local_index import LocalPaperIndex, paper_to_row
+from pdf_references import extract_references_many
+
+# 监视的文件类型
+EXTENSIONS = ('.pdf', '.bib')
+# 每批导入的文件数（每批结束后写入清单，中断后从下一批继续）
+INGEST_BATCH = 64
+# 从 PDF 前几页提取标题和摘要
+PDF_HEAD_PAGES = 2
+PDF_ABSTRACT_CHARS = 2000
+
+
+def default_manifest_path() -> str:
+    """导入清单数据库路径，可通过 INGEST_MANIFEST_DB 环境变量配置"""
+    return os.getenv('INGEST_MANIFEST_DB') or os.path.join(os.path.expanduser('~'), '.cache', 'acagent',
+                                                          'ingest_manifest.db')
+
+
+def file_digest(path: str, chunk_size: int = 1 << 20) -> str:
+    """文件内容的 SHA-256"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def scan_folder(root: str) -> Dict[str, Tuple[int, int]]:
+    """递归列出文件夹中的 PDF / BibTeX 文件，返回 {绝对路径: (大小, 修改时间 ns)}；跳过隐藏文件和 Office 临时文件"""
+    files = {}
+    stack = [os.path.abspath(root)]
+    while stack:
+        directory = stack.pop()
+        try:
+            entries = list(os.scandir(directory))
+        except OSError as e:
+            print(f"[DEBUG] 无法读取目录 {directory}: {str(e)}")
+            continue
+        for entry in entries:
+            if entry.name.startswith(('.', '~$')):
+                continue
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.name.lower().endswith(EXTENSIONS) and entry.is_file():
+                    stat = entry.stat()
+                    files[entry.path] = (stat.st_size, stat.st_mtime_ns)
+            except OSError:
+                # 扫描期间被删除的文件
+                continue
+    return files
+
+
+class IngestManifest:
+    """已导入文件的清单：路径、大小、修改时间、内容哈希，以及该文件在引用图中对应的文档键
+
+    Args:
+        db_path: 清单数据库路径，不存在时自动创建
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode = WAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY,
+                size INTEGER,
+                mtime_ns INTEGER,
+                sha256 TEXT,
+                kind TEXT,
+                records INTEGER,
+                graph_keys TEXT,
+                ingested REAL
+            );
+        """)
+        self.conn.commit()
+        self._lock = threading.Lock()
+
+    def entries(self, root: str) -> Dict[str, Dict[str, Any]]:
+        """root 目录下已导入的文件 {路径: 清单记录}"""
+        prefix = os.path.join(os.path.abspath(root), '')
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT path, size, mtime_ns, sha256, kind, records, graph_keys FROM files "
+                "WHERE path >= ? AND path < ?", (prefix, prefix + '\uffff')).fetchall()
+        return {row[0]: {'size': row[1], 'mtime_ns': row[2], 'sha256': row[3], 'kind': row[4],
+                         'records': row[5], 'graph_keys': json.loads(row[6] or '[]')} for row in rows}
+
+    def update(self, records: List[tuple]):
+        """写入 (路径, 大小, 修改时间 ns, 哈希, 类型, 记录数, 引用图文档键) 记录"""
+        with self._lock:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO files (path, size, mtime_ns, sha256, kind, records, graph_keys, ingested) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [record[:6] + (json.dumps(record[6]), time.time()) for record in records])
+            self.conn.commit()
+
+    def touch(self, changes: List[tuple]):
+        """只更新 (路径, 大小, 修改时间 ns)：内容未变的文件（如被 touch 或重新复制）"""
+        with self._lock:
+            self.conn.executemany("UPDATE files SET size = ?, mtime_ns = ? WHERE path = ?",
+                                  [(size, mtime_ns, path) for path, size, mtime_ns in changes])
+            self.conn.commit()
+
+    def remove(self, paths: List[str]):
+        with self._lock:
+            self.conn.executemany("DELETE FROM files WHERE path = ?", [(path,) for path in paths])
+            self.conn.commit()
+
+    def __len__(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+
+    def close(self):
+        self.conn.close()
+
+
+class FolderIngestor:
+    """把共享文件夹中的 PDF / BibTeX 增量导入离线检索索引和引用图
+
+    - 扫描只读取目录项的大小和修改时间，与清单一致的文件直接跳过；只对有变化的文件计算哈希，
+      内容未变（只是修改时间变了）的文件只更新清单
+    - 新文件和内容变化的文件重新解析：先从索引和引用图中删除旧内容，再加入新内容
+    - 清单中有但文件夹中已不存在的文件，从索引和引用图中删除
+    - 修改时间在 settle 秒以内的文件可能仍在复制，留到下一轮再导入
+
+    Args:
+        tools: AcademicTools 实例（解析 PDF / BibTeX、更新引用图）
+        manifest: 导入清单
+        index: 离线检索索引，为 None 时只更新引用图
+        settle: 文件最后修改后等待的秒数
+        workers: 并行提取参考文献的进程数
+    """
+
+    def __init__(self, tools, manifest: IngestManifest, index: Optional[LocalPaperIndex] = None,
+                 settle: float = 2.0, workers: Optional[int] = None):
+        self.tools = tools
+        self.manifest = manifest
+        self.index = index
+        self.settle = settle
+        self.workers = workers
+
+    def plan(self, root: str) -> Dict[str, Any]:
+        """对比文件夹和清单，返回需要处理的文件：new / changed（含新哈希）、deleted、touched、pending"""
+        known = self.manifest.entries(root)
+        files = scan_folder(root)
+        now_ns = time.time_ns()
+        plan = {'new': [], 'changed': [], 'deleted': [], 'touched': [], 'pending': [], 'unchanged': 0,
+                'known': known, 'scanned': len(files)}
+        for path, (size, mtime_ns) in files.items():
+            entry = known.get(path)
+            if entry and entry['size'] == size and entry['mtime_ns'] == mtime_ns:
+                plan['unchanged'] += 1
+                continue
+            if now_ns - mtime_ns < self.settle * 1e9:
+                plan['pending'].append(path)
+                continue
+            try:
+                digest = file_digest(path)
+            except OSError:
+                continue
+            if entry is None:
+                plan['new'].append((path, size, mtime_ns, digest))
+            elif entry['sha256'] == digest:
+                plan['touched'].append((path, size, mtime_ns))
+            else:
+                plan['changed'].append((path, size, mtime_ns, digest))
+        plan['deleted'] = [path for path in known if path not in files]
+        return plan
+
+    def sync(self, root: str) -> Dict[str, Any]:
+        """同步一次文件夹，返回统计信息"""
+        start = time.time()
+        plan = self.plan(root)
+        known = plan.pop('known')
+        stats = {key: len(value) if isinstance(value, list) else value for key, value in plan.items()}
+        stats.update({'records': 0, 'removed_records': 0, 'edges': 0, 'removed_edges': 0})
+
+        # 已删除的文件：从索引、引用图和清单中删除
+        if plan['deleted']:
+            self._remove_downstream(plan['deleted'], known, stats)
+            self.manifest.remove(plan['deleted'])
+        if plan['touched']:
+            self.manifest.touch(plan['touched'])
+
+        pending = plan['changed'] + plan['new']
+        for offset in range(0, len(pending), INGEST_BATCH):
+            batch = pending[offset:offset + INGEST_BATCH]
+            changed = [item[0] for item in batch if item[0] in known]
+            if changed:
+                self._remove_downstream(changed, known, stats)
+            self.manifest.update(self._ingest(batch, stats))
+
+        stats['seconds'] = round(time.time() - start, 3)
+        if stats['new'] or stats['changed'] or stats['deleted']:
+            print(f"[DEBUG] 同步 {root}: 新增 {stats['new']}，修改 {stats['changed']}，删除 {stats['deleted']}，"
+                  f"未变 {stats['unchanged']}，待稳定 {stats['pending']}，用时 {stats['seconds']} 秒")
+        return stats
+
+    def _remove_downstream(self, paths: List[str], known: Dict[str, Dict[str, Any]], stats: Dict[str, Any]):
+        """从索引和引用图中删除这些文件导入的内容"""
+        if self.index is not None:
+            for path in paths:
+                stats['removed_records'] += self.index.remove_source(f"file:{path}#")
+        keys = [key for path in paths for key in known.get(path, {}).get('graph_keys', [])]
+        if keys:
+            stats['removed_edges'] += self.tools.update_citation_graph(remove=keys)['removed']
+
+    def _ingest(self, batch: List[tuple], stats: Dict[str, Any]) -> List[tuple]:
+        """解析一批文件并写入索引和引用图，返回清单记录"""
+        pdfs = [item[0] for item in batch if item[0].lower().endswith('.pdf')]
+        references = extract_references_many(pdfs, self.workers) if pdfs else {}
+        rows, documents, entries, records = [], [], [], []
+        for path, size, mtime_ns, digest in batch:
+            if path in references:
+                kind, graph_keys = 'pdf', [f"pdf:{path}"]
+                papers = [self._pdf_paper(path)]
+                documents.append((graph_keys[0], references[path]))
+                file_rows = [paper_to_row(f"file:{path}#pdf", papers[0])]
+            else:
+                kind = 'bib'
+                papers = self._bib_papers(path)
+                linked = [paper for paper in papers if paper.get('crossref')]
+                graph_keys = sorted({paper_key(paper) for paper in linked} - {None})
+                entries.extend(papers if linked else [])
+                file_rows = [paper_to_row(f"file:{path}#{paper.get('bibtex_key') or number}", paper)
+                             for number, paper in enumerate(papers)]
+            file_rows = [row for row in file_rows if row]
+            rows.extend(file_rows)
+            records.append((path, size, mtime_ns, digest, kind, len(file_rows), graph_keys))
+        if self.index is not None and rows:
+            stats['records'] += self.index.add_rows(rows)
+        if documents or entries:
+            stats['edges'] += self.tools.update_citation_graph(documents=documents, entries=entries)['added']
+        return records
+
+    def _pdf_paper(self, path: str) -> Dict[str, Any]:
+        """从 PDF 前几页取标题（元数据标题，没有时用首行文本或文件名）和摘要"""
+        pdf = self.tools.parse_pdf(path, max_pages=PDF_HEAD_PAGES)
+        text = pdf.get('text') or ''
+        lines = [line.strip() for line in text.splitlines() if line.strip()]
+        metadata = pdf.get('metadata') or {}
+        author = metadata.get('author')
+        title = metadata.get('title') or (lines[0] if lines else '') \
+            or os.path.splitext(os.path.basename(path))[0]
+        lower = text.lower()
+        position = lower.find('abstract')
+        abstract = text[position + len('abstract'):] if position >= 0 else text
+        return {'title': title, 'abstract': ' '.join(abstract.split())[:PDF_ABSTRACT_CHARS],
+                'authors': [author] if author else [], 'year': '',
+                'url': f"file://{path}"}
+
+    def _bib_papers(self, path: str) -> List[Dict[str, Any]]:
+        try:
+            with open(path, 'r', encoding='utf-8', errors='replace') as f:
+                return self.tools.parse_bibtex(f.read())
+        except OSError as e:
+            print(f"[DEBUG] 读取 {path} 失败: {str(e)}")
+            return []
+
+    def watch(self, roots: List[str], interval: float = 5.0, quiet: float = 2.0, max_delay: float = 30.0,
+              rescan: float = 300.0, stop: Optional[threading.Event] = None):
+        """持续监视文件夹：安装了 watchdog 时按文件系统事件触发同步（每 rescan 秒再全量核对一次），
+        否则每 interval 秒扫描一次；一连串事件合并为一次同步——最后一个事件后安静 quiet 秒，
+        或从第一个事件起最多 max_delay 秒"""
+        stop = stop or threading.Event()
+        changed = threading.Event()
+        observer = self._observer(roots, changed)
+        timeout = rescan if observer else interval
+        try:
+            while not stop.is_set():
+                pending = sum(self.sync(root)['pending'] for root in roots)
+                # 还有未复制完的文件时，稳定期过后再同步
+                wait = min(timeout, self.settle + 0.1) if pending else timeout
+                if not changed.wait(wait) or stop.is_set():
+                    continue
+                first = time.time()
+                while True:
+                    changed.clear()
+                    if not changed.wait(quiet) or time.time() - first >= max_delay or stop.is_set():
+                        break
+        finally:
+            if observer:
+                observer.stop()
+                observer.join()
+
+    @staticmethod
+    def _observer(roots: List[str], changed: threading.Event):
+        """watchdog 观察者，未安装 watchdog 时返回 None（改为定时扫描）"""
+        try:
+            from watchdog.events import FileSystemEventHandler
+            from watchdog.observers import Observer
+        except ImportError:
+            print("[DEBUG] 未安装 watchdog，改为定时扫描文件夹")
+            return None
+
+        class Handler(FileSystemEventHandler):
+            def on_any_event(self, event):
+                paths = [getattr(event, 'src_path', ''), getattr(event, 'dest_path', '')]
+                if event.is_directory or any(str(p).lower().endswith(EXTENSIONS) for p in paths):
+                    changed.set()
+
+        observer = Observer()
+        for root in roots:
+            observer.schedule(Handler(), root, recursive=True)
+        observer.start()
+        return observer
+
+
+def main():
+    parser = argparse.ArgumentParser(description="监视共享文件夹，把新增/修改的 PDF 和 BibTeX 增量导入离线检索索引和引用图")
+    parser.add_argument("folders", nargs='+', help="要监视的文件夹，可指定多个")
+    parser.add_argument("--once", action="store_true", help="只同步一次后退出")
+    parser.add_argument("--index", default=os.getenv('LOCAL_INDEX_DB'), help="离线检索索引数据库路径（默认 LOCAL_INDEX_DB）")
+    parser.add_argument("--manifest", default=default_manifest_path(), help="导入清单数据库路径")
+    parser.add_argument("--interval", type=float, default=5.0, help="未安装 watchdog 时的扫描间隔（秒）")
+    parser.add_argument("--quiet", type=float, default=2.0, help="合并一连串文件事件的安静时间（秒）")
+    parser.add_argument("--max-delay", type=float, default=30.0, help="一连串文件事件最多延迟多久同步（秒）")
+    parser.add_argument("--settle", type=float, default=2.0, help="文件最后修改后等待多久再导入（秒）")
+    parser.add_argument("--workers", type=int, default=None, help="并行提取参考文献的进程数")
+    args = parser.parse_args()
+
+    for folder in args.folders:
+        if not os.path.isdir(folder):
+            parser.error(f"找不到文件夹: {folder}")
+    if not args.index:
+        print("[DEBUG] 未设置 LOCAL_INDEX_DB（或 --index），只更新引用图")
+
+    from academic_tools import AcademicTools
+    tools = AcademicTools()
+    manifest = IngestManifest(args.manifest)
+    index = LocalPaperIndex(args.index) if args.index else None
+    ingestor = FolderIngestor(tools, manifest, index, args.settle, args.workers)
+    try:
+        if args.once:
+            for folder in args.folders:
+                stats = ingestor.sync(folder)
+                print(f"{folder}: 扫描 {stats['scanned']} 个文件，新增 {stats['new']}，修改 {stats['changed']}，"
+                      f"删除 {stats['deleted']}，待稳定 {stats['pending']}，用时 {stats['seconds']} 秒")
+        else:
+            print(f"开始监视 {', '.join(args.folders)}（Ctrl-C 退出）")
+            ingestor.watch(args.folders, args.interval, args.quiet, args.max_delay)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        manifest.close()
+        if index is not None:
+            index.close()
+
+
+if __name__ == "__main__":
+    main()